@@ -0,0 +1,414 @@
+"""
+效能基準測試
+
+以固定種子的合成 OHLCV（utils/synthetic_data.py）在暫存沙盒中建立價格資料庫與版本目錄，
+完全離線地量測回測熱點在不同規模下的執行時間與記憶體峰值：
+    load_price_data / load_price_panel      價格資料庫讀取
+    calculate_rsi / calculate_sma           指標計算
+    generate_signals (RSI / CROSS)          M2-1 單組參數訊號
+    calculate_performance_metrics           M2-2 單組參數績效
+    m2_signal_batch / m2_performance_batch  M2-1、M2-2 整批參數迴圈
+    m7_account_update                       M7 一日帳戶更新（下單、市值重估、日結）
+
+每個項目先重複執行取最短時間，再另外執行一次以 tracemalloc 量記憶體峰值
+（tracemalloc 會拖慢執行，因此不與計時混在一起）。結果與基準檔比較，
+時間或記憶體超過門檻即視為退步，以非 0 結束碼結束，可直接接在 CI 中。
+共用主機上數十毫秒的項目單次量測可差到 1.5 倍，因此時間門檻預設為慢 50% 且至少慢
+MIN_SECONDS（50 ms），更短的項目只比較記憶體（tracemalloc 的峰值不受主機負載影響）；
+超過門檻的項目會重新量測一次、取兩次中較快者再判定，偶發的雜訊不會讓 CI 失敗。
+基準與機器有關，換機器或接受新的效能水準時以 --update-baseline 重新記錄。
+專案附的 benchmark_baseline.json 是以預設規模（small,medium）在開發機上記錄的，
+檔案中的 machine 欄位記載了當時的環境。CI 請加 --check：基準檔不存在或缺少
+這次量測的項目時也以非 0 結束碼結束，不會因為沒有基準而永遠通過。
+
+用法：
+    python benchmark_runner.py                          # small,medium，與基準比較
+    python benchmark_runner.py --sizes large --repeat 1
+    python benchmark_runner.py --only m2 --threshold 0.3
+    python benchmark_runner.py --update-baseline        # 記錄目前結果為基準
+    python benchmark_runner.py --check                  # CI：沒有基準也視為失敗
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(PROJECT_DIR, 'benchmark_baseline.json')
+SEED = 20240615
+# 預設的計時重複次數與時間退步門檻（相對、絕對）
+DEFAULT_REPEAT = 5
+TIME_THRESHOLD = 0.5
+MIN_SECONDS = 0.05
+# 同 utils.version_manager.PROJECT_ROOT_ENV；沙盒必須在引入版本管理器之前設定，因此不從該模組引入
+PROJECT_ROOT_ENV = 'QUANT_PROJECT_ROOT'
+
+# 各規模：價格資料庫的股票數與根數、M2 整批迴圈的參數組數、M7 的帳戶數
+SIZES = {
+    'small': {'symbols': 10, 'bars': 2_000, 'params': 10, 'accounts': 10_000},
+    'medium': {'symbols': 50, 'bars': 10_000, 'params': 25, 'accounts': 100_000},
+    'large': {'symbols': 200, 'bars': 40_000, 'params': 50, 'accounts': 1_000_000},
+}
+
+RSI_PARAMS = {'rsi_period': 14, 'rsi_upper': 70, 'rsi_lower': 30}
+CROSS_PARAMS = {'fast_period': 10, 'slow_period': 50}
+
+
+# === 沙盒 ===
+
+@contextlib.contextmanager
+def benchmark_sandbox(workdir=None, keep=False):
+    """
+    在暫存目錄中執行：專案根目錄環境變數指向沙盒，工作目錄切換到沙盒，
+    所有模組寫出的資料庫、版本目錄與產出檔目錄都不會碰到真正的專案檔案。
+    必須在引入 utils.version_manager 之前進入（版本管理器在引入時決定專案根目錄）。
+    """
+    root = os.path.abspath(workdir or tempfile.mkdtemp(prefix='quant_benchmark_'))
+    os.makedirs(root, exist_ok=True)
+    previous_cwd, previous_root = os.getcwd(), os.environ.get(PROJECT_ROOT_ENV)
+    os.environ[PROJECT_ROOT_ENV] = root
+    os.chdir(root)
+    try:
+        from utils.version_manager import version_manager
+        if version_manager.project_root != root:
+            raise RuntimeError("版本管理器已在沙盒外建立，請以獨立行程執行 benchmark_runner.py")
+        yield root
+    finally:
+        os.chdir(previous_cwd)
+        if previous_root is None:
+            os.environ.pop(PROJECT_ROOT_ENV, None)
+        else:
+            os.environ[PROJECT_ROOT_ENV] = previous_root
+        if not keep and not workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+# === 基準項目：每個函式完成準備工作（不計時），回傳要計時的無參數函式 ===
+
+def bench_load_price_data(ctx):
+    from utils.db_loader import load_price_data
+    symbol = ctx['symbols'][0]
+    return lambda: load_price_data(symbol, ctx['start_date'], ctx['end_date'])
+
+def bench_load_price_panel(ctx):
+    from utils.db_loader import load_price_panel
+    return lambda: load_price_panel(ctx['symbols'], ctx['start_date'], ctx['end_date'])
+
+def bench_calculate_rsi(ctx):
+    from utils.indicator_utils import calculate_rsi
+    return lambda: calculate_rsi(ctx['price_df'].copy(), period=RSI_PARAMS['rsi_period'])
+
+def bench_calculate_sma(ctx):
+    from utils.indicator_utils import calculate_sma
+    return lambda: calculate_sma(ctx['price_df'].copy(), period=CROSS_PARAMS['slow_period'], col_name='sma')
+
+def bench_generate_signals_rsi(ctx):
+    from modules.m2_signal_generator_batch import generate_signals
+    return lambda: generate_signals(ctx['symbols'][0], ctx['start_date'], ctx['end_date'], 'RSI', RSI_PARAMS)
+
+def bench_generate_signals_cross(ctx):
+    from modules.m2_signal_generator_batch import generate_signals
+    return lambda: generate_signals(ctx['symbols'][0], ctx['start_date'], ctx['end_date'], 'CROSS', CROSS_PARAMS)
+
+def bench_calculate_performance_metrics(ctx):
+    from modules.m2_signal_generator_batch import generate_signals
+    from utils.performance_utils import calculate_performance_metrics
+    group = generate_signals(ctx['symbols'][0], ctx['start_date'], ctx['end_date'], 'CROSS', CROSS_PARAMS)
+    group = group.reset_index()
+    return lambda: calculate_performance_metrics(group)
+
+def _param_log(ctx, strategy_type):
+    """寫出 n 組參數的 param_log（格式同 M1），回傳路徑"""
+    import numpy as np
+    rng = np.random.default_rng(SEED)
+    params = []
+    for i in range(ctx['size']['params']):
+        if strategy_type == 'RSI':
+            param = {'rsi_period': int(rng.integers(5, 30)), 'rsi_upper': int(rng.integers(60, 85)),
+                     'rsi_lower': int(rng.integers(15, 40))}
+        else:
+            fast = int(rng.integers(3, 20))
+            param = {'fast_period': fast, 'slow_period': int(rng.integers(fast + 5, 120))}
+        param['id'] = f'{strategy_type}_{i:08x}_benchmark'
+        params.append(param)
+    path = os.path.join(ctx['root'], f'param_log_{strategy_type}_{ctx["symbols"][0]}.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    return path
+
+def bench_m2_signal_batch(ctx):
+    from modules.m2_signal_generator_batch import run_signal_batch
+    from utils.version_manager import version_manager
+    param_log = _param_log(ctx, 'CROSS')
+    signals_dir = version_manager.get_version_path(ctx['version_id'], 'trading_signal')
+    return lambda: run_signal_batch(param_log, ctx['symbols'][0], 'CROSS', ctx['start_date'], ctx['end_date'],
+                                    signals_dir)
+
+def bench_m2_performance_batch(ctx):
+    from modules.m2_signal_generator_batch import run_signal_batch
+    from modules.m2_performance_from_signals_batch import run_performance_batch
+    from utils.version_manager import version_manager
+    signals_dir = version_manager.get_version_path(ctx['version_id'], 'trading_signal')
+    perf_dir = version_manager.get_version_path(ctx['version_id'], 'trading_performance')
+    with contextlib.redirect_stdout(io.StringIO()):
+        signal_file = run_signal_batch(_param_log(ctx, 'CROSS'), ctx['symbols'][0], 'CROSS', ctx['start_date'],
+                                       ctx['end_date'], signals_dir)
+    return lambda: run_performance_batch(signal_file, perf_dir, ctx['version_id'])
+
+def bench_m7_account_update(ctx):
+    import numpy as np
+    import pandas as pd
+    from utils.account_book import AccountBook
+    n = ctx['size']['accounts']
+    rng = np.random.default_rng(SEED)
+    param_ids = [f'CROSS_{i:08x}_benchmark' for i in range(n)]
+    symbols = np.array(ctx['symbols'], dtype=object)[rng.integers(0, len(ctx['symbols']), n)]
+    closes = pd.Series({s: df['close'].iloc[-1] for s, df in ctx['universe'].items()})
+    signals = rng.choice([-1, 0, 1], n)
+    prices = closes[symbols].to_numpy()
+    # 一半的帳戶有訊號，另一半以最新收盤價重估
+    signaled = rng.random(n) < 0.5
+
+    def run():
+        accounts = AccountBook(capacity=n)
+        rows = accounts.rows_for(param_ids)
+        accounts.apply_signals_at(rows, np.ones(n, dtype=int), prices, '2024-01-01', symbols)
+        accounts.apply_signals_at(rows[signaled], signals[signaled], prices[signaled] * 1.01, '2024-01-02',
+                                  symbols[signaled])
+        accounts.mark_to_market(closes, rows[~signaled])
+        accounts.close_day(rows)
+    return run
+
+BENCHMARKS = {
+    'load_price_data': bench_load_price_data,
+    'load_price_panel': bench_load_price_panel,
+    'calculate_rsi': bench_calculate_rsi,
+    'calculate_sma': bench_calculate_sma,
+    'generate_signals_rsi': bench_generate_signals_rsi,
+    'generate_signals_cross': bench_generate_signals_cross,
+    'calculate_performance_metrics': bench_calculate_performance_metrics,
+    'm2_signal_batch': bench_m2_signal_batch,
+    'm2_performance_batch': bench_m2_performance_batch,
+    'm7_account_update': bench_m7_account_update,
+}
+
+
+# === 量測 ===
+
+def measure(fn, repeat=DEFAULT_REPEAT):
+    """重複執行取最短與中位數時間，再單獨執行一次量 tracemalloc 記憶體峰值（MB）"""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {'seconds': min(times), 'median_seconds': statistics.median(times), 'peak_mb': peak / 2 ** 20}
+
+def prepare_size(size_name, root):
+    """在沙盒中寫入該規模的合成價格資料庫並建立版本，回傳基準項目共用的 context"""
+    from utils.synthetic_data import synthetic_universe, write_price_db
+    from utils.version_manager import version_manager
+    size = SIZES[size_name]
+    universe = synthetic_universe(size['symbols'], size['bars'], seed=SEED)
+    write_price_db(universe, os.path.join(root, 'database', 'stock_price.db'))
+    symbols = list(universe)
+    first = universe[symbols[0]]
+    with contextlib.redirect_stdout(io.StringIO()):
+        version_id = version_manager.create_new_version(f'benchmark {size_name}', make_current=False)
+    price_df = first.assign(date=lambda d: d['date'].astype('datetime64[ns]')).set_index('date')
+    return {
+        'root': root,
+        'size': size,
+        'universe': universe,
+        'symbols': symbols,
+        'start_date': first['date'].iloc[0],
+        'end_date': first['date'].iloc[-1],
+        'price_df': price_df,
+        'version_id': version_id,
+    }
+
+def run_benchmarks(sizes, names=None, repeat=DEFAULT_REPEAT, workdir=None, keep=False, recheck=None):
+    """
+    在沙盒中依規模執行基準項目。
+    recheck(key, result) 回傳 True 的項目（例如超過退步門檻）立刻再量測一次，計時取較快的一次，
+    排除單次的主機雜訊。
+
+    回傳:
+        dict: {'size/name': {'seconds', 'median_seconds', 'peak_mb'}}
+    """
+    names = names or list(BENCHMARKS)
+    results = {}
+    with benchmark_sandbox(workdir, keep) as root:
+        for size_name in sizes:
+            size = SIZES[size_name]
+            print(f"\n=== {size_name}: {size['symbols']} 支股票 × {size['bars']:,} 根，"
+                  f"{size['params']} 組參數，{size['accounts']:,} 個帳戶 ===")
+            start = time.perf_counter()
+            ctx = prepare_size(size_name, root)
+            print(f"合成資料準備完成（{time.perf_counter() - start:.1f}s）")
+            for name in names:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    fn = BENCHMARKS[name](ctx)
+                result = measure(fn, repeat)
+                key = f'{size_name}/{name}'
+                if recheck is not None and recheck(key, result):
+                    again = measure(fn, repeat)
+                    print(f"  {name:<32} 超過門檻，重新量測：{again['seconds']:.4f}s")
+                    if again['seconds'] < result['seconds']:
+                        result.update(seconds=again['seconds'], median_seconds=again['median_seconds'])
+                results[key] = result
+                print(f"  {name:<32} {result['seconds']:>9.4f}s  (中位數 {result['median_seconds']:.4f}s)"
+                      f"  峰值 {result['peak_mb']:>8.1f} MB")
+    return results
+
+
+# === 基準比較 ===
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('results', {})
+
+def save_baseline(path, results, merge=True):
+    """記錄基準（預設與既有基準合併，只覆寫這次有量測的項目）"""
+    import numpy as np
+    import pandas as pd
+    baseline = load_baseline(path) if merge else {}
+    baseline.update({key: {k: round(v, 6) for k, v in value.items()} for key, value in results.items()})
+    data = {
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                    'processor': platform.processor() or platform.machine(), 'cpu_count': os.cpu_count(),
+                    'numpy': np.__version__, 'pandas': pd.__version__},
+        'results': dict(sorted(baseline.items())),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
+
+def compare_to_baseline(results, baseline, threshold=TIME_THRESHOLD, memory_threshold=0.25, min_seconds=MIN_SECONDS,
+                        min_mb=1.0):
+    """
+    與基準比較。時間（最短時間）超過基準 × (1 + threshold) 且差距大於 min_seconds，
+    或記憶體峰值超過基準 × (1 + memory_threshold) 且差距大於 min_mb，即視為退步；
+    絕對門檻避免毫秒級項目的計時雜訊誤報。
+
+    回傳:
+        list: 每個項目的比較列 {key, seconds, baseline_seconds, time_ratio, peak_mb,
+              baseline_peak_mb, memory_ratio, status}，status 為 ok / REGRESSION / faster / new
+    """
+    rows = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        row = {'key': key, 'seconds': result['seconds'], 'peak_mb': result['peak_mb'],
+               'baseline_seconds': None, 'time_ratio': None, 'baseline_peak_mb': None, 'memory_ratio': None,
+               'status': 'new'}
+        if base:
+            time_ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else float('inf')
+            memory_ratio = result['peak_mb'] / base['peak_mb'] if base['peak_mb'] > 0 else float('inf')
+            slower = time_ratio > 1 + threshold and result['seconds'] - base['seconds'] > min_seconds
+            bigger = memory_ratio > 1 + memory_threshold and result['peak_mb'] - base['peak_mb'] > min_mb
+            faster = time_ratio < 1 / (1 + threshold) and base['seconds'] - result['seconds'] > min_seconds
+            row.update(baseline_seconds=base['seconds'], time_ratio=time_ratio, baseline_peak_mb=base['peak_mb'],
+                       memory_ratio=memory_ratio,
+                       status='REGRESSION' if slower or bigger else 'faster' if faster else 'ok')
+        rows.append(row)
+    return rows
+
+def print_comparison(rows):
+    print(f"\n{'項目':<42}{'時間(s)':>10}{'基準(s)':>10}{'倍數':>8}{'峰值(MB)':>11}{'基準(MB)':>11}{'倍數':>8}  狀態")
+    for row in rows:
+        def fmt(value, spec):
+            return format(value, spec) if value is not None else '-'
+        print(f"{row['key']:<42}{row['seconds']:>10.4f}{fmt(row['baseline_seconds'], '>10.4f'):>10}"
+              f"{fmt(row['time_ratio'], '>8.2f'):>8}{row['peak_mb']:>11.1f}{fmt(row['baseline_peak_mb'], '>11.1f'):>11}"
+              f"{fmt(row['memory_ratio'], '>8.2f'):>8}  {row['status']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuantaIV 效能基準測試（合成資料，離線）")
+    parser.add_argument('--sizes', default='small,medium', help=f"逗號分隔：{','.join(SIZES)}")
+    parser.add_argument('--only', default=None, help='只執行名稱含有這些字串的項目（逗號分隔）')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='計時重複次數（取最短時間）')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='基準檔路徑')
+    parser.add_argument('--threshold', type=float, default=TIME_THRESHOLD, help='時間退步門檻（0.5 = 慢 50%%）')
+    parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS, help='時間退步的最小絕對差距（秒）')
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help='記憶體峰值退步門檻')
+    parser.add_argument('--update-baseline', action='store_true', help='將這次結果寫入基準檔')
+    parser.add_argument('--check', action='store_true', help='基準檔不存在或缺少項目時也以非 0 結束碼結束（CI 用）')
+    parser.add_argument('--output', default=None, help='另將這次結果寫成 JSON')
+    parser.add_argument('--workdir', default=None, help='沙盒目錄（預設為暫存目錄，結束後刪除）')
+    parser.add_argument('--keep', action='store_true', help='保留暫存沙盒目錄')
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES]
+    if unknown:
+        parser.error(f"未知的規模: {', '.join(unknown)}")
+    names = list(BENCHMARKS)
+    if args.only:
+        patterns = [p.strip() for p in args.only.split(',') if p.strip()]
+        names = [n for n in names if any(p in n for p in patterns)]
+        if not names:
+            parser.error(f"沒有符合 --only {args.only} 的項目")
+
+    if args.check and not args.update_baseline and not os.path.exists(args.baseline):
+        print(f"❌ 找不到基準檔: {args.baseline}，請先以 --update-baseline 記錄")
+        return 1
+
+    baseline = load_baseline(args.baseline)
+
+    def recheck(key, result):
+        if args.update_baseline:
+            return False
+        row = compare_to_baseline({key: result}, baseline, args.threshold, args.memory_threshold, args.min_seconds)[0]
+        return row['status'] == 'REGRESSION'
+
+    results = run_benchmarks(sizes, names, args.repeat, args.workdir, args.keep, recheck)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"📁 結果已存於: {args.output}")
+
+    if args.update_baseline:
+        save_baseline(args.baseline, results)
+        print(f"\n✅ 已更新基準: {args.baseline}")
+        return 0
+
+    rows = compare_to_baseline(results, baseline, args.threshold, args.memory_threshold, args.min_seconds)
+    print_comparison(rows)
+    regressions = [row['key'] for row in rows if row['status'] == 'REGRESSION']
+    if regressions:
+        print(f"\n❌ {len(regressions)} 個項目效能退步: {', '.join(regressions)}")
+        return 1
+    missing = [row['key'] for row in rows if row['status'] == 'new']
+    if missing:
+        print(f"\n{'❌' if args.check else '⚠️'} 基準檔沒有 {len(missing)} 個項目，"
+              f"請以 --update-baseline 記錄: {args.baseline}")
+        return 1 if args.check else 0
+    print("\n✅ 沒有效能退步")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
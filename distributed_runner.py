@@ -0,0 +1,328 @@
+"""
+分散式執行器
+
+協調者把 (symbol, strategy, param-shard, window) 任務寫入 SQLite 工作佇列，
+任意數量、任意主機上的 worker 行程領取任務、以既有的訊號與績效計算執行，
+並回寫精簡的績效結果；最後由協調者彙整成 M2-2 格式的績效檔供 M3 使用。
+
+用法：
+    python distributed_runner.py submit  --symbols AAPL,NVDA --strategies RSI,CROSS \\
+                                         --window 2023-06-15:2024-06-30 --shard-size 200
+    python distributed_runner.py worker  [--db database/work_queue.db]
+    python distributed_runner.py status  --job JOB_ID
+    python distributed_runner.py collect --job JOB_ID
+    python distributed_runner.py local   --symbols AAPL --strategies RSI \\
+                                         --window 2023-06-15:2024-06-30 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+from utils.progress_metrics import ProgressTracker, metrics, record_cache
+from utils.results_store import record_performance
+from utils.work_queue import DONE, FAILED, PENDING, RUNNING, WorkQueue
+from utils.version_manager import version_manager
+
+DEFAULT_DB = 'database/work_queue.db'
+
+
+# === 任務處理（在 worker 行程中執行） ===
+
+# 同一個 worker 處理同一支股票、同一區間的多個分片時，共用價格/指標快取；
+# 只保留最近使用的 CACHE_SIZE 組，長時間執行的 worker 記憶體不會無限成長
+CACHE_SIZE = 8
+_CACHES = OrderedDict()
+
+def _cache_for(symbol, start_date, end_date):
+    from utils.return_matrix import SignalMatrixCache
+    key = (symbol, start_date, end_date)
+    cache = _CACHES.get(key)
+    record_cache('signal_matrix', hit=cache is not None)
+    if cache is None:
+        cache = _CACHES[key] = SignalMatrixCache.from_db(symbol, start_date, end_date)
+        while len(_CACHES) > CACHE_SIZE:
+            _CACHES.popitem(last=False)
+    else:
+        _CACHES.move_to_end(key)
+    return cache
+
+def handle_sweep(payload):
+    """計算一個參數分片在一個區間內的績效，回傳 M2-2 格式的紀錄列表"""
+    cache = _cache_for(payload['symbol'], payload['start_date'], payload['end_date'])
+    perf = cache.window_performance(payload['strategy_type'], payload['params'], 0, len(cache.close))
+    return perf.astype(object).where(perf.notna(), None).to_dict('records')
+
+def handle_walk_forward(payload):
+    """對一支股票、一個策略的完整參數清單執行 walk-forward"""
+    from modules.walk_forward import run_walk_forward
+    cache = _cache_for(payload['symbol'], payload['start_date'], payload['end_date'])
+    result = run_walk_forward(payload['symbol'], payload['strategy_type'], payload['params'],
+                              cache=cache, **payload.get('options', {}))
+    if result is None:
+        return {'splits': [], 'equity': []}
+    equity = result['equity'].assign(date=result['equity']['date'].astype(str))
+    splits = result['splits'].astype(str)
+    return {'splits': splits.to_dict('records'), 'equity': equity.to_dict('records')}
+
+TASK_HANDLERS = {
+    'sweep': handle_sweep,
+    'walk_forward': handle_walk_forward,
+}
+
+
+# === worker ===
+
+def run_worker(db_path=DEFAULT_DB, worker_id=None, lease_seconds=120.0, poll_interval=1.0, max_idle=None,
+               job_id=None):
+    """
+    持續領取並執行任務。執行期間背景執行緒會定期延長租約；
+    max_idle 秒內都沒有可領取的任務時結束（None 表示永不結束）。
+    指定 job_id 時，該 job 沒有 pending/running 任務後才結束，其他 worker 中途當機時
+    仍會留下來接手租約到期的任務。
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    queue = WorkQueue(db_path)
+    idle_since = time.time()
+    processed = 0
+    print(f"[worker {worker_id}] 啟動，佇列: {db_path}")
+
+    while True:
+        task = queue.claim(worker_id, lease_seconds)
+        if task is None:
+            if job_id is not None and queue.is_finished(job_id):
+                break
+            if max_idle is not None and time.time() - idle_since > max_idle:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        stop = threading.Event()
+
+        def keep_alive(task_id=task['task_id']):
+            while not stop.wait(lease_seconds / 3):
+                if not queue.heartbeat(task_id, worker_id, lease_seconds):
+                    break
+
+        heartbeat = threading.Thread(target=keep_alive, daemon=True)
+        heartbeat.start()
+        try:
+            handler = TASK_HANDLERS[task['kind']]
+            queue.complete(task['task_id'], worker_id, handler(task['payload']))
+            processed += 1
+            metrics.inc('quant_worker_tasks_total', 1, 'Tasks handled by this worker', worker=worker_id, result='done')
+        except Exception:
+            queue.fail(task['task_id'], worker_id, traceback.format_exc())
+            metrics.inc('quant_worker_tasks_total', 1, 'Tasks handled by this worker', worker=worker_id, result='failed')
+            print(f"[worker {worker_id}] 任務 {task['task_id']} 失敗（第 {task['attempts']} 次）")
+        finally:
+            stop.set()
+            heartbeat.join()
+        metrics.export(force=False)
+        idle_since = time.time()
+
+    metrics.export()
+    print(f"[worker {worker_id}] 結束，共完成 {processed} 個任務")
+    return processed
+
+
+# === 協調者 ===
+
+def _load_param_log(version_id, strategy_type, symbol):
+    params_dir = version_manager.get_version_path(version_id, "in_sample_params")
+    path = os.path.join(params_dir, f'param_log_{strategy_type}_{symbol}.json')
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def submit_job(symbols, strategies, windows, kind='sweep', shard_size=200, db_path=DEFAULT_DB,
+               job_id=None, version_id=None, options=None, max_attempts=3):
+    """
+    依當前版本的 param log 建立任務並寫入佇列，回傳 job_id。
+    windows 為 [(start_date, end_date), ...]；walk_forward 任務不分片。
+    """
+    version_id = version_id or version_manager.get_current_version()
+    if not version_id:
+        raise RuntimeError("沒有當前版本，請先執行 M1 建立版本")
+    job_id = job_id or f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+    payloads = []
+    for symbol in symbols:
+        for strategy_type in strategies:
+            param_list = _load_param_log(version_id, strategy_type, symbol)
+            size = max(len(param_list), 1) if kind == 'walk_forward' else shard_size
+            for start_date, end_date in windows:
+                for shard_start in range(0, len(param_list), size):
+                    payloads.append({
+                        'symbol': symbol, 'strategy_type': strategy_type,
+                        'start_date': start_date, 'end_date': end_date,
+                        'shard': shard_start // size,
+                        'params': param_list[shard_start:shard_start + size],
+                        'options': options or {},
+                    })
+
+    queue = WorkQueue(db_path)
+    queue.enqueue(job_id, kind, payloads, max_attempts)
+    print(f"✅ 已送出 job {job_id}：{len(payloads)} 個任務（版本 {version_id}）")
+    return job_id
+
+def collect_results(job_id, db_path=DEFAULT_DB, version_id=None):
+    """將 job 結果彙整為績效檔，回傳輸出檔路徑列表"""
+    version_id = version_id or version_manager.get_current_version()
+    out_dir = version_manager.get_version_path(version_id, "trading_performance")
+    os.makedirs(out_dir, exist_ok=True)
+    queue = WorkQueue(db_path)
+
+    groups = {}
+    for item in queue.results(job_id):
+        p = item['payload']
+        key = (item['kind'], p['symbol'], p['strategy_type'], p['start_date'], p['end_date'])
+        groups.setdefault(key, []).append(item['result'])
+
+    out_files = []
+    for (kind, symbol, strategy_type, start_date, end_date), results in groups.items():
+        # 以區間起訖日取代時間戳，檔名格式與 M2-2 相同，M3 可直接讀取
+        stamp = f"{start_date.replace('-', '')}_{end_date.replace('-', '')}"
+        if kind == 'sweep':
+            df = pd.DataFrame([row for rows in results for row in rows])
+            out_file = os.path.join(out_dir, f'performance_{symbol}_{strategy_type}_signals_all_params_{stamp}_batch.csv')
+            df.to_csv(out_file, index=False)
+            version_manager.register_artifact(out_file, 'performance', symbol, strategy_type, version_id,
+                                              start_date, end_date, rows=len(df), job_id=job_id)
+            record_performance(df, out_file, version_id, 'in_sample', start_date, end_date)
+            out_files.append(out_file)
+        else:
+            prefix = os.path.join(out_dir, f'walk_forward_{symbol}_{strategy_type}_{stamp}')
+            pd.DataFrame(results[0]['splits']).to_csv(f'{prefix}_splits.csv', index=False)
+            pd.DataFrame(results[0]['equity']).to_csv(f'{prefix}_equity.csv', index=False)
+            for part in ('splits', 'equity'):
+                version_manager.register_artifact(f'{prefix}_{part}.csv', 'walk_forward', symbol, strategy_type,
+                                                  version_id, start_date, end_date,
+                                                  rows=len(results[0][part]), part=part, job_id=job_id)
+            out_files.extend([f'{prefix}_splits.csv', f'{prefix}_equity.csv'])
+
+    for failure in queue.failures(job_id):
+        print(f"❌ 任務 {failure['task_id']} 在 {failure['attempts']} 次嘗試後失敗:\n{failure['error']}")
+    for f in out_files:
+        print(f'📁 存檔於: {f}')
+    return out_files
+
+def wait_for_job(job_id, db_path=DEFAULT_DB, poll_interval=1.0, timeout=None, workers=None, spawn_worker=None):
+    """
+    等待 job 完成；期間回報佇列深度（各狀態的任務數）、完成速率與 ETA。
+    每次輪詢都把租約已過期的任務放回 pending。
+    workers 為本機 worker 行程列表，有 worker 在 job 完成前結束時以 spawn_worker() 補上。
+    timeout 秒內未完成時拋出 TimeoutError。
+    """
+    queue = WorkQueue(db_path)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    status = queue.job_status(job_id)
+    progress = ProgressTracker(f'job {job_id}', total=sum(status.values()), unit='tasks', stage='distributed')
+    while True:
+        for state, count in status.items():
+            metrics.set('quant_queue_tasks', count, 'Tasks in the work queue by status', job=job_id, status=state)
+        progress.advance(status[DONE] + status[FAILED] - progress.done)
+        if status[PENDING] == 0 and status[RUNNING] == 0:
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError(f"job {job_id} 未在 {timeout} 秒內完成: {status}")
+        if workers is not None and spawn_worker is not None:
+            for i, worker in enumerate(workers):
+                if not worker.is_alive():
+                    print(f"⚠️ worker 行程 {worker.pid} 已結束（exit code {worker.exitcode}），啟動新的 worker")
+                    workers[i] = spawn_worker()
+        time.sleep(poll_interval)
+        reclaimed = queue.reclaim_expired()
+        if reclaimed:
+            print(f"⚠️ {reclaimed} 個任務的租約已過期，已放回佇列")
+        status = queue.job_status(job_id)
+    progress.finish()
+    return status
+
+def run_local(symbols, strategies, windows, n_workers=4, kind='sweep', shard_size=200,
+              db_path=DEFAULT_DB, options=None, lease_seconds=120.0, timeout=None, poll_interval=1.0):
+    """
+    在本機啟動多個 worker 行程執行整個 job，完成後彙整結果。
+    worker 留到 job 完成才結束；中途結束的 worker 會被補上，其任務在租約到期後重新執行。
+    """
+    job_id = submit_job(symbols, strategies, windows, kind, shard_size, db_path, options=options)
+
+    def spawn_worker():
+        worker = multiprocessing.Process(target=run_worker, kwargs={
+            'db_path': db_path, 'lease_seconds': lease_seconds, 'poll_interval': poll_interval, 'job_id': job_id})
+        worker.start()
+        return worker
+
+    workers = [spawn_worker() for _ in range(n_workers)]
+    try:
+        status = wait_for_job(job_id, db_path, poll_interval, timeout, workers, spawn_worker)
+        for w in workers:
+            w.join()
+    finally:
+        for w in workers:
+            if w.is_alive():
+                w.terminate()
+                w.join()
+    print(f"job {job_id} 狀態: {status}")
+    return collect_results(job_id, db_path)
+
+
+def _parse_windows(values):
+    return [tuple(v.split(':')) for v in values]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="QuantaIV 分散式執行器")
+    parser.add_argument('--db', default=DEFAULT_DB, help='工作佇列 SQLite 檔路徑（可放在共用磁碟）')
+    parser.add_argument('--metrics-dir', default=None, help='寫出 Prometheus textfile 與 JSON 指標快照的目錄')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    for name in ('submit', 'local'):
+        p = sub.add_parser(name)
+        p.add_argument('--symbols', required=True)
+        p.add_argument('--strategies', required=True)
+        p.add_argument('--window', action='append', required=True, help='START:END，可重複指定')
+        p.add_argument('--kind', choices=sorted(TASK_HANDLERS), default='sweep')
+        p.add_argument('--shard-size', type=int, default=200)
+        p.add_argument('--options', default='{}', help='walk_forward 參數（JSON）')
+        if name == 'local':
+            p.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+            p.add_argument('--timeout', type=float, default=None, help='job 未在此秒數內完成時中止')
+
+    p = sub.add_parser('worker')
+    p.add_argument('--lease', type=float, default=120.0)
+    p.add_argument('--max-idle', type=float, default=None)
+
+    for name in ('status', 'collect'):
+        sub.add_parser(name).add_argument('--job', required=True)
+
+    args = parser.parse_args(argv)
+    if args.metrics_dir:
+        metrics.configure(directory=args.metrics_dir)
+
+    if args.command in ('submit', 'local'):
+        symbols = [s.strip().upper() for s in args.symbols.split(',')]
+        strategies = [s.strip().upper() for s in args.strategies.split(',')]
+        windows = _parse_windows(args.window)
+        options = json.loads(args.options)
+        if args.command == 'submit':
+            submit_job(symbols, strategies, windows, args.kind, args.shard_size, args.db, options=options)
+        else:
+            run_local(symbols, strategies, windows, args.workers, args.kind, args.shard_size, args.db, options,
+                      timeout=args.timeout)
+    elif args.command == 'worker':
+        run_worker(args.db, lease_seconds=args.lease, max_idle=args.max_idle)
+    elif args.command == 'status':
+        print(WorkQueue(args.db).job_status(args.job))
+    elif args.command == 'collect':
+        collect_results(args.job, args.db)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
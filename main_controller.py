@@ -1,108 +1,234 @@
+"""
+QuantaIV 主控選單
+
+各階段模組都在選到該項目時才載入：啟動時只引入標準函式庫，pandas、polygon、
+dotenv 與 VersionManager 都延遲到第一次真正需要時，選單（或單一階段的無人值守指令）
+可以立即出現。
+
+    python main_controller.py                  互動式選單
+    python main_controller.py 6                只執行選單項目 6 後結束
+    python main_controller.py --startup-check  量測冷啟動時間，超過預算或提前載入重量級套件時回傳非零
+"""
+import time
+
+_STARTED = time.perf_counter()
+
 import os
 import sys
+import json
+import argparse
 import importlib
-from modules.m0_data_loader import download_stock_data, load_stock_data
-from modules.m1_param_generator import main as m1_main
-from modules.m2_signal_generator_batch import main as m2_signal_batch_main
-from modules.m2_performance_from_signals_batch import main as m2_perf_batch_main
-from modules.m3_strategy_selector import main as m3_main
-from modules.m4_1_validation_signal_generator import main as m4_1_main
-# We will dynamically import and reload m4_2
-# from modules.m4_2_validation_performance import main as m4_2_main 
-from modules.m5_validation_strategy_selector import main as m5_main
-from modules.m6_multi_strategy_signal_generator import generate_trade_signals
-from modules.m7_multi_account_simulator import simulate_accounts
 
-def main():
-    while True:
-        print("\n=== QuantaIV 主控選單 ===")
-        print("\n--- 1. 策略回測與驗證 (M0-M5) ---")
-        print("1. M0 - 資料載入模組")
-        print("2. M1 - 參數生成模組")
-        print("3. M2 - 樣本內(in-sample)回測 (訊號+績效)")
-        print("4. M3 - 樣本內(in-sample)策略挑選")
-        print("5. M4/M5 - 樣本外(out-sample)驗證 (訊號+績效+挑選)")
-        print("\n--- 2. 模擬交易 (M6-M7) ---")
-        print("6. M6 - 產生模擬交易訊號")
-        print("7. M7 - 模擬每日績效")
-        print("\n--- 0. 系統 ---")
-        print("0. 離開")
+# 冷啟動（直譯器啟動到選單出現）的時間預算（毫秒）
+STARTUP_BUDGET_MS = 200
+# 選單出現前不應被載入的模組
+DEFERRED_MODULES = ('pandas', 'numpy', 'polygon', 'dotenv', 'utils.version_manager')
+
+
+def _lazy(module_name, attr):
+    """回傳延遲載入的入口函式：第一次呼叫時才匯入模組"""
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), attr)(*args, **kwargs)
+    call.__name__ = attr
+    call.__qualname__ = f"{module_name}.{attr}"
+    return call
+
+
+download_stock_data = _lazy('modules.m0_data_loader', 'download_stock_data')
+load_stock_data = _lazy('modules.m0_data_loader', 'load_stock_data')
+m1_main = _lazy('modules.m1_param_generator', 'main')
+m2_signal_batch_main = _lazy('modules.m2_signal_generator_batch', 'main')
+m2_perf_batch_main = _lazy('modules.m2_performance_from_signals_batch', 'main')
+m3_main = _lazy('modules.m3_strategy_selector', 'main')
+m4_1_main = _lazy('modules.m4_1_validation_signal_generator', 'main')
+m4_2_main = _lazy('modules.m4_2_validation_performance', 'main')
+m5_main = _lazy('modules.m5_validation_strategy_selector', 'main')
+generate_trade_signals = _lazy('modules.m6_multi_strategy_signal_generator', 'generate_trade_signals')
+m6_live_main = _lazy('modules.m6_live_signal_daemon', 'main')
+simulate_accounts = _lazy('modules.m7_multi_account_simulator', 'simulate_accounts')
+m7_replay_main = _lazy('modules.m7_historical_replay', 'main')
+walk_forward_main = _lazy('modules.walk_forward', 'main')
+cpcv_main = _lazy('modules.cpcv_validation', 'main')
+universe_sweep_main = _lazy('modules.universe_sweep', 'main')
+version_retention_main = _lazy('modules.version_retention', 'main')
+run_pipeline = _lazy('pipeline_runner', 'run_pipeline')
+
+
+def startup_probe():
+    """在本行程回報：匯入本模組所花的時間與已提前載入的模組"""
+    return {
+        'import_ms': (time.perf_counter() - _STARTED) * 1000,
+        'loaded': [name for name in DEFERRED_MODULES if name in sys.modules],
+    }
+
+
+def startup_check(budget_ms=STARTUP_BUDGET_MS, runs=5):
+    """
+    以全新的子行程量測冷啟動時間（含直譯器啟動），取多次中最短者。
+
+    回傳:
+        bool: 未超過預算且未提前載入 DEFERRED_MODULES 時為 True
+    """
+    import subprocess
+    command = [sys.executable, os.path.abspath(__file__), '--startup-probe']
+    best_ms, probe = None, None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if best_ms is None or elapsed_ms < best_ms:
+            best_ms, probe = elapsed_ms, json.loads(result.stdout)
+    ok = best_ms <= budget_ms and not probe['loaded']
+    print(f"冷啟動: {best_ms:.1f} ms（預算 {budget_ms} ms，其中匯入主控模組 {probe['import_ms']:.1f} ms）")
+    if probe['loaded']:
+        print(f"⚠️ 選單出現前已載入: {', '.join(probe['loaded'])}")
+    print("✅ 符合啟動預算" if ok else "❌ 超過啟動預算")
+    return ok
+
+
+def print_menu():
+    print("\n=== QuantaIV 主控選單 ===")
+    print("\n--- 1. 策略回測與驗證 (M0-M5) ---")
+    print("1. M0 - 資料載入模組")
+    print("2. M1 - 參數生成模組")
+    print("3. M2 - 樣本內(in-sample)回測 (訊號+績效)")
+    print("4. M3 - 樣本內(in-sample)策略挑選")
+    print("5. M4/M5 - 樣本外(out-sample)驗證 (訊號+績效+挑選)")
+    print("\n--- 2. 模擬交易 (M6-M7) ---")
+    print("6. M6 - 產生模擬交易訊號")
+    print("7. M7 - 模擬每日績效")
+    print("13. M6 Live - 即時訊號常駐程式 (bar stream)")
+    print("14. M7 Replay - 歷史區間回放模擬 (M6→M7 多日)")
+    print("\n--- 3. 自動化 ---")
+    print("8. 依設定檔執行無人值守管線 (M0-M7)")
+    print("9. Walk-Forward 滾動樣本內/樣本外最佳化")
+    print("10. CPCV 組合式淨化交叉驗證")
+    print("11. 全市場參數掃描 (universe)")
+    print("\n--- 0. 系統 ---")
+    print("12. 版本保留與壓縮")
+    print("0. 離開")
+
+
+def run_choice(choice):
+    """執行一個選單項目；選擇離開時回傳 False"""
+    if choice == "0":
+        print("感謝使用，再見！")
+        return False
+    elif choice == "1":
+        print("\n【M0 資料載入模組】")
+        symbol = input("請輸入股票代碼（例如 AAPL）：")
+        start_date = input("請輸入起始日期（格式：YYYY-MM-DD）：")
+        end_date = input("請輸入結束日期（格式：YYYY-MM-DD）：")
+        download_delay = int(input("請輸入下載延遲秒數（預設：2）：") or "2")
+        date_chunk_size = int(input("請輸入時間切段大小（天數，預設：180）：") or "180")
         
-        choice = input("請選擇模組：")
+        download_stock_data(symbol, start_date, end_date, download_delay, date_chunk_size)
+        df = load_stock_data(symbol, start_date, end_date, source='csv')
         
-        if choice == "0":
-            print("感謝使用，再見！")
-            break
-        elif choice == "1":
-            print("\n【M0 資料載入模組】")
-            symbol = input("請輸入股票代碼（例如 AAPL）：")
-            start_date = input("請輸入起始日期（格式：YYYY-MM-DD）：")
-            end_date = input("請輸入結束日期（格式：YYYY-MM-DD）：")
-            download_delay = int(input("請輸入下載延遲秒數（預設：2）：") or "2")
-            date_chunk_size = int(input("請輸入時間切段大小（天數，預設：180）：") or "180")
-            
-            download_stock_data(symbol, start_date, end_date, download_delay, date_chunk_size)
-            df = load_stock_data(symbol, start_date, end_date, source='csv')
-            
-            # 處理多個股票的返回結果
-            if isinstance(df, dict):
-                # 多個股票的情況
-                print(f"\n=== 載入完成，共 {len(df)} 個股票 ===")
-                for stock_symbol, stock_df in df.items():
-                    if not stock_df.empty:
-                        print(f"\n{stock_symbol} 資料摘要：")
-                        print(f"  資料筆數：{len(stock_df)}")
-                        print(f"  日期範圍：{stock_df['date'].min()} 到 {stock_df['date'].max()}")
-                        print(f"  價格範圍：${stock_df['close'].min():.2f} - ${stock_df['close'].max():.2f}")
-                        print(f"  最新收盤價：${stock_df['close'].iloc[-1]:.2f}")
-                    else:
-                        print(f"\n{stock_symbol}：無資料")
-            else:
-                # 單一股票的情況
-                if not df.empty:
-                    print(f"\n=== 載入完成 ===")
-                    print(f"資料筆數：{len(df)}")
-                    print(f"日期範圍：{df['date'].min()} 到 {df['date'].max()}")
-                    print(f"價格範圍：${df['close'].min():.2f} - ${df['close'].max():.2f}")
-                    print(f"最新收盤價：${df['close'].iloc[-1]:.2f}")
-                    print("\n前5筆資料：")
-                    print(df.head())
+        # 處理多個股票的返回結果
+        if isinstance(df, dict):
+            # 多個股票的情況
+            print(f"\n=== 載入完成，共 {len(df)} 個股票 ===")
+            for stock_symbol, stock_df in df.items():
+                if not stock_df.empty:
+                    print(f"\n{stock_symbol} 資料摘要：")
+                    print(f"  資料筆數：{len(stock_df)}")
+                    print(f"  日期範圍：{stock_df['date'].min()} 到 {stock_df['date'].max()}")
+                    print(f"  價格範圍：${stock_df['close'].min():.2f} - ${stock_df['close'].max():.2f}")
+                    print(f"  最新收盤價：${stock_df['close'].iloc[-1]:.2f}")
                 else:
-                    print("無資料載入")
-        elif choice == "2":
-            print("\n【M1 參數生成模組】")
-            m1_main()
-        elif choice == "3":
-            print("\n【M2-1 樣本內批次訊號產生】")
-            m2_signal_batch_main()
-            print("\n【M2-2 樣本內批次回測】")
-            m2_perf_batch_main()
-        elif choice == "4":
-            print("\n【M3 策略挑選模組】")
-            m3_main()
-        elif choice == "5":
-            print("\n【M4-1 驗證區間批次訊號產生】")
-            m4_1_main()
-            print("\n【M4-2 驗證區間回測】")
-            # Force reload the module to bypass cache issues
-            import modules.m4_2_validation_performance
-            importlib.reload(modules.m4_2_validation_performance)
-            modules.m4_2_validation_performance.main()
-            print("\n【M5 驗證區間策略再挑選】")
-            m5_main()
-        elif choice == "6":
-            print("\n【M6 - 產生模擬交易訊號】")
-            symbols_input = input("請輸入要產生訊號的股票代碼，用逗號分隔 (例如: AAPL,NVDA): ")
-            symbols = [s.strip().upper() for s in symbols_input.split(',')]
-            if symbols:
-                generate_trade_signals(symbols)
+                    print(f"\n{stock_symbol}：無資料")
+        else:
+            # 單一股票的情況
+            if not df.empty:
+                print(f"\n=== 載入完成 ===")
+                print(f"資料筆數：{len(df)}")
+                print(f"日期範圍：{df['date'].min()} 到 {df['date'].max()}")
+                print(f"價格範圍：${df['close'].min():.2f} - ${df['close'].max():.2f}")
+                print(f"最新收盤價：${df['close'].iloc[-1]:.2f}")
+                print("\n前5筆資料：")
+                print(df.head())
             else:
-                print("未輸入任何股票代碼。")
-        elif choice == "7":
-            print("\n【M7 - 模擬每日績效】")
-            simulate_accounts()
+                print("無資料載入")
+    elif choice == "2":
+        print("\n【M1 參數生成模組】")
+        m1_main()
+    elif choice == "3":
+        print("\n【M2-1 樣本內批次訊號產生】")
+        m2_signal_batch_main()
+        print("\n【M2-2 樣本內批次回測】")
+        m2_perf_batch_main()
+    elif choice == "4":
+        print("\n【M3 策略挑選模組】")
+        m3_main()
+    elif choice == "5":
+        print("\n【M4-1 驗證區間批次訊號產生】")
+        m4_1_main()
+        print("\n【M4-2 驗證區間回測】")
+        m4_2_main()
+        print("\n【M5 驗證區間策略再挑選】")
+        m5_main()
+    elif choice == "6":
+        print("\n【M6 - 產生模擬交易訊號】")
+        symbols_input = input("請輸入要產生訊號的股票代碼，用逗號分隔 (例如: AAPL,NVDA): ")
+        symbols = [s.strip().upper() for s in symbols_input.split(',')]
+        if symbols:
+            generate_trade_signals(symbols)
+        else:
+            print("未輸入任何股票代碼。")
+    elif choice == "7":
+        print("\n【M7 - 模擬每日績效】")
+        simulate_accounts()
+    elif choice == "13":
+        print("\n【M6 Live - 即時訊號常駐程式】")
+        m6_live_main()
+    elif choice == "14":
+        print("\n【M7 Replay - 歷史區間回放模擬】")
+        m7_replay_main()
+    elif choice == "8":
+        print("\n【無人值守管線】")
+        spec_path = input("請輸入管線設定檔路徑（預設 pipeline_spec_example.json）：").strip() or "pipeline_spec_example.json"
+        if os.path.exists(spec_path):
+            run_pipeline(spec_path)
         else:
-            print("無效的選擇，請重新輸入")
+            print(f"找不到設定檔: {spec_path}")
+    elif choice == "9":
+        print("\n【Walk-Forward 最佳化】")
+        walk_forward_main()
+    elif choice == "10":
+        print("\n【CPCV 組合式淨化交叉驗證】")
+        cpcv_main()
+    elif choice == "11":
+        print("\n【全市場參數掃描】")
+        universe_sweep_main()
+    elif choice == "12":
+        print("\n【版本保留與壓縮】")
+        version_retention_main()
+    else:
+        print("無效的選擇，請重新輸入")
+    return True
+
+
+def main():
+    while True:
+        print_menu()
+        choice = input("請選擇模組：")
+        if not run_choice(choice.strip()):
+            break
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="QuantaIV 主控選單")
+    parser.add_argument("choice", nargs="?", help="直接執行的選單項目（省略時進入互動式選單）")
+    parser.add_argument("--startup-check", action="store_true", help="量測冷啟動時間是否符合預算")
+    parser.add_argument("--startup-budget-ms", type=float, default=STARTUP_BUDGET_MS, help="冷啟動時間預算（毫秒）")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.startup_probe:
+        print(json.dumps(startup_probe()))
+    elif args.startup_check:
+        sys.exit(0 if startup_check(args.startup_budget_ms) else 1)
+    elif args.choice:
+        run_choice(args.choice)
+    else:
+        main()
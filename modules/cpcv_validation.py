@@ -0,0 +1,106 @@
+"""
+CPCV 驗證模組
+
+對一個 param log 的所有參數執行組合式淨化交叉驗證（含禁入期），
+輸出每組參數的樣本外 Sharpe 分佈與回測過度擬合機率 (PBO)，
+產出的 cpcv_*.csv 可供 M3 / M5 挑選時過濾。
+"""
+import os
+import json
+import numpy as np
+from datetime import datetime
+from utils.cpcv import cpcv_masks, masked_sharpe, probability_of_backtest_overfitting, summarize_cpcv
+from utils.return_matrix import SignalMatrixCache, param_id_of
+from utils.version_manager import version_manager
+
+
+def run_cpcv(symbol, strategy_type, param_list, start_date, end_date, n_groups=6,
+             n_test_groups=2, purge=1, embargo=5, out_dir=None, cache=None):
+    """
+    執行 CPCV，回傳 (summary_df, 輸出檔路徑或 None)。
+    """
+    cache = cache or SignalMatrixCache.from_db(symbol, start_date, end_date)
+    n_bars = len(cache.close)
+    # 每組參數的每日策略報酬只計算一次
+    daily_returns, active = cache.window_returns(strategy_type, param_list, 0, n_bars)
+
+    train_masks, test_masks, combos = cpcv_masks(n_bars, n_groups, n_test_groups, purge, embargo)
+    is_sharpe = masked_sharpe(daily_returns, train_masks, active)
+    oos_sharpe = masked_sharpe(daily_returns, test_masks, active)
+    pbo, logits = probability_of_backtest_overfitting(is_sharpe, oos_sharpe)
+
+    summary = summarize_cpcv([param_id_of(p) for p in param_list], is_sharpe, oos_sharpe, pbo)
+    print(f"✅ {symbol} {strategy_type}: {len(param_list)} 組參數 × {len(combos)} 個組合，"
+          f"PBO={pbo:.2%}，logit 中位數={np.median(logits):.3f}")
+
+    out_file = None
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        out_file = os.path.join(out_dir, f'cpcv_{symbol}_{strategy_type}_{timestamp}.csv')
+        summary.to_csv(out_file, index=False)
+        version_manager.register_artifact(out_file, 'cpcv', symbol, strategy_type, start_date=start_date,
+                                          end_date=end_date, rows=len(summary), pbo=float(pbo))
+        print(f'📁 存檔於: {out_file}')
+    return summary, out_file
+
+def main():
+    print("【CPCV 組合式淨化交叉驗證模組】")
+
+    current_version = version_manager.get_current_version()
+    if not current_version:
+        print("⚠️ 沒有當前版本，請先執行 M1 建立版本")
+        return
+
+    print(f"使用版本: {current_version}")
+    strategies_dir = version_manager.get_version_path(current_version, "in_sample_params")
+    perf_dir = version_manager.get_version_path(current_version, "trading_performance")
+
+    if not os.path.exists(strategies_dir):
+        print(f"版本目錄不存在: {strategies_dir}")
+        return
+
+    records = version_manager.find_artifacts('param_log', current_version)
+    files = [os.path.basename(r['path']) for r in records]
+    if not files:
+        print(f'{strategies_dir} 目錄下沒有 param_log_*.json 檔案！')
+        return
+
+    print('請選擇要執行 CPCV 的 param_log 檔案（可輸入多個編號，用逗號分隔）：')
+    for idx, f in enumerate(files, 1):
+        print(f'{idx}. {f}')
+
+    try:
+        choice_indices = [int(x.strip()) - 1 for x in input('請輸入檔案編號：').strip().split(',')]
+        selected_files = [records[i] for i in choice_indices if 0 <= i < len(files)]
+    except Exception:
+        print('輸入錯誤，結束。')
+        return
+    if not selected_files:
+        print('沒有選擇任何有效檔案，結束。')
+        return
+
+    start_date = input('請輸入起始日期（YYYY-MM-DD）：').strip()
+    end_date = input('請輸入結束日期（YYYY-MM-DD）：').strip()
+    n_groups = input('請輸入分組數 N（預設6）：').strip()
+    n_groups = int(n_groups) if n_groups.isdigit() else 6
+    n_test_groups = input('請輸入每個組合的測試組數 k（預設2）：').strip()
+    n_test_groups = int(n_test_groups) if n_test_groups.isdigit() else 2
+    embargo = input('請輸入禁入期 embargo（交易日數，預設5）：').strip()
+    embargo = int(embargo) if embargo.isdigit() else 5
+
+    caches = {}
+    for record in selected_files:
+        symbol, strategy_type = record['symbol'], record['strategy']
+        print(f"\n處理策略: {strategy_type}, 股票: {symbol}")
+        with open(record['path'], 'r', encoding='utf-8') as f:
+            param_list = json.load(f)
+        if symbol not in caches:
+            caches[symbol] = SignalMatrixCache.from_db(symbol, start_date, end_date)
+        run_cpcv(symbol, strategy_type, param_list, start_date, end_date, n_groups,
+                 n_test_groups, embargo=embargo, out_dir=perf_dir, cache=caches[symbol])
+
+    print(f'📂 版本目錄: {current_version}')
+
+if __name__ == '__main__':
+    main()
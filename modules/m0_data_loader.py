@@ -1,27 +1,46 @@
 import os
+import functools
 from datetime import datetime, timedelta
-from dotenv import load_dotenv
-from polygon import RESTClient
 import pandas as pd
 import sqlite3
 import time
 
-# 載入環境變數
-load_dotenv()
-
 # 從 docs/Polygon.io/polygon API Key.txt 讀取 API Key
 api_key_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'docs', 'Polygon.io', 'polygon API Key.txt')
-if os.path.exists(api_key_path):
-    with open(api_key_path, 'r') as f:
-        POLYGON_API_KEY = f.read().strip()
-else:
-    POLYGON_API_KEY = os.getenv("POLYGON_API_KEY") or "YOUR_POLYGON_API_KEY"  # 請替換為你的 API Key
+
+
+@functools.lru_cache(maxsize=None)
+def get_polygon_api_key() -> str:
+    """
+    第一次需要時才載入 .env 並讀取 API Key 檔，匯入本模組不做任何檔案讀取；
+    找不到檔案時使用環境變數 POLYGON_API_KEY
+    """
+    from dotenv import load_dotenv
+    load_dotenv()
+    if os.path.exists(api_key_path):
+        with open(api_key_path, 'r') as f:
+            return f.read().strip()
+    return os.getenv("POLYGON_API_KEY") or "YOUR_POLYGON_API_KEY"  # 請替換為你的 API Key
+
+
+@functools.lru_cache(maxsize=None)
+def get_polygon_client():
+    """延遲建立的共用 Polygon 客戶端；只有實際下載時才引入 polygon 套件"""
+    from polygon import RESTClient
+    return RESTClient(api_key=get_polygon_api_key())
+
+
+def __getattr__(name):
+    # 相容舊程式以 m0_data_loader.POLYGON_API_KEY 取用 API Key
+    if name == 'POLYGON_API_KEY':
+        return get_polygon_api_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def test_polygon_api():
     """測試 Polygon API 的功能和限制"""
     print("=== Polygon API 測試 ===")
-    client = RESTClient(api_key=POLYGON_API_KEY)
+    client = get_polygon_client()
     
     # 測試最近的資料
     print("1. 測試最近的資料 (2024-01-01 到 2024-01-31):")
@@ -63,7 +82,7 @@ def test_polygon_api():
 
 
 def get_stock_data(ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
-    client = RESTClient(api_key=POLYGON_API_KEY)
+    client = get_polygon_client()
     start = datetime.strptime(start_date, "%Y-%m-%d")
     end = datetime.strptime(end_date, "%Y-%m-%d")
     try:
@@ -78,10 +78,10 @@ def generate_cross_params(n=100):
         params.append(param)
     return params
 
-def save_params(symbol, strategy_type, params, mode='in_sample'):
-    """儲存參數到指定模式資料夾"""
+def save_params(symbol, strategy_type, params, mode='in_sample', version_id=None):
+    """儲存參數到指定模式資料夾（version_id 未指定時使用當前版本）"""
     # 取得當前版本目錄
-    current_version = version_manager.get_current_version()
+    current_version = version_id or version_manager.get_current_version()
     if not current_version:
         print("⚠️ 沒有當前版本，建立新版本...")
         current_version = version_manager.create_new_version()
@@ -98,6 +98,8 @@ def save_params(symbol, strategy_type, params, mode='in_sample'):
     param_log_file = os.path.join(strategies_dir, f'param_log_{strategy_type}_{symbol}.json')
     with open(param_log_file, 'w', encoding='utf-8') as f:
         json.dump(params, f, indent=2, ensure_ascii=False)
+    version_manager.register_artifact(param_log_file, 'param_log' if mode == 'in_sample' else 'best_param_log',
+                                      symbol, strategy_type, current_version, rows=len(params))
     
     # 儲存參數映射
     signal_param_map = {param['id']: param for param in params}
@@ -108,6 +110,22 @@ def save_params(symbol, strategy_type, params, mode='in_sample'):
     print(f"📁 參數已儲存到版本目錄: {current_version}")
     return param_log_file, map_file
 
+PARAM_GENERATORS = {
+    "RSI": generate_rsi_params,
+    "CROSS": generate_cross_params,
+}
+
+def run_param_generation(symbol, strategy_type, n_params=100, version_id=None):
+    """
+    非互動式參數產生，供管線執行器呼叫。
+    回傳 param_log 檔案路徑。
+    """
+    if strategy_type not in PARAM_GENERATORS:
+        raise ValueError(f"未知的策略類型: {strategy_type}")
+    params = PARAM_GENERATORS[strategy_type](n_params)
+    param_log_file, _ = save_params(symbol, strategy_type, params, 'in_sample', version_id)
+    return param_log_file
+
 def main():
     print("【策略參數產生 M1】")
     
@@ -1,8 +1,96 @@
 import os
 import pandas as pd
 from utils.performance_utils import calculate_performance_metrics
+from utils.results_store import record_performance
+from utils.memory_guard import memory_monitor
+from utils.progress_metrics import ProgressTracker
+from utils.signal_io import estimate_signal_frame_mb, iter_signal_groups, read_signal_file
+from utils.tracing import span
 from utils.version_manager import version_manager
-from datetime import datetime
+
+def run_performance_batch(signal_file_path, perf_dir, version_id=None):
+    """
+    計算單一 signals 檔案中所有 param_id 的績效並存檔。
+    非互動式，供 main() 與管線執行器共用；回傳輸出檔路徑，失敗時回傳 None。
+    績效同時附加到結果資料庫（version_id 預設為當前版本）。
+    """
+    symbol, strategy_type = version_manager.artifact_symbol_strategy(signal_file_path)
+    with span('M2-2 performance', file=signal_file_path), \
+            memory_monitor.stage('M2-2', report_dir=perf_dir, symbol=symbol, strategy=strategy_type):
+        signal_file = os.path.basename(signal_file_path)
+        print(f"\n正在讀取檔案: {signal_file_path}")
+        # 預估整檔讀入會超過記憶體上限時，只讀表頭，之後分段逐組讀取
+        # （壓縮成 .npz 的訊號檔一律整檔載入，估計值為 0）
+        estimated_mb = estimate_signal_frame_mb(signal_file_path)
+        chunked = estimated_mb > 0 and memory_monitor.should_chunk(estimated_mb, f'M2-2 讀取 {signal_file}')
+        with span('read_signals', cat='io', chunked=chunked) as read_span:
+            df = pd.read_csv(signal_file_path, nrows=0) if chunked else read_signal_file(signal_file_path)
+            read_span.set(rows=len(df))
+
+        # 檢查必要欄位
+        required_cols = ['date', 'param_id', 'signal', 'close']
+        if not all(col in df.columns for col in required_cols):
+            print(f"檔案缺少必要欄位! 需要的欄位: {required_cols}")
+            return None
+
+        if chunked:
+            print("\n=== 開始計算所有策略的績效（分段讀取） ===")
+            groups = iter_signal_groups(signal_file_path)
+            n_params = None
+        else:
+            # 資料預處理
+            df['date'] = pd.to_datetime(df['date'])
+            df = df.sort_values(by='date')
+
+            print("\n=== 開始計算所有策略的績效 ===")
+    
+            unique_params = df['param_id'].unique()
+            print(f"找到 {len(unique_params)} 個不同的參數組合")
+    
+            groups = ((param_id, df[df['param_id'] == param_id].copy()) for param_id in unique_params)
+            n_params = len(unique_params)
+    
+        results = []
+        dates = []
+    
+        progress = ProgressTracker(f'M2-2 {signal_file}', total=n_params, stage='M2-2')
+        for param_id, group in groups:
+            memory_monitor.check(f'M2-2 {signal_file}')
+            with span('param', param_id=param_id):
+                perf_series = calculate_performance_metrics(group)
+            dates.extend((group['date'].min(), group['date'].max()))
+            perf_series['param_id'] = param_id
+            results.append(perf_series)
+            progress.advance(bars=len(group))
+        progress.finish()
+    
+        results_df = pd.DataFrame(results)
+
+        # 重新排列欄位，將 param_id 放到第一位
+        if not results_df.empty:
+            cols = ['param_id'] + [col for col in results_df.columns if col != 'param_id']
+            results_df = results_df[cols]
+
+        print("=== 績效計算完成 ===")
+    
+        os.makedirs(perf_dir, exist_ok=True)
+        out_file = os.path.join(perf_dir, f'performance_{signal_file.replace(".csv", "")}_batch.csv')
+    
+        print("\n=== 最終結果統計 ===")
+        print(results_df.describe())
+
+        with span('write_csv', cat='io', rows=len(results_df)):
+            results_df.to_csv(out_file, index=False)
+        print(f'\n✅ 已完成 {len(results_df)} 組績效計算')
+        print(f'📁 存檔於: {out_file}')
+
+        version_id = version_id or version_manager.get_current_version()
+        start_date, end_date = min(dates).strftime('%Y-%m-%d'), max(dates).strftime('%Y-%m-%d')
+        version_manager.register_artifact(out_file, 'performance', symbol, strategy_type, version_id, start_date,
+                                          end_date, parents=[signal_file_path], rows=len(results_df))
+        with span('write_db', cat='io', rows=len(results_df)):
+            record_performance(results_df, out_file, version_id, 'in_sample', start_date, end_date)
+        return out_file
 
 def main():
     print("【M2-2 績效計算模組】")
@@ -27,19 +115,11 @@ def main():
         print(f"版本目錄不存在: {signals_dir}")
         return
     
-    # 取得檔案列表並按修改時間排序
-    all_files = [f for f in os.listdir(signals_dir) if 'all_params' in f and f.endswith('.csv')]
-    if not all_files:
+    # 由產出檔目錄取得訊號檔列表（最新的在前）
+    files = [os.path.basename(r['path']) for r in version_manager.find_artifacts('signals', current_version)]
+    if not files:
         print(f'{signals_dir} 目錄下沒有 all_params signals 檔案！')
         return
-
-    files_with_mtime = []
-    for f in all_files:
-        full_path = os.path.join(signals_dir, f)
-        files_with_mtime.append((f, os.path.getmtime(full_path)))
-    
-    files_with_mtime.sort(key=lambda x: x[1], reverse=True)
-    files = [f[0] for f in files_with_mtime]
         
     print('請選擇要批次計算績效的 signals 檔案（可輸入多個編號，用逗號分隔，已按時間倒序排列，最新的在最上方）：')
     for idx, f in enumerate(files, 1):
@@ -67,54 +147,7 @@ def main():
     
     # 處理每個選中的檔案
     for signal_file in selected_files:
-        signal_file_path = os.path.join(signals_dir, signal_file)
-        print(f"\n正在讀取檔案: {signal_file_path}")
-        df = pd.read_csv(signal_file_path)
-
-        # 檢查必要欄位
-        required_cols = ['date', 'param_id', 'signal', 'close']
-        if not all(col in df.columns for col in required_cols):
-            print(f"檔案缺少必要欄位! 需要的欄位: {required_cols}")
-            continue
-
-        # 資料預處理
-        df['date'] = pd.to_datetime(df['date'])
-        df = df.sort_values(by='date')
-
-        print("\n=== 開始計算所有策略的績效 ===")
-        
-        unique_params = df['param_id'].unique()
-        print(f"找到 {len(unique_params)} 個不同的參數組合")
-        
-        results = []
-        
-        for i, param_id in enumerate(unique_params, 1):
-            group = df[df['param_id'] == param_id].copy()
-            perf_series = calculate_performance_metrics(group)
-            perf_series['param_id'] = param_id
-            results.append(perf_series)
-            
-            if i % 10 == 0:
-                print(f"進度: {i}/{len(unique_params)}")
-        
-        results_df = pd.DataFrame(results)
-
-        # 重新排列欄位，將 param_id 放到第一位
-        if not results_df.empty:
-            cols = ['param_id'] + [col for col in results_df.columns if col != 'param_id']
-            results_df = results_df[cols]
-
-        print("=== 績效計算完成 ===")
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        out_file = os.path.join(perf_dir, f'performance_{signal_file.replace(".csv", "")}_batch.csv')
-        
-        print("\n=== 最終結果統計 ===")
-        print(results_df.describe())
-
-        results_df.to_csv(out_file, index=False)
-        print(f'\n✅ 已完成 {len(results_df)} 組績效計算')
-        print(f'📁 存檔於: {out_file}')
+        run_performance_batch(os.path.join(signals_dir, signal_file), perf_dir, current_version)
     
     print(f'📂 版本目錄: {current_version}')
 
@@ -1,10 +1,12 @@
 import os
-import pandas as pd
 import numpy as np
 import json
 from datetime import datetime
 from utils.indicator_utils import calculate_rsi, calculate_sma
 from utils.db_loader import load_price_data
+from utils.memory_guard import SpillingCsvWriter, memory_monitor
+from utils.progress_metrics import ProgressTracker
+from utils.tracing import span
 from utils.version_manager import version_manager
 
 def generate_signals(symbol, start_date, end_date, strategy_type, params):
@@ -52,6 +54,49 @@ def generate_signals_df(params, strategy_type, start_date, end_date):
         print(f"[錯誤] 產生 param_id={param_id} 訊號失敗: {e}")
         return None
 
+def run_signal_batch(param_log_path, symbol, strategy_type, start_date, end_date, signals_dir):
+    """
+    為一個 param_log 檔案中的所有參數產生訊號並存成單一 CSV。
+    非互動式，供 main() 與管線執行器共用；回傳輸出檔路徑，失敗時回傳 None。
+    """
+    with span('M2-1 signals', symbol=symbol, strategy=strategy_type), \
+            memory_monitor.stage('M2-1', report_dir=signals_dir, symbol=symbol, strategy=strategy_type):
+        print(f"\n處理策略: {strategy_type}, 股票: {symbol}")
+        
+        with open(param_log_path, 'r', encoding='utf-8') as f:
+            param_list = json.load(f)
+        
+        print(f"開始為 {len(param_list)} 組參數產生訊號...")
+        
+        os.makedirs(signals_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        out_file = os.path.join(signals_dir, f'{symbol}_{strategy_type}_signals_all_params_{timestamp}.csv')
+        # 預估 concat 會超過記憶體上限時，改為逐組附加寫入 out_file
+        writer = SpillingCsvWriter(out_file, what=f'M2-1 {symbol} {strategy_type} concat')
+        progress = ProgressTracker(f'M2-1 {symbol} {strategy_type}', total=len(param_list), stage='M2-1')
+        for param in param_list:
+            memory_monitor.check(f'M2-1 {symbol} {strategy_type}')
+            param['symbol'] = symbol
+            # 將 start_date 和 end_date 傳遞給 generate_signals_df
+            with span('param', param_id=param.get('id')):
+                signals_df = generate_signals_df(param, strategy_type, start_date, end_date)
+            if signals_df is not None:
+                writer.add(signals_df)
+            progress.advance(bars=0 if signals_df is None else len(signals_df))
+        progress.finish()
+        
+        rows = writer.close()
+        if not writer.n_frames:
+            print(f'沒有成功產生 {symbol} 的任何 signals！')
+            return None
+        
+        version_manager.register_artifact(out_file, 'signals', symbol, strategy_type, start_date=start_date,
+                                          end_date=end_date, parents=[param_log_path], rows=rows)
+        
+        print(f'✅ 已產生 {len(param_list)} 組 {symbol} signals')
+        print(f'📁 存檔於: {out_file}')
+        return out_file
+
 def main():
     print("【M2-1 訊號生成模組】")
     
@@ -75,7 +120,8 @@ def main():
         print(f"版本目錄不存在: {strategies_dir}")
         return
     
-    files = [f for f in os.listdir(strategies_dir) if f.startswith('param_log_') and f.endswith('.json')]
+    records = version_manager.find_artifacts('param_log', current_version)
+    files = [os.path.basename(r['path']) for r in records]
     if not files:
         print(f'{strategies_dir} 目錄下沒有 param_log_*.json 檔案！')
         return
@@ -92,7 +138,7 @@ def main():
         selected_files = []
         for idx in choice_indices:
             if 0 <= idx < len(files):
-                selected_files.append(files[idx])
+                selected_files.append(records[idx])
             else:
                 print(f'警告：檔案編號 {idx + 1} 超出範圍，已忽略')
         
@@ -109,41 +155,8 @@ def main():
     end_date = input('請輸入結束日期（YYYY-MM-DD）：').strip()
     
     # 處理每個選中的檔案
-    for param_file in selected_files:
-        strategy_type = param_file.split('_')[2] # 從檔名解析策略類型
-        symbol = param_file.split('_')[-1].replace('.json', '')
-        
-        print(f"\n處理策略: {strategy_type}, 股票: {symbol}")
-        
-        with open(os.path.join(strategies_dir, param_file), 'r', encoding='utf-8') as f:
-            param_list = json.load(f)
-        
-        print(f"開始為 {len(param_list)} 組參數產生訊號...")
-        
-        all_signals = []
-        for i, param in enumerate(param_list, 1):
-            param['symbol'] = symbol
-            # 將 start_date 和 end_date 傳遞給 generate_signals_df
-            signals_df = generate_signals_df(param, strategy_type, start_date, end_date)
-            if signals_df is not None:
-                all_signals.append(signals_df)
-            
-            if i % 10 == 0:
-                print(f"進度: {i}/{len(param_list)}")
-        
-        if not all_signals:
-            print(f'沒有成功產生 {symbol} 的任何 signals！')
-            continue
-        
-        df_all = pd.concat(all_signals, ignore_index=False)
-        df_all.reset_index(inplace=True)
-        
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        out_file = os.path.join(signals_dir, f'{symbol}_{strategy_type}_signals_all_params_{timestamp}.csv')
-        df_all.to_csv(out_file, index=False)
-        
-        print(f'✅ 已產生 {len(param_list)} 組 {symbol} signals')
-        print(f'📁 存檔於: {out_file}')
+    for record in selected_files:
+        run_signal_batch(record['path'], record['symbol'], record['strategy'], start_date, end_date, signals_dir)
     
     print(f'📂 版本目錄: {current_version}')
 
@@ -1,9 +1,79 @@
 import os
 import pandas as pd
-import json
-import glob
+from utils.cpcv import apply_cpcv_filter, prompt_cpcv_filter
+from utils.pareto import pareto_select, prompt_pareto_objectives
+from utils.param_loader import write_best_param_log
+from utils.param_robustness import add_robustness_for_perf_file, prompt_robustness
+from utils.results_store import select_top_from_store, prompt_results_query
 from utils.version_manager import version_manager
 
+def select_best_strategies(perf_file_path, strat_dir, sort_col='sharpe', ascending=False, top_n=10,
+                           cpcv_filter=None, version_id=None, pareto=None,
+                           robustness=None, perf_df=None):
+    """
+    依指定欄位排序績效報告並保留前 N 名，存成 best_strategies_*.csv。
+    cpcv_filter 為 {'file', 'max_overfit_prob', 'min_oos_sharpe'} 時先依 CPCV 結果過濾。
+    績效檔已寫入結果資料庫時以索引查詢取前 N 名，不再讀取並排序整份 CSV。
+    pareto 為指標清單或 {指標: 'max'|'min'} 時改用 Pareto 前緣與擁擠距離挑選，忽略 sort_col。
+    robustness 為 {'metric', 'k', 'penalty', 'min_positive_ratio'} 時先加上參數鄰域穩健度欄位
+    （robust_sharpe 等），可用來排序或過濾。
+    perf_df 為已讀入（且已加上穩健度欄位）的績效表時直接使用，不再讀檔或重新計算穩健度。
+    回傳 (輸出檔路徑, 篩選後的 DataFrame)。
+    """
+    perf_file = os.path.basename(perf_file_path)
+    version_id = version_id or version_manager.get_current_version()
+    df_sorted = None
+    if not pareto and not robustness and perf_df is None:
+        df_sorted = select_top_from_store(perf_file_path, version_id, sort_col, ascending, top_n, cpcv_filter)
+    if df_sorted is None:
+        if perf_df is not None:
+            df = perf_df
+        else:
+            df = pd.read_csv(perf_file_path)
+        if robustness and perf_df is None:
+            df = add_robustness_for_perf_file(df, perf_file_path, version_id, **robustness)
+        if sort_col not in df.columns:
+            print(f'欄位 {sort_col} 不存在，預設用 sharpe')
+            sort_col = 'sharpe'
+
+        # 可選：先以 CPCV 結果剔除過度擬合的參數
+        if cpcv_filter:
+            df = apply_cpcv_filter(df, cpcv_filter['file'], cpcv_filter.get('max_overfit_prob'),
+                                   cpcv_filter.get('min_oos_sharpe'))
+
+        if pareto:
+            df_sorted = pareto_select(df, pareto, top_n)
+        else:
+            df_sorted = df.sort_values(by=sort_col, ascending=ascending).head(top_n)
+    
+    os.makedirs(strat_dir, exist_ok=True)
+    out_file = os.path.join(strat_dir, f'best_strategies_{perf_file.replace("performance_", "")}')
+    df_sorted.to_csv(out_file, index=False)
+    symbol, strategy_type = version_manager.artifact_symbol_strategy(perf_file_path)
+    version_manager.register_artifact(out_file, 'best_strategies', symbol, strategy_type, version_id,
+                                      parents=[perf_file_path, (cpcv_filter or {}).get('file')], rows=len(df_sorted))
+    print(f'✅ 已篩選出前{top_n}名最佳策略')
+    print(f'📁 存檔於: {out_file}')
+    return out_file, df_sorted
+
+def copy_best_param_log(df_sorted, symbol, strategy_type, version_id, best_file=None):
+    """
+    將樣本內 param log 依最佳策略過濾後複製到樣本外參數目錄（保持原始檔名）。
+    best_file 為對應的最佳策略檔，登記為來源之一，M4-1 據此找到同一批參數。
+    回傳複製後的檔案路徑，找不到來源檔時回傳 None。
+    """
+    # 由產出檔目錄查詢該版本 {symbol} {strategy_type} 的樣本內 param log，只保留 best_strategies 裡的 param_id
+    paramlog_dst = write_best_param_log(df_sorted['param_id'], symbol, strategy_type, version_id, best_file)
+    if paramlog_dst is None:
+        all_params_dir = version_manager.get_version_path(version_id, "in_sample_params")
+        print(f'❌ 找不到對應的 param log 檔案: {os.path.join(all_params_dir, f"param_log_{strategy_type}_{symbol}.json")}')
+        return None
+    
+    print(f'✅ 已自動複製並過濾 param log')
+    print(f'📁 存檔於: {paramlog_dst}')
+    print(f'📂 版本目錄: {version_id}')
+    return paramlog_dst
+
 def main():
     print("【M3 策略選擇模組】")
     
@@ -22,25 +92,23 @@ def main():
     # 建立最佳策略目錄
     os.makedirs(strat_dir, exist_ok=True)
 
+    mode = input('請選擇模式：1. 從績效報告挑選（預設）  2. 從結果資料庫跨股票/策略查詢：').strip()
+    if mode == '2':
+        prompt_results_query('in_sample', current_version, perf_dir, strat_dir)
+        return
+
     # 檢查績效檔案
     if not os.path.exists(perf_dir):
         print(f"版本目錄不存在: {perf_dir}")
         return
     
-    # 更新檔案列表邏輯以匹配新的需求
-    all_files = [f for f in os.listdir(perf_dir) if f.startswith('performance_') and f.endswith('_batch.csv')]
-    if not all_files:
+    # 由產出檔目錄取得績效報告列表（最新的在前）
+    perf_records = version_manager.find_artifacts('performance', current_version)
+    files = [os.path.basename(r['path']) for r in perf_records]
+    if not files:
         print(f'\'{perf_dir}\' 目錄下沒有績效報告！')
         return
 
-    files_with_mtime = []
-    for f in all_files:
-        full_path = os.path.join(perf_dir, f)
-        files_with_mtime.append((f, os.path.getmtime(full_path)))
-    
-    files_with_mtime.sort(key=lambda x: x[1], reverse=True)
-    files = [f[0] for f in files_with_mtime]
-
     print('請選擇績效報告（已按時間倒序排列，最新的在最上方）：')
     for idx, f in enumerate(files, 1):
         print(f'{idx}. {f}')
@@ -56,79 +124,54 @@ def main():
         
     perf_file = files[idx]
     df = pd.read_csv(os.path.join(perf_dir, perf_file))
+
+    # 可選：加上參數鄰域穩健度欄位，之後可依 robust_sharpe 排序
+    robustness = prompt_robustness()
+    if robustness:
+        df = add_robustness_for_perf_file(df, os.path.join(perf_dir, perf_file), current_version, **robustness)
     
-    print('可用排序欄位：', ', '.join(df.columns))
-    sort_col = input('請輸入排序欄位（如 total_return、sharpe）：').strip()
-    if sort_col not in df.columns:
-        print('欄位錯誤，預設用 sharpe')
-        sort_col = 'sharpe'
-        
-    # 預設排序方向
-    ascending = False
-    if sort_col in ['total_return', 'sharpe']:
-        ascending = False
-    elif sort_col == 'max_drawdown':
-        ascending = True
-        
-    user_desc = input(f'是否由大到小排序？(y/n, 預設{"n" if ascending else "y"})：').strip().lower()
-    if user_desc == 'y':
+    pareto = None
+    sort_col, ascending = 'sharpe', False
+    if input('請選擇篩選方式：1. 單一欄位排序（預設）  2. Pareto 多目標：').strip() == '2':
+        pareto = prompt_pareto_objectives(df.columns)
+    if pareto is None:
+        print('可用排序欄位：', ', '.join(df.columns))
+        sort_col = input('請輸入排序欄位（如 total_return、sharpe）：').strip()
+        if sort_col not in df.columns:
+            print('欄位錯誤，預設用 sharpe')
+            sort_col = 'sharpe'
+
+        # 預設排序方向
         ascending = False
-    elif user_desc == 'n':
-        ascending = True
-        
+        if sort_col in ['total_return', 'sharpe']:
+            ascending = False
+        elif sort_col == 'max_drawdown':
+            ascending = True
+
+        user_desc = input(f'是否由大到小排序？(y/n, 預設{"n" if ascending else "y"})：').strip().lower()
+        if user_desc == 'y':
+            ascending = False
+        elif user_desc == 'n':
+            ascending = True
+
     top_n = input('請輸入要保留的前N名策略（預設10）：').strip()
     top_n = int(top_n) if top_n.isdigit() else 10
+    cpcv_filter = prompt_cpcv_filter(current_version)
     
-    df_sorted = df.sort_values(by=sort_col, ascending=ascending).head(top_n)
-    
-    out_file = os.path.join(strat_dir, f'best_strategies_{perf_file.replace("performance_", "")}')
-    df_sorted.to_csv(out_file, index=False)
-    print(f'✅ 已篩選出前{top_n}名最佳策略')
-    print(f'📁 存檔於: {out_file}')
+    # 穩健度已在上面算過，直接交給挑選函式使用
+    best_file, df_sorted = select_best_strategies(os.path.join(perf_dir, perf_file), strat_dir, sort_col, ascending,
+                                                  top_n, cpcv_filter, current_version, pareto, robustness,
+                                                  perf_df=df if robustness else None)
 
     # === 新增：自動複製 param log ===
-    # 從最佳策略的 param_id 中推斷出 strategy_type (最可靠)
-    if not df_sorted.empty and 'param_id' in df_sorted.columns:
-        strategy_type = df_sorted['param_id'].iloc[0].split('_')[0]
-    else:
-        print("無法從最佳策略中推斷出策略類型，請檢查績效報告欄位。")
+    # symbol 與策略類型由產出檔目錄取得，不再從檔名拆解
+    symbol, strategy_type = perf_records[idx]['symbol'], perf_records[idx]['strategy']
+    if df_sorted.empty or not symbol or not strategy_type:
+        print("無法取得最佳策略的股票與策略類型，請檢查績效報告。")
         return
-        
-    # 從績效檔名中，穩健地解析出 symbol
-    base_name = perf_file.replace('performance_', '').replace(f'_{strategy_type}_signals_all_params', '').replace('_batch.csv', '')
-    # 找最後一個時間戳前的部分
-    symbol = '_'.join(base_name.split('_')[:-2])
 
-    # 使用版本化的參數目錄
-    all_params_dir = version_manager.get_version_path(current_version, "in_sample_params")
-    
-    # 搜尋所有符合 param_log_{strategy_type}_{symbol}.json 的檔案
-    param_log_filename = f'param_log_{strategy_type}_{symbol}.json'
-    paramlog_src = os.path.join(all_params_dir, param_log_filename)
-    
-    if os.path.exists(paramlog_src):
-        # 使用版本化的樣本外參數目錄
-        paramlog_dst_dir = version_manager.get_version_path(current_version, "out_sample_params")
-        os.makedirs(paramlog_dst_dir, exist_ok=True)
-        # 保持原始檔名
-        paramlog_dst = os.path.join(paramlog_dst_dir, os.path.basename(paramlog_src))
-        
-        # 讀取原始 param log
-        with open(paramlog_src, 'r', encoding='utf-8') as f:
-            all_params = json.load(f)
-        # 只保留 best_strategies 裡的 param_id
-        best_ids = set(df_sorted['param_id'])
-        filtered_params = [p for p in all_params if p.get('id') in best_ids]
-        
-        with open(paramlog_dst, 'w', encoding='utf-8') as f:
-            json.dump(filtered_params, f, ensure_ascii=False, indent=2)
-        
-        print(f'✅ 已自動複製並過濾 param log')
-        print(f'📁 存檔於: {paramlog_dst}')
-        print(f'📂 版本目錄: {current_version}')
+    if copy_best_param_log(df_sorted, symbol, strategy_type, current_version, best_file):
         print('這份檔案可直接用於 M4-1 驗證區間批次訊號產生！')
-    else:
-        print(f'❌ 找不到對應的 param log 檔案: {paramlog_src}')
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
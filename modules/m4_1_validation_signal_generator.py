@@ -1,10 +1,64 @@
 import os
-import pandas as pd
 from .m2_signal_generator_batch import generate_signals_df
 from datetime import datetime
 import json
+from utils.memory_guard import SpillingCsvWriter, memory_monitor
+from utils.param_loader import best_param_log_for
+from utils.progress_metrics import ProgressTracker
+from utils.tracing import span
 from utils.version_manager import version_manager
 
+def run_validation_signals(param_log_path, symbol, strategy_type, start_date, end_date, signals_dir):
+    """
+    以 M3 過濾後的 param log 產生驗證區間訊號。
+    非互動式，供 main() 與管線執行器共用；回傳輸出檔路徑，失敗時回傳 None。
+    """
+    with span('M4-1 signals', symbol=symbol, strategy=strategy_type), \
+            memory_monitor.stage('M4-1', report_dir=signals_dir, symbol=symbol, strategy=strategy_type):
+        # 讀取已經被 M3 過濾好的參數檔案
+        with open(param_log_path, 'r', encoding='utf-8') as f:
+            param_list = json.load(f)
+    
+        os.makedirs(signals_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        out_file = os.path.join(signals_dir, f'{symbol}_{strategy_type}_signals_all_params_{timestamp}_validation.csv')
+        # 預估 concat 會超過記憶體上限時，改為逐組附加寫入 out_file
+        writer = SpillingCsvWriter(out_file, what=f'M4-1 {symbol} {strategy_type} concat')
+        n_generated = 0
+        print(f'開始產生 {len(param_list)} 組參數的訊號...')
+    
+        progress = ProgressTracker(f'M4-1 {symbol} {strategy_type}', total=len(param_list), stage='M4-1')
+        for param in param_list:
+            memory_monitor.check(f'M4-1 {symbol} {strategy_type}')
+        
+            # 將 symbol, date, 和 param_id 加入到要傳遞的參數字典中
+            pass_params = param.copy()
+            pass_params['symbol'] = symbol
+            pass_params['start_date'] = start_date
+            pass_params['end_date'] = end_date
+            pass_params['param_id'] = param['id']
+
+            with span('param', param_id=param['id']):
+                signals_df = generate_signals_df(pass_params, strategy_type, start_date, end_date)
+
+            if signals_df is not None:
+                writer.add(signals_df)
+                n_generated += 1
+            progress.advance(bars=0 if signals_df is None else len(signals_df))
+        progress.finish()
+    
+        rows = writer.close()
+        if not writer.n_frames:
+            print('❌ 沒有成功產生任何 signals！')
+            return None
+    
+        version_manager.register_artifact(out_file, 'validation_signals', symbol, strategy_type, start_date=start_date,
+                                          end_date=end_date, parents=[param_log_path], rows=rows)
+    
+        print(f'✅ 已產生 {n_generated} 組 signals')
+        print(f'📁 存檔於: {out_file}')
+        return out_file
+
 def main():
     print("【M4-1 樣本外訊號生成模組】")
     
@@ -29,8 +83,9 @@ def main():
         print(f"版本目錄不存在: {strategies_dir}")
         return
     
-    # 先找最佳策略清單
-    strategy_files = [f for f in os.listdir(strategies_dir) if f.startswith('best_strategies_') and f.endswith('.csv')]
+    # 先找最佳策略清單（由產出檔目錄查詢，最新的在前）
+    strategy_records = version_manager.find_artifacts('best_strategies', current_version)
+    strategy_files = [os.path.basename(r['path']) for r in strategy_records]
     if not strategy_files:
         print(f'{strategies_dir} 下沒有最佳策略清單！')
         return
@@ -48,71 +103,25 @@ def main():
         print('輸入錯誤，結束。')
         return
         
-    strategy_file = strategy_files[idx]
-    
-    # 讀取最佳策略清單以推斷策略類型
-    df_strategies = pd.read_csv(os.path.join(strategies_dir, strategy_file))
-    
-    if df_strategies.empty or 'param_id' not in df_strategies.columns:
-        print("無法從最佳策略中推斷出策略類型，請檢查檔案內容。")
+    record = strategy_records[idx]
+    symbol, strategy_type = record['symbol'], record['strategy']
+    if not symbol or not strategy_type:
+        print("無法從產出檔目錄取得最佳策略的股票與策略類型，請檢查檔案。")
         return
-    strategy_type = df_strategies['param_id'].iloc[0].split('_')[0]
-
-    # 從檔名穩健地解析出 symbol
-    base_name = strategy_file.replace('best_strategies_', '').replace('_batch.csv', '')
-    temp_name = base_name.split(f'_{strategy_type}_signals_all_params_')[0]
-    symbol = temp_name
     
     print(f"處理策略: {strategy_type}, 股票: {symbol}")
     
-    # 精準定位唯一的 param_log 檔案
-    param_log_file = f'param_log_{strategy_type}_{symbol}.json'
-    param_log_path = os.path.join(param_logs_dir, param_log_file)
-    
-    if not os.path.exists(param_log_path):
-        print(f'❌ 找不到對應的參數檔案：{param_log_path}')
+    # 與所選最佳策略清單一起寫出的 param_log（產出檔目錄的來源紀錄），不是同股票同策略最新的一份
+    param_log_path = best_param_log_for(record['path'], symbol, strategy_type, current_version)
+    if param_log_path is None:
+        print(f'❌ 找不到對應的參數檔案：{os.path.join(param_logs_dir, f"param_log_{strategy_type}_{symbol}.json")}')
         return
         
-    # 讀取已經被 M3 過濾好的參數檔案
-    with open(param_log_path, 'r', encoding='utf-8') as f:
-            param_list = json.load(f)
-    
     start_date = input('請輸入起始日期（YYYY-MM-DD）：').strip()
     end_date = input('請輸入結束日期（YYYY-MM-DD）：').strip()
     
-    all_signals = []
-    print(f'開始產生 {len(param_list)} 組參數的訊號...')
-    
-    for i, param in enumerate(param_list, 1):
-        print(f'處理參數 {param["id"]}... ({i}/{len(param_list)})')
-        
-        # 將 symbol, date, 和 param_id 加入到要傳遞的參數字典中
-        pass_params = param.copy()
-        pass_params['symbol'] = symbol
-        pass_params['start_date'] = start_date
-        pass_params['end_date'] = end_date
-        pass_params['param_id'] = param['id']
-
-        signals_df = generate_signals_df(pass_params, strategy_type, start_date, end_date)
-
-        if signals_df is not None:
-            all_signals.append(signals_df)
-            print(f'✅ 完成參數 {param["id"]} 的訊號產生')
-    
-    if not all_signals:
-        print('❌ 沒有成功產生任何 signals！')
-        return
-        
-    df_all = pd.concat(all_signals, ignore_index=False)
-    df_all.reset_index(inplace=True)
-    
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    out_file = os.path.join(signals_dir, f'{symbol}_{strategy_type}_signals_all_params_{timestamp}_validation.csv')
-    df_all.to_csv(out_file, index=False)
-    
-    print(f'✅ 已產生 {len(all_signals)} 組 signals')
-    print(f'📁 存檔於: {out_file}')
-    print(f'📂 版本目錄: {current_version}')
+    if run_validation_signals(param_log_path, symbol, strategy_type, start_date, end_date, signals_dir):
+        print(f'📂 版本目錄: {current_version}')
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -1,8 +1,113 @@
 import os
 import pandas as pd
 from utils.performance_utils import calculate_performance_metrics
+from utils.results_store import record_performance
+from utils.memory_guard import memory_monitor
+from utils.progress_metrics import ProgressTracker
+from utils.signal_io import estimate_signal_frame_mb, iter_signal_groups, read_signal_file
+from utils.tracing import span
 from utils.version_manager import version_manager
-from datetime import datetime
+
+def run_validation_performance(signal_file_path, perf_dir, version_id=None):
+    """
+    計算單一 validation signals 檔案中所有 param_id 的績效並存檔。
+    非互動式，供 main() 與管線執行器共用；回傳輸出檔路徑，失敗時回傳 None。
+    績效同時附加到結果資料庫（version_id 預設為當前版本）。
+    """
+    symbol, strategy_type = version_manager.artifact_symbol_strategy(signal_file_path)
+    with span('M4-2 performance', file=signal_file_path), \
+            memory_monitor.stage('M4-2', report_dir=perf_dir, symbol=symbol, strategy=strategy_type):
+        signal_file = os.path.basename(signal_file_path)
+        print(f"\n正在讀取檔案: {signal_file_path}")
+        # 預估整檔讀入會超過記憶體上限時，只讀表頭，之後分段逐組讀取
+        # （壓縮成 .npz 的訊號檔一律整檔載入，估計值為 0）
+        estimated_mb = estimate_signal_frame_mb(signal_file_path)
+        chunked = estimated_mb > 0 and memory_monitor.should_chunk(estimated_mb, f'M4-2 讀取 {signal_file}')
+        with span('read_signals', cat='io', chunked=chunked) as read_span:
+            df = pd.read_csv(signal_file_path, nrows=0) if chunked else read_signal_file(signal_file_path)
+            read_span.set(rows=len(df))
+    
+        # 檢查必要欄位
+        required_cols = ['date', 'param_id', 'signal', 'close']
+        if not all(col in df.columns for col in required_cols):
+            print(f"檔案缺少必要欄位! 需要的欄位: {required_cols}")
+            return None
+
+        if chunked:
+            print("\n=== 開始計算所有策略的績效（分段讀取） ===")
+            groups = iter_signal_groups(signal_file_path)
+            n_params = None
+        else:
+            # 資料預處理
+            df['date'] = pd.to_datetime(df['date'])
+            df = df.sort_values(by='date')
+    
+            # 輸出載入的數據基本資訊
+            print(f"\n=== 數據基本資訊 ===")
+            print(f"總資料筆數: {len(df)}")
+            print(f"欄位: {df.columns.tolist()}")
+            print(f"param_id 分布:\n{df['param_id'].value_counts().head()}")
+            print(f"signal 值域: [{df['signal'].min()}, {df['signal'].max()}]")
+            print(f"close 價格範圍: [{df['close'].min():.2f}, {df['close'].max():.2f}]")
+            print(f"時間範圍: [{df['date'].min()}, {df['date'].max()}]")
+
+            # === 統一的績效計算流程 ===
+            print("\n=== 開始計算所有策略的績效 ===")
+    
+            unique_params = df['param_id'].unique()
+            print(f"找到 {len(unique_params)} 個不同的參數組合")
+    
+            groups = ((param_id, df[df['param_id'] == param_id].copy()) for param_id in unique_params)
+            n_params = len(unique_params)
+    
+        results = []
+        dates = []
+    
+        progress = ProgressTracker(f'M4-2 {signal_file}', total=n_params, stage='M4-2')
+        for param_id, group in groups:
+            memory_monitor.check(f'M4-2 {signal_file}')
+            with span('param', param_id=param_id):
+                perf_series = calculate_performance_metrics(group)
+            dates.extend((group['date'].min(), group['date'].max()))
+            if perf_series is not None:
+                perf_series['param_id'] = param_id
+                results.append(perf_series)
+            progress.advance(bars=len(group))
+        progress.finish()
+    
+        if not results:
+            print("❌ 所有策略計算績效後均無結果，請檢查資料或 `calculate_performance_metrics` 函式。")
+            return None
+
+        results_df = pd.DataFrame(results)
+    
+        # 重新排列欄位，將 param_id 放到第一位
+        if not results_df.empty:
+            cols = ['param_id'] + [col for col in results_df.columns if col != 'param_id']
+            results_df = results_df[cols]
+
+        print("=== 績效計算完成 ===")
+    
+        # 儲存結果
+        os.makedirs(perf_dir, exist_ok=True)
+        out_file = os.path.join(perf_dir, f'performance_{signal_file.replace(".csv", "")}_validation.csv')
+    
+        # 輸出最終結果統計
+        print("\n=== 最終結果統計 ===")
+        print(results_df.describe())
+    
+        with span('write_csv', cat='io', rows=len(results_df)):
+            results_df.to_csv(out_file, index=False)
+        print(f'\n✅ 已完成 {len(results_df)} 組績效計算')
+        print(f'📁 存檔於: {out_file}')
+
+        version_id = version_id or version_manager.get_current_version()
+        start_date, end_date = min(dates).strftime('%Y-%m-%d'), max(dates).strftime('%Y-%m-%d')
+        version_manager.register_artifact(out_file, 'validation_performance', symbol, strategy_type, version_id,
+                                          start_date, end_date, parents=[signal_file_path], rows=len(results_df))
+        with span('write_db', cat='io', rows=len(results_df)):
+            record_performance(results_df, out_file, version_id, 'out_sample', start_date, end_date)
+        return out_file
 
 def main():
     print("【M4-2 樣本外績效計算模組】")
@@ -27,19 +132,11 @@ def main():
         print(f"版本目錄不存在: {signals_dir}")
         return
     
-    # 取得檔案列表並按修改時間排序
-    all_files = [f for f in os.listdir(signals_dir) if 'validation' in f and f.endswith('.csv')]
-    if not all_files:
+    # 由產出檔目錄取得驗證訊號檔列表（最新的在前）
+    files = [os.path.basename(r['path']) for r in version_manager.find_artifacts('validation_signals', current_version)]
+    if not files:
         print(f'{signals_dir} 目錄下沒有 validation signals 檔案！')
         return
-
-    files_with_mtime = []
-    for f in all_files:
-        full_path = os.path.join(signals_dir, f)
-        files_with_mtime.append((f, os.path.getmtime(full_path)))
-    
-    files_with_mtime.sort(key=lambda x: x[1], reverse=True)
-    files = [f[0] for f in files_with_mtime]
         
     print('請選擇要批次計算績效的 validation signals 檔案（已按時間倒序排列，最新的在最上方）：')
     for idx, f in enumerate(files, 1):
@@ -55,72 +152,8 @@ def main():
         return
         
     signal_file = files[idx]
-    signal_file_path = os.path.join(signals_dir, signal_file)
-    print(f"\n正在讀取檔案: {signal_file_path}")
-    df = pd.read_csv(signal_file_path, parse_dates=['date'])
-    
-    # 檢查必要欄位
-    required_cols = ['date', 'param_id', 'signal', 'close']
-    if not all(col in df.columns for col in required_cols):
-        print(f"檔案缺少必要欄位! 需要的欄位: {required_cols}")
-        return
-
-    # 資料預處理
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values(by='date')
-    
-    # 輸出載入的數據基本資訊
-    print(f"\n=== 數據基本資訊 ===")
-    print(f"總資料筆數: {len(df)}")
-    print(f"欄位: {df.columns.tolist()}")
-    print(f"param_id 分布:\n{df['param_id'].value_counts().head()}")
-    print(f"signal 值域: [{df['signal'].min()}, {df['signal'].max()}]")
-    print(f"close 價格範圍: [{df['close'].min():.2f}, {df['close'].max():.2f}]")
-    print(f"時間範圍: [{df['date'].min()}, {df['date'].max()}]")
-
-    # === 統一的績效計算流程 ===
-    print("\n=== 開始計算所有策略的績效 ===")
-    
-    unique_params = df['param_id'].unique()
-    print(f"找到 {len(unique_params)} 個不同的參數組合")
-    
-    results = []
-    
-    for i, param_id in enumerate(unique_params, 1):
-        group = df[df['param_id'] == param_id].copy()
-        perf_series = calculate_performance_metrics(group)
-        if perf_series is not None:
-            perf_series['param_id'] = param_id
-            results.append(perf_series)
-        
-        if i % 5 == 0:
-            print(f"進度: {i}/{len(unique_params)}")
-    
-    if not results:
-        print("❌ 所有策略計算績效後均無結果，請檢查資料或 `calculate_performance_metrics` 函式。")
-        return
-
-    results_df = pd.DataFrame(results)
-    
-    # 重新排列欄位，將 param_id 放到第一位
-    if not results_df.empty:
-        cols = ['param_id'] + [col for col in results_df.columns if col != 'param_id']
-        results_df = results_df[cols]
-
-    print("=== 績效計算完成 ===")
-    
-    # 儲存結果
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    out_file = os.path.join(perf_dir, f'performance_{signal_file.replace(".csv", "")}_validation.csv')
-    
-    # 輸出最終結果統計
-    print("\n=== 最終結果統計 ===")
-    print(results_df.describe())
-    
-    results_df.to_csv(out_file, index=False)
-    print(f'\n✅ 已完成 {len(results_df)} 組績效計算')
-    print(f'📁 存檔於: {out_file}')
-    print(f'📂 版本目錄: {current_version}')
+    if run_validation_performance(os.path.join(signals_dir, signal_file), perf_dir, current_version):
+        print(f'📂 版本目錄: {current_version}')
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
@@ -1,7 +1,62 @@
 import os
 import pandas as pd
+from utils.cpcv import apply_cpcv_filter, prompt_cpcv_filter
+from utils.diversity import diversify, prompt_diversity, validation_signal_file_for
+from utils.pareto import pareto_select, prompt_pareto_objectives
+from utils.results_store import select_top_from_store, prompt_results_query
 from utils.version_manager import version_manager
 
+def select_final_strategies(perf_file_path, strat_dir, sort_col='sharpe', ascending=False, top_n=10,
+                            cpcv_filter=None, version_id=None, pareto=None, diversity=None):
+    """
+    依指定欄位排序樣本外績效報告並保留前 N 名，存到樣本外最佳策略目錄。
+    cpcv_filter 為 {'file', 'max_overfit_prob', 'min_oos_sharpe'} 時先依 CPCV 結果過濾。
+    績效檔已寫入結果資料庫時以索引查詢取前 N 名，不再讀取並排序整份 CSV。
+    pareto 為指標清單或 {指標: 'max'|'min'} 時改用 Pareto 前緣與擁擠距離挑選，忽略 sort_col。
+    diversity 為 {'max_corr'} 時依排名順序貪婪挑選，排除與已選策略每日報酬相關係數超過上限的候選。
+    非互動式，供 main() 與管線執行器共用；回傳輸出檔路徑。
+    """
+    perf_file = os.path.basename(perf_file_path)
+    version_id = version_id or version_manager.get_current_version()
+    df_sorted = None
+    if not pareto and not diversity:
+        df_sorted = select_top_from_store(perf_file_path, version_id, sort_col, ascending, top_n, cpcv_filter)
+    if df_sorted is None:
+        df = pd.read_csv(perf_file_path)
+        if sort_col not in df.columns:
+            print(f'欄位 {sort_col} 不存在，預設用 sharpe')
+            sort_col = 'sharpe'
+
+        # 可選：先以 CPCV 結果剔除過度擬合的參數
+        if cpcv_filter:
+            df = apply_cpcv_filter(df, cpcv_filter['file'], cpcv_filter.get('max_overfit_prob'),
+                                   cpcv_filter.get('min_oos_sharpe'))
+
+        # 多樣化篩選需要完整的排名，由前往後挑到 top_n 為止
+        n_ranked = len(df) if diversity else top_n
+        if pareto:
+            df_sorted = pareto_select(df, pareto, n_ranked)
+        else:
+            df_sorted = df.sort_values(by=sort_col, ascending=ascending).head(n_ranked)
+
+        if diversity:
+            signals_dir = version_manager.get_version_path(version_id, "trading_signal")
+            df_sorted = diversify(df_sorted, validation_signal_file_for(perf_file_path, signals_dir),
+                                  diversity.get('max_corr', 0.7), top_n)
+    
+    # 輸出檔名邏輯
+    os.makedirs(strat_dir, exist_ok=True)
+    out_file_name = f'best_strategies_{perf_file.replace("performance_", "")}'
+    out_file = os.path.join(strat_dir, out_file_name)
+    df_sorted.to_csv(out_file, index=False)
+    symbol, strategy_type = version_manager.artifact_symbol_strategy(perf_file_path)
+    version_manager.register_artifact(out_file, 'final_strategies', symbol, strategy_type, version_id,
+                                      parents=[perf_file_path, (cpcv_filter or {}).get('file')], rows=len(df_sorted))
+    
+    print(f'✅ 已篩選出前{top_n}名最佳策略')
+    print(f'📁 存檔於: {out_file}')
+    return out_file
+
 def main():
     """
     M5 策略挑選模組 (樣本外)
@@ -25,27 +80,23 @@ def main():
     
     # 建立最佳策略目錄
     os.makedirs(strat_dir, exist_ok=True)
+
+    mode = input('請選擇模式：1. 從績效報告挑選（預設）  2. 從結果資料庫跨股票/策略查詢：').strip()
+    if mode == '2':
+        prompt_results_query('out_sample', current_version, perf_dir, strat_dir)
+        return
     
     # 檢查績效檔案
     if not os.path.exists(perf_dir):
         print(f"版本目錄不存在: {perf_dir}")
         return
 
-    # 根據模式設定檔案過濾條件
-    file_suffix = '_validation.csv'
-    all_files = [f for f in os.listdir(perf_dir) if f.endswith(file_suffix)]
-    if not all_files:
+    # 由產出檔目錄取得樣本外績效報告列表（最新的在前）
+    files = [os.path.basename(r['path']) for r in version_manager.find_artifacts('validation_performance', current_version)]
+    if not files:
         print(f'{perf_dir} 下沒有績效報告！')
         return
 
-    # 按時間排序
-    files_with_mtime = []
-    for f in all_files:
-        full_path = os.path.join(perf_dir, f)
-        files_with_mtime.append((f, os.path.getmtime(full_path)))
-    files_with_mtime.sort(key=lambda x: x[1], reverse=True)
-    files = [f[0] for f in files_with_mtime]
-
     print('請選擇績效報告：')
     for idx, f in enumerate(files, 1):
         print(f'{idx}. {f}')
@@ -63,37 +114,37 @@ def main():
     df = pd.read_csv(os.path.join(perf_dir, perf_file))
 
     # --- 篩選邏輯 ---
-    print(f'可用排序欄位： {", ".join(df.columns)}')
-    sort_col = input('請輸入排序欄位（如 total_return、sharpe）：').strip()
-    if sort_col not in df.columns:
-        print('欄位錯誤，預設用 sharpe')
-        sort_col = 'sharpe'
+    pareto = None
+    sort_col, ascending = 'sharpe', False
+    if input('請選擇篩選方式：1. 單一欄位排序（預設）  2. Pareto 多目標：').strip() == '2':
+        pareto = prompt_pareto_objectives(df.columns)
+    if pareto is None:
+        print(f'可用排序欄位： {", ".join(df.columns)}')
+        sort_col = input('請輸入排序欄位（如 total_return、sharpe）：').strip()
+        if sort_col not in df.columns:
+            print('欄位錯誤，預設用 sharpe')
+            sort_col = 'sharpe'
 
-    # 預設排序方向
-    ascending = False
-    if sort_col in ['total_return', 'sharpe']:
-        ascending = False
-    elif sort_col == 'max_drawdown':
-        ascending = True
-        
-    user_desc = input(f'是否由大到小排序？(y/n, 預設{"n" if ascending else "y"})：').strip().lower()
-    if user_desc == 'y':
+        # 預設排序方向
         ascending = False
-    elif user_desc == 'n':
-        ascending = True
-    
+        if sort_col in ['total_return', 'sharpe']:
+            ascending = False
+        elif sort_col == 'max_drawdown':
+            ascending = True
+
+        user_desc = input(f'是否由大到小排序？(y/n, 預設{"n" if ascending else "y"})：').strip().lower()
+        if user_desc == 'y':
+            ascending = False
+        elif user_desc == 'n':
+            ascending = True
+
     top_n = input('請輸入要保留的前N名策略（預設10）：').strip()
     top_n = int(top_n) if top_n.isdigit() else 10
+    cpcv_filter = prompt_cpcv_filter(current_version)
+    diversity = prompt_diversity()
     
-    df_sorted = df.sort_values(by=sort_col, ascending=ascending).head(top_n)
-    
-    # 輸出檔名邏輯
-    out_file_name = f'best_strategies_{perf_file.replace("performance_", "")}'
-    out_file = os.path.join(strat_dir, out_file_name)
-    df_sorted.to_csv(out_file, index=False)
-    
-    print(f'✅ 已篩選出前{top_n}名最佳策略')
-    print(f'📁 存檔於: {out_file}')
+    select_final_strategies(os.path.join(perf_dir, perf_file), strat_dir, sort_col, ascending, top_n, cpcv_filter,
+                            current_version, pareto, diversity)
     print(f'📂 版本目錄: {current_version}')
 
 if __name__ == '__main__':
@@ -0,0 +1,354 @@
+"""
+M6 Live: Event-Driven Signal Daemon
+
+A long-running counterpart of the daily M6 batch. It subscribes to a bar
+stream (local socket, named pipe, tailed file, or a replay of data_csv),
+keeps the indicator state of every best strategy in memory, and re-evaluates
+a symbol's strategies as soon as one of its bars arrives.
+
+Indicator state is incremental: each distinct RSI period / SMA period of a
+symbol keeps a running window sum, so a bar costs O(number of distinct
+periods) regardless of history length. Signals follow the same rules as
+utils.strategy_runner (RSI thresholds, golden/death crossover).
+
+Whenever a strategy's signal changes, a decision is appended to
+M6_live_decisions_{YYYYMMDD}.jsonl in the version's signal directory. The
+arrival-to-logged latency of every bar is tracked and reported as
+percentiles, and written next to the log when the daemon stops.
+"""
+import os
+import json
+import math
+import time
+from collections import deque
+from datetime import datetime
+import numpy as np
+from utils.bar_stream import open_bar_stream
+from utils.db_loader import get_recent_price_panel
+from utils.strategy_runner import required_lookback
+from utils.tracing import traced
+from utils.version_manager import version_manager
+from modules.m6_multi_strategy_signal_generator import index_best_strategies, resolve_strategies
+
+# Running sums are re-summed from the window this often to stop float drift
+_RESUM_EVERY = 1024
+
+
+class _RollingMean:
+    """Mean of the last `period` values, updated in O(1) per value."""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.values = deque(maxlen=period)
+        self.total = 0.0
+        self.pushes = 0
+
+    def push(self, value: float) -> float:
+        if len(self.values) == self.period:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+        self.pushes += 1
+        if self.pushes % _RESUM_EVERY == 0:
+            self.total = math.fsum(self.values)
+        if len(self.values) < self.period:
+            return np.nan
+        mean = self.total / self.period
+        # Same residual clamp as indicator_utils.rsi_array
+        return 0.0 if abs(mean) < 1e-12 else mean
+
+
+class SymbolSignalState:
+    """Indicator state and last signals of every strategy of one symbol."""
+
+    def __init__(self, strategies: list):
+        self.strategies = strategies
+        self.last_close = None
+        self.last_date = None
+        self.signals = np.zeros(len(strategies), dtype=int)
+
+        def param(strategy, key):
+            return strategy['params'].get(key) or np.nan
+
+        rsi = [i for i, s in enumerate(strategies) if str(s['strategy_type']).upper() == 'RSI']
+        cross = [i for i, s in enumerate(strategies) if str(s['strategy_type']).upper() == 'CROSS']
+        for s in strategies:
+            if str(s['strategy_type']).upper() not in ('RSI', 'CROSS'):
+                print(f"WARNING: Strategy type '{s['strategy_type']}' is not supported.")
+
+        # RSI: one gain/loss window per distinct period, strategies index into it
+        self.rsi_rows = np.array(rsi, dtype=int)
+        rsi_period = np.array([param(strategies[i], 'rsi_period') for i in rsi], dtype=float)
+        self.rsi_upper = np.array([param(strategies[i], 'rsi_upper') for i in rsi], dtype=float)
+        self.rsi_lower = np.array([param(strategies[i], 'rsi_lower') for i in rsi], dtype=float)
+        self.rsi_periods = sorted({int(p) for p in rsi_period if not np.isnan(p)})
+        self.gains = [_RollingMean(p) for p in self.rsi_periods]
+        self.losses = [_RollingMean(p) for p in self.rsi_periods]
+        self.rsi_slot = self._slots(rsi_period, self.rsi_periods)
+
+        # CROSS: one SMA window per distinct period, with its previous value
+        self.cross_rows = np.array(cross, dtype=int)
+        fast = np.array([param(strategies[i], 'fast_period') for i in cross], dtype=float)
+        slow = np.array([param(strategies[i], 'slow_period') for i in cross], dtype=float)
+        self.sma_periods = sorted({int(p) for p in np.concatenate([fast, slow]) if not np.isnan(p)})
+        self.smas = [_RollingMean(p) for p in self.sma_periods]
+        self.sma_curr = np.full(len(self.sma_periods) + 1, np.nan)
+        self.sma_prev = np.full(len(self.sma_periods) + 1, np.nan)
+        self.fast_slot = self._slots(fast, self.sma_periods)
+        self.slow_slot = self._slots(slow, self.sma_periods)
+
+        incomplete = (np.isnan(rsi_period) | np.isnan(self.rsi_upper) | np.isnan(self.rsi_lower)).sum() \
+            + (np.isnan(fast) | np.isnan(slow)).sum()
+        if incomplete:
+            print(f"WARNING: {incomplete} strategies of {strategies[0]['symbol']} are missing parameters; "
+                  f"they will always hold.")
+
+    @staticmethod
+    def _slots(periods: np.ndarray, distinct: list) -> np.ndarray:
+        """Index of each strategy's period in `distinct`; missing periods point at a trailing NaN slot."""
+        lookup = {p: i for i, p in enumerate(distinct)}
+        return np.array([lookup.get(int(p), len(distinct)) if not np.isnan(p) else len(distinct)
+                         for p in periods], dtype=int)
+
+    def update(self, close: float) -> np.ndarray:
+        """Feeds one close and returns the new signal of every strategy."""
+        delta = 0.0 if self.last_close is None else close - self.last_close
+        self.last_close = close
+        signals = np.zeros(len(self.strategies), dtype=int)
+
+        if len(self.rsi_rows):
+            rsi = np.full(len(self.rsi_periods) + 1, np.nan)
+            for k in range(len(self.rsi_periods)):
+                gain = self.gains[k].push(delta if delta > 0 else 0.0)
+                loss = self.losses[k].push(-delta if delta < 0 else 0.0)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    rsi[k] = 100 - (100 / (1 + np.float64(gain) / loss))
+            latest = rsi[self.rsi_slot]
+            with np.errstate(invalid='ignore'):
+                signals[self.rsi_rows] = np.where(latest > self.rsi_upper, -1,
+                                                  np.where(latest < self.rsi_lower, 1, 0))
+
+        if len(self.cross_rows):
+            self.sma_prev[:] = self.sma_curr
+            for k, sma in enumerate(self.smas):
+                self.sma_curr[k] = sma.push(close)
+            prev_short, prev_long = self.sma_prev[self.fast_slot], self.sma_prev[self.slow_slot]
+            curr_short, curr_long = self.sma_curr[self.fast_slot], self.sma_curr[self.slow_slot]
+            with np.errstate(invalid='ignore'):
+                golden = (prev_short <= prev_long) & (curr_short > curr_long)
+                death = (prev_short >= prev_long) & (curr_short < curr_long)
+            signals[self.cross_rows] = np.where(golden, 1, np.where(death, -1, 0))
+
+        return signals
+
+
+class LiveSignalEngine:
+    """
+    In-memory signal state for every best strategy of the watched symbols.
+
+    on_bar() updates the bar's symbol, appends a decision for every strategy
+    whose signal changed, and records the bar's arrival-to-logged latency.
+    """
+
+    def __init__(self, strategies_by_symbol: dict, log_path: str, fsync: bool = False, latency_window: int = 100000):
+        self.states = {symbol: SymbolSignalState(strategies) for symbol, strategies in strategies_by_symbol.items()}
+        self.log_path = log_path
+        self.fsync = fsync
+        self.latencies = deque(maxlen=latency_window)
+        self.bars = 0
+        self.ignored = 0
+        self.decisions = 0
+        os.makedirs(os.path.dirname(log_path) or '.', exist_ok=True)
+        # Append-only: earlier decisions of the same day are never rewritten
+        self._log = open(log_path, 'a', encoding='utf-8')
+
+    @traced()
+    def warm_up(self, window: int = 30):
+        """
+        Primes every symbol's indicators with its recent bars from the
+        database (at least `window`, more if a strategy's period is longer),
+        so signals are available from the first live bar. The signals
+        reached at the end of warm-up are the baseline for changes, and the
+        date of the last warm-up bar is the symbol's last date, so a feed
+        that repeats bars already in the database does not apply them twice.
+        """
+        window = max([window] + [required_lookback(state.strategies) for state in self.states.values()])
+        panel, last_dates = get_recent_price_panel(list(self.states), window=window, with_dates=True)
+        for symbol in panel.columns:
+            state = self.states[symbol]
+            for close in panel[symbol].dropna():
+                state.signals = state.update(float(close))
+            state.last_date = last_dates.get(symbol, state.last_date)
+        print(f"INFO: Warmed up {len(panel.columns)} symbols with up to {window} bars each.")
+
+    @traced()
+    def on_bar(self, bar: dict) -> list:
+        """
+        Processes one bar. Bars for unwatched symbols and bars not newer than
+        the symbol's last bar are ignored.
+
+        Returns:
+            list: The decisions (dicts) appended to the log for this bar.
+        """
+        state = self.states.get(bar['symbol'])
+        if state is None or (state.last_date is not None and bar['date'] <= state.last_date):
+            self.ignored += 1
+            return []
+        state.last_date = bar['date']
+        self.bars += 1
+
+        signals = state.update(float(bar['close']))
+        changed = np.nonzero(signals != state.signals)[0]
+        decisions = []
+        for i in changed:
+            strategy = state.strategies[i]
+            decisions.append({
+                'date': bar['date'],
+                'symbol': bar['symbol'],
+                'strategy_type': strategy['strategy_type'],
+                'param_id': strategy['param_id'],
+                'signal': int(signals[i]),
+                'prev_signal': int(state.signals[i]),
+                'price': float(bar['close']),
+                'comment': strategy['comment'],
+            })
+        state.signals = signals
+
+        if decisions:
+            self._log.write(''.join(json.dumps(d, ensure_ascii=False) + '\n' for d in decisions))
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self.decisions += len(decisions)
+        self.latencies.append(time.perf_counter() - bar.get('received_at', time.perf_counter()))
+        return decisions
+
+    def latency_percentiles(self) -> dict:
+        """Arrival-to-logged latency percentiles (milliseconds) over the recent bars."""
+        if not self.latencies:
+            return {}
+        latencies = np.fromiter(self.latencies, dtype=float) * 1000
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        return {'count': len(latencies), 'p50_ms': float(p50), 'p90_ms': float(p90), 'p99_ms': float(p99),
+                'max_ms': float(latencies.max())}
+
+    def close(self):
+        self._log.close()
+
+
+def _format_latency(stats: dict) -> str:
+    if not stats:
+        return 'no bars yet'
+    return (f"p50 {stats['p50_ms']:.3f} ms, p90 {stats['p90_ms']:.3f} ms, "
+            f"p99 {stats['p99_ms']:.3f} ms, max {stats['max_ms']:.3f} ms")
+
+@traced('M6 live daemon', cat='stage')
+def run_live_daemon(source: str, symbols: list = None, warm_up: bool = True, report_every: int = 1000,
+                    max_bars: int = None, fsync: bool = False, **source_options) -> dict:
+    """
+    Runs the live signal daemon until the stream ends, max_bars bars were
+    processed, or it is interrupted (Ctrl+C).
+
+    Args:
+        source (str): A bar stream spec for utils.bar_stream.open_bar_stream(),
+            e.g. 'replay:AAPL,NVDA', 'tail:feed.jsonl', 'pipe:/tmp/bars', 'tcp:9009'.
+        symbols (list, optional): Symbols to watch. Defaults to every symbol
+            with best strategies in the current version.
+        warm_up (bool): Prime indicators with recent database bars first.
+            Turn off when replaying history from its beginning.
+        report_every (int): Print progress and latency every N bars.
+        max_bars (int, optional): Stop after this many processed bars.
+        fsync (bool): fsync the decision log after every write.
+        **source_options: Passed to the bar stream (e.g. start_date, delay).
+
+    Returns:
+        dict: Run summary (bars, ignored, decisions, latency, log paths),
+              or None if there is nothing to watch.
+    """
+    current_version = version_manager.get_current_version()
+    if not current_version:
+        print("WARNING: No current version found. Please run M1-M5 workflow first.")
+        return None
+    strategy_index = index_best_strategies(current_version)
+    strategies_by_symbol = resolve_strategies(symbols or sorted(strategy_index), strategy_index)
+    if not strategies_by_symbol:
+        print("M6 Live - No best strategies to watch.")
+        return None
+
+    output_dir = version_manager.get_version_path(current_version, "trading_signal")
+    log_path = os.path.join(output_dir, f"M6_live_decisions_{datetime.now().strftime('%Y%m%d')}.jsonl")
+    engine = LiveSignalEngine(strategies_by_symbol, log_path, fsync=fsync)
+    if warm_up:
+        engine.warm_up()
+
+    n_strategies = sum(len(s) for s in strategies_by_symbol.values())
+    print(f"M6 Live - Watching {len(strategies_by_symbol)} symbols / {n_strategies} strategies on '{source}'.")
+    print(f"INFO: Decisions are appended to {log_path}")
+    started = time.perf_counter()
+    last_report = 0
+    try:
+        for bar in open_bar_stream(source, **source_options):
+            for d in engine.on_bar(bar):
+                print(f"  -> {d['date']} {d['symbol']} {d['strategy_type']} {d['param_id']}: "
+                      f"{d['prev_signal']} -> {d['signal']} @ {d['price']}")
+            if report_every and engine.bars - last_report >= report_every:
+                last_report = engine.bars
+                print(f"INFO: {engine.bars} bars, {engine.decisions} decisions; latency {_format_latency(engine.latency_percentiles())}")
+            if max_bars and engine.bars >= max_bars:
+                break
+    except KeyboardInterrupt:
+        print("\nINFO: Stopping live daemon...")
+    finally:
+        engine.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        'version_id': current_version,
+        'source': source,
+        'bars': engine.bars,
+        'ignored': engine.ignored,
+        'decisions': engine.decisions,
+        'elapsed_s': elapsed,
+        'latency': engine.latency_percentiles(),
+        'log_path': log_path,
+    }
+    latency_path = os.path.splitext(log_path)[0] + '_latency.json'
+    with open(latency_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    summary['latency_path'] = latency_path
+    if os.path.exists(log_path):
+        source_files = {s['source_file'] for strategies in strategies_by_symbol.values() for s in strategies}
+        version_manager.register_artifact(log_path, 'live_decisions', version_id=current_version,
+                                          parents=sorted(p for p in source_files if p), source=source)
+
+    print(f"\nSUCCESS: M6 Live processed {engine.bars} bars ({engine.ignored} ignored) in {elapsed:.2f}s, "
+          f"{engine.decisions} decisions logged.")
+    print(f"Latency: {_format_latency(summary['latency'])}")
+    print(f"📂 版本目錄: {current_version}")
+    return summary
+
+def main():
+    print("【M6 即時訊號常駐程式】")
+    print("訊號來源：1. 重播 data_csv（預設）  2. 追蹤檔案  3. 具名管道  4. 本機 TCP 連接埠")
+    choice = input("請選擇訊號來源：").strip()
+    symbols_input = input("請輸入要監看的股票代碼，用逗號分隔（直接 Enter 監看所有有最佳策略的股票）：").strip()
+    symbols = [s.strip().upper() for s in symbols_input.split(',') if s.strip()] or None
+
+    options = {}
+    if choice == '2':
+        source = f"tail:{input('請輸入檔案路徑：').strip()}"
+    elif choice == '3':
+        source = f"pipe:{input('請輸入具名管道路徑（例如 /tmp/m6_bars）：').strip()}"
+    elif choice == '4':
+        source = f"tcp:{input('請輸入連接埠（預設 9009）：').strip() or '9009'}"
+    else:
+        source = f"replay:{','.join(symbols or [])}"
+        start_date = input("重播起始日期（YYYY-MM-DD，直接 Enter 從頭開始）：").strip()
+        if start_date:
+            options['start_date'] = start_date
+    # 重播歷史時從頭累積指標，其餘來源先以資料庫最近的 K 棒暖機
+    warm_up = not source.startswith('replay')
+    run_live_daemon(source, symbols, warm_up=warm_up, **options)
+
+if __name__ == '__main__':
+    main()
@@ -8,67 +8,103 @@ trade decision file.
 """
 import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from utils.param_loader import load_param
-from utils.db_loader import get_recent_price_series
-from utils.strategy_runner import apply_strategy
+from utils.param_loader import load_param, load_best_strategy_table
+from utils.db_loader import get_recent_price_panel
+from utils.strategy_runner import apply_strategies_batch, required_lookback
+from utils.tracing import span, traced, tracer
 from utils.version_manager import version_manager
 
-def find_best_strategies_for_symbol(symbol: str) -> list:
+def index_best_strategies(version_id: str) -> dict:
     """
-    Finds all best strategies for a given symbol by scanning the 'best' strategies directory.
+    Indexes the M5 'final_strategies' artifacts of a version by symbol in a
+    single pass over the artifact catalog.
 
-    It looks for files matching the pattern 'best_strategies_*_{symbol}_*' inside
-    the versioned 'strategies/out_sample/best/' directory.
+    Args:
+        version_id (str): The version whose best strategies are indexed.
+
+    Returns:
+        dict: {symbol: {strategy_type: [path, ...]}} with every file of the
+              version, oldest first (the same set of files the former
+              directory scan read).
+    """
+    index = {}
+    for record in reversed(version_manager.find_artifacts('final_strategies', version_id)):
+        if record['symbol'] and record['strategy']:
+            index.setdefault(record['symbol'], {}).setdefault(record['strategy'], []).append(record['path'])
+    return index
+
+def index_best_strategy_files(paths: list) -> dict:
+    """
+    Indexes explicitly given best-strategy files (e.g. the M5 outputs a
+    pipeline passes downstream) in the same form as index_best_strategies().
+    The symbol and strategy type come from each file's catalog record.
+
+    Args:
+        paths (list): Paths of M5 best-strategy files.
+
+    Returns:
+        dict: {symbol: {strategy_type: [path, ...]}}.
+    """
+    index = {}
+    for path in paths:
+        symbol, strategy_type = version_manager.artifact_symbol_strategy(path)
+        if symbol and strategy_type:
+            index.setdefault(symbol, {}).setdefault(strategy_type, []).append(path)
+        else:
+            print(f"WARNING: Could not identify symbol/strategy of {path}. Skipping.")
+    return index
+
+def find_best_strategies_for_symbol(symbol: str, strategy_index: dict = None) -> list:
+    """
+    Finds all best strategies for a given symbol through the artifact catalog.
+
+    Every M5 'final_strategies' artifact of the current version registered
+    for this symbol is read; no directory scan or filename parsing is
+    involved. A parameter listed in several files is used once. Best-strategy
+    tables are read through the process-wide cache in utils.param_loader.
 
     Args:
         symbol (str): The stock symbol (e.g., 'AAPL').
+        strategy_index (dict, optional): A prebuilt index from
+            index_best_strategies(); built on demand when omitted.
 
     Returns:
         list: A list of dictionaries, where each dictionary represents a
               best strategy with keys like 'strategy_type', 'param_id', etc.
+              Each dictionary also carries 'source_file' for lineage.
               Returns an empty list if no strategy files are found.
     """
     print(f"INFO: Finding best strategies for {symbol}...")
     
-    # 使用版本管理器取得當前版本的最佳策略目錄
-    current_version = version_manager.get_current_version()
-    if not current_version:
-        print("WARNING: No current version found. Please run M1-M5 workflow first.")
-        return []
+    if strategy_index is None:
+        # 使用版本管理器取得當前版本的最佳策略
+        current_version = version_manager.get_current_version()
+        if not current_version:
+            print("WARNING: No current version found. Please run M1-M5 workflow first.")
+            return []
+        strategy_index = index_best_strategies(current_version)
     
-    best_strategies_dir = version_manager.get_version_path(current_version, "out_sample_best")
     all_strategies = []
-
-    if not os.path.exists(best_strategies_dir):
-        print(f"WARNING: Directory not found: {best_strategies_dir}")
-        return []
-
-    for filename in os.listdir(best_strategies_dir):
-        # Check if filename contains the symbol and starts with 'best_strategies_'
-        if f'_{symbol}_' in filename and filename.startswith('best_strategies_') and filename.endswith('.csv'):
+    seen = set()
+    for strategy_type, paths in strategy_index.get(symbol, {}).items():
+        for path in paths:
+            filename = os.path.basename(path)
             try:
-                # Extract strategy type from filename, e.g., 'RSI' from 'best_strategies_NVDA_RSI_signals_all_params_...'
-                parts = filename.replace('.csv', '').split('_')
-                # Find the strategy type (RSI or CROSS) in the filename
-                strategy_type = None
-                for part in parts:
-                    if part in ['RSI', 'CROSS']:
-                        strategy_type = part
-                        break
-                
-                if not strategy_type:
-                    print(f"WARNING: Could not identify strategy type from filename: {filename}")
-                    continue
-
-                strategy_df = pd.read_csv(os.path.join(best_strategies_dir, filename))
-                
+                strategy_df = load_best_strategy_table(path)
+
                 # As per our discussion, we take ALL strategies from the best list, not just top 1
-                for _, row in strategy_df.iterrows():
-                    strategy_info = row.to_dict()
+                for strategy_info in strategy_df.to_dict('records'):
+                    # One account per parameter: a signal must not be applied twice
+                    key = (strategy_type, strategy_info.get('param_id'))
+                    if key in seen:
+                        continue
+                    seen.add(key)
                     strategy_info['strategy_type'] = strategy_type # Add strategy type for context
+                    strategy_info['source_file'] = path
                     all_strategies.append(strategy_info)
-                
+
                 print(f"  - Loaded {len(strategy_df)} strategies from {filename}")
 
             except Exception as e:
@@ -76,7 +112,74 @@ def find_best_strategies_for_symbol(symbol: str) -> list:
 
     return all_strategies
 
-def generate_trade_signals(symbols: list):
+@traced()
+def resolve_strategies(symbols: list, strategy_index: dict) -> dict:
+    """
+    Resolves the best strategies of each symbol together with their detailed
+    parameters, in the flat form apply_strategies_batch() and the live
+    signal daemon consume.
+
+    Args:
+        symbols (list): Stock symbols to resolve; duplicates are ignored.
+        strategy_index (dict): An index from index_best_strategies().
+
+    Returns:
+        dict: {symbol: [{'symbol', 'strategy_type', 'param_id', 'params',
+              'comment', 'source_file'}, ...]}, leaving out symbols without
+              best strategies.
+    """
+    strategies_by_symbol = {}
+    for symbol in dict.fromkeys(symbols):
+        best_strategies = find_best_strategies_for_symbol(symbol, strategy_index)
+
+        if not best_strategies:
+            print(f"WARNING: No best strategies found for {symbol}. Skipping.")
+            continue
+
+        for strategy_info in best_strategies:
+            strategy_type = strategy_info.get('strategy_type')
+            param_id = strategy_info.get('param_id')
+
+            if not all([strategy_type, param_id]):
+                print(f"WARNING: Incomplete strategy info found. Skipping: {strategy_info}")
+                continue
+
+            strategies_by_symbol.setdefault(symbol, []).append({
+                'symbol': symbol,
+                'strategy_type': strategy_type,
+                'param_id': param_id,
+                'params': load_param(strategy_type, param_id, symbol, 'out_sample'),
+                'comment': strategy_info.get('comment', ''),
+                'source_file': strategy_info.get('source_file'),
+            })
+    return strategies_by_symbol
+
+def _evaluate_symbol_chunk(symbols: list, strategies: list, window: int) -> tuple:
+    """
+    Fetches the price panel for a chunk of symbols and evaluates all of their
+    strategies in one vectorized pass. Runs in a worker process when M6 is
+    given many symbols, so it only takes plain, picklable arguments.
+
+    Returns:
+        tuple: (signals, latest_prices, skipped) where signals align with
+               strategies, latest_prices maps symbol -> last close, and
+               skipped lists symbols with fewer than 2 bars.
+    """
+    with span('evaluate_chunk', symbols=len(symbols), strategies=len(strategies)):
+        panel = get_recent_price_panel(symbols, window=window)
+        n_bars = panel.notna().sum()
+        skipped = [s for s in symbols if n_bars.get(s, 0) < 2]  # Need at least 2 points for some indicators
+        panel = panel.drop(columns=[s for s in skipped if s in panel.columns])
+        kept = [strategy for strategy in strategies if strategy['symbol'] in panel.columns]
+        signals = apply_strategies_batch(panel, kept) if kept else []
+    # Worker processes hand their spans to the tracing process through the spool directory
+    if tracer.is_worker:
+        tracer.spool()
+    return list(signals), panel.iloc[-1].to_dict(), skipped
+
+@traced('M6 signals', cat='stage')
+def generate_trade_signals(symbols: list, n_workers: int = None, chunk_size: int = 200, window: int = 30,
+                           best_files: list = None):
     """
     Generates trading signals for a list of stock symbols and saves them to a file.
 
@@ -84,81 +187,114 @@ def generate_trade_signals(symbols: list):
     validation phase (M5), fetches the latest price data, applies the strategy
     logic, and generates a buy (1), sell (-1), or hold (0) signal.
 
+    Prices are fetched as one aligned panel per chunk of symbols, strategies
+    sharing a type and period are evaluated together, and chunks are spread
+    across a process pool when there is more than one.
+
     The final output is a CSV file containing all trade decisions for the day.
 
     Args:
         symbols (list): A list of stock symbols to process (e.g., ['AAPL', 'TSLA']).
+        n_workers (int, optional): Worker processes for evaluating chunks.
+            Defaults to the CPU count; 1 evaluates in-process.
+        chunk_size (int): Symbols per price query / worker task.
+        window (int): The minimum number of recent bars fetched per symbol;
+            widened to the longest indicator period of the strategies.
+        best_files (list, optional): Best-strategy files to use instead of
+            looking up the current version's M5 artifacts in the catalog.
+
+    Returns:
+        str: The path of the trade decisions file, or None if no decisions
+             were generated.
     """
     today_str = datetime.now().strftime('%Y%m%d')
     all_decisions = []
+    source_files = set()
 
     print("M6 - Generating Simulated Trading Signals...")
 
-    for symbol in symbols:
-        print(f"Processing symbol: {symbol}")
-        best_strategies = find_best_strategies_for_symbol(symbol)
-
-        if not best_strategies:
-            print(f"WARNING: No best strategies found for {symbol}. Skipping.")
-            continue
-
-        # Get recent price data once per symbol
-        price_df = get_recent_price_series(symbol, window=30)
-        if price_df.empty or len(price_df) < 2: # Need at least 2 points for some indicators
-            print(f"WARNING: Insufficient price data for {symbol}. Skipping.")
-            continue
-        
-        latest_price = price_df['close'].iloc[-1]
+    # Index every symbol's best-strategy files once instead of once per symbol
+    current_version = version_manager.get_current_version()
+    if not current_version:
+        print("WARNING: No current version found. Please run M1-M5 workflow first.")
+        return None
+    if best_files is not None:
+        strategy_index = index_best_strategy_files(best_files)
+    else:
+        strategy_index = index_best_strategies(current_version)
 
-        for strategy_info in best_strategies:
-            strategy_type = strategy_info.get('strategy_type')
-            param_id = strategy_info.get('param_id')
+    # Resolve strategies and their parameters in this process (the param caches live here)
+    strategies_by_symbol = resolve_strategies(symbols, strategy_index)
 
-            if not all([strategy_type, param_id]):
-                print(f"WARNING: Incomplete strategy info found. Skipping: {strategy_info}")
-                continue
+    # Fetch enough bars for the longest indicator period, or it could never signal
+    all_strategies = [s for strategies in strategies_by_symbol.values() for s in strategies]
+    window = max(window, required_lookback(all_strategies))
 
-            # Load the detailed parameters for the strategy
-            params = load_param(strategy_type, param_id, symbol, 'out_sample')
+    chunks = []
+    pending = list(strategies_by_symbol)
+    for start in range(0, len(pending), chunk_size):
+        chunk_symbols = pending[start:start + chunk_size]
+        chunks.append((chunk_symbols, [s for symbol in chunk_symbols for s in strategies_by_symbol[symbol]]))
 
-            # Apply the strategy to get a signal
-            signal = apply_strategy(strategy_type, price_df, params)
+    n_workers = min(n_workers or os.cpu_count() or 1, len(chunks))
+    print(f"INFO: Evaluating {sum(len(c[1]) for c in chunks)} strategies for {len(pending)} symbols "
+          f"in {len(chunks)} chunk(s) with {max(n_workers, 1)} worker(s)...")
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_evaluate_symbol_chunk, *zip(*chunks), [window] * len(chunks)))
+    else:
+        results = [_evaluate_symbol_chunk(chunk_symbols, chunk_strategies, window)
+                   for chunk_symbols, chunk_strategies in chunks]
 
-            decision = {
-                'date': datetime.now().strftime('%Y-%m-%d'),
-                'symbol': symbol,
-                'strategy_type': strategy_type,
-                'param_id': param_id,
-                'signal': signal,
-                'price': latest_price,
-                'comment': strategy_info.get('comment', '')
-            }
-            all_decisions.append(decision)
-            print(f"  -> Strategy: {strategy_type}, Param_ID: {param_id}, Signal: {signal}, Price: {latest_price}")
+    decision_date = datetime.now().strftime('%Y-%m-%d')
+    for (chunk_symbols, chunk_strategies), (signals, latest_prices, skipped) in zip(chunks, results):
+        for symbol in skipped:
+            print(f"WARNING: Insufficient price data for {symbol}. Skipping.")
+        signal_iter = iter(signals)
+        for symbol in chunk_symbols:
+            if symbol in skipped:
+                continue
+            counts = {1: 0, -1: 0, 0: 0}
+            for strategy_info in strategies_by_symbol[symbol]:
+                signal = int(next(signal_iter))
+                counts[signal] += 1
+                all_decisions.append({
+                    'date': decision_date,
+                    'symbol': symbol,
+                    'strategy_type': strategy_info['strategy_type'],
+                    'param_id': strategy_info['param_id'],
+                    'signal': signal,
+                    'price': latest_prices[symbol],
+                    'comment': strategy_info['comment']
+                })
+                source_files.add(strategy_info['source_file'])
+            print(f"  -> {symbol}: {sum(counts.values())} strategies, buy {counts[1]}, sell {counts[-1]}, "
+                  f"hold {counts[0]}, Price: {latest_prices[symbol]}")
 
     if not all_decisions:
         print("M6 - No trade decisions were generated today.")
-        return
+        return None
 
     # Save the decisions to a daily file
     output_df = pd.DataFrame(all_decisions)
     
     # 使用版本管理器取得當前版本的訊號目錄
-    current_version = version_manager.get_current_version()
-    if current_version:
-        output_dir = version_manager.get_version_path(current_version, "trading_signal")
-    else:
-        output_dir = 'trading_simulation/signal'
+    output_dir = version_manager.get_version_path(current_version, "trading_signal")
     
     output_path = os.path.join(output_dir, f'M6_trade_decisions_{today_str}.csv')
     
     # 確保目錄存在
     os.makedirs(output_dir, exist_ok=True)
     
-    output_df.to_csv(output_path, index=False)
+    with span('write_csv', cat='io', rows=len(output_df)):
+        output_df.to_csv(output_path, index=False)
+    version_manager.register_artifact(output_path, 'trade_decisions', version_id=current_version,
+                                      start_date=output_df['date'].iloc[0], end_date=output_df['date'].iloc[-1],
+                                      parents=sorted(p for p in source_files if p), rows=len(output_df))
     print(f"\nSUCCESS: M6 process complete. Trade decisions saved to:\n{output_path}")
     if current_version:
         print(f"📂 版本目錄: {current_version}")
+    return output_path
 
 if __name__ == '__main__':
     # Example usage:
@@ -0,0 +1,171 @@
+"""
+M7 Replay: Multi-Day Historical Paper-Trading Replay
+
+Runs the M6 signal logic and the M7 account updates over a date range in a
+single process. Instead of writing M6_trade_decisions_{date}.csv and
+M7_simulation_result_{date}.csv for every day and finding "yesterday" by
+filename, indicator state (one SymbolSignalState per symbol, as in the live
+daemon) and account state (one AccountBook) stay in memory between days.
+
+Only two files are written: the final account state and an equity-curve
+table with one row per trading day.
+"""
+import os
+import numpy as np
+import pandas as pd
+from utils.account_book import AccountBook
+from utils.db_loader import load_price_panel
+from utils.strategy_runner import required_lookback
+from utils.tracing import span, traced
+from utils.version_manager import version_manager
+from modules.m6_multi_strategy_signal_generator import index_best_strategies, resolve_strategies
+from modules.m6_live_signal_daemon import SymbolSignalState
+from modules.m7_multi_account_simulator import show_account_performance
+
+# Bars fed before the replay starts, matching daily M6's lookback window
+WARMUP_BARS = 30
+
+
+@traced('M7 replay', cat='stage')
+def replay_paper_trading(start_date: str, end_date: str, symbols: list = None, warmup_bars: int = WARMUP_BARS,
+                         per_account: bool = False) -> dict:
+    """
+    Replays daily M6 signals and M7 account updates from start_date to end_date.
+
+    Each trading day, every watched strategy's signal is computed from that
+    day's close (the same rules as M6), and all of the day's signals are
+    applied to the accounts at once at that close. A symbol with no bar on a
+    date produces no decisions that day, and its accounts carry over.
+
+    Args:
+        start_date (str): First trading day to replay (YYYY-MM-DD).
+        end_date (str): Last trading day to replay (YYYY-MM-DD).
+        symbols (list, optional): Symbols to replay. Defaults to every symbol
+            with best strategies in the current version.
+        warmup_bars (int): Minimum bars before start_date fed to the indicators
+            without trading; widened to each symbol's longest indicator period.
+        per_account (bool): Also write each account's daily total_value
+            (a dates × accounts table).
+
+    Returns:
+        dict: {'final_state', 'equity_curve', 'account_equity'} output paths,
+              or None if nothing could be replayed.
+    """
+    print(f"\nM7 Replay - Paper trading from {start_date} to {end_date}...")
+    current_version = version_manager.get_current_version()
+    if not current_version:
+        print("WARNING: No current version found. Please run M1-M5 workflow first.")
+        return None
+    strategy_index = index_best_strategies(current_version)
+    strategies_by_symbol = resolve_strategies(symbols or sorted(strategy_index), strategy_index)
+    if not strategies_by_symbol:
+        print("M7 Replay - No best strategies to replay.")
+        return None
+
+    watched = list(strategies_by_symbol)
+    panel = load_price_panel(watched, '0000-01-01', end_date)
+    panel.index = panel.index.strftime('%Y-%m-%d')
+    history = panel[panel.index < start_date]
+    panel = panel[panel.index >= start_date]
+    if panel.empty:
+        print(f"ERROR: No price data between {start_date} and {end_date}.")
+        return None
+
+    states = {symbol: SymbolSignalState(strategies_by_symbol[symbol]) for symbol in watched}
+    for symbol in watched:
+        lookback = max(warmup_bars, required_lookback(strategies_by_symbol[symbol]))
+        for close in history[symbol].dropna().tail(lookback):
+            states[symbol].update(float(close))
+
+    # One flat row per strategy, so a day's decisions are a gather over these arrays
+    param_ids = [s['param_id'] for symbol in watched for s in strategies_by_symbol[symbol]]
+    account_symbols = np.array([symbol for symbol in watched for _ in strategies_by_symbol[symbol]], dtype=object)
+    bounds = np.cumsum([0] + [len(strategies_by_symbol[symbol]) for symbol in watched])
+    accounts = AccountBook(capacity=len(param_ids))
+    rows = accounts.rows_for(param_ids)
+
+    closes = panel.to_numpy(dtype=float)
+    signals = np.zeros(len(param_ids), dtype=int)
+    prices = np.zeros(len(param_ids))
+    curve = []
+    account_equity = []
+    for day, date in enumerate(panel.index):
+        with span('day', date=date):
+            traded = np.zeros(len(param_ids), dtype=bool)
+            with span('signals', cat='compute'):
+                for k, symbol in enumerate(watched):
+                    close = closes[day, k]
+                    if np.isnan(close):
+                        continue
+                    lo, hi = bounds[k], bounds[k + 1]
+                    signals[lo:hi] = states[symbol].update(close)
+                    prices[lo:hi] = close
+                    traded[lo:hi] = True
+            executed = accounts.apply_signals_at(rows[traded], signals[traded], prices[traded], date,
+                                                 account_symbols[traded])
+            accounts.close_day(rows[traded])
+        curve.append({
+            'date': date,
+            'total_value': accounts.total_value.sum(),
+            'cash': accounts.cash.sum(),
+            'position_value': accounts.position_value.sum(),
+            'n_accounts': len(accounts),
+            'n_invested': int((accounts.position_size > 0).sum()),
+            'buys': executed['buys'],
+            'sells': executed['sells'],
+        })
+        if per_account:
+            account_equity.append(accounts.total_value.copy())
+
+    performance_dir = version_manager.get_version_path(current_version, "trading_performance")
+    os.makedirs(performance_dir, exist_ok=True)
+    first, last = panel.index[0], panel.index[-1]
+    tag = f"{first.replace('-', '')}_{last.replace('-', '')}"
+    final_path = os.path.join(performance_dir, f'M7_replay_final_{tag}.csv')
+    curve_path = os.path.join(performance_dir, f'M7_replay_equity_{tag}.csv')
+    source_files = sorted({s['source_file'] for strategies in strategies_by_symbol.values()
+                           for s in strategies if s['source_file']})
+
+    curve_df = pd.DataFrame(curve)
+    with span('write_csv', cat='io', rows=len(accounts)):
+        accounts.to_frame().to_csv(final_path, index=False)
+        curve_df.to_csv(curve_path, index=False)
+    version_manager.register_artifact(final_path, 'account_snapshot', version_id=current_version,
+                                      start_date=first, end_date=last, parents=source_files,
+                                      rows=len(accounts), replay=True)
+    version_manager.register_artifact(curve_path, 'equity_curve', version_id=current_version,
+                                      start_date=first, end_date=last, parents=[final_path], rows=len(curve_df))
+    result = {'final_state': final_path, 'equity_curve': curve_path, 'account_equity': None}
+    if per_account:
+        account_path = os.path.join(performance_dir, f'M7_replay_account_equity_{tag}.csv')
+        pd.DataFrame(np.vstack(account_equity), index=panel.index, columns=accounts.param_ids) \
+            .rename_axis('date').to_csv(account_path)
+        version_manager.register_artifact(account_path, 'equity_curve', version_id=current_version,
+                                          start_date=first, end_date=last, parents=[final_path],
+                                          rows=len(account_equity), per_account=True)
+        result['account_equity'] = account_path
+
+    start_value, end_value = curve_df['total_value'].iloc[0], curve_df['total_value'].iloc[-1]
+    print(f"\nSUCCESS: M7 Replay complete. {len(panel)} trading days, {len(accounts)} accounts, "
+          f"{curve_df['buys'].sum()} buys / {curve_df['sells'].sum()} sells.")
+    print(f"Total simulated asset value: ${start_value:,.2f} -> ${end_value:,.2f}")
+    print(f"Final state saved to:\n{final_path}")
+    print(f"Equity curve saved to:\n{curve_path}")
+    print(f"📂 版本目錄: {current_version}")
+    show_account_performance(accounts)
+    return result
+
+def main():
+    print("【M7 歷史回放模擬（M6→M7 多日）】")
+    start_date = input("請輸入起始日期（格式：YYYY-MM-DD）：").strip()
+    end_date = input("請輸入結束日期（格式：YYYY-MM-DD）：").strip()
+    if not start_date or not end_date:
+        print("未輸入日期，結束。")
+        return
+    symbols_input = input("請輸入股票代碼，用逗號分隔（直接 Enter 使用所有有最佳策略的股票）：").strip()
+    symbols = [s.strip().upper() for s in symbols_input.split(',') if s.strip()] or None
+    per_account = input("是否輸出每個帳戶的每日權益？(y/n, 預設n)：").strip().lower() == 'y'
+    replay_paper_trading(start_date, end_date, symbols, per_account=per_account)
+
+if __name__ == '__main__':
+    main()
@@ -5,72 +5,88 @@ This module simulates daily performance for multiple trading strategies,
 each with its own virtual account.
 """
 import os
+import re
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from utils import config
+from datetime import datetime
+from utils.account_book import AccountBook
+from utils.account_ledger import AccountLedger
+from utils.db_loader import get_latest_closes
+from utils.tracing import span, traced
 from utils.version_manager import version_manager
 
-def new_account(param_id):
-    """Initializes a new trading account."""
-    return {
-        "param_id": param_id,
-        "cash": config.INITIAL_CAPITAL,
-        "position_size": 0,
-        "position_value": 0.0,
-        "total_value": config.INITIAL_CAPITAL,
-        "last_updated": "N/A"
-    }
-
-def load_accounts_from_snapshot(snapshot_path: str) -> dict:
-    """Loads all accounts from the previous day's snapshot CSV."""
+# Account ledger directory inside the version's performance directory
+LEDGER_DIR = 'account_ledger'
+# Daily snapshot names written by older M7 runs
+_SNAPSHOT_NAME = re.compile(r'M7_simulation_result_(\d{4})(\d{2})(\d{2})\.csv')
+
+def load_accounts_from_snapshot(snapshot_path: str) -> AccountBook:
+    """Loads all accounts from a daily snapshot CSV written by older M7 runs."""
     print(f"INFO: Loading accounts from snapshot: {snapshot_path}")
-    df = pd.read_csv(snapshot_path)
-    # Convert the DataFrame rows into a dictionary of account dicts, keyed by param_id
-    accounts = {row['param_id']: row.to_dict() for _, row in df.iterrows()}
-    return accounts
+    return AccountBook.from_snapshot(snapshot_path)
 
-def update_account(account: dict, trade_signal: dict) -> dict:
+def snapshot_date(record: dict) -> str:
     """
-    Updates an account based on a trade signal.
-    This is the core trading logic for the simulation.
+    The last day an account snapshot covers: its cataloged end_date, or for
+    legacy snapshots (cataloged without dates) the date in the
+    M7_simulation_result_{YYYYMMDD}.csv name. None when neither is known.
     """
-    signal = trade_signal['signal']
-    price = trade_signal['price']
-    
-    # Update position value based on the new price
-    account['position_value'] = account['position_size'] * price
-    account['total_value'] = account['cash'] + account['position_value']
-
-    # --- MVP Trading Logic ---
-    # Signal 1: Buy (if not already holding a position)
-    if signal == 1 and account['position_size'] == 0:
-        shares_to_buy = account['cash'] / price
-        account['position_size'] += shares_to_buy
-        account['cash'] = 0
-        print(f"  - EXECUTE BUY: param_id={account['param_id']}, shares={shares_to_buy:.2f}, price={price}")
-
-    # Signal -1: Sell (if currently holding a position)
-    elif signal == -1 and account['position_size'] > 0:
-        cash_from_sale = account['position_size'] * price
-        account['cash'] += cash_from_sale
-        account['position_size'] = 0
-        print(f"  - EXECUTE SELL: param_id={account['param_id']}, shares={account['position_size']:.2f}, price={price}")
-    
-    # Update total value one last time after trade execution
-    account['position_value'] = account['position_size'] * price
-    account['total_value'] = account['cash'] + account['position_value']
-    
-    return account
+    if record.get('end_date'):
+        return record['end_date']
+    match = _SNAPSHOT_NAME.fullmatch(os.path.basename(record['path']))
+    return '-'.join(match.groups()) if match else None
 
-def simulate_accounts():
+@traced()
+def load_previous_accounts(ledger: AccountLedger, today: str, current_version: str = None) -> tuple:
     """
-    Main function for M7. Loads today's signals, loads yesterday's account
-    states, simulates trades, and saves today's account states.
+    Loads the accounts as they stood before today.
+
+    The ledger's latest_state is used when the ledger ends before today. When
+    today is already in the ledger (a re-run), the state before today is
+    rebuilt from it. An empty ledger falls back to the newest daily snapshot
+    CSV of an earlier day written by older M7 runs, found through the artifact
+    catalog rather than by guessing yesterday's file name.
+
+    Returns:
+        tuple: (AccountBook, rerun) where rerun is True when today is replaced.
+    """
+    last_date = ledger.last_date()
+    if last_date is not None and last_date < today:
+        print(f"INFO: Loading accounts from the ledger (last day {last_date}).")
+        return AccountBook.from_frame(ledger.latest_state()), False
+    if last_date == today:
+        print(f"INFO: {today} is already in the ledger; re-running it from the previous state.")
+        return AccountBook.from_frame(ledger.state_as_of(today, inclusive=False)), True
+
+    if current_version:
+        # Snapshots without a known date are skipped rather than taken as older than today
+        snapshots = [(snapshot_date(record), record['path'])
+                     for record in version_manager.find_artifacts('account_snapshot', current_version)
+                     if not record.get('replay') and record['path'].endswith('.csv')]
+        earlier = [(date, path) for date, path in snapshots if date and date < today]
+        if earlier:
+            return load_accounts_from_snapshot(max(earlier)[1]), False
+    print("INFO: No previous account state found. Starting with fresh accounts.")
+    return AccountBook(), False
+
+@traced('M7 accounts', cat='stage')
+def simulate_accounts(signal_path: str = None):
+    """
+    Main function for M7. Loads today's signals, loads the previous account
+    states, simulates trades, and appends today's account states and fills
+    to the version's account ledger.
+
+    Args:
+        signal_path (str, optional): The M6 trade decisions file to simulate.
+            The trading day is then taken from the file's 'date' column.
+            Defaults to today's decisions file of the current version.
+
+    Returns:
+        str: The path of the ledger partition written, or None if nothing was simulated.
     """
     print("\nM7 - Simulating Daily Multi-Strategy Performance...")
     today_str_ymd = datetime.now().strftime('%Y-%m-%d')
     today_str = datetime.now().strftime('%Y%m%d')
-    yesterday_str = (datetime.now() - timedelta(days=1)).strftime('%Y%m%d')
 
     # 使用版本管理器取得當前版本
     current_version = version_manager.get_current_version()
@@ -83,67 +99,80 @@ def simulate_accounts():
         signal_dir = "trading_simulation/signal"
         performance_dir = "trading_simulation/performance"
     
-    signal_path = os.path.join(signal_dir, f'M6_trade_decisions_{today_str}.csv')
-    snapshot_path_yesterday = os.path.join(performance_dir, f'M7_simulation_result_{yesterday_str}.csv')
-    snapshot_path_today = os.path.join(performance_dir, f'M7_simulation_result_{today_str}.csv')
+    if signal_path is None:
+        signal_path = os.path.join(signal_dir, f'M6_trade_decisions_{today_str}.csv')
+    ledger = AccountLedger(os.path.join(performance_dir, LEDGER_DIR))
 
     # --- Step 1: Load today's trade signals ---
     if not os.path.exists(signal_path):
         print(f"ERROR: M6 signal file not found for today: {signal_path}")
-        return
-    df_signal = pd.read_csv(signal_path)
+        return None
+    with span('read_signals', cat='io'):
+        df_signal = pd.read_csv(signal_path)
+    if len(df_signal):
+        today_str_ymd = str(df_signal['date'].iloc[0])
     print(f"INFO: Loaded {len(df_signal)} trade signals for {today_str_ymd}.")
 
-    # --- Step 2: Load yesterday's accounts ---
-    if os.path.exists(snapshot_path_yesterday):
-        accounts = load_accounts_from_snapshot(snapshot_path_yesterday)
-    else:
-        print("INFO: No snapshot from yesterday found. Starting with fresh accounts.")
-        accounts = {}
+    # --- Step 2: Load the previous accounts ---
+    accounts, rerun = load_previous_accounts(ledger, today_str_ymd, current_version)
 
     # --- Step 3: Update accounts based on signals ---
-    all_param_ids_today = set(df_signal['param_id'].unique())
-    
-    for _, row in df_signal.iterrows():
-        param_id = row['param_id']
-        # Get existing account or create a new one
-        account = accounts.get(param_id, new_account(param_id))
-        # Update account with the trade signal
-        updated_account = update_account(account, row)
-        updated_account['last_updated'] = today_str_ymd
-        accounts[param_id] = updated_account
-
-    # --- Step 4: Carry over accounts that had no signal today ---
-    # This ensures we don't lose track of strategies that were simply holding.
-    existing_param_ids = set(accounts.keys())
-    unseen_ids = existing_param_ids - all_param_ids_today
-    if unseen_ids:
-        print(f"INFO: {len(unseen_ids)} accounts had no signal today. Carrying them over.")
-        # We just need to update their total value with the latest price,
-        # but for MVP, we will just carry them as is. A future version
-        # would need to fetch the price for their symbol to update their value.
-
-    # --- Step 5: Save today's snapshot ---
-    if not accounts:
+    # All of today's signals are applied at once as masked array updates
+    rows = accounts.rows_for(df_signal['param_id'].tolist())
+    executed = accounts.apply_signals_at(rows, df_signal['signal'].to_numpy(), df_signal['price'].to_numpy(),
+                                         today_str_ymd, df_signal['symbol'].to_numpy())
+    print(f"  - EXECUTED: {executed['buys']} buys, {executed['sells']} sells")
+
+    # --- Step 4: Mark accounts that had no signal today to market ---
+    # Open positions are revalued at their symbol's latest close up to today, fetched for all symbols in one
+    # query; closes after today are ignored so replaying a past day does not look ahead
+    unseen = np.setdiff1d(np.arange(len(accounts)), rows)
+    if len(unseen):
+        holding = unseen[accounts.position_size[unseen] > 0]
+        latest_closes = get_latest_closes(accounts.symbol[holding].tolist(), as_of=today_str_ymd)
+        revalued = accounts.mark_to_market(latest_closes, holding)
+        stale = len(holding) - len(revalued)
+        print(f"INFO: {len(unseen)} accounts had no signal today; {len(revalued)} open positions marked to market"
+              f"{f', {stale} without a price (carried as is)' if stale else ''}.")
+        # Flat accounts are valued correctly by their cash; stale ones sit out today's performance update
+        valued = np.union1d(rows, np.setdiff1d(unseen, np.setdiff1d(holding, revalued)))
+    else:
+        valued = rows
+    accounts.close_day(valued)
+
+    # --- Step 5: Append today's states and fills to the ledger ---
+    if not len(accounts):
         print("M7 - No accounts were simulated today.")
-        return
-    
-    # 確保目錄存在
-    os.makedirs(performance_dir, exist_ok=True)
-        
-    today_results_df = pd.DataFrame(list(accounts.values()))
-    today_results_df.to_csv(snapshot_path_today, index=False)
+        return None
+
+    partition_path = ledger.append_day(today_str_ymd, accounts.rows_frame(valued),
+                                       accounts.fills_frame(executed['fills'], today_str_ymd), replace=rerun)
+    version_manager.register_artifact(partition_path, 'account_ledger', version_id=current_version,
+                                      end_date=today_str_ymd, parents=[signal_path], rows=len(valued))
     print(f"\nSUCCESS: M7 process complete. {len(accounts)} accounts simulated.")
-    print(f"Today's performance snapshot saved to:\n{snapshot_path_today}")
+    print(f"Today's account states appended to the ledger:\n{partition_path}")
     if current_version:
         print(f"📂 版本目錄: {current_version}")
     
     # Display summary
-    total_asset_value = today_results_df['total_value'].sum()
+    total_asset_value = accounts.total_value.sum()
     print(f"\n--- Simulation Summary ---")
-    print(f"Total simulated strategies: {len(today_results_df)}")
+    print(f"Total simulated strategies: {len(accounts)}")
     print(f"Total simulated asset value: ${total_asset_value:,.2f}")
     print("--------------------------")
+    show_account_performance(accounts)
+    return partition_path
+
+def show_account_performance(accounts: AccountBook, top_n: int = 5, sort_col: str = 'sharpe'):
+    """Prints the live performance of the top N accounts, read from their accumulators."""
+    performance = accounts.performance_frame()
+    if performance.empty:
+        return performance
+    top = performance.sort_values(sort_col, ascending=False, na_position='last').head(top_n)
+    print(f"\n--- Live Account Performance (top {len(top)} by {sort_col}) ---")
+    print(top[['param_id', 'n_days', 'total_return', 'sharpe', 'sortino', 'max_drawdown', 'n_trades']]
+          .to_string(index=False, float_format=lambda v: f'{v:.4f}'))
+    return performance
 
 
 if __name__ == '__main__':
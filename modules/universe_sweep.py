@@ -0,0 +1,112 @@
+"""
+全市場參數掃描模組
+
+同一組 RSI/CROSS 參數網格一次套用到所有股票：價格面板只載入一次，
+指標以 bars × symbols × windows 張量計算，並產出 symbols × params 的績效立方體。
+另外提供「跨股票泛化最佳參數」查詢，取代逐一開啟每支股票的績效檔。
+"""
+import os
+from datetime import datetime
+from utils.db_loader import list_symbols, load_price_panel
+from utils.param_generator import generate_param_combinations
+from utils.file_saver import save_json
+from utils.universe_matrix import universe_performance_cube, cube_to_long, rank_generalizing_params
+from utils.version_manager import version_manager
+
+# 預設參數網格（可擴充）
+DEFAULT_GRIDS = {
+    "RSI": {
+        "rsi_period": list(range(5, 31, 1)),
+        "rsi_upper": list(range(60, 91, 5)),
+        "rsi_lower": list(range(10, 41, 5)),
+    },
+    "CROSS": {
+        "fast_period": list(range(5, 21, 1)),
+        "slow_period": list(range(21, 61, 1)),
+    },
+}
+
+
+def run_universe_sweep(symbols, strategy_type, param_list, start_date, end_date, out_dir=None,
+                       metric='sharpe', agg='median', min_positive_ratio=0.0, top_n=20):
+    """
+    對所有股票執行同一組參數的掃描。
+
+    回傳 dict：
+        cube:           指標名稱 → symbols × params 的 DataFrame
+        generalization: 跨股票泛化排名
+        files:          有指定 out_dir 時輸出的檔案路徑
+    """
+    panel = load_price_panel(symbols, start_date, end_date)
+    print(f"價格面板：{panel.shape[0]} 個交易日 × {panel.shape[1]} 支股票，{len(param_list)} 組參數")
+
+    cube = universe_performance_cube(panel, strategy_type, param_list)
+    ranking = rank_generalizing_params(cube, metric, agg, min_positive_ratio, top_n)
+    result = {'cube': cube, 'generalization': ranking, 'files': {}}
+
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        cube_file = os.path.join(out_dir, f'universe_performance_{strategy_type}_{timestamp}.csv')
+        rank_file = os.path.join(out_dir, f'universe_generalization_{strategy_type}_{timestamp}.csv')
+        cube_to_long(cube).to_csv(cube_file, index=False)
+        ranking.to_csv(rank_file, index=False)
+        result['files'] = {'cube': cube_file, 'generalization': rank_file}
+        print(f'📁 績效立方體存檔於: {cube_file}')
+        print(f'📁 泛化排名存檔於: {rank_file}')
+
+    print(f"✅ 完成 {len(symbols)} 支股票 × {len(param_list)} 組參數")
+    return result
+
+def main():
+    print("【全市場參數掃描模組】")
+
+    current_version = version_manager.get_current_version()
+    if not current_version:
+        print("建立新版本...")
+        current_version = version_manager.create_new_version()
+    print(f"使用版本: {current_version}")
+
+    available = list_symbols()
+    symbol_input = input(f"請輸入股票代碼，用逗號分隔（直接 Enter 使用全部 {len(available)} 支）：").strip().upper()
+    symbols = [s.strip() for s in symbol_input.split(',')] if symbol_input else available
+    missing = [s for s in symbols if s not in available]
+    if missing:
+        print(f"資料庫中沒有以下股票，已略過：{', '.join(missing)}")
+        symbols = [s for s in symbols if s in available]
+    if not symbols:
+        print("沒有可用的股票，結束。")
+        return
+
+    print("請選擇策略類型：")
+    print("1. RSI")
+    print("2. CROSS")
+    strategy_type = "CROSS" if input("> ").strip() == "2" else "RSI"
+
+    param_list, _ = generate_param_combinations(strategy_type, DEFAULT_GRIDS[strategy_type])
+    print(f"參數網格共 {len(param_list)} 組")
+
+    start_date = input('請輸入起始日期（YYYY-MM-DD）：').strip()
+    end_date = input('請輸入結束日期（YYYY-MM-DD）：').strip()
+    metric = input('請輸入泛化排名指標（total_return / max_drawdown / sharpe，預設 sharpe）：').strip() or 'sharpe'
+    if metric not in ('total_return', 'max_drawdown', 'sharpe'):
+        print('欄位錯誤，預設用 sharpe')
+        metric = 'sharpe'
+    top_n = input('請輸入要保留的前N名參數（預設20）：').strip()
+    top_n = int(top_n) if top_n.isdigit() else 20
+
+    # 整個 universe 共用一份參數網格
+    params_dir = version_manager.get_version_path(current_version, "in_sample_params")
+    os.makedirs(params_dir, exist_ok=True)
+    save_json(param_list, os.path.join(params_dir, f'universe_params_{strategy_type}.json'))
+
+    perf_dir = version_manager.get_version_path(current_version, "trading_performance")
+    result = run_universe_sweep(symbols, strategy_type, param_list, start_date, end_date,
+                                out_dir=perf_dir, metric=metric, top_n=top_n)
+
+    print("\n=== 跨股票泛化最佳參數 ===")
+    print(result['generalization'].to_string(index=False))
+    print(f'📂 版本目錄: {current_version}')
+
+if __name__ == '__main__':
+    main()
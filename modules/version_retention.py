@@ -0,0 +1,66 @@
+"""
+版本保留與壓縮模組
+
+列出所有版本與其訊號檔佔用的空間，可釘選/取消釘選版本，
+並依保留政策將過期版本的訊號 CSV 壓縮為 .npz 或直接刪除。
+"""
+import os
+from utils.retention import BULKY_KINDS, apply_retention, format_bytes
+from utils.version_manager import version_manager
+
+
+def _signal_bytes(version_id):
+    """版本中訊號檔（CSV 與壓縮後的 .npz）佔用的位元組數"""
+    return sum(os.path.getsize(r['path']) for kind in BULKY_KINDS
+               for r in version_manager.find_artifacts(kind, version_id))
+
+def show_versions():
+    current = version_manager.get_current_version()
+    versions = version_manager.list_versions()
+    print('版本列表（由舊到新）：')
+    for idx, v in enumerate(versions, 1):
+        flags = []
+        if v['version_id'] == current:
+            flags.append('當前')
+        if v.get('pinned'):
+            flags.append('📌釘選')
+        if v.get('compacted'):
+            flags.append(f"已{'壓縮' if v['compacted']['mode'] == 'compress' else '清除'}訊號")
+        print(f"{idx}. {v['version_id']}  訊號檔 {format_bytes(_signal_bytes(v['version_id']))}"
+              f"{'  [' + ', '.join(flags) + ']' if flags else ''}")
+    return versions
+
+def main():
+    print("【版本保留與壓縮模組】")
+    versions = show_versions()
+    if not versions:
+        print("⚠️ 尚未建立任何版本")
+        return
+
+    action = input('請選擇動作：1. 套用保留政策（預設）  2. 釘選/取消釘選版本：').strip()
+    if action == '2':
+        choice = input('請輸入版本編號：').strip()
+        if not choice.isdigit() or not 1 <= int(choice) <= len(versions):
+            print('輸入錯誤，結束。')
+            return
+        version = versions[int(choice) - 1]
+        version_manager.pin_version(version['version_id'], not version.get('pinned'))
+        return
+
+    keep_last = input('保留最新幾個版本（直接 Enter 不使用此條件）：').strip()
+    keep_last = int(keep_last) if keep_last.isdigit() else None
+    max_age_days = input('保留幾天內建立的版本（直接 Enter 不使用此條件）：').strip()
+    max_age_days = float(max_age_days) if max_age_days.replace('.', '', 1).isdigit() else None
+    if keep_last is None and max_age_days is None:
+        print('未指定保留條件，結束。')
+        return
+
+    mode = 'drop' if input('過期版本的訊號檔：1. 壓縮為 .npz（預設）  2. 直接刪除：').strip() == '2' else 'compress'
+    report = apply_retention(keep_last, max_age_days, mode, dry_run=True)
+    if not report['files']:
+        return
+    if input('確認執行？(y/n, 預設n)：').strip().lower() == 'y':
+        apply_retention(keep_last, max_age_days, mode)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Walk-Forward 最佳化模組
+
+自動建立錨定 (anchored) 或滾動 (rolling) 的樣本內/樣本外切分，
+每個切分在樣本內區間以 M3 相同的規則挑選前 N 名參數，
+再於緊接著的樣本外區間評估，最後串接成每支股票的樣本外淨值曲線。
+
+指標與訊號矩陣由 SignalMatrixCache 對完整價格序列只計算一次，
+所有重疊的視窗都直接切片重用。
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from utils.return_matrix import SignalMatrixCache, param_id_of
+from utils.version_manager import version_manager
+
+
+def generate_walk_forward_splits(n_bars, train_bars, test_bars, step_bars=None, anchored=False):
+    """
+    產生以 bar 索引表示的切分列表 [(train_start, train_end, test_start, test_end), ...]，
+    區間皆為左閉右開。anchored=True 時樣本內起點固定在 0，否則隨 step 滾動。
+    """
+    if train_bars <= 0 or test_bars <= 0:
+        raise ValueError("train_bars 與 test_bars 必須大於 0")
+    step_bars = step_bars or test_bars
+
+    splits = []
+    train_start, train_end = 0, train_bars
+    while train_end + test_bars <= n_bars:
+        splits.append((train_start, train_end, train_end, train_end + test_bars))
+        train_end += step_bars
+        if not anchored:
+            train_start += step_bars
+    return splits
+
+def select_top_params(perf_df, sort_col='sharpe', ascending=False, top_n=10):
+    """與 M3 相同的排序挑選規則（NaN 排在最後）"""
+    return perf_df.sort_values(by=sort_col, ascending=ascending).head(top_n)
+
+def run_walk_forward(symbol, strategy_type, param_list, train_bars=252, test_bars=63,
+                     step_bars=None, anchored=False, sort_col='sharpe', ascending=False,
+                     top_n=10, start_date='1900-01-01', end_date='2999-12-31',
+                     out_dir=None, cache=None):
+    """
+    對單一股票、單一策略執行 walk-forward。
+
+    回傳 dict：
+        splits: 每個切分的區間、入選參數與樣本外績效
+        equity: 串接後的樣本外每日報酬與淨值（入選參數等權重）
+        files:  有指定 out_dir 時輸出的檔案路徑
+    """
+    cache = cache or SignalMatrixCache.from_db(symbol, start_date, end_date)
+    splits = generate_walk_forward_splits(len(cache.close), train_bars, test_bars, step_bars, anchored)
+    if not splits:
+        print(f"⚠️ {symbol} 資料筆數 {len(cache.close)} 不足以建立任何切分")
+        return None
+
+    param_index = {param_id_of(p): i for i, p in enumerate(param_list)}
+    split_rows = []
+    oos_dates, oos_returns = [], []
+    covered_until = 0
+
+    for k, (tr_s, tr_e, te_s, te_e) in enumerate(splits, 1):
+        train_perf = cache.window_performance(strategy_type, param_list, tr_s, tr_e)
+        selected = select_top_params(train_perf, sort_col, ascending, top_n)
+        selected_params = [param_list[param_index[pid]] for pid in selected['param_id']]
+
+        daily_returns, active = cache.window_returns(strategy_type, selected_params, te_s, te_e)
+        portfolio = np.where(active, daily_returns, 0.0).mean(axis=1)
+        nav = np.cumprod(1 + portfolio)
+        peak = np.maximum.accumulate(nav)
+        std = portfolio.std()
+
+        split_rows.append({
+            'split': k,
+            'train_start': cache.dates[tr_s].date(),
+            'train_end': cache.dates[tr_e - 1].date(),
+            'test_start': cache.dates[te_s].date(),
+            'test_end': cache.dates[te_e - 1].date(),
+            'n_selected': len(selected_params),
+            f'train_{sort_col}_mean': selected[sort_col].mean(),
+            'oos_total_return': nav[-1] - 1,
+            'oos_max_drawdown': ((nav - peak) / peak).min(),
+            'oos_sharpe': portfolio.mean() * 252 / (std * np.sqrt(252)) if std > 0 else 0.0,
+            'selected_param_ids': ','.join(selected['param_id']),
+        })
+
+        # 樣本外區間重疊時（step < test），只串接尚未涵蓋的部分
+        keep_from = max(te_s, covered_until) - te_s
+        oos_dates.extend(cache.dates[te_s + keep_from:te_e])
+        oos_returns.extend(portfolio[keep_from:])
+        covered_until = te_e
+
+        print(f"切分 {k}/{len(splits)}: 訓練 {split_rows[-1]['train_start']}~{split_rows[-1]['train_end']}, "
+              f"測試 {split_rows[-1]['test_start']}~{split_rows[-1]['test_end']}, "
+              f"樣本外報酬 {split_rows[-1]['oos_total_return']:.4f}")
+
+    splits_df = pd.DataFrame(split_rows)
+    equity_df = pd.DataFrame({'date': oos_dates, 'daily_return': oos_returns})
+    equity_df['nav'] = (1 + equity_df['daily_return']).cumprod()
+
+    result = {'splits': splits_df, 'equity': equity_df, 'files': {}}
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        prefix = os.path.join(out_dir, f'walk_forward_{symbol}_{strategy_type}_{timestamp}')
+        splits_df.to_csv(f'{prefix}_splits.csv', index=False)
+        equity_df.to_csv(f'{prefix}_equity.csv', index=False)
+        result['files'] = {'splits': f'{prefix}_splits.csv', 'equity': f'{prefix}_equity.csv'}
+        for part, df in (('splits', splits_df), ('equity', equity_df)):
+            version_manager.register_artifact(result['files'][part], 'walk_forward', symbol, strategy_type,
+                                              start_date=str(cache.dates[0])[:10], end_date=str(cache.dates[-1])[:10],
+                                              rows=len(df), part=part)
+        print(f'📁 存檔於: {prefix}_splits.csv / _equity.csv')
+
+    print(f"✅ {symbol} {strategy_type}: {len(splits)} 個切分，樣本外累積報酬 {equity_df['nav'].iloc[-1] - 1:.4f}")
+    return result
+
+def main():
+    print("【Walk-Forward 最佳化模組】")
+
+    current_version = version_manager.get_current_version()
+    if not current_version:
+        print("⚠️ 沒有當前版本，請先執行 M1 建立版本")
+        return
+
+    print(f"使用版本: {current_version}")
+    strategies_dir = version_manager.get_version_path(current_version, "in_sample_params")
+    perf_dir = version_manager.get_version_path(current_version, "trading_performance")
+
+    if not os.path.exists(strategies_dir):
+        print(f"版本目錄不存在: {strategies_dir}")
+        return
+
+    records = version_manager.find_artifacts('param_log', current_version)
+    files = [os.path.basename(r['path']) for r in records]
+    if not files:
+        print(f'{strategies_dir} 目錄下沒有 param_log_*.json 檔案！')
+        return
+
+    print('請選擇要執行 walk-forward 的 param_log 檔案（可輸入多個編號，用逗號分隔）：')
+    for idx, f in enumerate(files, 1):
+        print(f'{idx}. {f}')
+
+    try:
+        choice_indices = [int(x.strip()) - 1 for x in input('請輸入檔案編號：').strip().split(',')]
+        selected_files = [records[i] for i in choice_indices if 0 <= i < len(files)]
+    except Exception:
+        print('輸入錯誤，結束。')
+        return
+    if not selected_files:
+        print('沒有選擇任何有效檔案，結束。')
+        return
+
+    train_bars = input('請輸入樣本內長度（交易日數，預設252）：').strip()
+    train_bars = int(train_bars) if train_bars.isdigit() else 252
+    test_bars = input('請輸入樣本外長度（交易日數，預設63）：').strip()
+    test_bars = int(test_bars) if test_bars.isdigit() else 63
+    step_bars = input(f'請輸入每次前進的交易日數（預設{test_bars}）：').strip()
+    step_bars = int(step_bars) if step_bars.isdigit() else test_bars
+    anchored = input('是否使用錨定 (anchored) 樣本內起點？(y/n, 預設n)：').strip().lower() == 'y'
+    sort_col = input('請輸入排序欄位（如 total_return、sharpe，預設 sharpe）：').strip() or 'sharpe'
+    ascending = sort_col == 'max_drawdown'
+    top_n = input('請輸入每個切分保留的前N名策略（預設10）：').strip()
+    top_n = int(top_n) if top_n.isdigit() else 10
+
+    # 同一支股票的多個策略共用一份價格/指標快取
+    caches = {}
+    for record in selected_files:
+        symbol, strategy_type = record['symbol'], record['strategy']
+        print(f"\n處理策略: {strategy_type}, 股票: {symbol}")
+        with open(record['path'], 'r', encoding='utf-8') as f:
+            param_list = json.load(f)
+        if symbol not in caches:
+            caches[symbol] = SignalMatrixCache.from_db(symbol)
+        run_walk_forward(symbol, strategy_type, param_list, train_bars, test_bars, step_bars,
+                         anchored, sort_col, ascending, top_n, out_dir=perf_dir, cache=caches[symbol])
+
+    print(f'📂 版本目錄: {current_version}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+無人值守管線執行器
+
+依 JSON 設定檔（股票、策略、樣本內/樣本外區間、挑選規則）將
+M0→M1→M2→M3→M4→M5→M6→M7 建成相依圖並執行。不同股票、不同策略的分支
+彼此獨立，會在 max_workers 的核心數預算內平行執行；各階段的產出檔路徑
+直接傳給下游階段，不再以目錄掃描與修改時間排序來尋找。
+每次執行使用自己的版本（不改變全域當前版本），同一台機器上可同時執行多條管線。
+
+用法：
+    python pipeline_runner.py pipeline_spec_example.json
+    python pipeline_runner.py pipeline_spec_example.json --trace trace.json   # 匯出 Chrome trace 與彙總表
+"""
+import os
+import sys
+import json
+import argparse
+from utils.dag_scheduler import ArtifactRef, StageNode, run_dag
+from utils.memory_guard import memory_monitor
+from utils.progress_metrics import metrics
+from utils.tracing import tracer
+from utils.version_manager import version_manager
+
+DEFAULT_SELECTION = {"sort_col": "sharpe", "ascending": False, "top_n": 10}
+
+
+# === 各階段的非互動式包裝（需為模組層級函式，才能交給子行程執行） ===
+
+def stage_m0_download(symbol, start_date, end_date, download_delay=2, date_chunk_size=180):
+    # 延遲載入：只有需要下載時才引入 polygon 客戶端
+    from modules.m0_data_loader import download_stock_data
+    download_stock_data(symbol, start_date, end_date, download_delay, date_chunk_size)
+    return symbol
+
+def stage_m1(symbol, strategy_type, n_params, version_id):
+    from modules.m1_param_generator import run_param_generation
+    return run_param_generation(symbol, strategy_type, n_params, version_id)
+
+def stage_m2_signals(param_log_path, symbol, strategy_type, start_date, end_date, version_id):
+    from modules.m2_signal_generator_batch import run_signal_batch
+    signals_dir = version_manager.get_version_path(version_id, "trading_signal")
+    return run_signal_batch(param_log_path, symbol, strategy_type, start_date, end_date, signals_dir)
+
+def stage_m2_performance(signal_file_path, version_id):
+    from modules.m2_performance_from_signals_batch import run_performance_batch
+    perf_dir = version_manager.get_version_path(version_id, "trading_performance")
+    return run_performance_batch(signal_file_path, perf_dir, version_id)
+
+def _cpcv_filter(cpcv_file, cpcv_rule):
+    if not cpcv_file:
+        return None
+    return {"file": cpcv_file, **(cpcv_rule or {})}
+
+def stage_m3(perf_file_path, symbol, strategy_type, version_id, selection, cpcv_file=None, cpcv_rule=None):
+    from modules.m3_strategy_selector import select_best_strategies, copy_best_param_log
+    strat_dir = version_manager.get_version_path(version_id, "in_sample_best")
+    best_file, df_sorted = select_best_strategies(perf_file_path, strat_dir, **selection,
+                                                  cpcv_filter=_cpcv_filter(cpcv_file, cpcv_rule),
+                                                  version_id=version_id)
+    param_log = copy_best_param_log(df_sorted, symbol, strategy_type, version_id, best_file)
+    if not param_log:
+        return None
+    return {"best_file": best_file, "param_log": param_log}
+
+def stage_m4_signals(param_log_path, symbol, strategy_type, start_date, end_date, version_id):
+    from modules.m4_1_validation_signal_generator import run_validation_signals
+    signals_dir = version_manager.get_version_path(version_id, "trading_signal")
+    return run_validation_signals(param_log_path, symbol, strategy_type, start_date, end_date, signals_dir)
+
+def stage_m4_performance(signal_file_path, version_id):
+    from modules.m4_2_validation_performance import run_validation_performance
+    perf_dir = version_manager.get_version_path(version_id, "trading_performance")
+    return run_validation_performance(signal_file_path, perf_dir, version_id)
+
+def stage_m5(perf_file_path, version_id, selection, cpcv_file=None, cpcv_rule=None):
+    from modules.m5_validation_strategy_selector import select_final_strategies
+    strat_dir = version_manager.get_version_path(version_id, "out_sample_best")
+    return select_final_strategies(perf_file_path, strat_dir, **selection,
+                                   cpcv_filter=_cpcv_filter(cpcv_file, cpcv_rule), version_id=version_id)
+
+def stage_walk_forward(param_log_path, symbol, strategy_type, version_id, options):
+    from modules.walk_forward import run_walk_forward
+    with open(param_log_path, 'r', encoding='utf-8') as f:
+        param_list = json.load(f)
+    out_dir = version_manager.get_version_path(version_id, "trading_performance")
+    result = run_walk_forward(symbol, strategy_type, param_list, out_dir=out_dir, **options)
+    return result["files"] if result else None
+
+def stage_cpcv(param_log_path, symbol, strategy_type, start_date, end_date, version_id, options):
+    from modules.cpcv_validation import run_cpcv
+    with open(param_log_path, 'r', encoding='utf-8') as f:
+        param_list = json.load(f)
+    out_dir = version_manager.get_version_path(version_id, "trading_performance")
+    return run_cpcv(symbol, strategy_type, param_list, start_date, end_date, out_dir=out_dir, **options)[1]
+
+def stage_m6(symbols, best_files, version_id):
+    # M6 只讀取本次管線 M5 產出的最佳策略檔；M5 以 optional 參照傳入，
+    # 失敗或被略過的分支為 None，其餘分支照常產生訊號
+    from modules.m6_multi_strategy_signal_generator import generate_trade_signals
+    with version_manager.run_scope(version_id):
+        return generate_trade_signals(symbols, best_files=[f for f in best_files if f])
+
+def stage_m7(decisions_file, version_id):
+    from modules.m7_multi_account_simulator import simulate_accounts
+    if not decisions_file:
+        print("M6 未產生交易訊號，略過 M7")
+        return None
+    with version_manager.run_scope(version_id):
+        return simulate_accounts(decisions_file)
+
+
+def load_spec(spec_path):
+    """讀取管線設定檔"""
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def build_pipeline(spec, version_id):
+    """依設定檔建立管線的 DAG 節點列表"""
+    symbols = [s.strip().upper() for s in spec["symbols"]]
+    strategies = [s.strip().upper() for s in spec["strategies"]]
+    in_sample = spec["in_sample"]
+    out_sample = spec["out_sample"]
+    selection = spec.get("selection", {})
+    in_rule = {**DEFAULT_SELECTION, **selection.get("in_sample", {})}
+    out_rule = {**DEFAULT_SELECTION, **selection.get("out_sample", {})}
+    download = spec.get("download", {})
+    # CPCV：engine 參數交給 run_cpcv，max_overfit_prob / min_oos_sharpe 交給 M3/M5 過濾
+    cpcv = dict(spec.get("cpcv", {}))
+    cpcv_rule = {k: cpcv.pop(k) for k in ("max_overfit_prob", "min_oos_sharpe") if k in cpcv}
+
+    nodes = []
+    for symbol in symbols:
+        m0_deps = []
+        if download.get("enabled", False):
+            m0 = f"M0:{symbol}"
+            nodes.append(StageNode(m0, stage_m0_download, {
+                "symbol": symbol,
+                "start_date": in_sample["start"],
+                "end_date": out_sample["end"],
+                "download_delay": download.get("download_delay", 2),
+                "date_chunk_size": download.get("date_chunk_size", 180),
+            }))
+            m0_deps = [m0]
+
+        for strategy_type in strategies:
+            key = f"{symbol}:{strategy_type}"
+            nodes.append(StageNode(f"M1:{key}", stage_m1, {
+                "symbol": symbol, "strategy_type": strategy_type,
+                "n_params": spec.get("n_params", 100), "version_id": version_id,
+            }, deps=m0_deps))
+            if "walk_forward" in spec:
+                nodes.append(StageNode(f"WF:{key}", stage_walk_forward, {
+                    "param_log_path": ArtifactRef(f"M1:{key}"),
+                    "symbol": symbol, "strategy_type": strategy_type,
+                    "version_id": version_id, "options": spec["walk_forward"],
+                }))
+            cpcv_ref = None
+            if "cpcv" in spec:
+                nodes.append(StageNode(f"CPCV:{key}", stage_cpcv, {
+                    "param_log_path": ArtifactRef(f"M1:{key}"),
+                    "symbol": symbol, "strategy_type": strategy_type,
+                    "start_date": in_sample["start"], "end_date": in_sample["end"],
+                    "version_id": version_id, "options": cpcv,
+                }))
+                cpcv_ref = ArtifactRef(f"CPCV:{key}")
+            nodes.append(StageNode(f"M2-1:{key}", stage_m2_signals, {
+                "param_log_path": ArtifactRef(f"M1:{key}"),
+                "symbol": symbol, "strategy_type": strategy_type,
+                "start_date": in_sample["start"], "end_date": in_sample["end"],
+                "version_id": version_id,
+            }))
+            nodes.append(StageNode(f"M2-2:{key}", stage_m2_performance, {
+                "signal_file_path": ArtifactRef(f"M2-1:{key}"), "version_id": version_id,
+            }))
+            nodes.append(StageNode(f"M3:{key}", stage_m3, {
+                "perf_file_path": ArtifactRef(f"M2-2:{key}"),
+                "symbol": symbol, "strategy_type": strategy_type,
+                "version_id": version_id, "selection": in_rule,
+                "cpcv_file": cpcv_ref, "cpcv_rule": cpcv_rule,
+            }))
+            nodes.append(StageNode(f"M4-1:{key}", stage_m4_signals, {
+                "param_log_path": ArtifactRef(f"M3:{key}", "param_log"),
+                "symbol": symbol, "strategy_type": strategy_type,
+                "start_date": out_sample["start"], "end_date": out_sample["end"],
+                "version_id": version_id,
+            }))
+            nodes.append(StageNode(f"M4-2:{key}", stage_m4_performance, {
+                "signal_file_path": ArtifactRef(f"M4-1:{key}"), "version_id": version_id,
+            }))
+            nodes.append(StageNode(f"M5:{key}", stage_m5, {
+                "perf_file_path": ArtifactRef(f"M4-2:{key}"),
+                "version_id": version_id, "selection": out_rule,
+                "cpcv_file": cpcv_ref, "cpcv_rule": cpcv_rule,
+            }))
+
+    if spec.get("simulate", False):
+        nodes.append(StageNode("M6", stage_m6, {
+            "symbols": symbols,
+            "best_files": [ArtifactRef(f"M5:{s}:{t}", optional=True) for s in symbols for t in strategies],
+            "version_id": version_id,
+        }))
+        nodes.append(StageNode("M7", stage_m7, {"decisions_file": ArtifactRef("M6"), "version_id": version_id}))
+
+    return nodes
+
+def run_pipeline(spec, trace_path=None):
+    """
+    執行整條管線。spec 可為設定檔路徑或已載入的 dict。
+    trace_path（或設定檔的 "trace"）指定時記錄各階段的追蹤區段並匯出 Chrome trace。
+    回傳各節點的執行報告。
+    """
+    if isinstance(spec, str):
+        spec = load_spec(spec)
+    trace_path = trace_path or spec.get("trace")
+    if trace_path:
+        tracer.enable(trace_path)
+    # 記憶體上限：{"ceiling_mb": 8000, "on_ceiling": "chunk"|"fail", "allocations": false, "reports": false}
+    if spec.get("memory"):
+        memory_monitor.configure(**spec["memory"])
+    # 進度指標：Prometheus textfile 與 JSON 快照的輸出目錄
+    if spec.get("metrics_dir"):
+        metrics.configure(directory=spec["metrics_dir"])
+
+    # 每次管線只使用自己的版本，不改變全域當前版本，多條管線可同時執行；
+    # 設定檔指定 "set_current": true 時才把本次版本設為當前版本
+    version_id = spec.get("version")
+    if version_id:
+        if version_id not in [v["version_id"] for v in version_manager.list_versions()]:
+            raise ValueError(f"版本 {version_id} 不存在")
+    else:
+        version_id = version_manager.create_new_version(f"Pipeline run {spec.get('name', '')}".strip(),
+                                                        make_current=False)
+    if spec.get("set_current", False):
+        version_manager.set_current_version(version_id)
+
+    max_workers = spec.get("max_workers") or os.cpu_count() or 1
+    nodes = build_pipeline(spec, version_id)
+    print(f"=== 管線開始：版本 {version_id}，共 {len(nodes)} 個階段，max_workers={max_workers} ===")
+
+    # 執行期間持有版本租約，保留政策不會清理仍在使用中的版本
+    with version_manager.hold_version(version_id), \
+            tracer.span("pipeline", version=version_id, nodes=len(nodes)):
+        report = run_dag(nodes, max_workers=max_workers)
+
+    done = sum(1 for r in report.values() if r["status"] == "done")
+    failed = [name for name, r in report.items() if r["status"] == "failed"]
+    skipped = [name for name, r in report.items() if r["status"] == "skipped"]
+    print(f"\n=== 管線結束：完成 {done}，失敗 {len(failed)}，略過 {len(skipped)} ===")
+    for name in failed:
+        print(f"  ❌ {name}")
+    print(f"📂 版本目錄: {version_id}")
+    if trace_path:
+        tracer.export(trace_path)
+        tracer.reset()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="QuantaIV 無人值守管線執行器")
+    parser.add_argument("spec", help="管線設定檔（JSON）")
+    parser.add_argument("--trace", default=None, help="匯出 Chrome trace JSON 的路徑（同時寫出 _summary.csv）")
+    args = parser.parse_args()
+    result = run_pipeline(args.spec, args.trace)
+    sys.exit(1 if any(r["status"] != "done" for r in result.values()) else 0)
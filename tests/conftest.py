@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+
+@pytest.fixture
+def sandbox(tmp_path, monkeypatch):
+    """
+    在暫存目錄中執行：工作目錄與版本管理器的專案根目錄都指向 tmp_path，
+    價格資料庫、版本目錄與產出檔都不會碰到真正的專案檔案。
+    """
+    from utils.version_manager import PROJECT_ROOT_ENV, version_manager
+    monkeypatch.setenv(PROJECT_ROOT_ENV, str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    previous_root = version_manager.project_root
+    version_manager.__init__(str(tmp_path))
+    try:
+        yield tmp_path
+    finally:
+        version_manager.__init__(previous_root)
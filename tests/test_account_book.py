@@ -0,0 +1,112 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from utils import config
+from utils.account_book import ACCOUNT_COLUMNS, AccountBook
+
+
+def update_account(account, signal, price):
+    """M7 原本逐列套用訊號的規則，作為向量化版本的對照"""
+    account['position_value'] = account['position_size'] * price
+    account['total_value'] = account['cash'] + account['position_value']
+    if signal == 1 and account['position_size'] == 0:
+        account['position_size'] = account['cash'] / price
+        account['cash'] = 0.0
+    elif signal == -1 and account['position_size'] > 0:
+        account['cash'] += account['position_size'] * price
+        account['position_size'] = 0.0
+    account['position_value'] = account['position_size'] * price
+    account['total_value'] = account['cash'] + account['position_value']
+
+
+def test_apply_signals_matches_the_per_row_loop():
+    rng = np.random.default_rng(11)
+    ids = [f'P{i}' for i in range(8)]
+    book, expected = AccountBook(capacity=2), {}
+    days = [
+        # 同一天先買後賣、先賣後買，以及同一 param_id 連續出現三次
+        (['P0', 'P0', 'P1', 'P1', 'P2', 'P2', 'P2'], [1, -1, -1, 1, 1, 1, -1]),
+    ]
+    for _ in range(20):
+        n = int(rng.integers(1, 15))
+        days.append((list(rng.choice(ids, n)), list(rng.choice([-1, 0, 1], n))))
+
+    for day, (param_ids, signals) in enumerate(days):
+        prices = rng.uniform(5, 15, len(param_ids))
+        date = f'2025-01-{day + 1:02d}'
+        executed = book.apply_signals(param_ids, signals, prices, date)
+        trades = 0
+        for param_id, signal, price in zip(param_ids, signals, prices):
+            account = expected.setdefault(param_id, {'cash': config.INITIAL_CAPITAL, 'position_size': 0.0})
+            before = account['position_size']
+            update_account(account, signal, price)
+            account['last_updated'] = date
+            trades += (before == 0) != (account['position_size'] == 0)
+        assert executed['buys'] + executed['sells'] == trades
+
+        assert book.param_ids == list(expected)
+        for field in ('cash', 'position_size', 'position_value', 'total_value'):
+            np.testing.assert_allclose(getattr(book, field), [expected[p][field] for p in book.param_ids])
+        assert list(book.last_updated) == [expected[p]['last_updated'] for p in book.param_ids]
+
+    # 第一天：P0 買進後賣出、P1 先賣（空手不動作）再買進、P2 買進、重複買進不動作、再賣出
+    first = AccountBook()
+    executed = first.apply_signals(*days[0], np.full(7, 10.0), '2025-01-01')
+    assert (executed['buys'], executed['sells']) == (3, 2)
+    fills = first.fills_frame(executed['fills'], '2025-01-01')
+    assert list(zip(fills['param_id'], fills['side'])) == [('P0', 'BUY'), ('P2', 'BUY'), ('P1', 'BUY'),
+                                                           ('P0', 'SELL'), ('P2', 'SELL')]
+
+
+def test_performance_frame_matches_the_direct_calculation():
+    prices = np.array([10.0, 10.5, 10.2, 11.0, 9.8, 10.4, 10.9])
+    book = AccountBook()
+    book.apply_signals(['A', 'FLAT'], [1, 0], [prices[0], prices[0]], 'd0')
+    book.close_day(np.arange(len(book)))
+    for day, price in enumerate(prices[1:], 1):
+        book.apply_signals(['A', 'FLAT'], [-1 if day == 5 else 0, 0], [price, price], f'd{day}')
+        book.close_day(np.arange(len(book)))
+
+    # 第一天收盤的報酬以初始資金為基準
+    values = pd.Series(np.r_[config.INITIAL_CAPITAL, config.INITIAL_CAPITAL,
+                             config.INITIAL_CAPITAL / prices[0] * prices[1:6],
+                             np.full(1, config.INITIAL_CAPITAL / prices[0] * prices[5])])
+    returns = values.pct_change().dropna()
+    perf = book.performance_frame().set_index('param_id')
+    assert perf.loc['A', 'n_days'] == len(returns)
+    assert perf.loc['A', 'sharpe'] == pytest.approx(returns.mean() * 252 / (returns.std(ddof=0) * np.sqrt(252)))
+    assert perf.loc['A', 'max_drawdown'] == pytest.approx((values / values.cummax() - 1).min())
+    assert perf.loc['A', 'total_return'] == pytest.approx(values.iloc[-1] / config.INITIAL_CAPITAL - 1)
+    assert (perf.loc['A', 'n_buys'], perf.loc['A', 'n_sells']) == (1, 1)
+    # 從未交易的帳戶報酬恆為 0
+    assert perf.loc['FLAT', 'sharpe'] == 0.0 and perf.loc['FLAT', 'max_drawdown'] == 0.0
+
+
+def test_from_frame_starts_accumulators_for_legacy_snapshots():
+    legacy = pd.DataFrame({
+        'param_id': ['A', 'B', 'A'],
+        'cash': [0.0, 500.0, 0.0],
+        'position_size': [10.0, 0.0, 20.0],
+        'position_value': [100.0, 0.0, 240.0],
+        'total_value': [100.0, 500.0, 240.0],
+        'last_updated': ['2025-01-01', '2025-01-01', '2025-01-02'],
+    })
+    book = AccountBook.from_frame(legacy)
+    # 重複的 param_id 保留最後一列；沒有 symbol 與累積量欄位時以新帳戶的值起算，
+    # 高點與前一日收盤都是快照的 total_value
+    assert book.param_ids == ['B', 'A']
+    np.testing.assert_array_equal(book.position_size, [0.0, 20.0])
+    np.testing.assert_array_equal(book.peak_value, [500.0, 240.0])
+    np.testing.assert_array_equal(book.close_value, [500.0, 240.0])
+    np.testing.assert_array_equal(book.n_days, [0, 0])
+    assert list(book.symbol) == ['', '']
+
+    book.apply_signals(['A'], [0], [13.2], '2025-01-03')
+    book.close_day(np.arange(len(book)))
+    perf = book.performance_frame().set_index('param_id')
+    # 第一天的報酬以快照的 total_value 為基準
+    assert perf.loc['A', 'mean_daily_return'] == pytest.approx(264.0 / 240.0 - 1)
+    assert perf.loc['B', 'mean_daily_return'] == 0.0
+    assert list(book.to_frame().columns[:len(ACCOUNT_COLUMNS)]) == ACCOUNT_COLUMNS
@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+import utils.account_ledger as account_ledger
+from utils.account_ledger import AccountLedger
+
+
+def _states(values):
+    return pd.DataFrame({'param_id': list(values), 'total_value': list(values.values())})
+
+
+def test_rerun_rebuilds_latest_state(tmp_path):
+    ledger = AccountLedger(str(tmp_path))
+    ledger.append_day('2025-01-30', _states({'A': 1.0, 'B': 2.0}))
+    ledger.append_day('2025-02-03', _states({'A': 3.0, 'C': 4.0}))
+    # 重跑同一天時 C 不再出現，B 取 1 月的狀態、A 取重跑的結果
+    ledger.append_day('2025-02-03', _states({'A': 5.0}), replace=True)
+    latest = ledger.latest_state().set_index('param_id')
+    assert latest['total_value'].to_dict() == {'B': 2.0, 'A': 5.0}
+    assert latest.loc['B', 'date'] == '2025-01-30'
+    assert ledger.states_between('2025-02-01', '2025-02-28')['param_id'].tolist() == ['A']
+
+
+def test_partition_and_index_are_written_in_one_transaction(tmp_path, monkeypatch):
+    ledger = AccountLedger(str(tmp_path))
+    ledger.append_day('2025-01-30', _states({'A': 1.0}))
+    insert = account_ledger._insert
+
+    def failing_insert(conn, table, df, replace=False):
+        if table.endswith('latest_state'):
+            raise sqlite3.OperationalError('disk I/O error')
+        insert(conn, table, df, replace)
+
+    monkeypatch.setattr(account_ledger, '_insert', failing_insert)
+    with pytest.raises(sqlite3.OperationalError):
+        ledger.append_day('2025-01-31', _states({'A': 2.0}))
+    # 索引更新失敗時當天的帳戶列也一起回滾
+    assert ledger.last_date() == '2025-01-30'
+    assert ledger.states_between('2025-01-01', '2025-01-31')['date'].tolist() == ['2025-01-30']
+    assert ledger.latest_state()['total_value'].tolist() == [1.0]
+
+    monkeypatch.setattr(account_ledger, '_insert', insert)
+    ledger.append_day('2025-01-31', _states({'A': 2.0}))
+    assert ledger.latest_state()['total_value'].tolist() == [2.0]
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from utils.cpcv import cpcv_masks, masked_sharpe, prompt_cpcv_filter, summarize_cpcv
+from utils.performance_utils import calculate_performance_metrics, positions_from_signals, strategy_returns_matrix
+from utils.version_manager import version_manager
+
+
+def test_masked_sharpe_starts_at_the_first_trade():
+    rng = np.random.default_rng(0)
+    n_bars = 60
+    close = 100 * np.cumprod(1 + rng.normal(0, 0.01, n_bars))
+    signals = np.zeros((n_bars, 2))
+    signals[0, 0] = 1
+    signals[25, 1] = 1
+    signals[40, 1] = -1
+    daily_returns, active = strategy_returns_matrix(close, positions_from_signals(signals))
+    train_masks, test_masks, _ = cpcv_masks(n_bars, n_groups=3, n_test_groups=1, purge=0, embargo=0)
+
+    # 只有一個組合、遮罩涵蓋全部 bar 時，應與 calculate_performance_metrics 相同
+    full = np.ones((1, n_bars), dtype=bool)
+    sharpe = masked_sharpe(daily_returns, full, active)
+    dates = pd.date_range('2024-01-01', periods=n_bars)
+    for j in range(signals.shape[1]):
+        group = pd.DataFrame({'date': dates, 'close': close, 'signal': signals[:, j]})
+        assert sharpe[0, j] == pytest.approx(calculate_performance_metrics(group)['sharpe'])
+
+    # 第二組參數在第一個區塊內尚未進場，該區塊的 Sharpe 無從計算
+    oos = masked_sharpe(daily_returns, test_masks, active)
+    assert np.isnan(oos[0, 1])
+    assert not np.isnan(oos[0, 0])
+
+
+def test_overfit_prob_is_conditioned_on_in_sample_top_half():
+    # 參數 0：樣本內永遠最好、樣本外永遠最差；參數 3：樣本內從未進入前半
+    is_sharpe = np.array([[4.0, 3.0, 2.0, 1.0],
+                          [4.0, 2.0, 3.0, 1.0],
+                          [4.0, 3.0, 2.0, 1.0]])
+    oos_sharpe = np.array([[1.0, 4.0, 3.0, 2.0],
+                           [1.0, 3.0, 4.0, 2.0],
+                           [1.0, 3.0, 2.0, 4.0]])
+    summary = summarize_cpcv(['a', 'b', 'c', 'd'], is_sharpe, oos_sharpe, pbo=1.0).set_index('param_id')
+    assert summary.loc['a', 'overfit_prob'] == 1.0
+    assert summary.loc['a', 'is_top_half_ratio'] == 1.0
+    assert summary.loc['b', 'overfit_prob'] == 0.0
+    assert summary.loc['c', 'overfit_prob'] == 0.0
+    assert np.isnan(summary.loc['d', 'overfit_prob'])
+
+
+def test_prompt_lists_cataloged_cpcv_results(sandbox, monkeypatch):
+    version_id = version_manager.create_new_version('cpcv')
+    perf_dir = version_manager.get_version_path(version_id, 'trading_performance')
+    os.makedirs(perf_dir, exist_ok=True)
+    path = os.path.join(perf_dir, 'cpcv_AAPL_RSI_20240101_000000.csv')
+    pd.DataFrame({'param_id': ['a'], 'overfit_prob': [0.2], 'pbo': [0.1]}).to_csv(path, index=False)
+    version_manager.register_artifact(path, 'cpcv', 'AAPL', 'RSI', version_id)
+    # 未登記的同名檔案不列入
+    pd.DataFrame({'param_id': ['b']}).to_csv(os.path.join(perf_dir, 'cpcv_notes.csv'), index=False)
+
+    answers = iter(['1', '0.3'])
+    monkeypatch.setattr('builtins.input', lambda _: next(answers))
+    assert prompt_cpcv_filter(version_id) == {'file': path, 'max_overfit_prob': 0.3}
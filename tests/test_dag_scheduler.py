@@ -0,0 +1,29 @@
+import pytest
+
+from utils.dag_scheduler import ArtifactRef, StageNode, run_dag
+
+
+def _produce(value):
+    if value is None:
+        raise RuntimeError('上游失敗')
+    return value
+
+def _collect(values):
+    return [v for v in values if v is not None] or None
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_failed_optional_upstream_does_not_skip_downstream(max_workers):
+    nodes = [
+        StageNode('A', _produce, {'value': 'a'}),
+        StageNode('B', _produce, {'value': None}),
+        StageNode('B2', _produce, {'value': ArtifactRef('B')}),
+        StageNode('ALL', _collect, {'values': [ArtifactRef(n, optional=True) for n in ('A', 'B', 'B2')]}),
+        StageNode('STRICT', _collect, {'values': [ArtifactRef('A'), ArtifactRef('B')]}),
+    ]
+    report = run_dag(nodes, max_workers=max_workers)
+    assert report['B']['status'] == 'failed'
+    assert report['B2']['status'] == 'skipped'
+    # 只有必要的參照會連帶略過下游
+    assert report['STRICT']['status'] == 'skipped'
+    assert report['ALL'] == {'status': 'done', 'result': ['a']}
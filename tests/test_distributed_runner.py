@@ -0,0 +1,90 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+import distributed_runner
+from utils.return_matrix import SignalMatrixCache
+from utils.synthetic_data import synthetic_universe, write_price_db
+from utils.version_manager import version_manager
+from utils.work_queue import DONE, FAILED, WorkQueue
+
+SYMBOLS = ['SYN0000', 'SYN0001']
+WINDOW = ('2000-01-01', '2099-12-31')
+
+
+@pytest.fixture
+def job_env(sandbox):
+    """合成價格資料庫、一個版本與各股票的 RSI param log"""
+    write_price_db(synthetic_universe(len(SYMBOLS), 300, seed=7))
+    version_id = version_manager.create_new_version('distributed runner test')
+    params = [{'id': f'RSI_{i:04d}', 'rsi_period': 5 + i, 'rsi_upper': 70, 'rsi_lower': 30} for i in range(10)]
+    params_dir = version_manager.get_version_path(version_id, 'in_sample_params')
+    for symbol in SYMBOLS:
+        with open(os.path.join(params_dir, f'param_log_RSI_{symbol}.json'), 'w', encoding='utf-8') as f:
+            json.dump(params, f)
+    return {'version_id': version_id, 'params': params, 'db_path': str(sandbox / 'queue.db')}
+
+
+def _expected(symbol, params):
+    cache = SignalMatrixCache.from_db(symbol, *WINDOW)
+    return cache.window_performance('RSI', params, 0, len(cache.close))
+
+
+def _assert_matches_single_process(out_files, params):
+    assert len(out_files) == len(SYMBOLS)
+    for symbol in SYMBOLS:
+        out_file = next(f for f in out_files if f'performance_{symbol}_RSI_' in os.path.basename(f))
+        got = pd.read_csv(out_file).sort_values('param_id').reset_index(drop=True)
+        expected = _expected(symbol, params).sort_values('param_id').reset_index(drop=True)
+        pd.testing.assert_frame_equal(got[expected.columns], expected, check_dtype=False)
+
+
+def test_run_local_with_several_workers_matches_single_process(job_env):
+    out_files = distributed_runner.run_local(SYMBOLS, ['RSI'], [WINDOW], n_workers=3, shard_size=3,
+                                             db_path=job_env['db_path'], timeout=120, poll_interval=0.1)
+    _assert_matches_single_process(out_files, job_env['params'])
+
+
+def test_task_of_crashed_worker_is_reclaimed(job_env):
+    db_path = job_env['db_path']
+    job_id = distributed_runner.submit_job(SYMBOLS, ['RSI'], [WINDOW], shard_size=5, db_path=db_path)
+    queue = WorkQueue(db_path)
+    # 模擬 worker 領取任務後當機：租約到期前沒有人回寫結果
+    crashed = queue.claim('crashed-worker', lease_seconds=1.0)
+
+    def spawn_worker():
+        worker = multiprocessing.Process(target=distributed_runner.run_worker, kwargs={
+            'db_path': db_path, 'lease_seconds': 30.0, 'poll_interval': 0.1, 'job_id': job_id})
+        worker.start()
+        return worker
+
+    workers = [spawn_worker() for _ in range(2)]
+    try:
+        status = distributed_runner.wait_for_job(job_id, db_path, poll_interval=0.1, timeout=120,
+                                                 workers=workers, spawn_worker=spawn_worker)
+    finally:
+        for worker in workers:
+            worker.join(timeout=30)
+    assert status[DONE] == 2 * len(SYMBOLS) and status[FAILED] == 0
+    assert all(not w.is_alive() for w in workers)
+    assert any(r['task_id'] == crashed['task_id'] and r['worker_id'] != 'crashed-worker'
+               for r in queue.results(job_id))
+    _assert_matches_single_process(distributed_runner.collect_results(job_id, db_path), job_env['params'])
+
+
+def test_job_ids_are_unique_within_a_second(job_env):
+    db_path = job_env['db_path']
+    ids = {distributed_runner.submit_job(SYMBOLS, ['RSI'], [WINDOW], db_path=db_path) for _ in range(3)}
+    assert len(ids) == 3
+
+
+def test_wait_for_job_times_out_without_workers(job_env):
+    db_path = job_env['db_path']
+    job_id = distributed_runner.submit_job(SYMBOLS, ['RSI'], [WINDOW], db_path=db_path)
+    with pytest.raises(TimeoutError):
+        distributed_runner.wait_for_job(job_id, db_path, poll_interval=0.05, timeout=0.2)
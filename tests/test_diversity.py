@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from utils.diversity import returns_matrix_from_signals, validation_signal_file_for
+from utils.version_manager import version_manager
+
+
+def _touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+    return path
+
+
+def test_signal_file_is_found_through_the_catalog_lineage(sandbox):
+    version_id = version_manager.create_new_version('diversity')
+    signals_dir = version_manager.get_version_path(version_id, 'trading_signal')
+    perf_dir = version_manager.get_version_path(version_id, 'trading_performance')
+    signal_file = _touch(os.path.join(signals_dir, 'validation_RSI_AAPL_20250101.npz'))
+    perf_file = _touch(os.path.join(perf_dir, 'performance_validation_RSI_AAPL_20250101.npz_validation.csv'))
+    version_manager.register_artifact(signal_file, 'validation_signals', 'AAPL', 'RSI', version_id)
+    version_manager.register_artifact(perf_file, 'validation_performance', 'AAPL', 'RSI', version_id,
+                                      parents=[signal_file])
+    assert validation_signal_file_for(perf_file, signals_dir) == signal_file
+
+    # 未登記的舊檔由檔名推回，壓縮後的 .npz 不再多接一個 .csv
+    legacy = os.path.join(perf_dir, 'performance_old_RSI_AAPL.npz_validation.csv')
+    assert validation_signal_file_for(legacy, signals_dir) == os.path.join(signals_dir, 'old_RSI_AAPL.npz')
+    legacy = os.path.join(perf_dir, 'performance_old_RSI_AAPL_validation.csv')
+    assert validation_signal_file_for(legacy, signals_dir) == os.path.join(signals_dir, 'old_RSI_AAPL.csv')
+
+
+def test_param_ids_missing_from_the_signal_file_are_dropped(capsys):
+    dates = pd.date_range('2025-01-01', periods=4).repeat(2)
+    signal_df = pd.DataFrame({'date': dates, 'param_id': ['A', 'B'] * 4,
+                              'signal': [1, 0, 0, 1, 0, 0, -1, 0], 'close': np.repeat([10.0, 11.0, 12.0, 11.0], 2)})
+    param_ids, returns = returns_matrix_from_signals(signal_df, ['B', 'GONE', 'A'])
+    assert param_ids == ['B', 'A']
+    assert returns.shape == (4, 2)
+    assert 'GONE' in capsys.readouterr().out
@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from modules.m6_live_signal_daemon import LiveSignalEngine
+from utils import bar_stream
+from utils.strategy_runner import apply_strategies_batch
+from utils.synthetic_data import synthetic_universe, write_price_db
+
+
+def _strategies(symbol):
+    rsi = [(5, 70, 30), (14, 60, 40), (14, 55, 45)]
+    cross = [(3, 8), (5, 20)]
+    strategies = [{'strategy_type': 'RSI', 'param_id': f'RSI_{i}',
+                   'params': {'rsi_period': p, 'rsi_upper': u, 'rsi_lower': l}} for i, (p, u, l) in enumerate(rsi)]
+    strategies += [{'strategy_type': 'CROSS', 'param_id': f'CROSS_{i}',
+                    'params': {'fast_period': f, 'slow_period': s}} for i, (f, s) in enumerate(cross)]
+    for s in strategies:
+        s.update(symbol=symbol, comment='', source_file=None)
+    return strategies
+
+
+def _engine(tmp_path, symbols):
+    return LiveSignalEngine({s: _strategies(s) for s in symbols}, str(tmp_path / 'decisions.jsonl'))
+
+
+def _read_log(engine):
+    engine.close()
+    with open(engine.log_path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_signals_match_the_batch_runner_and_only_changes_are_logged(tmp_path):
+    bars = synthetic_universe(1, 250, seed=11)['SYN0000']
+    engine = _engine(tmp_path, ['SYN0000'])
+    state = engine.states['SYN0000']
+    logged = []
+    for t, (date, close) in enumerate(zip(bars['date'], bars['close'])):
+        previous = state.signals.copy()
+        decisions = engine.on_bar({'symbol': 'SYN0000', 'date': date, 'close': close})
+        # 與 get_recent_price_panel 一樣在上方以 NaN 補足長度
+        panel = pd.DataFrame({'SYN0000': np.concatenate(([np.nan], bars['close'].iloc[:t + 1]))})
+        expected = apply_strategies_batch(panel, state.strategies)
+        np.testing.assert_array_equal(state.signals, expected)
+        changed = [state.strategies[i]['param_id'] for i in np.nonzero(expected != previous)[0]]
+        assert [d['param_id'] for d in decisions] == changed
+        logged += decisions
+    assert engine.bars == len(bars) and engine.decisions == len(logged) > 0
+    assert _read_log(engine) == logged
+
+
+def test_duplicate_stale_and_unwatched_bars_are_ignored(tmp_path):
+    engine = _engine(tmp_path, ['AAA'])
+    assert engine.on_bar({'symbol': 'AAA', 'date': '2025-01-02', 'close': 10.0}) == []
+    engine.on_bar({'symbol': 'AAA', 'date': '2025-01-02', 'close': 99.0})
+    engine.on_bar({'symbol': 'AAA', 'date': '2025-01-01', 'close': 99.0})
+    engine.on_bar({'symbol': 'BBB', 'date': '2025-01-03', 'close': 99.0})
+    assert (engine.bars, engine.ignored) == (1, 3)
+    assert engine.states['AAA'].last_close == 10.0
+    engine.on_bar({'symbol': 'AAA', 'date': '2025-01-03', 'close': 11.0})
+    assert (engine.bars, engine.ignored) == (2, 3)
+    engine.close()
+
+
+def test_warm_up_marks_database_bars_as_seen(sandbox):
+    universe = synthetic_universe(2, 60, seed=5)
+    write_price_db(universe)
+    engine = _engine(sandbox, list(universe))
+    engine.warm_up()
+    for symbol, bars in universe.items():
+        state = engine.states[symbol]
+        assert state.last_date == bars['date'].iloc[-1]
+        assert state.last_close == bars['close'].iloc[-1]
+        # 訊號源重送資料庫中已有的最後一根 K 棒時不會重複套用
+        assert engine.on_bar({'symbol': symbol, 'date': bars['date'].iloc[-1], 'close': 1.0}) == []
+        expected = apply_strategies_batch(pd.DataFrame({symbol: bars['close'].to_numpy()}), state.strategies)
+        np.testing.assert_array_equal(state.signals, expected)
+    assert (engine.bars, engine.ignored) == (0, 2)
+    engine.on_bar({'symbol': 'SYN0000', 'date': '2099-01-01', 'close': 1.0})
+    assert engine.bars == 1
+    engine.close()
+
+
+def test_warm_up_without_symbols(sandbox):
+    write_price_db(synthetic_universe(1, 10, seed=5))
+    engine = _engine(sandbox, [])
+    engine.warm_up(window=5)
+    assert engine.states == {}
+    engine.close()
+
+
+def test_pipe_falls_back_to_a_followed_file_without_fifos(tmp_path, monkeypatch):
+    monkeypatch.delattr(bar_stream.os, 'mkfifo', raising=False)
+    path = str(tmp_path / 'bars')
+
+    def writer():
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('AAA,2025-01-02,1,2,0.5,1.5,100\n')
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    bar = next(bar_stream.pipe_bars(path))
+    thread.join()
+    assert (bar['symbol'], bar['date'], bar['close']) == ('AAA', '2025-01-02', 1.5)
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from modules.m6_multi_strategy_signal_generator import find_best_strategies_for_symbol, index_best_strategies
+from utils.version_manager import version_manager
+
+
+def _best_file(version_id, name, param_ids, strategy='RSI'):
+    path = os.path.join(version_manager.get_version_path(version_id, 'out_sample_best'), name)
+    pd.DataFrame({'param_id': param_ids, 'sharpe': [1.0] * len(param_ids)}).to_csv(path, index=False)
+    version_manager.register_artifact(path, 'final_strategies', 'AAPL', strategy, version_id)
+    return path
+
+
+def test_every_final_strategies_file_is_used_once_per_param(sandbox):
+    version_id = version_manager.create_new_version('m6 test')
+    first = _best_file(version_id, 'best_strategies_AAPL_RSI_a.csv', ['RSI_1', 'RSI_2'])
+    second = _best_file(version_id, 'best_strategies_AAPL_RSI_b.csv', ['RSI_2', 'RSI_3'])
+    cross = _best_file(version_id, 'best_strategies_AAPL_CROSS_a.csv', ['CROSS_1'], strategy='CROSS')
+
+    index = index_best_strategies(version_id)
+    assert index == {'AAPL': {'RSI': [first, second], 'CROSS': [cross]}}
+
+    strategies = find_best_strategies_for_symbol('AAPL', index)
+    assert sorted((s['strategy_type'], s['param_id']) for s in strategies) == [
+        ('CROSS', 'CROSS_1'), ('RSI', 'RSI_1'), ('RSI', 'RSI_2'), ('RSI', 'RSI_3')]
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from modules.m7_multi_account_simulator import load_previous_accounts
+from utils.account_ledger import AccountLedger
+from utils.db_loader import get_latest_closes
+from utils.synthetic_data import synthetic_universe, write_price_db
+from utils.version_manager import version_manager
+
+
+def _snapshot(version_id, name, param_id, **dates):
+    path = os.path.join(version_manager.get_version_path(version_id, 'trading_performance'), name)
+    pd.DataFrame({'param_id': [param_id], 'cash': [1.0], 'total_value': [1.0]}).to_csv(path, index=False)
+    version_manager.register_artifact(path, 'account_snapshot', version_id=version_id, **dates)
+    return path
+
+
+def test_legacy_snapshots_are_dated_by_file_name(sandbox):
+    version_id = version_manager.create_new_version('m7 test')
+    _snapshot(version_id, 'M7_simulation_result_20250101.csv', 'OLD')
+    _snapshot(version_id, 'M7_simulation_result_20250102.csv', 'YESTERDAY')
+    _snapshot(version_id, 'M7_simulation_result_20250103.csv', 'TODAY')
+    _snapshot(version_id, 'M7_simulation_result_backup.csv', 'UNDATED')
+    ledger = AccountLedger(str(sandbox / 'ledger'))
+
+    accounts, rerun = load_previous_accounts(ledger, '2025-01-03', version_id)
+    assert list(accounts.param_ids) == ['YESTERDAY'] and not rerun
+    accounts, _ = load_previous_accounts(ledger, '2025-01-01', version_id)
+    assert len(accounts) == 0
+
+
+def test_latest_closes_ignore_bars_after_the_simulated_day(sandbox):
+    universe = synthetic_universe(2, 10, start_date='2025-01-01', freq='D')
+    write_price_db(universe)
+    symbols = list(universe)
+    # 重跑過去某一天時不得使用之後的收盤價
+    closes = get_latest_closes(symbols, as_of='2025-01-05')
+    assert closes.to_dict() == {s: universe[s]['close'].iloc[4] for s in symbols}
+    assert get_latest_closes(symbols).to_dict() == {s: universe[s]['close'].iloc[-1] for s in symbols}
+    assert get_latest_closes(symbols, as_of='2024-12-31').empty
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from utils.memory_guard import (MEMORY_ALLOCATIONS_ENV, MEMORY_CEILING_ENV, MEMORY_REPORTS_ENV,
+                                MemoryMonitor)
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    # configure() 會寫入環境變數；先經 monkeypatch 設定一次，測試結束時才會還原
+    for name in (MEMORY_CEILING_ENV, MEMORY_ALLOCATIONS_ENV, MEMORY_REPORTS_ENV):
+        monkeypatch.setenv(name, '')
+        monkeypatch.delenv(name)
+    return MemoryMonitor(max_records=3)
+
+
+def _reports(path):
+    return sorted(f for f in os.listdir(path) if f.startswith('memory_')) if os.path.isdir(path) else []
+
+
+def test_reports_are_written_only_when_enabled(sandbox, monitor):
+    report_dir = str(sandbox / 'signals')
+    with monitor.stage('M2-1', report_dir=report_dir, symbol='AAPL', strategy='RSI'):
+        pass
+    assert _reports(report_dir) == []
+
+    monitor.configure(ceiling_mb=10 ** 6)
+    with monitor.stage('M2-1', report_dir=report_dir, symbol='AAPL', strategy='RSI'):
+        pass
+    assert len(_reports(report_dir)) == 1
+
+    monitor.configure(ceiling_mb=0, reports=True)
+    assert MemoryMonitor().reports  # 子行程由環境變數沿用
+    with monitor.stage('M2-2', report_dir=report_dir, symbol='AAPL', strategy='RSI'):
+        pass
+    assert len(_reports(report_dir)) == 2
+
+
+def test_records_keep_only_the_latest_stages(monitor):
+    for i in range(10):
+        with monitor.stage(f'stage-{i}'):
+            with monitor.stage(f'child-{i}'):
+                pass
+    assert [r['stage'] for r in monitor.records] == ['stage-7', 'stage-8', 'stage-9']
+    assert [c['stage'] for c in monitor.records[-1]['children']] == ['child-9']
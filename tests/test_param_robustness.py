@@ -0,0 +1,83 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+import json
+import os
+
+from utils.param_robustness import KDTree, add_robustness_for_perf_file
+
+
+def brute_force_knn(points, k):
+    """以座標差計算所有兩兩距離，回傳每個點排序後的 k 個最近鄰距離（不含自己）"""
+    d = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    np.fill_diagonal(d, np.inf)
+    return np.sort(d, axis=1)[:, :k]
+
+
+def assert_matches_brute_force(points, k, leaf_size):
+    indices, distances = KDTree(points, leaf_size=leaf_size).knn_all(k)
+    expected = brute_force_knn(points, k)
+    m = min(k, len(points) - 1)
+    np.testing.assert_array_equal(distances[:, :m], expected[:, :m])
+    # 回傳的索引確實是該距離的點（同距離的點可任選其一），且不含自己、不重複
+    rows = np.arange(len(points))[:, None]
+    recomputed = np.sqrt(((points[indices[:, :m]] - points[rows]) ** 2).sum(axis=2))
+    np.testing.assert_array_equal(recomputed, distances[:, :m])
+    assert not (indices[:, :m] == rows).any()
+    assert all(len(set(row)) == m for row in indices[:, :m].tolist())
+
+
+@pytest.mark.parametrize('trial', range(60))
+def test_knn_all_matches_brute_force_on_random_points(trial):
+    rng = np.random.default_rng(trial)
+    dim = int(rng.integers(1, 4))
+    n = int(rng.integers(2, 1500))
+    points = rng.random((n, dim)) * rng.choice([1.0, 1e3])
+    assert_matches_brute_force(points, int(rng.integers(1, 16)), int(rng.choice([4, 8, 32])))
+
+
+def test_knn_all_one_dimensional_near_ties():
+    # 1-D、大量點、小葉節點：第 k 近的距離與鄰近葉節點的邊界盒距離只差捨入誤差
+    rng = np.random.default_rng(1327)
+    points = np.sort(rng.random(1327) * 4)[:, None]
+    assert_matches_brute_force(points, 10, 4)
+
+
+def test_knn_all_with_ties_on_a_grid():
+    # 整數網格上大量等距的鄰居（正規化後的 RSI 參數常見的情況）
+    grid = np.stack(np.meshgrid(np.arange(12), np.arange(10), np.arange(6)), axis=-1).reshape(-1, 3) / 11.0
+    for k in (1, 6, 8, 26):
+        assert_matches_brute_force(grid, k, 4)
+
+
+def test_knn_all_with_duplicate_points():
+    points = np.repeat(np.random.default_rng(3).random((40, 2)), 3, axis=0)
+    assert_matches_brute_force(points, 5, 4)
+
+
+def test_knn_all_pads_when_fewer_than_k_points():
+    indices, distances = KDTree(np.array([[0.0], [1.0], [3.0]])).knn_all(4)
+    assert indices[0].tolist() == [1, 2, -1, -1]
+    assert distances[0, :2].tolist() == [1.0, 3.0] and np.isinf(distances[0, 2:]).all()
+
+
+def test_robustness_uses_the_param_log_the_performance_file_came_from(sandbox):
+    from utils.version_manager import version_manager
+    version_id = version_manager.create_new_version('robustness')
+    params_dir = version_manager.get_version_path(version_id, 'in_sample_params')
+    perf_dir = version_manager.get_version_path(version_id, 'trading_performance')
+    params = [{'id': f'RSI_{i}', 'rsi_period': 5 + i, 'rsi_upper': 70, 'rsi_lower': 30} for i in range(6)]
+    # 檔名不是 param_log_{strategy}_{symbol}.json，只能由產出檔目錄的 parents 找到
+    param_log = os.path.join(params_dir, 'param_log_RSI_AAPL_20250101_000000.json')
+    with open(param_log, 'w', encoding='utf-8') as f:
+        json.dump(params, f)
+    perf_file = os.path.join(perf_dir, 'performance_RSI_AAPL_batch.csv')
+    perf_df = pd.DataFrame({'param_id': [p['id'] for p in params], 'sharpe': np.linspace(-1, 1, len(params))})
+    perf_df.to_csv(perf_file, index=False)
+    version_manager.register_artifact(param_log, 'param_log', 'AAPL', 'RSI', version_id)
+    version_manager.register_artifact(perf_file, 'performance', 'AAPL', 'RSI', version_id, parents=[param_log])
+
+    scored = add_robustness_for_perf_file(perf_df, perf_file, version_id, k=2)
+    assert scored['robust_sharpe'].notna().all()
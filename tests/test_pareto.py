@@ -0,0 +1,61 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from utils.pareto import crowding_distance, non_dominated_mask, pareto_fronts, pareto_select
+
+
+def brute_force_non_dominated(costs):
+    """逐對比較：沒有任何點在所有維度都不差、且至少一維更好"""
+    dominated = [any(np.all(other <= point) and np.any(other < point) for other in costs) for point in costs]
+    return ~np.array(dominated, dtype=bool)
+
+
+@pytest.mark.parametrize('trial', range(30))
+def test_non_dominated_mask_matches_brute_force(trial):
+    rng = np.random.default_rng(trial)
+    n, m = int(rng.integers(1, 120)), int(rng.integers(2, 4))
+    # 整數成本會產生大量重複與同值的點
+    costs = rng.integers(0, 6, (n, m)).astype(float) if trial % 2 else rng.random((n, m))
+    np.testing.assert_array_equal(non_dominated_mask(costs), brute_force_non_dominated(costs))
+
+
+def test_fronts_of_a_known_set():
+    costs = np.array([
+        [1.0, 4.0],  # 第 1 層
+        [2.0, 2.0],  # 第 1 層
+        [4.0, 1.0],  # 第 1 層
+        [2.0, 2.0],  # 與上一個點相同，彼此不支配
+        [3.0, 3.0],  # 被 (2, 2) 支配 → 第 2 層
+        [4.0, 4.0],  # 被 (3, 3) 支配 → 第 3 層
+    ])
+    assert pareto_fronts(costs).tolist() == [1, 1, 1, 1, 2, 3]
+    # 累積點數達到 min_points 即停止，其餘標記為 0
+    assert pareto_fronts(costs, min_points=4).tolist() == [1, 1, 1, 1, 0, 0]
+
+
+def test_crowding_distance():
+    costs = np.array([[0.0, 4.0], [1.0, 3.0], [3.0, 1.0], [4.0, 0.0]])
+    distance = crowding_distance(costs)
+    assert np.isinf(distance[[0, 3]]).all()
+    # 每個指標的相鄰差距除以全距後加總
+    assert distance[1] == pytest.approx((3 - 0) / 4 + (4 - 1) / 4)
+    assert distance[2] == pytest.approx((4 - 1) / 4 + (3 - 0) / 4)
+    assert np.isinf(crowding_distance(costs[:2])).all()
+    # 某個指標全部相同時該指標不貢獻距離
+    flat = np.array([[0.0, 1.0], [1.0, 1.0], [2.0, 1.0]])
+    assert crowding_distance(flat)[1] == pytest.approx(1.0)
+
+
+def test_pareto_select_skips_rows_with_nan_metrics():
+    df = pd.DataFrame({
+        'param_id': ['a', 'b', 'c', 'd', 'e'],
+        'sharpe': [2.0, 1.0, np.nan, 0.5, 3.0],
+        'max_drawdown': [-0.3, -0.1, -0.01, -0.4, np.nan],
+    })
+    selected = pareto_select(df, ['sharpe', 'max_drawdown'], top_n=5)
+    assert selected['param_id'].tolist() == ['a', 'b', 'd']
+    assert selected['pareto_front'].tolist() == [1, 1, 2]
+    with pytest.raises(ValueError):
+        pareto_select(df, ['sharpe', 'n_trades'])
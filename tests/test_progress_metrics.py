@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from utils.progress_metrics import MetricsRegistry, ProgressTracker
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _export_in_child(directory):
+    registry = MetricsRegistry(directory)
+    with ProgressTracker('M2-1 AAPL RSI', total=1, stage='M2-1', registry=registry) as progress:
+        progress.advance()
+
+
+def test_progress_is_labelled_by_stage_not_by_file():
+    registry = MetricsRegistry()
+    for symbol in ('AAPL', 'NVDA', 'MSFT'):
+        with ProgressTracker(f'M2-1 {symbol} RSI', total=2, stage='M2-1', registry=registry) as progress:
+            progress.advance(2, bars=100)
+    text = registry.to_prometheus()
+    assert 'AAPL' not in text
+    assert registry.get('quant_progress_done', stage='M2-1', unit='params') == 2
+    assert registry.get('quant_bars_processed_total', stage='M2-1') == 300
+
+
+def test_prom_file_is_removed_when_a_forked_worker_exits(tmp_path):
+    child = multiprocessing.get_context('fork').Process(target=_export_in_child, args=(str(tmp_path),))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert os.listdir(tmp_path) == [f'quant_metrics_{child.pid}.jsonl']
+
+
+def test_prom_file_is_removed_when_the_process_exits(tmp_path):
+    code = ('from utils.progress_metrics import MetricsRegistry; import os; '
+            f'registry = MetricsRegistry({str(tmp_path)!r}); registry.set("quant_test", 1); '
+            'assert os.path.exists(registry.export())')
+    subprocess.run([sys.executable, '-c', code], cwd=PROJECT_DIR, check=True)
+    files = os.listdir(tmp_path)
+    assert len(files) == 1 and files[0].endswith('.jsonl')
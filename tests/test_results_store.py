@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from utils import results_store
+from utils.param_loader import best_param_log_for, write_best_param_log
+from utils.results_store import ResultsStore
+from utils.version_manager import version_manager
+
+
+def _perf(n):
+    return pd.DataFrame({
+        'param_id': [f'RSI_{i:05d}' for i in range(n)],
+        'total_return': [i / n for i in range(n)],
+        'max_drawdown': [-0.1] * n,
+        'sharpe': [float(i) for i in range(n)],
+    })
+
+
+def test_top_n_accepts_more_param_ids_than_sqlite_variables(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.db'))
+    store.append(_perf(3000), 'v1', 'in_sample', 'AAPL', 'RSI', 'performance_AAPL_RSI_signals_all_params_x.csv')
+    param_ids = [f'RSI_{i:05d}' for i in range(0, 3000, 2)]
+    df = store.top_n('sharpe', top_n=5, version_id='v1', param_ids=param_ids, symbols=['AAPL'] * 1200)
+    assert df['param_id'].tolist() == ['RSI_02998', 'RSI_02996', 'RSI_02994', 'RSI_02992', 'RSI_02990']
+    assert store.top_n('sharpe', version_id='v1', param_ids=[]).empty
+
+
+def test_reappending_a_source_file_replaces_its_rows(tmp_path):
+    store = ResultsStore(str(tmp_path / 'results.db'))
+    source = 'performance_AAPL_RSI_signals_all_params_x.csv'
+    store.append(_perf(10), 'v1', 'in_sample', 'AAPL', 'RSI', source)
+    store.append(_perf(4), 'v1', 'in_sample', 'AAPL', 'RSI', source)
+    assert len(store.top_n('sharpe', top_n=100, version_id='v1')) == 4
+    store.optimize()
+
+
+def test_optimize_skips_a_deleted_database(tmp_path):
+    path = tmp_path / 'results.db'
+    store = ResultsStore(str(path))
+    store.append(_perf(3), 'v1', 'in_sample', 'AAPL', 'RSI', 'performance_AAPL_RSI_signals_all_params_x.csv')
+    path.unlink()
+    store.optimize()
+    assert not path.exists()
+
+
+def _query(monkeypatch, store, answers, version_id, out_dir):
+    monkeypatch.setattr(results_store, '_store', store)
+    answers = iter(answers)
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+    return results_store.prompt_results_query('in_sample', version_id, str(out_dir), str(out_dir))
+
+
+def test_query_writes_the_param_log_of_the_queried_params(sandbox, monkeypatch):
+    version_id = version_manager.create_new_version('query test')
+    params_dir = version_manager.get_version_path(version_id, 'in_sample_params')
+    param_log = os.path.join(params_dir, 'param_log_RSI_AAPL.json')
+    with open(param_log, 'w', encoding='utf-8') as f:
+        json.dump([{'id': f'RSI_{i:05d}', 'rsi_period': i} for i in range(10)], f)
+    version_manager.register_artifact(param_log, 'param_log', 'AAPL', 'RSI', version_id)
+    store = ResultsStore(str(sandbox / 'results.db'))
+    store.append(_perf(10), version_id, 'in_sample', 'AAPL', 'RSI', 'performance_AAPL_RSI_signals_all_params_x.csv')
+    store.append(_perf(10), 'other', 'in_sample', 'MSFT', 'RSI', 'performance_MSFT_RSI_signals_all_params_x.csv')
+    # M3 先前挑出的另一批參數
+    m3_file = str(sandbox / 'best_strategies_AAPL_RSI.csv')
+    write_best_param_log(['RSI_00000'], 'AAPL', 'RSI', version_id, m3_file)
+    out_dir = sandbox / 'best'
+
+    out_files = _query(monkeypatch, store, ['1', '', '', 'sharpe', 'y', '', '3'], version_id, out_dir)
+    assert len(out_files) == 1
+    assert version_manager.get_artifact(out_files[0])['kind'] == 'best_strategies'
+    query_log = best_param_log_for(out_files[0], 'AAPL', 'RSI', version_id)
+    with open(query_log, encoding='utf-8') as f:
+        assert [p['id'] for p in json.load(f)] == ['RSI_00007', 'RSI_00008', 'RSI_00009']
+    # M3 的參數檔沒有被覆寫，M3 的清單仍對應到自己的參數
+    with open(best_param_log_for(m3_file, 'AAPL', 'RSI', version_id), encoding='utf-8') as f:
+        assert [p['id'] for p in json.load(f)] == ['RSI_00000']
+
+    # 跨版本查詢只寫檔，不登記為產出檔
+    out_files = _query(monkeypatch, store, ['2', 'MSFT', '', 'sharpe', 'y', '', '3'], version_id, out_dir)
+    assert len(out_files) == 1
+    assert version_manager.get_artifact(out_files[0]) is None
+    assert list(pd.read_csv(out_files[0]).columns[:2]) == ['version_id', 'param_id']
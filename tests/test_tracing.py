@@ -0,0 +1,87 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from utils.tracing import _NULL_SPAN, TRACE_ENV, TRACE_SPOOL_ENV, Tracer
+
+
+@pytest.fixture
+def local_tracer(tmp_path, monkeypatch):
+    """獨立的 Tracer；enable() 設定的環境變數在測試結束後還原"""
+    monkeypatch.setenv(TRACE_ENV, '')
+    monkeypatch.setenv(TRACE_SPOOL_ENV, '')
+    return Tracer().enable(str(tmp_path / 'trace.json'), spool_dir=str(tmp_path / 'spool'))
+
+
+def test_self_time_excludes_children(local_tracer):
+    with local_tracer.span('outer'):
+        time.sleep(0.01)
+        with local_tracer.span('inner', cat='io') as s:
+            time.sleep(0.02)
+            s.set(rows=3)
+        with local_tracer.span('inner', cat='io'):
+            time.sleep(0.01)
+    events = {(e['name'], e['ts']): e for e in local_tracer.collect()}
+    outer = next(e for (name, _), e in events.items() if name == 'outer')
+    inner = [e for (name, _), e in sorted(events.items()) if name == 'inner']
+    assert [e['depth'] for e in inner] == [1, 1] and outer['depth'] == 0
+    assert inner[0]['args'] == {'rows': 3}
+    # 子區段沒有自己的子區段，自身時間等於總時間；外層的自身時間扣掉兩個子區段
+    assert all(e['self'] == e['dur'] for e in inner)
+    assert outer['self'] == pytest.approx(outer['dur'] - sum(e['dur'] for e in inner), abs=1e-3)
+    assert outer['self'] >= 10_000 * 0.9
+
+    summary = {r['name']: r for r in local_tracer.summary()}
+    assert summary['inner']['count'] == 2
+    assert summary['inner']['total_ms'] == pytest.approx(sum(e['dur'] for e in inner) / 1000)
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    assert tracer.span('x', rows=1) is _NULL_SPAN
+    with tracer.span('x') as s:
+        s.set(rows=2)
+
+    @tracer.traced()
+    def add(a, b):
+        return a + b
+
+    assert add(1, 2) == 3
+    assert tracer.events == [] and tracer.collect() == []
+    assert tracer.export() is None
+
+
+def _work_in_child(tracer):
+    assert tracer.is_worker
+    with tracer.span('child_stage', symbol='AAPL'):
+        pass
+    tracer.spool()
+
+
+def test_spans_of_a_forked_worker_are_merged(local_tracer):
+    with local_tracer.span('before_fork'):
+        pass
+    child = multiprocessing.get_context('fork').Process(target=_work_in_child, args=(local_tracer,))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    with local_tracer.span('after_fork'):
+        pass
+
+    events = local_tracer.collect()
+    # 子行程帶著父行程的事件副本，但只寫出自己的事件，不會重複
+    assert sorted(e['name'] for e in events) == ['after_fork', 'before_fork', 'child_stage']
+    by_name = {e['name']: e for e in events}
+    assert by_name['child_stage']['pid'] == child.pid != by_name['before_fork']['pid']
+    assert by_name['child_stage']['args'] == {'symbol': 'AAPL'}
+
+    path = local_tracer.export(print_summary=False)
+    with open(path, 'r', encoding='utf-8') as f:
+        trace = json.load(f)
+    assert {e['pid'] for e in trace['traceEvents']} == {os.getpid(), child.pid}
+    assert os.path.exists(os.path.splitext(path)[0] + '_summary.csv')
+    local_tracer.reset()
+    assert local_tracer.collect() == []
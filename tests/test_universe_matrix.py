@@ -0,0 +1,43 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from utils.return_matrix import SignalMatrixCache
+from utils.synthetic_data import synthetic_universe
+from utils.universe_matrix import cube_to_long, universe_performance_cube
+
+PARAMS = {
+    'RSI': [{'id': f'RSI_{i}', 'rsi_period': p, 'rsi_upper': u, 'rsi_lower': 100 - u}
+            for i, (p, u) in enumerate([(5, 70), (9, 65), (14, 60)])],
+    'CROSS': [{'id': f'CROSS_{i}', 'fast_period': f, 'slow_period': s}
+              for i, (f, s) in enumerate([(3, 10), (5, 20), (10, 30)])],
+}
+
+
+def _panel():
+    universe = synthetic_universe(2, 300, seed=3)
+    panel = pd.DataFrame({s: df.set_index(pd.to_datetime(df['date']))['close'] for s, df in universe.items()})
+    # 第二支股票較晚上市，面板開頭為 NaN
+    panel.iloc[:60, 1] = np.nan
+    return panel
+
+
+@pytest.mark.parametrize('strategy_type', ['RSI', 'CROSS'])
+def test_cube_matches_per_symbol_performance(strategy_type):
+    panel, params = _panel(), PARAMS[strategy_type]
+    cube = universe_performance_cube(panel, strategy_type, params, chunk_size=2)
+    long_df = cube_to_long(cube)
+    assert list(long_df.columns) == ['symbol', 'param_id', 'total_return', 'max_drawdown', 'sharpe', 'n_trades']
+    assert len(long_df) == panel.shape[1] * len(params)
+
+    long_df = long_df.set_index(['symbol', 'param_id'])
+    for symbol in panel.columns:
+        # 與 M2 對單一股票、完整期間回測的結果相同
+        cache = SignalMatrixCache(panel[symbol].dropna())
+        expected = cache.window_performance(strategy_type, params, 0, len(cache.close)).set_index('param_id')
+        for param_id, row in expected.iterrows():
+            got = long_df.loc[(symbol, param_id)]
+            for col in ('total_return', 'max_drawdown', 'sharpe'):
+                assert got[col] == pytest.approx(row[col], nan_ok=True)
+            assert got['n_trades'] == row['n_trades']
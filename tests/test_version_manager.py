@@ -0,0 +1,123 @@
+import multiprocessing
+import os
+
+from utils.version_manager import version_manager
+
+
+def _write(path, text='x'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def _register_in_child(path, version_id):
+    version_manager.register_artifact(path, 'param_log', 'AAPL', 'RSI', version_id)
+
+
+def test_reregistering_a_path_makes_it_the_latest(sandbox):
+    version_id = version_manager.create_new_version('catalog test')
+    params_dir = version_manager.get_version_path(version_id, 'in_sample_params')
+    first = _write(os.path.join(params_dir, 'param_log_RSI_AAPL.json'))
+    second = _write(os.path.join(params_dir, 'param_log_RSI_AAPL_2.json'))
+    version_manager.register_artifact(first, 'param_log', 'AAPL', 'RSI', version_id)
+    version_manager.register_artifact(second, 'param_log', 'AAPL', 'RSI', version_id)
+    assert version_manager.latest_artifact('param_log', version_id, 'AAPL', 'RSI')['path'] == second
+
+    version_manager.register_artifact(first, 'param_log', 'AAPL', 'RSI', version_id, rows=3)
+    records = version_manager.find_artifacts('param_log', version_id, 'AAPL')
+    assert [r['path'] for r in records] == [first, second]
+    assert records[0]['rows'] == 3
+
+
+def test_registration_in_a_forked_worker_is_visible_to_the_parent(sandbox):
+    # 管線的平行節點在子行程登記產出檔，父行程（與其他 worker）必須查得到
+    version_id = version_manager.create_new_version('fork test', make_current=False)
+    assert version_manager.latest_artifact('param_log', version_id) is None
+    path = _write(os.path.join(version_manager.get_version_path(version_id, 'in_sample_params'),
+                               'param_log_RSI_AAPL.json'))
+    child = multiprocessing.get_context('fork').Process(target=_register_in_child, args=(path, version_id))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert version_manager.latest_artifact('param_log', version_id, 'AAPL', 'RSI')['path'] == path
+
+
+def _hold_in_child(version_id, ready, release):
+    with version_manager.hold_version(version_id):
+        ready.set()
+        release.wait(30)
+
+
+def test_running_and_recent_versions_do_not_expire(sandbox):
+    old, running, other_process = (version_manager.create_new_version(f'v{i}', make_current=False)
+                                   for i in range(3))
+    current = version_manager.create_new_version('current')
+    # 剛建立的版本都在寬限期內
+    assert version_manager.expired_versions(keep_last=0) == []
+
+    ctx = multiprocessing.get_context('fork')
+    ready, release = ctx.Event(), ctx.Event()
+    child = ctx.Process(target=_hold_in_child, args=(other_process, ready, release))
+    child.start()
+    try:
+        assert ready.wait(30)
+        with version_manager.run_scope(running):
+            assert version_manager.active_versions() == {running, other_process}
+            assert version_manager.expired_versions(keep_last=0, grace_hours=0) == [old]
+    finally:
+        release.set()
+        child.join()
+    assert version_manager.active_versions() == set()
+    assert version_manager.expired_versions(keep_last=0, grace_hours=0) == [old, running, other_process]
+    assert current not in version_manager.expired_versions(keep_last=0, grace_hours=0)
+
+
+def test_lease_of_a_killed_process_is_released(sandbox):
+    version_id = version_manager.create_new_version('killed', make_current=False)
+    ctx = multiprocessing.get_context('fork')
+    ready, release = ctx.Event(), ctx.Event()
+    child = ctx.Process(target=_hold_in_child, args=(version_id, ready, release))
+    child.start()
+    assert ready.wait(30)
+    assert version_manager.active_versions() == {version_id}
+    child.kill()
+    child.join()
+    # 當機的行程留下的租約檔不算使用中，並會被清掉
+    assert version_manager.active_versions() == set()
+    assert os.listdir(os.path.join(str(sandbox), '.active_versions')) == []
+
+
+def test_lease_removed_before_it_is_locked_is_recreated(sandbox, monkeypatch):
+    import utils.version_manager as vm
+    version_id = version_manager.create_new_version('race', make_current=False)
+    lock_handle, raced = vm._lock_handle, []
+
+    def lock_after_cleanup(handle, blocking=True):
+        # 模擬另一個行程在租約檔建立後、上鎖前執行保留政策：未上鎖的租約檔被當成過期刪除
+        if blocking and not raced:
+            raced.append(True)
+            assert version_manager.active_versions() == set()
+        return lock_handle(handle, blocking)
+
+    monkeypatch.setattr(vm, '_lock_handle', lock_after_cleanup)
+    with version_manager.hold_version(version_id):
+        assert raced
+        assert version_manager.active_versions() == {version_id}
+    assert version_manager.active_versions() == set()
+
+
+def test_checksum_is_only_computed_on_request(sandbox):
+    version_id = version_manager.create_new_version('checksum')
+    params_dir = version_manager.get_version_path(version_id, 'in_sample_params')
+    plain = _write(os.path.join(params_dir, 'param_log_RSI_AAPL.json'), 'abc')
+    hashed = _write(os.path.join(params_dir, 'param_log_RSI_MSFT.json'), 'abc')
+    assert version_manager.register_artifact(plain, 'param_log', 'AAPL', 'RSI', version_id)['checksum'] is None
+    assert version_manager.register_artifact(hashed, 'param_log', 'MSFT', 'RSI', version_id, checksum=True)['checksum']
+    assert version_manager.verify_artifact(plain) and version_manager.verify_artifact(hashed)
+
+    # 沒有 checksum 時以大小與修改時間判斷
+    _write(plain, 'abcd')
+    _write(hashed, 'xyz')
+    assert not version_manager.verify_artifact(plain)
+    assert not version_manager.verify_artifact(hashed)
@@ -0,0 +1,80 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from modules.walk_forward import generate_walk_forward_splits, run_walk_forward
+from utils.performance_utils import calculate_performance_metrics
+from utils.return_matrix import SignalMatrixCache
+from utils.synthetic_data import synthetic_ohlcv
+
+RSI_PARAMS = [{'id': f'RSI_{i}', 'rsi_period': p, 'rsi_upper': u, 'rsi_lower': 100 - u}
+              for i, (p, u) in enumerate([(5, 70), (9, 65), (14, 70), (21, 60)])]
+CROSS_PARAMS = [{'id': f'CROSS_{i}', 'fast_period': f, 'slow_period': s}
+                for i, (f, s) in enumerate([(3, 10), (5, 20), (10, 30)])]
+
+
+def _cache(n_bars=400, seed=5):
+    bars = synthetic_ohlcv(n_bars, seed=seed)
+    return SignalMatrixCache(bars.set_index(pd.to_datetime(bars['date']))['close'])
+
+
+def _direct_metrics(cache, strategy_type, param, start, end):
+    """以 calculate_performance_metrics 計算同一視窗的績效（M2-2/M4-2 的算法）"""
+    signals = cache.signal_matrix(strategy_type, [param])[start:end, 0]
+    group = pd.DataFrame({'date': cache.dates[start:end], 'close': cache.close[start:end], 'signal': signals})
+    return calculate_performance_metrics(group)
+
+
+@pytest.mark.parametrize('anchored', [False, True])
+@pytest.mark.parametrize('step_bars', [None, 20, 50])
+def test_split_boundaries(anchored, step_bars):
+    n_bars, train_bars, test_bars = 300, 100, 40
+    splits = generate_walk_forward_splits(n_bars, train_bars, test_bars, step_bars, anchored)
+    step = step_bars or test_bars
+    assert len(splits) == (n_bars - train_bars - test_bars) // step + 1
+    for k, (tr_s, tr_e, te_s, te_e) in enumerate(splits):
+        # 樣本外緊接在樣本內之後，兩者不重疊，且不超出資料範圍
+        assert tr_e == te_s and te_e - te_s == test_bars and te_e <= n_bars
+        assert tr_s == (0 if anchored else k * step)
+        assert tr_e == train_bars + k * step
+    if step >= test_bars:
+        # step 不小於 test_bars 時，各切分的樣本外區間互不重疊
+        assert all(prev[3] <= cur[2] for prev, cur in zip(splits, splits[1:]))
+    assert generate_walk_forward_splits(100, 80, 40) == []
+    with pytest.raises(ValueError):
+        generate_walk_forward_splits(100, 0, 10)
+
+
+@pytest.mark.parametrize('strategy_type, params', [('RSI', RSI_PARAMS), ('CROSS', CROSS_PARAMS)])
+def test_window_performance_matches_calculate_performance_metrics(strategy_type, params):
+    cache = _cache()
+    for start, end in [(0, 400), (37, 163), (250, 400)]:
+        perf = cache.window_performance(strategy_type, params, start, end).set_index('param_id')
+        for param in params:
+            expected = _direct_metrics(cache, strategy_type, param, start, end)
+            for col in ('total_return', 'max_drawdown', 'sharpe'):
+                assert perf.loc[param['id'], col] == pytest.approx(expected[col], nan_ok=True)
+            assert perf.loc[param['id'], 'n_trades'] == expected['n_trades']
+
+
+def test_oos_metrics_match_calculate_performance_metrics():
+    cache = _cache()
+    result = run_walk_forward('SYN', 'CROSS', CROSS_PARAMS, train_bars=150, test_bars=50, top_n=1, cache=cache)
+    splits = generate_walk_forward_splits(len(cache.close), 150, 50)
+    assert len(result['splits']) == len(splits)
+    by_id = {p['id']: p for p in CROSS_PARAMS}
+    for row, (tr_s, tr_e, te_s, te_e) in zip(result['splits'].to_dict('records'), splits):
+        # 入選的是樣本內 sharpe 最高的參數
+        train = cache.window_performance('CROSS', CROSS_PARAMS, tr_s, tr_e)
+        assert row['selected_param_ids'] == train.sort_values('sharpe', ascending=False)['param_id'].iloc[0]
+        expected = _direct_metrics(cache, 'CROSS', by_id[row['selected_param_ids']], te_s, te_e)
+        assert row['oos_total_return'] == pytest.approx(expected['total_return'])
+        assert row['oos_max_drawdown'] == pytest.approx(expected['max_drawdown'])
+        assert row['oos_sharpe'] == pytest.approx(expected['sharpe'])
+
+    # 串接的樣本外淨值涵蓋每個測試區間一次
+    equity = result['equity']
+    assert len(equity) == sum(te_e - te_s for _, _, te_s, te_e in splits)
+    assert equity['date'].is_monotonic_increasing and equity['date'].is_unique
+    assert equity['nav'].iloc[-1] == pytest.approx(np.prod(1 + result['splits']['oos_total_return']))
@@ -0,0 +1,46 @@
+import time
+
+from utils.work_queue import DONE, FAILED, PENDING, RUNNING, WorkQueue
+
+
+def _queue(tmp_path, n_tasks=3, max_attempts=3):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.enqueue('job', 'sweep', [{'shard': i} for i in range(n_tasks)], max_attempts)
+    return queue
+
+
+def test_claim_complete_and_results(tmp_path):
+    queue = _queue(tmp_path)
+    while True:
+        task = queue.claim('w1')
+        if task is None:
+            break
+        assert queue.complete(task['task_id'], 'w1', {'shard': task['payload']['shard']})
+    assert queue.job_status('job') == {PENDING: 0, RUNNING: 0, DONE: 3, FAILED: 0}
+    assert [r['result']['shard'] for r in queue.results('job')] == [0, 1, 2]
+    assert queue.is_finished('job')
+
+
+def test_reclaim_expired_returns_crashed_task_to_pending(tmp_path):
+    queue = _queue(tmp_path, n_tasks=1)
+    crashed = queue.claim('dead-worker', lease_seconds=0.05)
+    time.sleep(0.1)
+    assert queue.reclaim_expired() == 1
+    assert queue.job_status('job')[PENDING] == 1
+
+    retried = queue.claim('w2')
+    assert retried['task_id'] == crashed['task_id']
+    assert retried['attempts'] == 2
+    # 原本的 worker 已失去租約，晚到的結果被忽略
+    assert not queue.complete(crashed['task_id'], 'dead-worker', 'late')
+    assert queue.complete(retried['task_id'], 'w2', 'ok')
+    assert queue.results('job')[0]['result'] == 'ok'
+
+
+def test_expired_task_without_attempts_left_fails(tmp_path):
+    queue = _queue(tmp_path, n_tasks=1, max_attempts=1)
+    queue.claim('dead-worker', lease_seconds=0.05)
+    time.sleep(0.1)
+    assert queue.reclaim_expired() == 0
+    assert queue.job_status('job')[FAILED] == 1
+    assert queue.failures('job')[0]['error'] == 'lease expired'
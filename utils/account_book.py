@@ -0,0 +1,316 @@
+"""
+Account Book
+
+Struct-of-arrays storage for M7's virtual trading accounts. Every account
+field is a NumPy array and an account is a row, looked up by param_id
+through a dict index. A day's signals are applied to all accounts at once
+with masked array updates instead of one dict per account and one
+update per signal row.
+
+Each account also carries online performance accumulators (Welford mean and
+variance of daily returns, downside deviation, running peak and maximum
+drawdown, trade counts). They are updated in O(1) per account per day by
+close_day() and saved with the account state, so performance_frame() gives
+every account's live Sharpe, Sortino, volatility and drawdown without
+re-reading its history.
+"""
+import numpy as np
+import pandas as pd
+from utils import config
+from utils.tracing import traced
+
+# Snapshot columns: the ones M7 has always written, then the symbol the account trades
+ACCOUNT_COLUMNS = ['param_id', 'cash', 'position_size', 'position_value', 'total_value', 'last_updated', 'symbol']
+
+# Online performance accumulators, persisted after the account columns:
+#   n_days / return_mean / return_m2   Welford count, mean and M2 of daily returns
+#   downside_sq_sum                    sum of squared negative daily returns
+#   peak_value / max_drawdown          running peak of total_value and worst drawdown (<= 0)
+#   close_value                        total_value at the last close_day(), the base of the next return
+#   n_buys / n_sells                   executed trades
+ACCUMULATOR_COLUMNS = ['n_days', 'return_mean', 'return_m2', 'downside_sq_sum', 'peak_value', 'max_drawdown',
+                       'close_value', 'n_buys', 'n_sells']
+
+# Field -> (dtype, value of a new account); None means config.INITIAL_CAPITAL
+_FIELDS = {
+    'cash': (float, None),
+    'position_size': (float, 0.0),
+    'position_value': (float, 0.0),
+    'total_value': (float, None),
+    'last_updated': (object, 'N/A'),
+    'symbol': (object, ''),
+    'n_days': (np.int64, 0),
+    'return_mean': (float, 0.0),
+    'return_m2': (float, 0.0),
+    'downside_sq_sum': (float, 0.0),
+    'peak_value': (float, None),
+    'max_drawdown': (float, 0.0),
+    'close_value': (float, None),
+    'n_buys': (np.int64, 0),
+    'n_sells': (np.int64, 0),
+}
+
+# Trading days per year, as in utils.performance_utils
+TRADING_DAYS = 252
+
+
+def _initial(field: str):
+    default = _FIELDS[field][1]
+    return config.INITIAL_CAPITAL if default is None else default
+
+class AccountBook:
+    """
+    Accounts stored as parallel arrays indexed by param_id.
+
+    Attributes:
+        param_ids (list): The param_id of each row, in insertion order.
+        index (dict): param_id -> row.
+        cash, position_size, position_value, total_value (np.ndarray): float64 per account.
+        last_updated (np.ndarray): The last date each account traded (object).
+        n_days, return_mean, ... (np.ndarray): The ACCUMULATOR_COLUMNS, see close_day().
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.param_ids = []
+        self.index = {}
+        self._size = 0
+        self._capacity = max(int(capacity), 1)
+        self._arrays = {field: np.full(self._capacity, _initial(field), dtype=dtype)
+                        for field, (dtype, _) in _FIELDS.items()}
+
+    def __len__(self):
+        return self._size
+
+    def __getattr__(self, name):
+        # Expose each field as a view of the filled rows only
+        arrays = self.__dict__.get('_arrays')
+        if arrays is not None and name in arrays:
+            return arrays[name][:self._size]
+        raise AttributeError(name)
+
+    def _grow(self, needed: int):
+        if needed <= self._capacity:
+            return
+        while self._capacity < needed:
+            self._capacity *= 2
+        for field, values in self._arrays.items():
+            grown = np.full(self._capacity, _initial(field), dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._arrays[field] = grown
+
+    def rows_for(self, param_ids) -> np.ndarray:
+        """
+        Returns the row of each param_id, opening new accounts with
+        config.INITIAL_CAPITAL in cash for ids not seen before.
+        """
+        new_ids = [p for p in dict.fromkeys(param_ids) if p not in self.index]
+        if new_ids:
+            start = self._size
+            self._grow(start + len(new_ids))
+            end = start + len(new_ids)
+            for offset, param_id in enumerate(new_ids):
+                self.index[param_id] = start + offset
+            self.param_ids.extend(new_ids)
+            for field, values in self._arrays.items():
+                values[start:end] = _initial(field)
+            self._size = end
+        return np.fromiter((self.index[p] for p in param_ids), dtype=np.int64, count=len(param_ids))
+
+    def apply_signals(self, param_ids, signals, prices, date: str, symbols=None) -> dict:
+        """
+        Applies a day's trade signals to their accounts with the M7 MVP rules:
+        revalue the position at the signal's price, buy with all cash on a
+        1 when flat, sell the whole position on a -1 when holding.
+
+        A param_id that appears more than once is updated once per row, in
+        row order, exactly as the old per-row loop did: rows are applied in
+        rounds of first occurrences, second occurrences, and so on.
+
+        symbols, when given, records the symbol each account trades, which
+        mark_to_market() uses to revalue it on days without a signal.
+
+        Returns:
+            dict: {'buys': n, 'sells': n, 'fills': {...}}, see apply_signals_at().
+        """
+        return self.apply_signals_at(self.rows_for(list(param_ids)), signals, prices, date, symbols)
+
+    @traced(cat='compute')
+    def apply_signals_at(self, rows, signals, prices, date: str, symbols=None) -> dict:
+        """
+        apply_signals() for callers that already hold the rows (e.g. from rows_for()).
+
+        Returns:
+            dict: {'buys': n, 'sells': n, 'fills': {'row', 'side', 'shares', 'price'}}
+                  where fills lists every executed trade in execution order
+                  (side is 1 for a buy and -1 for a sell).
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        signals = np.asarray(signals)
+        prices = np.asarray(prices, dtype=float)
+        if symbols is not None:
+            self._arrays['symbol'][rows] = np.asarray(symbols, dtype=object)
+        occurrence = pd.Series(rows).groupby(rows).cumcount().to_numpy()
+        cash, size = self._arrays['cash'], self._arrays['position_size']
+        fills = []
+        for round_no in range(occurrence.max() + 1 if len(rows) else 0):
+            in_round = occurrence == round_no
+            r, signal, price = rows[in_round], signals[in_round], prices[in_round]
+
+            buy = (signal == 1) & (size[r] == 0)
+            sell = (signal == -1) & (size[r] > 0)
+            buy_rows, sell_rows = r[buy], r[sell]
+            size[buy_rows] = cash[buy_rows] / price[buy]
+            cash[buy_rows] = 0
+            self._arrays['n_buys'][buy_rows] += 1
+            self._arrays['n_sells'][sell_rows] += 1
+            fills.append((buy_rows, 1, size[buy_rows].copy(), price[buy]))
+            fills.append((sell_rows, -1, size[sell_rows].copy(), price[sell]))
+            cash[sell_rows] += size[sell_rows] * price[sell]
+            size[sell_rows] = 0
+
+            self._arrays['position_value'][r] = size[r] * price
+            self._arrays['total_value'][r] = cash[r] + self._arrays['position_value'][r]
+            self._arrays['last_updated'][r] = date
+
+        fill_rows = np.concatenate([f[0] for f in fills]) if fills else np.zeros(0, dtype=np.int64)
+        fill_side = np.concatenate([np.full(len(f[0]), f[1]) for f in fills]) if fills else np.zeros(0, dtype=int)
+        return {
+            'buys': int((fill_side == 1).sum()),
+            'sells': int((fill_side == -1).sum()),
+            'fills': {
+                'row': fill_rows,
+                'side': fill_side,
+                'shares': np.concatenate([f[2] for f in fills]) if fills else np.zeros(0),
+                'price': np.concatenate([f[3] for f in fills]) if fills else np.zeros(0),
+            },
+        }
+
+    def fills_frame(self, fills: dict, date: str) -> pd.DataFrame:
+        """Turns the 'fills' of apply_signals() into a DataFrame keyed by param_id."""
+        param_ids = np.asarray(self.param_ids, dtype=object)
+        return pd.DataFrame({
+            'date': date,
+            'param_id': param_ids[fills['row']],
+            'side': np.where(fills['side'] == 1, 'BUY', 'SELL'),
+            'shares': fills['shares'],
+            'price': fills['price'],
+        }, columns=['date', 'param_id', 'side', 'shares', 'price'])
+
+    @traced(cat='compute')
+    def mark_to_market(self, latest_prices, rows=None) -> np.ndarray:
+        """
+        Revalues open positions at their symbol's latest close with one
+        vectorized multiply: position_value = position_size × price and
+        total_value = cash + position_value.
+
+        Args:
+            latest_prices (dict | pd.Series): symbol -> latest close.
+            rows (array-like, optional): Limit revaluation to these rows.
+
+        Returns:
+            np.ndarray: The rows that were revalued.
+        """
+        rows = np.arange(self._size) if rows is None else np.unique(np.asarray(rows, dtype=np.int64))
+        a = self._arrays
+        prices = pd.Series(a['symbol'][rows]).map(pd.Series(latest_prices, dtype=float)).to_numpy(dtype=float)
+        held = (a['position_size'][rows] > 0) & ~np.isnan(prices)
+        rows, prices = rows[held], prices[held]
+        a['position_value'][rows] = a['position_size'][rows] * prices
+        a['total_value'][rows] = a['cash'][rows] + a['position_value'][rows]
+        return rows
+
+    @traced(cat='compute')
+    def close_day(self, rows) -> None:
+        """
+        Closes the day for the given accounts (those valued at a current
+        price today), updating their performance accumulators in O(1) each:
+        the daily return against the previous close feeds Welford's running
+        mean / M2 and the downside sum, and total_value updates the running
+        peak and maximum drawdown. Call it once per account per day, after
+        the day's trades (and mark-to-market).
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        a = self._arrays
+        value, previous = a['total_value'][rows], a['close_value'][rows]
+        returns = np.divide(value, previous, out=np.ones_like(value), where=previous > 0) - 1
+
+        n = a['n_days'][rows] + 1
+        delta = returns - a['return_mean'][rows]
+        mean = a['return_mean'][rows] + delta / n
+        a['return_m2'][rows] += delta * (returns - mean)
+        a['return_mean'][rows] = mean
+        a['n_days'][rows] = n
+        a['downside_sq_sum'][rows] += np.minimum(returns, 0.0) ** 2
+
+        peak = np.maximum(a['peak_value'][rows], value)
+        drawdown = np.divide(value, peak, out=np.ones_like(value), where=peak > 0) - 1
+        a['peak_value'][rows] = peak
+        a['max_drawdown'][rows] = np.minimum(a['max_drawdown'][rows], drawdown)
+        a['close_value'][rows] = value
+
+    def performance_frame(self) -> pd.DataFrame:
+        """
+        Live performance of every account from its accumulators, with the
+        same definitions as calculate_performance_metrics (annualized, zero
+        risk-free rate, population standard deviation).
+        """
+        a = {field: values[:self._size] for field, values in self._arrays.items()}
+        n = a['n_days'].astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volatility = np.sqrt(np.where(n > 0, a['return_m2'] / n, np.nan)) * np.sqrt(TRADING_DAYS)
+            downside = np.sqrt(np.where(n > 0, a['downside_sq_sum'] / n, np.nan)) * np.sqrt(TRADING_DAYS)
+            annual_return = a['return_mean'] * TRADING_DAYS
+            sharpe = np.where(volatility > 0, annual_return / volatility, 0.0)
+            sortino = np.where(downside > 0, annual_return / downside, 0.0)
+        return pd.DataFrame({
+            'param_id': self.param_ids,
+            'n_days': a['n_days'],
+            'total_return': a['total_value'] / config.INITIAL_CAPITAL - 1,
+            'mean_daily_return': a['return_mean'],
+            'volatility': volatility,
+            'downside_deviation': downside,
+            'sharpe': np.where(n > 0, sharpe, np.nan),
+            'sortino': np.where(n > 0, sortino, np.nan),
+            'max_drawdown': a['max_drawdown'],
+            'n_buys': a['n_buys'],
+            'n_sells': a['n_sells'],
+            'n_trades': a['n_buys'] + a['n_sells'],
+        })
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'AccountBook':
+        """
+        Builds a book from a snapshot DataFrame (one row per param_id).
+        Snapshots written before the accumulators existed start them fresh,
+        with the current total_value as peak and previous close.
+        """
+        if df.empty:
+            return cls()
+        # A param_id listed twice keeps its last row, as the old dict-based loader did
+        df = df.drop_duplicates('param_id', keep='last')
+        book = cls(capacity=len(df))
+        book.rows_for(df['param_id'].tolist())
+        n = len(book)
+        for field, (dtype, _) in _FIELDS.items():
+            default = df['total_value'] if field in ('peak_value', 'close_value') else _initial(field)
+            values = df[field].fillna(default) if field in df.columns else pd.Series(default, index=df.index)
+            book._arrays[field][:n] = values.astype(object).to_numpy() if dtype is object \
+                else values.to_numpy(dtype=dtype)
+        return book
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path: str) -> 'AccountBook':
+        """Loads a book from an M7 snapshot CSV."""
+        return cls.from_frame(pd.read_csv(snapshot_path))
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the book as a snapshot DataFrame (ACCOUNT_COLUMNS, then ACCUMULATOR_COLUMNS)."""
+        return self.rows_frame(np.arange(self._size))
+
+    def rows_frame(self, rows) -> pd.DataFrame:
+        """The snapshot rows of the given account rows only."""
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        data = {'param_id': np.asarray(self.param_ids, dtype=object)[rows]}
+        for field in ACCOUNT_COLUMNS[1:] + ACCUMULATOR_COLUMNS:
+            data[field] = self._arrays[field][rows]
+        return pd.DataFrame(data, columns=ACCOUNT_COLUMNS + ACCUMULATOR_COLUMNS)
@@ -0,0 +1,229 @@
+"""
+Account Ledger
+
+Append-only, date-partitioned storage of M7 account states and fills,
+replacing one full M7_simulation_result_{date}.csv per day.
+
+Layout (one directory per version):
+    ledger_index.sqlite     partition manifest (min/max date, row counts)
+                            and latest_state: the newest row of every account
+    ledger_{YYYY-MM}.sqlite one partition per month, with
+                              account_states (PRIMARY KEY (param_id, date))
+                              fills          (indexed on (param_id, date))
+
+A day appends one state row for every account whose state was written that
+day (traded or revalued), never rewriting earlier days. The partition rows
+and the index update of a day are committed in one transaction (the index
+is attached to the partition's connection), so a crash cannot leave
+latest_state out of step with the partitions. M7 starts from
+latest_state instead of guessing yesterday's file name, and range queries
+open only the partitions whose date range overlaps the query.
+
+Columns follow the DataFrames appended: a column seen for the first time is
+added to the tables, so account fields added later need no migration.
+"""
+import os
+import sqlite3
+from contextlib import closing
+import pandas as pd
+from utils.tracing import traced
+
+INDEX_FILE = 'ledger_index.sqlite'
+STATE_TABLE = 'account_states'
+FILL_TABLE = 'fills'
+
+
+def _sql_type(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return 'INTEGER'
+    if pd.api.types.is_numeric_dtype(series):
+        return 'REAL'
+    return 'TEXT'
+
+def _columns(conn, table: str) -> list:
+    schema, _, name = table.rpartition('.')
+    pragma = f'PRAGMA {schema}.table_info({name})' if schema else f'PRAGMA table_info({name})'
+    return [row[1] for row in conn.execute(pragma)]
+
+def _ensure_columns(conn, table: str, df: pd.DataFrame):
+    """Adds the DataFrame's columns that the table does not have yet."""
+    existing = set(_columns(conn, table))
+    for column in df.columns:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN "{column}" {_sql_type(df[column])}')
+
+def _insert(conn, table: str, df: pd.DataFrame, replace: bool = False):
+    if df.empty:
+        return
+    _ensure_columns(conn, table, df)
+    columns = ', '.join(f'"{c}"' for c in df.columns)
+    marks = ', '.join('?' for _ in df.columns)
+    verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+    # SQLite stores float NaN as NULL by itself; other columns need NA mapped to None
+    columns_values = [df[c].tolist() if pd.api.types.is_numeric_dtype(df[c])
+                      else df[c].astype(object).where(df[c].notna(), None).tolist() for c in df.columns]
+    values = zip(*columns_values)
+    conn.executemany(f'{verb} INTO {table} ({columns}) VALUES ({marks})', values)
+
+
+class AccountLedger:
+    """
+    The account ledger of one directory (normally a version's
+    trading_performance/account_ledger).
+    """
+
+    def __init__(self, ledger_dir: str):
+        self.ledger_dir = ledger_dir
+        os.makedirs(ledger_dir, exist_ok=True)
+        self.index_path = os.path.join(ledger_dir, INDEX_FILE)
+        with closing(sqlite3.connect(self.index_path)) as conn, conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS partitions ('
+                         'name TEXT PRIMARY KEY, min_date TEXT, max_date TEXT, state_rows INTEGER, fill_rows INTEGER)')
+            conn.execute('CREATE TABLE IF NOT EXISTS latest_state ('
+                         'param_id TEXT PRIMARY KEY, date TEXT NOT NULL)')
+
+    # --- partitions ---
+
+    @staticmethod
+    def partition_name(date: str) -> str:
+        return f'ledger_{date[:7]}.sqlite'
+
+    def partition_path(self, date: str) -> str:
+        return os.path.join(self.ledger_dir, self.partition_name(date))
+
+    def _open_partition(self, name: str):
+        conn = sqlite3.connect(os.path.join(self.ledger_dir, name))
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {STATE_TABLE} ('
+                     'param_id TEXT NOT NULL, date TEXT NOT NULL, PRIMARY KEY (param_id, date)) WITHOUT ROWID')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{STATE_TABLE}_date ON {STATE_TABLE} (date)')
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {FILL_TABLE} (param_id TEXT NOT NULL, date TEXT NOT NULL)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{FILL_TABLE}_param_date ON {FILL_TABLE} (param_id, date)')
+        return conn
+
+    def partitions(self, start_date: str = None, end_date: str = None) -> list:
+        """Partition file names whose date range overlaps [start_date, end_date], oldest first."""
+        query = 'SELECT name FROM partitions WHERE 1=1'
+        params = []
+        if start_date:
+            query += ' AND max_date >= ?'
+            params.append(start_date)
+        if end_date:
+            query += ' AND min_date <= ?'
+            params.append(end_date)
+        with closing(sqlite3.connect(self.index_path)) as conn:
+            return [row[0] for row in conn.execute(query + ' ORDER BY min_date', params)]
+
+    def last_date(self) -> str:
+        """The latest date appended, or None for an empty ledger."""
+        with closing(sqlite3.connect(self.index_path)) as conn:
+            return conn.execute('SELECT MAX(max_date) FROM partitions').fetchone()[0]
+
+    # --- writes ---
+
+    @traced(cat='io')
+    def append_day(self, date: str, states: pd.DataFrame, fills: pd.DataFrame = None, replace: bool = False):
+        """
+        Appends one day's account states (one row per param_id) and fills.
+
+        Days must be appended in date order. Appending the latest date again
+        raises unless replace=True, which first removes that day's rows (a
+        re-run of the same day) and then rebuilds latest_state.
+
+        Returns:
+            str: The path of the partition written.
+        """
+        last = self.last_date()
+        if last is not None and date < last:
+            raise ValueError(f"Ledger is append-only: {date} is before the last appended date {last}")
+        if last == date and not replace:
+            raise ValueError(f"Ledger already holds {date}; pass replace=True to re-run the day")
+
+        states = states.assign(date=date)
+        fills = (fills if fills is not None else pd.DataFrame(columns=['param_id'])).assign(date=date)
+        rebuilt = None
+        if last == date:
+            # A re-run may drop accounts written by the first run, so latest_state is rebuilt:
+            # today's rows, plus the newest earlier row of every account without one today
+            previous = self.state_as_of(date, inclusive=False)
+            if not previous.empty:
+                previous = previous[~previous['param_id'].isin(states['param_id'])]
+            frames = [f for f in (previous, states) if not f.empty]
+            rebuilt = pd.concat(frames, ignore_index=True) if frames else states
+        name = self.partition_name(date)
+        with closing(self._open_partition(name)) as conn:
+            conn.execute('ATTACH DATABASE ? AS idx', (self.index_path,))
+            with conn:
+                if last == date:
+                    conn.execute(f'DELETE FROM {STATE_TABLE} WHERE date = ?', (date,))
+                    conn.execute(f'DELETE FROM {FILL_TABLE} WHERE date = ?', (date,))
+                _insert(conn, STATE_TABLE, states)
+                _insert(conn, FILL_TABLE, fills)
+                state_rows = conn.execute(f'SELECT COUNT(*) FROM {STATE_TABLE}').fetchone()[0]
+                fill_rows = conn.execute(f'SELECT COUNT(*) FROM {FILL_TABLE}').fetchone()[0]
+                min_date = conn.execute(f'SELECT MIN(date) FROM {STATE_TABLE}').fetchone()[0] or date
+                conn.execute('INSERT OR REPLACE INTO idx.partitions VALUES (?, ?, ?, ?, ?)',
+                             (name, min_date, date, state_rows, fill_rows))
+                if rebuilt is not None:
+                    conn.execute('DELETE FROM idx.latest_state')
+                    _insert(conn, 'idx.latest_state', rebuilt)
+                else:
+                    _insert(conn, 'idx.latest_state', states, replace=True)
+        return os.path.join(self.ledger_dir, name)
+
+    # --- reads ---
+
+    def latest_state(self) -> pd.DataFrame:
+        """The newest state row of every account (for starting the next day)."""
+        with closing(sqlite3.connect(self.index_path)) as conn:
+            return pd.read_sql('SELECT * FROM latest_state ORDER BY rowid', conn)
+
+    def _read(self, table: str, where: str, params: list, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+        frames = []
+        for name in self.partitions(start_date, end_date):
+            with closing(self._open_partition(name)) as conn:
+                frames.append(pd.read_sql(f'SELECT * FROM {table} WHERE {where}', conn, params=params))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values(['date', 'param_id'], kind='stable', ignore_index=True)
+
+    def account_history(self, param_id: str, start_date: str = None, end_date: str = None) -> pd.DataFrame:
+        """One account's state rows in [start_date, end_date], read from the overlapping partitions only."""
+        where, params = 'param_id = ?', [param_id]
+        if start_date:
+            where, params = where + ' AND date >= ?', params + [start_date]
+        if end_date:
+            where, params = where + ' AND date <= ?', params + [end_date]
+        return self._read(STATE_TABLE, where, params, start_date, end_date)
+
+    def states_between(self, start_date: str, end_date: str) -> pd.DataFrame:
+        """Every account state row written in [start_date, end_date]."""
+        return self._read(STATE_TABLE, 'date >= ? AND date <= ?', [start_date, end_date], start_date, end_date)
+
+    def fills_between(self, start_date: str, end_date: str, param_id: str = None) -> pd.DataFrame:
+        """Fills in [start_date, end_date], optionally for one account."""
+        where, params = 'date >= ? AND date <= ?', [start_date, end_date]
+        if param_id is not None:
+            where, params = where + ' AND param_id = ?', params + [param_id]
+        return self._read(FILL_TABLE, where, params, start_date, end_date)
+
+    def state_as_of(self, date: str, inclusive: bool = True) -> pd.DataFrame:
+        """
+        Every account's newest state on or before `date` (strictly before when
+        inclusive is False). Any earlier partition may hold an account's newest
+        row, so all partitions up to `date` are read; this is for re-running a
+        day, while the normal startup path uses latest_state().
+        """
+        op = '<=' if inclusive else '<'
+        frames = []
+        for name in self.partitions(end_date=date):
+            with closing(self._open_partition(name)) as conn:
+                frames.append(pd.read_sql(
+                    f'SELECT s.* FROM {STATE_TABLE} s JOIN ('
+                    f'SELECT param_id, MAX(date) AS date FROM {STATE_TABLE} WHERE date {op} ? GROUP BY param_id'
+                    f') m ON s.param_id = m.param_id AND s.date = m.date', conn, params=[date]))
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame()
+        states = pd.concat(frames, ignore_index=True).sort_values('date', kind='stable')
+        return states.drop_duplicates('param_id', keep='last').reset_index(drop=True)
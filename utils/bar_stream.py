@@ -0,0 +1,224 @@
+"""
+Bar Stream
+
+Local bar feeds for the live M6 signal daemon. Every source is a generator
+of bar dicts ({'symbol', 'date', 'close', ...}) stamped with 'received_at'
+(time.perf_counter()) the moment the bar is read, so downstream latency is
+measured from arrival rather than from the bar's own timestamp.
+
+A line on a socket, pipe or tailed file is either a JSON object
+    {"symbol": "AAPL", "date": "2025-06-27 15:59", "close": 201.08}
+or a CSV row
+    AAPL,2025-06-27 15:59,200.9,201.3,200.8,201.08,123400
+(symbol, date, open, high, low, close, volume).
+
+These stand in for a real market data feed; replay_csv_bars() replays the
+daily bars in data_csv/ in date order across symbols.
+"""
+import os
+import json
+import time
+import socket
+import pandas as pd
+
+BAR_FIELDS = ('symbol', 'date', 'open', 'high', 'low', 'close', 'volume')
+
+
+def parse_bar(line: str) -> dict:
+    """
+    Parses one feed line (JSON object or CSV row) into a bar dict.
+
+    Returns:
+        dict: The bar with an upper-cased symbol and float prices, or None
+              for blank lines, CSV headers and malformed input.
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        if line.startswith('{'):
+            bar = json.loads(line)
+        else:
+            values = line.split(',')
+            if values[0].lower() == 'symbol' or len(values) < 6:
+                return None
+            bar = dict(zip(BAR_FIELDS, values))
+        bar['symbol'] = str(bar['symbol']).strip().upper()
+        bar['date'] = str(bar['date']).strip()
+        for field in BAR_FIELDS[2:]:
+            if bar.get(field) not in (None, ''):
+                bar[field] = float(bar[field])
+        if 'close' not in bar:
+            return None
+    except (ValueError, KeyError, TypeError):
+        print(f"WARNING: Malformed bar skipped: {line[:120]}")
+        return None
+    return bar
+
+def _stamped(bar: dict) -> dict:
+    bar['received_at'] = time.perf_counter()
+    return bar
+
+def replay_csv_bars(symbols: list = None, data_dir: str = 'data_csv', start_date: str = None,
+                    end_date: str = None, delay: float = 0.0):
+    """
+    Replays daily bars from data_csv/{SYMBOL}.csv, merged across symbols in
+    date order (symbols in the given order within a date).
+
+    Args:
+        symbols (list, optional): Symbols to replay. Defaults to every CSV in data_dir.
+        data_dir (str): Directory holding the per-symbol CSV files.
+        start_date (str, optional): First date to replay (inclusive).
+        end_date (str, optional): Last date to replay (inclusive).
+        delay (float): Seconds to sleep between dates, 0 replays as fast as possible.
+
+    Yields:
+        dict: One bar per symbol per date.
+    """
+    if symbols is None:
+        symbols = sorted(os.path.splitext(f)[0] for f in os.listdir(data_dir) if f.endswith('.csv'))
+    frames = []
+    for symbol in symbols:
+        path = os.path.join(data_dir, f'{symbol}.csv')
+        if not os.path.exists(path):
+            print(f"WARNING: No CSV data for {symbol}: {path}")
+            continue
+        df = pd.read_csv(path)
+        df['symbol'] = symbol
+        frames.append(df)
+    if not frames:
+        return
+    bars = pd.concat(frames, ignore_index=True)
+    if start_date:
+        bars = bars[bars['date'] >= start_date]
+    if end_date:
+        bars = bars[bars['date'] <= end_date]
+    order = {s: i for i, s in enumerate(symbols)}
+    bars = bars.assign(_order=bars['symbol'].map(order)).sort_values(['date', '_order'], kind='stable')
+
+    columns = [c for c in BAR_FIELDS if c in bars.columns]
+    previous_date = None
+    for record in bars[columns].to_dict('records'):
+        if delay and previous_date is not None and record['date'] != previous_date:
+            time.sleep(delay)
+        previous_date = record['date']
+        yield _stamped(record)
+
+def _read_lines(stream, pending: str = ''):
+    """Splits buffered text into complete lines, returning (lines, unfinished tail)."""
+    data = pending + stream
+    lines = data.split('\n')
+    return lines[:-1], lines[-1]
+
+def tail_file_bars(path: str, from_start: bool = False, poll_interval: float = 0.05, idle_timeout: float = None):
+    """
+    Follows a growing file (like `tail -f`) and yields a bar per complete line.
+
+    Args:
+        path (str): The file to follow; waited for if it does not exist yet.
+        from_start (bool): Replay existing lines first instead of only new ones.
+        poll_interval (float): Seconds between polls when no new data arrived.
+        idle_timeout (float, optional): Stop after this many seconds without
+            new data. None follows the file until the consumer stops.
+    """
+    while not os.path.exists(path):
+        time.sleep(poll_interval)
+    with open(path, 'r', encoding='utf-8') as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        pending = ''
+        idle_since = time.monotonic()
+        while True:
+            chunk = f.read()
+            if not chunk:
+                if idle_timeout is not None and time.monotonic() - idle_since > idle_timeout:
+                    return
+                time.sleep(poll_interval)
+                continue
+            idle_since = time.monotonic()
+            lines, pending = _read_lines(chunk, pending)
+            for line in lines:
+                bar = parse_bar(line)
+                if bar:
+                    yield _stamped(bar)
+
+def pipe_bars(path: str, reopen: bool = True):
+    """
+    Reads bars from a named pipe (FIFO), created if missing. When the writer
+    closes the pipe it is reopened for the next writer unless reopen is False.
+
+    Platforms without FIFOs (Windows) fall back to following `path` as a
+    regular file the writer appends to (see tail_file_bars()); use a tcp:
+    source there for a socket feed.
+    """
+    if not hasattr(os, 'mkfifo'):
+        print(f"WARNING: Named pipes are not supported on this platform; following {path} as a file instead.")
+        created = not os.path.exists(path)
+        if created:
+            open(path, 'a', encoding='utf-8').close()
+        # A file created here is empty, so lines a writer appends before it is opened are not skipped
+        yield from tail_file_bars(path, from_start=created)
+        return
+    if not os.path.exists(path):
+        os.mkfifo(path)
+    while True:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                bar = parse_bar(line)
+                if bar:
+                    yield _stamped(bar)
+        if not reopen:
+            return
+
+def socket_bars(host: str = '127.0.0.1', port: int = 9009, reopen: bool = True):
+    """
+    Listens on a local TCP socket and yields bars sent as newline-delimited
+    lines. Clients are served one at a time; when a client disconnects the
+    next one is accepted unless reopen is False.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, port))
+        server.listen(1)
+        print(f"INFO: Waiting for bar feed on {host}:{port}...")
+        while True:
+            conn, address = server.accept()
+            print(f"INFO: Bar feed connected from {address[0]}:{address[1]}")
+            with conn:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                pending = ''
+                while True:
+                    data = conn.recv(65536)
+                    if not data:
+                        break
+                    lines, pending = _read_lines(data.decode('utf-8', errors='replace'), pending)
+                    for line in lines:
+                        bar = parse_bar(line)
+                        if bar:
+                            yield _stamped(bar)
+            if not reopen:
+                return
+
+def open_bar_stream(spec: str, **kwargs):
+    """
+    Opens a bar source from a short spec string:
+        replay[:AAPL,NVDA]   replay data_csv bars
+        tail:PATH            follow a growing file
+        pipe:PATH            read a named pipe (a followed file where FIFOs are unavailable)
+        tcp:[HOST:]PORT      listen on a local TCP socket
+
+    Extra keyword arguments are passed to the underlying source.
+    """
+    kind, _, target = spec.partition(':')
+    kind = kind.strip().lower()
+    if kind == 'replay':
+        symbols = [s.strip().upper() for s in target.split(',') if s.strip()] or None
+        return replay_csv_bars(symbols, **kwargs)
+    if kind == 'tail':
+        return tail_file_bars(target, **kwargs)
+    if kind == 'pipe':
+        return pipe_bars(target, **kwargs)
+    if kind == 'tcp':
+        host, _, port = target.rpartition(':')
+        return socket_bars(host or '127.0.0.1', int(port), **kwargs)
+    raise ValueError(f"Unknown bar stream: {spec}")
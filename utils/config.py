@@ -5,4 +5,16 @@ This file contains global settings and constants for the Quanta system.
 """
  
 # Initial capital for each new simulated trading account in M7
-INITIAL_CAPITAL = 100000 
\ No newline at end of file
+INITIAL_CAPITAL = 100000
+
+# Memory ceiling (MB) for batch stages; None disables it.
+# The QUANT_MEMORY_CEILING_MB environment variable overrides this value.
+MEMORY_CEILING_MB = None
+
+# What a stage does when an allocation would approach the ceiling:
+# 'chunk' switches to a chunked path where one exists, 'fail' raises MemoryCeilingExceeded
+MEMORY_ON_CEILING = 'chunk'
+
+# Write a memory_*.json report per stage even without a ceiling or allocation tracking.
+# The QUANT_MEMORY_REPORTS environment variable overrides this value.
+MEMORY_REPORTS = False
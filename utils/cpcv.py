@@ -0,0 +1,142 @@
+"""
+組合式淨化交叉驗證 (Combinatorial Purged Cross-Validation, CPCV)
+
+將 bars 切成 n_groups 個連續區塊，任取 n_test_groups 個區塊作為測試集，
+其餘區塊扣除淨化 (purge) 與禁入期 (embargo) 後作為訓練集。
+每組參數的每日策略報酬只計算一次（bars × params 矩陣），
+所有組合的 Sharpe 都以遮罩矩陣乘法一次算出，不重新回測。
+"""
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from utils.version_manager import version_manager
+
+
+def cpcv_masks(n_bars, n_groups=6, n_test_groups=2, purge=1, embargo=5):
+    """
+    產生所有組合的訓練/測試遮罩。
+    回傳 (train_masks, test_masks, combos)：遮罩形狀為 combos × bars 的布林矩陣。
+    """
+    if not 0 < n_test_groups < n_groups:
+        raise ValueError("n_test_groups 必須介於 1 與 n_groups - 1 之間")
+    if n_bars < n_groups:
+        raise ValueError(f"資料筆數 {n_bars} 少於分組數 {n_groups}")
+
+    bounds = np.linspace(0, n_bars, n_groups + 1).astype(int)
+    combos = list(itertools.combinations(range(n_groups), n_test_groups))
+    train_masks = np.ones((len(combos), n_bars), dtype=bool)
+    test_masks = np.zeros((len(combos), n_bars), dtype=bool)
+
+    for c, groups in enumerate(combos):
+        for g in groups:
+            start, end = bounds[g], bounds[g + 1]
+            test_masks[c, start:end] = True
+            # 淨化：測試區塊前 purge 根 bar 的部位會延續到測試期，移出訓練集
+            # 禁入期：測試區塊後 embargo 根 bar 仍受測試期資訊影響，移出訓練集
+            train_masks[c, max(0, start - purge):min(n_bars, end + embargo)] = False
+    return train_masks, test_masks, combos
+
+def masked_sharpe(daily_returns, masks, active=None):
+    """
+    以遮罩矩陣一次計算所有組合、所有參數的年化 Sharpe。
+    daily_returns: bars × params；masks: combos × bars。回傳 combos × params。
+    active: strategy_returns_matrix 回傳的 bars × params 遮罩；第一筆交易前的 bar
+    不計入，與 calculate_performance_metrics 從第一筆交易開始計算的邏輯一致。
+    """
+    weights = masks.astype(float)
+    active = np.ones_like(daily_returns, dtype=float) if active is None else np.asarray(active, dtype=float)
+    daily_returns = daily_returns * active
+    counts = weights @ active
+    safe = np.maximum(counts, 1)
+    mean = weights @ daily_returns / safe
+    var = np.maximum(weights @ (daily_returns ** 2) / safe - mean ** 2, 0.0)
+    std = np.sqrt(var)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 1e-12, mean * 252 / (std * np.sqrt(252)), 0.0)
+    return np.where(counts > 1, sharpe, np.nan)
+
+def probability_of_backtest_overfitting(is_sharpe, oos_sharpe):
+    """
+    Bailey 等人的 PBO：每個組合取樣本內最佳參數，計算其在樣本外的相對排名
+    logit；logit <= 0（樣本外排名落在中位數以下）的組合比例即為 PBO。
+    回傳 (pbo, logits)。
+    """
+    n_params = is_sharpe.shape[1]
+    best = np.nanargmax(np.nan_to_num(is_sharpe, nan=-np.inf), axis=1)
+    oos = np.nan_to_num(oos_sharpe, nan=-np.inf)
+    # 排名 1..N（N 為最好），再轉為 (0, 1) 的相對排名
+    ranks = oos.argsort(axis=1).argsort(axis=1) + 1
+    omega = ranks[np.arange(len(best)), best] / (n_params + 1)
+    logits = np.log(omega / (1 - omega))
+    return float((logits <= 0).mean()), logits
+
+def summarize_cpcv(param_ids, is_sharpe, oos_sharpe, pbo):
+    """
+    整理每組參數的樣本外 Sharpe 分佈與過度擬合機率。
+    overfit_prob 為 PBO 的單一參數版本：只看該參數樣本內排名在前半的組合，
+    其中樣本外排名落在中位數以下的比例；從未進入樣本內前半的參數為 NaN。
+    """
+    median_rank = (oos_sharpe.shape[1] - 1) / 2
+    is_ranks = np.nan_to_num(is_sharpe, nan=-np.inf).argsort(axis=1).argsort(axis=1)
+    oos_ranks = np.nan_to_num(oos_sharpe, nan=-np.inf).argsort(axis=1).argsort(axis=1)
+    is_top = is_ranks > median_rank
+    below_median = oos_ranks < median_rank
+    n_top = is_top.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        overfit_prob = np.where(n_top > 0, (is_top & below_median).sum(axis=0) / n_top, np.nan)
+    return pd.DataFrame({
+        'param_id': param_ids,
+        'is_sharpe_mean': np.nanmean(is_sharpe, axis=0),
+        'oos_sharpe_mean': np.nanmean(oos_sharpe, axis=0),
+        'oos_sharpe_median': np.nanmedian(oos_sharpe, axis=0),
+        'oos_sharpe_std': np.nanstd(oos_sharpe, axis=0),
+        'oos_sharpe_p05': np.nanpercentile(oos_sharpe, 5, axis=0),
+        'oos_sharpe_p95': np.nanpercentile(oos_sharpe, 95, axis=0),
+        'oos_positive_ratio': (oos_sharpe > 0).mean(axis=0),
+        'is_top_half_ratio': is_top.mean(axis=0),
+        'overfit_prob': overfit_prob,
+        'pbo': pbo,
+    })
+
+def cpcv_allowed_param_ids(cpcv_file, max_overfit_prob=None, min_oos_sharpe=None):
+    """
+    回傳通過 CPCV 條件的 param_id 集合與 PBO：
+    overfit_prob <= max_overfit_prob 且 oos_sharpe_median >= min_oos_sharpe。
+    overfit_prob 為 NaN（從未進入樣本內前半）的參數無從估計，設定 max_overfit_prob 時不通過。
+    """
+    cpcv_df = pd.read_csv(cpcv_file)
+    keep = pd.Series(True, index=cpcv_df.index)
+    if max_overfit_prob is not None:
+        keep &= cpcv_df['overfit_prob'] <= max_overfit_prob
+    if min_oos_sharpe is not None:
+        keep &= cpcv_df['oos_sharpe_median'] >= min_oos_sharpe
+    return set(cpcv_df.loc[keep, 'param_id']), cpcv_df['pbo'].iloc[0]
+
+def apply_cpcv_filter(df, cpcv_file, max_overfit_prob=None, min_oos_sharpe=None):
+    """依 CPCV 結果過濾績效表（M3/M5 共用）"""
+    allowed, pbo = cpcv_allowed_param_ids(cpcv_file, max_overfit_prob, min_oos_sharpe)
+    filtered = df[df['param_id'].isin(allowed)]
+    print(f"CPCV 過濾：{len(df)} → {len(filtered)} 組參數（PBO={pbo:.2%}）")
+    return filtered
+
+def prompt_cpcv_filter(version_id):
+    """互動式詢問是否套用 CPCV 過濾（M3/M5 共用），回傳 cpcv_filter dict 或 None"""
+    records = version_manager.find_artifacts('cpcv', version_id)
+    if not records:
+        return None
+
+    print('可套用的 CPCV 結果（直接 Enter 略過）：')
+    for idx, record in enumerate(records, 1):
+        print(f"{idx}. {record['symbol']} {record['strategy']}（{os.path.basename(record['path'])}）")
+    choice = input('請輸入檔案編號：').strip()
+    if not choice.isdigit() or not 1 <= int(choice) <= len(records):
+        return None
+
+    max_prob = input('請輸入可接受的最大過度擬合機率 overfit_prob'
+                     '（樣本內排名前半時樣本外落在中位數以下的比例，預設0.5）：').strip()
+    try:
+        max_prob = float(max_prob) if max_prob else 0.5
+    except ValueError:
+        max_prob = 0.5
+    return {'file': records[int(choice) - 1]['path'], 'max_overfit_prob': max_prob}
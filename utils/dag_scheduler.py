@@ -0,0 +1,176 @@
+"""
+DAG 排程器
+
+將管線的各階段描述成有相依關係的節點，依相依順序執行，
+彼此獨立的分支（例如不同股票、不同策略）在核心數預算內平行執行。
+上游節點的產出以 ArtifactRef 直接傳給下游，不需要再掃描目錄找檔案。
+optional 的參照只要求上游節點結束：上游失敗或被略過時以 None 傳入，下游照常執行。
+"""
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from utils.tracing import tracer
+
+
+class ArtifactRef(NamedTuple):
+    """
+    指向上游節點產出的參照；key 為 None 時代表整個回傳值。
+    optional 為 True 時上游失敗或被略過不會連帶略過下游，參照解析為 None。
+    """
+    node: str
+    key: Optional[str] = None
+    optional: bool = False
+
+
+class StageNode:
+    """DAG 中的一個階段節點"""
+
+    def __init__(self, name: str, func: Callable, kwargs: Optional[Dict] = None, deps: Optional[List[str]] = None):
+        self.name = name
+        self.func = func
+        self.kwargs = kwargs or {}
+        # 相依節點 = 明確指定的 deps + kwargs 內引用到的節點
+        refs = list(_iter_refs(self.kwargs))
+        self.deps = list(dict.fromkeys((deps or []) + [v.node for v in refs]))
+        # 只以 optional 參照引用的節點不會阻擋本節點
+        required = set(deps or []) | {v.node for v in refs if not v.optional}
+        self.optional_deps = [d for d in self.deps if d not in required]
+
+
+def _iter_refs(value):
+    if isinstance(value, ArtifactRef):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _iter_refs(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            yield from _iter_refs(v)
+
+
+def _resolve(value, results: Dict[str, Any]):
+    """將 kwargs 內的 ArtifactRef 換成上游節點的實際產出"""
+    if isinstance(value, ArtifactRef):
+        if value.node not in results:
+            # 只有 optional 參照會在上游沒有產出時被解析
+            return None
+        result = results[value.node]
+        return result if value.key is None else result[value.key]
+    if isinstance(value, dict):
+        return {k: _resolve(v, results) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve(v, results) for v in value]
+    if isinstance(value, tuple):
+        return tuple(_resolve(v, results) for v in value)
+    return value
+
+
+def topological_order(nodes: List[StageNode]) -> List[str]:
+    """回傳節點的拓撲排序；有未知相依或循環時丟出 ValueError"""
+    by_name = {n.name: n for n in nodes}
+    if len(by_name) != len(nodes):
+        raise ValueError("DAG 中有重複的節點名稱")
+    for n in nodes:
+        for d in n.deps:
+            if d not in by_name:
+                raise ValueError(f"節點 {n.name} 相依於不存在的節點 {d}")
+
+    indegree = {n.name: len(n.deps) for n in nodes}
+    children: Dict[str, List[str]] = {n.name: [] for n in nodes}
+    for n in nodes:
+        for d in n.deps:
+            children[d].append(n.name)
+
+    order = []
+    ready = [name for name, deg in indegree.items() if deg == 0]
+    while ready:
+        name = ready.pop(0)
+        order.append(name)
+        for child in children[name]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                ready.append(child)
+
+    if len(order) != len(nodes):
+        raise ValueError("DAG 中存在循環相依")
+    return order
+
+
+def _run_node(func, kwargs, name=None):
+    try:
+        with tracer.span(name or func.__name__, cat='dag'):
+            return func(**kwargs)
+    finally:
+        # 平行子行程的區段寫入暫存目錄，由主行程匯出時合併
+        if tracer.is_worker:
+            tracer.spool()
+
+
+def run_dag(nodes: List[StageNode], max_workers: int = 1) -> Dict[str, Dict]:
+    """
+    執行 DAG。
+
+    max_workers <= 1 時依拓撲順序在目前行程內逐一執行；
+    否則以 ProcessPoolExecutor 平行執行所有相依已完成的節點。
+    節點回傳 None 或丟出例外視為失敗，其所有下游節點會被略過；
+    只以 optional 參照相依的下游節點仍會執行，該參照解析為 None。
+
+    回傳 {節點名稱: {"status": "done"|"failed"|"skipped", "result": ..., "error": ...}}
+    """
+    order = topological_order(nodes)
+    by_name = {n.name: n for n in nodes}
+    results: Dict[str, Any] = {}
+    report: Dict[str, Dict] = {}
+
+    def finish(name, result=None, error=None):
+        if error is None and result is not None:
+            results[name] = result
+            report[name] = {"status": "done", "result": result}
+            print(f"✅ [DAG] {name} 完成")
+        else:
+            report[name] = {"status": "failed", "result": None, "error": error or "沒有產出"}
+            print(f"❌ [DAG] {name} 失敗: {report[name]['error']}")
+
+    def blocked(node):
+        return any(report.get(d, {}).get("status") in ("failed", "skipped")
+                   for d in node.deps if d not in node.optional_deps)
+
+    if max_workers <= 1:
+        for name in order:
+            node = by_name[name]
+            if blocked(node):
+                report[name] = {"status": "skipped", "result": None}
+                continue
+            try:
+                finish(name, _run_node(node.func, _resolve(node.kwargs, results), name))
+            except Exception:
+                finish(name, error=traceback.format_exc())
+        return report
+
+    pending = list(order)
+    running = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # 提交所有相依已完成的節點
+            for name in list(pending):
+                node = by_name[name]
+                if blocked(node):
+                    report[name] = {"status": "skipped", "result": None}
+                    pending.remove(name)
+                elif all(d in report for d in node.deps):
+                    future = executor.submit(_run_node, node.func, _resolve(node.kwargs, results), name)
+                    running[future] = name
+                    pending.remove(name)
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    finish(name, future.result())
+                except Exception as e:
+                    finish(name, error=f"{type(e).__name__}: {e}")
+
+    return report
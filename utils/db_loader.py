@@ -1,6 +1,8 @@
 import sqlite3
 import pandas as pd
+from utils.tracing import traced
 
+@traced(cat='io')
 def load_price_data(symbol, start_date, end_date):
     conn = sqlite3.connect('database/stock_price.db')
     df = pd.read_sql(f"SELECT * FROM {symbol} WHERE date >= ? AND date <= ? ORDER BY date", conn, params=(start_date, end_date), parse_dates=['date'])
@@ -8,6 +10,7 @@ def load_price_data(symbol, start_date, end_date):
     df.set_index('date', inplace=True)
     return df
 
+@traced(cat='io')
 def get_recent_price_series(symbol: str, window: int = 30) -> pd.DataFrame:
     """
     Retrieves the most recent N (window) data points for a given symbol.
@@ -30,4 +33,122 @@ def get_recent_price_series(symbol: str, window: int = 30) -> pd.DataFrame:
         return df
     except Exception as e:
         print(f"ERROR: Failed to get recent price series for {symbol}. Reason: {e}")
-        return pd.DataFrame() 
\ No newline at end of file
+        return pd.DataFrame()
+
+
+@traced(cat='io')
+def list_symbols() -> list:
+    """Returns every symbol table stored in the price database."""
+    conn = sqlite3.connect('database/stock_price.db')
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name").fetchall()
+    conn.close()
+    return [r[0] for r in rows]
+
+# SQLite limits a compound SELECT to 500 terms by default
+_MAX_UNION_TERMS = 400
+
+@traced(cat='io')
+def load_price_panel(symbols: list, start_date: str, end_date: str, field: str = 'close') -> pd.DataFrame:
+    """
+    Loads one price field for many symbols in a single query
+    (one per 400 symbols).
+
+    Args:
+        symbols (list): Stock symbols (table names) to load.
+        start_date (str): Inclusive start date (YYYY-MM-DD).
+        end_date (str): Inclusive end date (YYYY-MM-DD).
+        field (str): Price column to load. Defaults to 'close'.
+
+    Returns:
+        pd.DataFrame: A dates × symbols panel aligned on the union of all
+                      trading dates; dates a symbol did not trade are NaN.
+    """
+    frames = []
+    conn = sqlite3.connect('database/stock_price.db')
+    for start in range(0, len(symbols), _MAX_UNION_TERMS):
+        chunk = symbols[start:start + _MAX_UNION_TERMS]
+        union = " UNION ALL ".join(
+            f"SELECT '{s}' AS symbol, date, {field} AS value FROM {s} WHERE date >= ? AND date <= ?"
+            for s in chunk
+        )
+        frames.append(pd.read_sql(union, conn, params=[start_date, end_date] * len(chunk), parse_dates=['date']))
+    conn.close()
+    df = pd.concat(frames, ignore_index=True)
+    # 部分資料表有重複日期，保留最後一筆
+    df = df.drop_duplicates(subset=['symbol', 'date'], keep='last')
+    panel = df.pivot(index='date', columns='symbol', values='value').sort_index()
+    return panel.reindex(columns=list(symbols))
+
+@traced(cat='io')
+def get_recent_price_panel(symbols: list, window: int = 30, field: str = 'close', with_dates: bool = False,
+                           as_of: str = None):
+    """
+    Retrieves the most recent N (window) bars of many symbols with one
+    UNION ALL query per 400 symbols, as a panel aligned on bar position.
+
+    Each column holds the same rows get_recent_price_series() would return
+    for that symbol: row window-1 is the symbol's latest bar, and symbols
+    with fewer than N bars are NaN-padded at the top. Symbols without a
+    table in the database are left out of the result.
+
+    Args:
+        symbols (list): Stock symbols (table names) to load.
+        window (int): The number of recent bars per symbol.
+        field (str): Price column to load. Defaults to 'close'.
+        with_dates (bool): Also return the date of each symbol's latest bar,
+            read by the same query as the panel.
+        as_of (str): Inclusive last date (YYYY-MM-DD). Bars after it are
+            ignored, so a replay of a past day does not see later prices.
+
+    Returns:
+        pd.DataFrame: A window × symbols panel indexed by bar position, or
+                      (panel, pd.Series of symbol -> latest bar date) when
+                      with_dates is True.
+    """
+    available = set(list_symbols())
+    found = [s for s in dict.fromkeys(symbols) if s in available]
+    where = "WHERE date <= ? " if as_of is not None else ""
+    frames = []
+    conn = sqlite3.connect('database/stock_price.db')
+    try:
+        for start in range(0, len(found), _MAX_UNION_TERMS):
+            chunk = found[start:start + _MAX_UNION_TERMS]
+            union = " UNION ALL ".join(
+                f"SELECT * FROM (SELECT '{s}' AS symbol, date, {field} AS value FROM {s} "
+                f"{where}ORDER BY date DESC LIMIT {int(window)})"
+                for s in chunk
+            )
+            params = [str(as_of)] * len(chunk) if as_of is not None else None
+            frames.append(pd.read_sql(union, conn, params=params))
+    finally:
+        conn.close()
+
+    if not frames:
+        panel = pd.DataFrame(index=pd.RangeIndex(window), columns=[], dtype=float)
+        return (panel, pd.Series(dtype=object)) if with_dates else panel
+    df = pd.concat(frames, ignore_index=True).sort_values(['symbol', 'date'], kind='stable')
+    # Position counted from each symbol's latest bar, so shorter histories are padded at the top
+    df['position'] = window - 1 - df.groupby('symbol').cumcount(ascending=False)
+    panel = df.pivot(index='position', columns='symbol', values='value')
+    panel = panel.reindex(index=pd.RangeIndex(window), columns=found).astype(float)
+    if with_dates:
+        return panel, df.groupby('symbol')['date'].last().reindex(found).dropna().rename(None)
+    return panel
+
+@traced(cat='io')
+def get_latest_closes(symbols: list, as_of: str = None) -> pd.Series:
+    """
+    Retrieves the latest close of many symbols in one batched query
+    (see get_recent_price_panel()).
+
+    Args:
+        symbols (list): Stock symbols (table names).
+        as_of (str): Inclusive last date (YYYY-MM-DD); later closes are ignored.
+
+    Returns:
+        pd.Series: symbol -> latest close, leaving out symbols without data.
+    """
+    symbols = [s for s in dict.fromkeys(symbols) if isinstance(s, str) and s]
+    if not symbols:
+        return pd.Series(dtype=float)
+    return get_recent_price_panel(symbols, window=1, as_of=as_of).iloc[-1].dropna().rename(None)
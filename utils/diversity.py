@@ -0,0 +1,116 @@
+"""
+報酬相關性多樣化篩選
+
+M5 依單一指標取前 N 名時，常會選到幾乎相同的策略（同一個 RSI 週期、門檻略有不同、
+在同樣的日子進出場）。此模組把每個候選策略的每日報酬排成 bars × params 矩陣，
+以分塊矩陣乘法計算相關係數，再依排名順序貪婪挑選：只有與已選策略的相關係數
+都不超過 max_corr 的候選才會入選。全程不建立逐對的 DataFrame。
+"""
+import os
+import numpy as np
+from utils.performance_utils import positions_from_signals, strategy_returns_matrix
+from utils.signal_io import read_signal_file, resolve_signal_file
+from utils.version_manager import version_manager
+
+
+def returns_matrix_from_signals(signal_df, param_ids=None):
+    """
+    由 M2-1/M4-1 的訊號檔（date, param_id, signal, close）建立每日策略報酬矩陣。
+    部位與報酬的計算方式與 calculate_performance_metrics 相同，第一次交易前的報酬為 0。
+    指定 param_ids 時依其順序排列，訊號檔中沒有的參數顯示警告後略過。
+    回傳 (param_ids, returns)：returns 為 bars × params。
+    """
+    signals = signal_df.pivot_table(index='date', columns='param_id', values='signal', aggfunc='last').sort_index()
+    close = signal_df.groupby('date')['close'].last().reindex(signals.index)
+    if param_ids is not None:
+        available = set(signals.columns)
+        missing = [p for p in param_ids if p not in available]
+        if missing:
+            print(f'⚠️ 訊號檔中沒有 {len(missing)} 組參數，略過: {", ".join(map(str, missing[:5]))}'
+                  f'{" ..." if len(missing) > 5 else ""}')
+        signals = signals[[p for p in param_ids if p in available]]
+    positions = positions_from_signals(signals.fillna(0).to_numpy())
+    daily_returns, active = strategy_returns_matrix(close.to_numpy(), positions)
+    return list(signals.columns), np.where(active, daily_returns, 0.0)
+
+def standardize(returns):
+    """每一欄減去平均並除以 (標準差 × sqrt(n))，使 Z.T @ Z 即為相關係數矩陣；常數欄為 0"""
+    returns = np.asarray(returns, dtype=float)
+    centered = returns - returns.mean(axis=0)
+    norm = np.sqrt((centered ** 2).sum(axis=0))
+    return np.divide(centered, norm, out=np.zeros_like(centered), where=norm > 0)
+
+def greedy_diverse_select(returns, max_corr=0.7, top_n=10, block_size=256):
+    """
+    依欄位順序（已由呼叫端依分數排序）貪婪挑選 top_n 個彼此相關係數不超過 max_corr 的策略。
+    候選以 block_size 為一塊處理：每塊只計算「塊內 × 塊內」與「塊內 × 已選」的相關係數，
+    選滿即停止，不需要完整的相關係數矩陣。回傳入選欄位的索引。
+    """
+    z = standardize(returns)
+    n = z.shape[1]
+    selected = []
+    for start in range(0, n, block_size):
+        block = z[:, start:start + block_size]
+        with_selected = block.T @ z[:, selected] if selected else np.zeros((block.shape[1], 0))
+        within = block.T @ block
+        picked = []
+        for i in range(block.shape[1]):
+            if with_selected[i].size and with_selected[i].max() > max_corr:
+                continue
+            if picked and within[i, picked].max() > max_corr:
+                continue
+            picked.append(i)
+            if len(selected) + len(picked) >= top_n:
+                break
+        selected.extend(start + i for i in picked)
+        if len(selected) >= top_n:
+            break
+    return selected
+
+def validation_signal_file_for(perf_file_path, signals_dir):
+    """
+    找出 M4-2 績效檔對應的 M4-1 訊號檔：依產出檔目錄的 parents 往上追溯；
+    未登記的舊檔才由檔名推回：performance_{X}_validation.csv → {X}.csv（{X} 可能是壓縮後的 .npz）。
+    """
+    for record in version_manager.artifact_lineage(perf_file_path):
+        if record['kind'] in ('validation_signals', 'signals'):
+            return record['path']
+
+    name = os.path.basename(perf_file_path)
+    for suffix in ('_validation.csv', '_batch.csv'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    if name.startswith('performance_'):
+        name = name[len('performance_'):]
+    if name.endswith('.npz'):
+        return os.path.join(signals_dir, name)
+    return os.path.join(signals_dir, f'{name}.csv')
+
+def diversify(ranked_df, signal_file_path, max_corr=0.7, top_n=10):
+    """
+    從已排序的績效表中依序挑出彼此報酬相關係數不超過 max_corr 的前 N 名（M5 使用）。
+    找不到訊號檔時顯示警告並直接取前 N 名；訊號檔已被壓縮為 .npz 時讀取壓縮檔。
+    """
+    if resolve_signal_file(signal_file_path) is None:
+        print(f'⚠️ 找不到訊號檔，略過多樣化篩選: {signal_file_path}')
+        return ranked_df.head(top_n)
+
+    signal_df = read_signal_file(signal_file_path, usecols=['date', 'param_id', 'signal', 'close'])
+    param_ids, returns = returns_matrix_from_signals(signal_df, ranked_df['param_id'])
+    picks = {param_ids[i] for i in greedy_diverse_select(returns, max_corr, top_n)}
+    # 欄位依排名順序排列，入選者保持原排名
+    result = ranked_df[ranked_df['param_id'].isin(picks)]
+    print(f'多樣化篩選：{len(ranked_df)} 組候選，相關係數上限 {max_corr}，入選 {len(result)} 組')
+    return result
+
+def prompt_diversity():
+    """互動式詢問是否啟用多樣化篩選（M5 使用），回傳 diversity dict 或 None"""
+    text = input('報酬相關係數上限（例如 0.7，啟用多樣化篩選；直接 Enter 略過）：').strip()
+    if not text:
+        return None
+    try:
+        return {'max_corr': float(text)}
+    except ValueError:
+        print('數值錯誤，略過多樣化篩選')
+        return None
@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
+from utils.tracing import traced
 
+@traced(cat='compute')
 def calculate_rsi(data, period=14, price_col='close'):
     """Calculate the Relative Strength Index (RSI)"""
     delta = data[price_col].diff()
@@ -10,7 +13,46 @@ def calculate_rsi(data, period=14, price_col='close'):
     data['rsi'] = rsi
     return data
 
+@traced(cat='compute')
 def calculate_sma(data, period, col_name, price_col='close'):
     """Calculate Simple Moving Average (SMA)"""
     data[col_name] = data[price_col].rolling(window=period).mean()
-    return data 
\ No newline at end of file
+    return data 
+
+# === numpy 版本：供批次/矩陣運算使用，語意與上方 pandas 版本一致 ===
+
+def rolling_mean_array(values, window):
+    """
+    沿 axis 0 計算滾動平均，前 window-1 筆為 NaN（同 pandas rolling().mean()）。
+    支援 1-D 或 bars × N 的陣列；視窗內含 NaN 時結果為 NaN。
+    """
+    values = np.asarray(values, dtype=float)
+    out = np.full(values.shape, np.nan)
+    if window <= 0 or window > len(values):
+        return out
+    valid = ~np.isnan(values)
+    csum = np.cumsum(np.insert(np.where(valid, values, 0.0), 0, 0.0, axis=0), axis=0)
+    ccount = np.cumsum(np.insert(valid, 0, False, axis=0), axis=0)
+    window_sum = csum[window:] - csum[:-window]
+    window_count = ccount[window:] - ccount[:-window]
+    out[window - 1:] = np.where(window_count == window, window_sum / window, np.nan)
+    return out
+
+@traced(cat='compute')
+def rsi_array(close, period=14):
+    """Calculate RSI on a numpy close array (1-D or bars × symbols)"""
+    close = np.asarray(close, dtype=float)
+    delta = np.diff(close, axis=0, prepend=np.nan * close[:1])
+    gain = rolling_mean_array(np.where(delta > 0, delta, 0.0), period)
+    loss = rolling_mean_array(np.where(delta < 0, -delta, 0.0), period)
+    # cumsum 相減會留下極小的殘差，歸零以免平盤區間被誤判
+    gain = np.where(np.abs(gain) < 1e-12, 0.0, gain)
+    loss = np.where(np.abs(loss) < 1e-12, 0.0, loss)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+@traced(cat='compute')
+def sma_array(close, period):
+    """Calculate SMA on a numpy close array"""
+    return rolling_mean_array(close, period)
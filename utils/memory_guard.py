@@ -0,0 +1,340 @@
+"""
+記憶體用量監控與上限保護
+
+大型參數掃描最容易在 M2-1/M4-1 的 pd.concat(all_signals) 與 M2-2/M4-2 讀入整個
+訊號檔時耗盡記憶體。此模組以 stage() 記錄每個階段（與股票、策略）的 RSS：
+開始、結束與背景執行緒取樣得到的峰值；啟用 allocations 時另以 tracemalloc
+比較階段前後的快照，列出成長最多的配置位置。
+
+設定記憶體上限（MB）後：
+    - check()：目前 RSS 超過上限 × fail_fraction 時丟出 MemoryCeilingExceeded，
+      在迴圈中呼叫即可在被 OOM killer 終止前提早失敗
+    - should_chunk(預估 MB)：預估的配置會讓 RSS 超過上限 × soft_fraction 時回傳 True，
+      呼叫端改走分段（chunked）路徑；on_ceiling='fail' 時改為直接丟出例外
+
+階段指定 report_dir，且設定了記憶體上限、啟用 allocations 或 reports 時，
+結束（包含失敗）後把數據寫成 memory_*.json 並登記為 memory_report 產出檔，
+留在該次執行的版本目錄中；都沒有啟用時只在記憶體中保留最近 max_records 筆紀錄。
+
+設定方式：utils.config.MEMORY_CEILING_MB / MEMORY_REPORTS、環境變數
+QUANT_MEMORY_CEILING_MB / QUANT_MEMORY_ALLOCATIONS / QUANT_MEMORY_REPORTS，
+或 memory_monitor.configure(...)（會一併設定環境變數，讓子行程沿用）。
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List, Optional
+from utils import config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MEMORY_CEILING_ENV = 'QUANT_MEMORY_CEILING_MB'
+MEMORY_ALLOCATIONS_ENV = 'QUANT_MEMORY_ALLOCATIONS'
+MEMORY_REPORTS_ENV = 'QUANT_MEMORY_REPORTS'
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class MemoryCeilingExceeded(MemoryError):
+    """RSS 接近或超過設定的記憶體上限"""
+
+
+def current_rss_mb() -> float:
+    """目前行程的 RSS（MB）。沒有 /proc 時以行程峰值代替（上界），都取不到時回傳 0"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    """行程啟動以來的 RSS 峰值（MB）"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報，macOS 以 bytes 回報
+    return peak / 2 ** 20 if os.uname().sysname == 'Darwin' else peak / 1024
+
+def frame_mb(df) -> float:
+    """DataFrame 佔用的記憶體（MB，不含字串內容，作為下限估計）"""
+    return df.memory_usage(index=True, deep=False).sum() / 2 ** 20
+
+
+class _StageContext:
+    def __init__(self, monitor: 'MemoryMonitor', name: str, report_dir: Optional[str], labels: Dict):
+        self.monitor = monitor
+        self.report_dir = report_dir
+        self.record = {'stage': name, 'labels': labels}
+        self._snapshot = None
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        monitor = self.monitor
+        rss = current_rss_mb()
+        self.record.update(started_at=datetime.now().isoformat(timespec='seconds'), start_mb=rss, peak_mb=rss,
+                           ceiling_mb=monitor.ceiling_mb, chunked=[], children=[])
+        self._first_child = len(monitor.records)
+        if monitor.allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            self._snapshot = tracemalloc.take_snapshot()
+        monitor._push(self.record)
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        monitor = self.monitor
+        monitor._pop(self.record)
+        rss = current_rss_mb()
+        record = self.record
+        record['end_mb'] = rss
+        record['peak_mb'] = max(record['peak_mb'], rss)
+        record['delta_mb'] = rss - record['start_mb']
+        record['process_peak_mb'] = peak_rss_mb()
+        if exc_type is not None:
+            record['error'] = f"{exc_type.__name__}: {exc}"
+        if self._snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self._snapshot, 'lineno')
+            record['top_allocations'] = [
+                {'location': f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+                 'size_diff_kb': round(s.size_diff / 1024, 1), 'count_diff': s.count_diff}
+                for s in stats[:monitor.top_n]
+            ]
+            self._snapshot = None
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        # 子階段已寫入 records，搬到本階段底下；取樣間隔內的短暫峰值只有子階段量得到
+        record['children'] = monitor.records[self._first_child:]
+        del monitor.records[self._first_child:]
+        record['peak_mb'] = max([record['peak_mb']] + [child['peak_mb'] for child in record['children']])
+        monitor.records.append(record)
+        # 只在沒有進行中的階段時修剪，進行中階段的 _first_child 索引才不會失效
+        if not monitor._active and len(monitor.records) > monitor.max_records:
+            del monitor.records[:-monitor.max_records]
+        if self.report_dir and monitor.reporting:
+            monitor.write_report(record, self.report_dir)
+        return False
+
+
+class MemoryMonitor:
+    """各階段的 RSS 紀錄與記憶體上限；整個行程共用 utils.memory_guard.memory_monitor"""
+
+    def __init__(self, ceiling_mb: Optional[float] = None, soft_fraction: float = 0.8,
+                 fail_fraction: float = 0.95, on_ceiling: str = 'chunk', allocations: bool = False,
+                 reports: bool = False, top_n: int = 10, interval: float = 0.05, max_records: int = 100):
+        env_ceiling = os.environ.get(MEMORY_CEILING_ENV)
+        self.ceiling_mb = float(env_ceiling) if env_ceiling else ceiling_mb
+        self.soft_fraction = soft_fraction
+        self.fail_fraction = fail_fraction
+        self.on_ceiling = on_ceiling
+        self.allocations = allocations or os.environ.get(MEMORY_ALLOCATIONS_ENV, '') not in ('', '0')
+        env_reports = os.environ.get(MEMORY_REPORTS_ENV)
+        self.reports = env_reports not in ('', '0') if env_reports is not None else reports
+        self.top_n = top_n
+        self.interval = interval
+        # 最近完成的頂層階段紀錄（長時間執行的行程不會無限累積）
+        self.max_records = max_records
+        self.records: List[Dict] = []
+        self._active: List[Dict] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._sampled_peak = 0.0
+
+    def configure(self, ceiling_mb: Optional[float] = None, on_ceiling: Optional[str] = None,
+                  allocations: Optional[bool] = None, reports: Optional[bool] = None,
+                  soft_fraction: Optional[float] = None, fail_fraction: Optional[float] = None):
+        """調整設定；上限、allocations 與 reports 同時寫入環境變數，讓之後啟動的子行程沿用"""
+        if ceiling_mb is not None:
+            self.ceiling_mb = float(ceiling_mb) if ceiling_mb > 0 else None
+            if self.ceiling_mb:
+                os.environ[MEMORY_CEILING_ENV] = str(self.ceiling_mb)
+            else:
+                os.environ.pop(MEMORY_CEILING_ENV, None)
+        if on_ceiling is not None:
+            if on_ceiling not in ('chunk', 'fail'):
+                raise ValueError(f"on_ceiling 必須是 'chunk' 或 'fail'，收到 {on_ceiling}")
+            self.on_ceiling = on_ceiling
+        if allocations is not None:
+            self.allocations = bool(allocations)
+            os.environ[MEMORY_ALLOCATIONS_ENV] = '1' if allocations else '0'
+        if reports is not None:
+            self.reports = bool(reports)
+            os.environ[MEMORY_REPORTS_ENV] = '1' if reports else '0'
+        if soft_fraction is not None:
+            self.soft_fraction = soft_fraction
+        if fail_fraction is not None:
+            self.fail_fraction = fail_fraction
+        return self
+
+    # === 階段紀錄 ===
+
+    def stage(self, name: str, report_dir: Optional[str] = None, **labels) -> _StageContext:
+        """
+        記錄一個階段的記憶體用量：
+            with memory_monitor.stage('M2-1', report_dir=signals_dir, symbol=symbol) as mem:
+                ...
+        回傳的 dict 在階段結束後帶有 start_mb / peak_mb / end_mb / delta_mb 等欄位。
+        """
+        return _StageContext(self, name, report_dir, labels)
+
+    def _push(self, record: Dict):
+        with self._lock:
+            self._active.append(record)
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample, name='memory-sampler', daemon=True)
+                self._sampler.start()
+
+    def _pop(self, record: Dict):
+        with self._lock:
+            self._active = [r for r in self._active if r is not record]
+
+    def _sample(self):
+        """背景取樣 RSS，更新所有進行中階段的峰值；沒有進行中的階段時結束"""
+        while True:
+            rss = current_rss_mb()
+            with self._lock:
+                if not self._active:
+                    self._sampler = None
+                    return
+                for record in self._active:
+                    if rss > record['peak_mb']:
+                        record['peak_mb'] = rss
+                self._sampled_peak = max(self._sampled_peak, rss)
+            time.sleep(self.interval)
+
+    # === 上限 ===
+
+    def headroom_mb(self) -> float:
+        """距離上限還有多少 MB（未設定上限時為無限大）"""
+        if not self.ceiling_mb:
+            return float('inf')
+        return self.ceiling_mb - current_rss_mb()
+
+    def check(self, where: str = ''):
+        """RSS（含背景取樣到的峰值）超過上限 × fail_fraction 時丟出 MemoryCeilingExceeded"""
+        if not self.ceiling_mb:
+            return
+        with self._lock:
+            rss = max(current_rss_mb(), self._sampled_peak)
+            self._sampled_peak = 0.0
+        if rss > self.ceiling_mb * self.fail_fraction:
+            raise MemoryCeilingExceeded(
+                f"{where or '目前階段'} 的 RSS {rss:,.0f} MB 已接近記憶體上限 {self.ceiling_mb:,.0f} MB")
+
+    def should_chunk(self, estimated_mb: float, what: str = '') -> bool:
+        """
+        預估再配置 estimated_mb 後 RSS 是否會超過上限 × soft_fraction。
+        會超過時：on_ceiling='chunk' 回傳 True（呼叫端改走分段路徑），
+        on_ceiling='fail' 直接丟出 MemoryCeilingExceeded。
+        """
+        if not self.ceiling_mb:
+            return False
+        rss = current_rss_mb()
+        if rss + estimated_mb <= self.ceiling_mb * self.soft_fraction:
+            return False
+        message = (f"{what or '配置'} 預估需要 {estimated_mb:,.0f} MB，目前 RSS {rss:,.0f} MB，"
+                   f"超過記憶體上限 {self.ceiling_mb:,.0f} MB 的 {self.soft_fraction:.0%}")
+        if self.on_ceiling == 'fail':
+            raise MemoryCeilingExceeded(message)
+        print(f"⚠️ {message}，改用分段處理")
+        with self._lock:
+            for record in self._active:
+                record['chunked'].append(what or 'chunked')
+        return True
+
+    # === 報告 ===
+
+    @property
+    def reporting(self) -> bool:
+        """階段結束時是否寫出 memory_*.json：設定了上限、啟用 allocations 或 reports 時才寫"""
+        return bool(self.ceiling_mb or self.allocations or self.reports)
+
+    def write_report(self, record: Dict, report_dir: str) -> str:
+        """將一個階段的紀錄寫成 memory_{stage}_{labels}_{時間}.json 並登記為產出檔"""
+        from utils.version_manager import version_manager
+        labels = record.get('labels', {})
+        tag = '_'.join(str(v) for v in labels.values() if v is not None and len(str(v)) <= 40)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        name = '_'.join(p for p in ('memory', record['stage'].replace(' ', '-'), tag, stamp) if p)
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, f'{name}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(_rounded(record), f, ensure_ascii=False, indent=2, default=str)
+        version_manager.register_artifact(path, 'memory_report', labels.get('symbol'), labels.get('strategy'),
+                                          stage=record['stage'], peak_mb=round(record['peak_mb'], 1),
+                                          failed='error' in record)
+        print(f"🧠 {record['stage']} 記憶體：峰值 {record['peak_mb']:,.0f} MB（增加 {record['delta_mb']:+,.0f} MB）"
+              f"{'，已改用分段處理' if record['chunked'] else ''}")
+        return path
+
+
+class SpillingCsvWriter:
+    """
+    收集各組參數的訊號 DataFrame，結束時一次 concat 並寫成 CSV（與原本的寫法相同）。
+    預估 concat 會超過記憶體上限時，改為把已收集與之後的 DataFrame 逐段附加寫入同一個 CSV，
+    產出的檔案內容與一次寫出相同，但不需要同時在記憶體中保留全部訊號。
+    """
+
+    def __init__(self, path: str, monitor: Optional[MemoryMonitor] = None, what: str = 'concat'):
+        self.path = path
+        self.monitor = monitor or memory_monitor
+        self.what = what
+        self.frames = []
+        self.buffered_mb = 0.0
+        self.n_frames = 0
+        self.rows = 0
+        self.spilled = False
+
+    def add(self, df):
+        self.n_frames += 1
+        if self.spilled:
+            self._append(df)
+            return
+        self.frames.append(df)
+        self.buffered_mb += frame_mb(df)
+        # concat 與 reset_index 各複製一份
+        if self.monitor.should_chunk(2 * self.buffered_mb, self.what):
+            self.spilled = True
+            frames, self.frames = self.frames, []
+            for frame in frames:
+                self._append(frame)
+
+    def _append(self, df):
+        df = df.reset_index()
+        df.to_csv(self.path, mode='a' if self.rows else 'w', header=not self.rows, index=False)
+        self.rows += len(df)
+
+    def close(self) -> int:
+        """寫出尚未寫入的 DataFrame，回傳總列數"""
+        if self.spilled or not self.frames:
+            return self.rows
+        import pandas as pd
+        from utils.tracing import span
+        with span('concat', cat='compute', frames=len(self.frames)):
+            df_all = pd.concat(self.frames, ignore_index=False)
+            df_all.reset_index(inplace=True)
+        self.frames = []
+        with span('write_csv', cat='io', rows=len(df_all)):
+            df_all.to_csv(self.path, index=False)
+        self.rows = len(df_all)
+        return self.rows
+
+
+def _rounded(value):
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: _rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_rounded(v) for v in value]
+    return value
+
+
+memory_monitor = MemoryMonitor(ceiling_mb=config.MEMORY_CEILING_MB, on_ceiling=config.MEMORY_ON_CEILING,
+                               reports=config.MEMORY_REPORTS)
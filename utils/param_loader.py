@@ -1,17 +1,132 @@
 import json
 import os
+import threading
+import pandas as pd
+from utils.progress_metrics import record_cache
 from utils.version_manager import version_manager
 
+# Process-wide cache: absolute path -> ((mtime_ns, size), parsed content)
+_FILE_CACHE = {}
+_FILE_CACHE_LOCK = threading.Lock()
+
+def _cached(path: str, loader):
+    """
+    Returns loader(path), parsing each file only once per process.
+    The entry is invalidated when the file's mtime or size changes.
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    entry = _FILE_CACHE.get(path)
+    if entry is not None and entry[0] == stamp:
+        record_cache('param_file', hit=True)
+        return entry[1]
+    record_cache('param_file', hit=False)
+    value = loader(path)
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE[path] = (stamp, value)
+    return value
+
+def clear_param_cache():
+    """Drops every cached param log and best-strategy table."""
+    with _FILE_CACHE_LOCK:
+        _FILE_CACHE.clear()
+
 def load_param_list(path):
     with open(path, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def _build_param_index(path):
+    return {param_set.get('id'): param_set for param_set in load_param_list(path)}
+
+def load_param_index(path: str) -> dict:
+    """
+    Returns an {id: params} dict for a param_log file.
+    The file is parsed once per process and re-read only after it changes.
+    The returned dict is shared by all callers and must not be mutated.
+    """
+    return _cached(path, _build_param_index)
+
+def load_best_strategy_table(path: str) -> pd.DataFrame:
+    """Reads a best_strategies_*.csv through the same process-wide cache (do not mutate the result)."""
+    return _cached(path, pd.read_csv)
+
+def param_log_path(strategy_type: str, symbol: str, mode: str = 'in_sample', version_id: str = None) -> str:
+    """
+    Resolves the param_log file of a strategy/symbol through the artifact
+    catalog, falling back to the conventional file name in the version directory.
+    """
+    if mode not in ('in_sample', 'out_sample'):
+        raise ValueError("Mode must be either 'in_sample' or 'out_sample'")
+    version_id = version_id or version_manager.get_current_version()
+    kind = 'param_log' if mode == 'in_sample' else 'best_param_log'
+    record = version_manager.latest_artifact(kind, version_id, symbol, strategy_type)
+    if record is not None:
+        return record['path']
+    path_type = 'in_sample_params' if mode == 'in_sample' else 'out_sample_params'
+    return os.path.join(version_manager.get_version_path(version_id, path_type),
+                        f'param_log_{strategy_type}_{symbol}.json')
+
+def param_log_paths(strategy_type: str, symbol: str, mode: str = 'in_sample', version_id: str = None) -> list:
+    """
+    Every param_log file of a strategy/symbol in the catalog, newest first,
+    ending with the conventional file name when it is not cataloged.
+    """
+    version_id = version_id or version_manager.get_current_version()
+    kind = 'param_log' if mode == 'in_sample' else 'best_param_log'
+    paths = [r['path'] for r in version_manager.find_artifacts(kind, version_id, symbol, strategy_type)]
+    fallback = param_log_path(strategy_type, symbol, mode, version_id)
+    return paths if fallback in paths else paths + [fallback]
+
+def best_param_log_for(best_file: str, symbol: str, strategy_type: str, version_id: str = None) -> str:
+    """
+    The best_param_log written together with a best-strategy table (its
+    catalog parents include best_file). Tables from before that lineage was
+    recorded fall back to the latest best_param_log of the strategy/symbol.
+    Returns None when there is none.
+    """
+    version_id = version_id or version_manager.get_current_version()
+    records = version_manager.find_artifacts('best_param_log', version_id, symbol, strategy_type)
+    for record in records:
+        if version_manager.derived_from(record['path'], best_file):
+            return record['path']
+    return records[0]['path'] if records else None
+
+def write_best_param_log(param_ids, symbol: str, strategy_type: str, version_id: str,
+                         best_file: str = None, file_name: str = None) -> str:
+    """
+    Copies the in-sample param_log of a strategy/symbol, keeping only
+    param_ids, into the version's out-of-sample params directory and
+    registers it as best_param_log (parents: the source log and best_file).
+    file_name defaults to the source log's name.
+
+    Returns:
+        str: The path written, or None if the in-sample param_log is not found.
+    """
+    record = version_manager.latest_artifact('param_log', version_id, symbol, strategy_type)
+    if record is None:
+        return None
+    src = record['path']
+    dst_dir = version_manager.get_version_path(version_id, 'out_sample_params')
+    os.makedirs(dst_dir, exist_ok=True)
+    dst = os.path.join(dst_dir, file_name or os.path.basename(src))
+    keep = set(param_ids)
+    params = [p for p in load_param_list(src) if p.get('id') in keep]
+    with open(dst, 'w', encoding='utf-8') as f:
+        json.dump(params, f, ensure_ascii=False, indent=2)
+    version_manager.register_artifact(dst, 'best_param_log', symbol, strategy_type, version_id,
+                                      parents=[src, best_file], rows=len(params))
+    return dst
+
 def load_param(strategy_type: str, param_id: str, symbol: str, mode: str = 'in_sample') -> dict:
     """
     Loads a specific parameter set from a JSON log file.
 
-    It constructs the path to the parameter log file based on the strategy,
-    symbol, and mode (in_sample or out_sample), using versioned directories.
+    The parameter log files are located through the artifact catalog based on
+    the strategy, symbol, and mode (in_sample or out_sample) and searched
+    newest first, so ids selected by an earlier M3 run or by a results query
+    are still found. Each file is parsed once per process into an
+    id -> params index (see load_param_index).
 
     Args:
         strategy_type (str): The strategy type (e.g., 'RSI').
@@ -29,33 +144,25 @@ def load_param(strategy_type: str, param_id: str, symbol: str, mode: str = 'in_s
     if not current_version:
         print("WARNING: No current version found. Please run M1-M5 workflow first.")
         return {}
-    
-    if mode == 'in_sample':
-        # M6/M7 always use out_sample params, but this maintains compatibility
-        param_dir = version_manager.get_version_path(current_version, "in_sample_params")
-    elif mode == 'out_sample':
-        # For M6/M7 simulation, we use parameters from the validation phase
-        param_dir = version_manager.get_version_path(current_version, "out_sample_params")
-    else:
-        raise ValueError("Mode must be either 'in_sample' or 'out_sample'")
 
-    param_log_path = os.path.join(param_dir, f'param_log_{strategy_type}_{symbol}.json')
+    # M6/M7 use 'out_sample' (validation-phase params); 'in_sample' is kept for compatibility
+    paths = param_log_paths(strategy_type, symbol, mode, current_version)
 
     try:
-        with open(param_log_path, 'r', encoding='utf-8') as f:
-            all_params = json.load(f)
-        
-        # The param_log file is a list of dictionaries
-        for param_set in all_params:
-            if param_set.get('id') == param_id:
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            # The param_log is parsed once into an id -> params dict and cached
+            param_set = load_param_index(path).get(param_id)
+            if param_set is not None:
                 return param_set
-        
-        print(f"WARNING: param_id '{param_id}' not found in {param_log_path}")
-        return {}
 
-    except FileNotFoundError:
-        print(f"ERROR: Parameter log file not found at {param_log_path}")
+        if not any(os.path.exists(path) for path in paths):
+            print(f"ERROR: Parameter log file not found at {paths[-1]}")
+        else:
+            print(f"WARNING: param_id '{param_id}' not found in {', '.join(paths)}")
         return {}
+
     except Exception as e:
         print(f"ERROR: Failed to load param_id '{param_id}'. Reason: {e}")
-        return {} 
\ No newline at end of file
+        return {}
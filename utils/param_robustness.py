@@ -0,0 +1,236 @@
+"""
+參數鄰域穩健度
+
+單一參數的 Sharpe 很高、但鄰近參數全部虧損，幾乎可以確定是過度擬合。
+此模組把 param log 的參數轉成正規化向量（每個維度縮放到 [0, 1]），
+以 KD-tree 找出每組參數的 k 個最近鄰，計算鄰域績效統計：
+鄰域中位數、離散程度、正報酬比例，以及「鄰域中位數 − penalty × 標準差」的平滑分數。
+
+KD-tree 以中位數切分建立，查詢時以葉節點為單位批次計算：
+同一葉節點的所有查詢點一起與候選葉節點做向量化距離運算，
+候選葉節點以邊界盒距離剪枝，整體約為 O(n log n)，不做 O(n²) 的兩兩比較。
+"""
+import os
+import json
+import warnings
+import numpy as np
+import pandas as pd
+from utils.return_matrix import param_id_of
+
+# 剪枝上界的相對放寬量
+BOUND_RTOL = 1e-9
+
+# 會影響訊號的參數；stop_loss / take_profit 目前不參與訊號產生，不納入距離計算
+SIGNAL_PARAM_KEYS = {
+    'RSI': ['rsi_period', 'rsi_upper', 'rsi_lower'],
+    'CROSS': ['fast_period', 'slow_period'],
+}
+
+
+class KDTree:
+    """以 numpy 實作的 KD-tree，只支援「所有點彼此查詢 k 個最近鄰」"""
+
+    def __init__(self, points, leaf_size=32):
+        self.points = np.asarray(points, dtype=float)
+        self.leaf_size = leaf_size
+        # 節點以陣列儲存：邊界盒、左右子節點（-1 表示葉節點）、父節點、節點內的點索引
+        lo, hi, children, parents, node_points = [], [], [], [], []
+
+        def new_node(idx, parent=-1):
+            pts = self.points[idx]
+            lo.append(pts.min(axis=0))
+            hi.append(pts.max(axis=0))
+            children.append([-1, -1])
+            parents.append(parent)
+            node_points.append(idx)
+            return len(children) - 1
+
+        # 以堆疊取代遞迴，避免大量參數時超過遞迴深度
+        stack = [new_node(np.arange(len(self.points)))] if len(self.points) else []
+        while stack:
+            node = stack.pop()
+            idx = node_points[node]
+            dim = int(np.argmax(hi[node] - lo[node]))
+            if len(idx) <= leaf_size or hi[node][dim] == lo[node][dim]:
+                continue
+            mid = len(idx) // 2
+            order = np.argpartition(self.points[idx, dim], mid)
+            children[node] = [new_node(idx[order[:mid]], node), new_node(idx[order[mid:]], node)]
+            stack.extend(children[node])
+
+        self.node_lo, self.node_hi = np.array(lo), np.array(hi)
+        self.children = np.array(children, dtype=int).reshape(-1, 2)
+        self.parents = np.array(parents, dtype=int)
+        self.node_points = node_points
+        self.leaves = np.nonzero(self.children[:, 0] < 0)[0]
+
+    def _candidate_leaves(self, bounds):
+        """
+        對每個查詢葉節點，由根節點往下逐層走訪，找出邊界盒距離不超過其上界的葉節點。
+        所有查詢葉節點同時以向量化方式走訪。回傳 (查詢葉節點, 候選葉節點) 配對。
+        """
+        qs = self.leaves.copy()
+        ns = np.zeros(len(qs), dtype=int)
+        found_q, found_n = [], []
+        while len(qs):
+            gap = np.maximum(0, np.maximum(self.node_lo[ns] - self.node_hi[qs], self.node_lo[qs] - self.node_hi[ns]))
+            keep = np.sqrt((gap ** 2).sum(axis=1)) <= bounds[qs]
+            qs, ns = qs[keep], ns[keep]
+            is_leaf = self.children[ns, 0] < 0
+            found_q.append(qs[is_leaf])
+            found_n.append(ns[is_leaf])
+            qs = np.repeat(qs[~is_leaf], 2)
+            ns = self.children[ns[~is_leaf]].ravel()
+        found_q, found_n = np.concatenate(found_q), np.concatenate(found_n)
+        order = np.argsort(found_q, kind='stable')
+        return found_q[order], found_n[order]
+
+    def knn_all(self, k):
+        """
+        回傳 (indices, distances)：每個點的 k 個最近鄰（不含自己），依距離由近到遠。
+        點數不足 k + 1 時，不足的位置以 -1 / inf 補齊。
+        """
+        n = len(self.points)
+        indices = np.full((n, k), -1, dtype=int)
+        distances = np.full((n, k), np.inf)
+        if n <= 1 or k <= 0:
+            return indices, distances
+
+        # 每個葉節點先在「至少含 k + 1 個點的最小祖先」內取得第 k 近距離的上界，作為剪枝半徑
+        bounds = np.full(len(self.children), np.inf)
+        for leaf in self.leaves:
+            node = leaf
+            while len(self.node_points[node]) <= k and self.parents[node] >= 0:
+                node = self.parents[node]
+            query_idx, cand_idx = self.node_points[leaf], self.node_points[node]
+            if len(cand_idx) > k:
+                d = self._pairwise(self.points[query_idx], self.points[cand_idx])
+                d[query_idx[:, None] == cand_idx[None, :]] = np.inf
+                bounds[leaf] = np.partition(d, k - 1, axis=1)[:, k - 1].max()
+        # 上界再放寬一點相對誤差，浮點運算的捨入不會讓真正的鄰居所在的葉節點被剪掉
+        bounds *= 1 + BOUND_RTOL
+
+        pair_q, pair_n = self._candidate_leaves(bounds)
+        splits = np.searchsorted(pair_q, self.leaves, side='right')
+        begin = 0
+        for leaf, end in zip(self.leaves, splits):
+            query_idx = self.node_points[leaf]
+            cand_idx = np.concatenate([self.node_points[j] for j in pair_n[begin:end]])
+            begin = end
+
+            d = self._pairwise(self.points[query_idx], self.points[cand_idx])
+            d[query_idx[:, None] == cand_idx[None, :]] = np.inf
+            m = min(k, len(cand_idx) - 1)
+            if m <= 0:
+                continue
+            part = np.argpartition(d, m - 1, axis=1)[:, :m]
+            part_d = np.take_along_axis(d, part, axis=1)
+            order = np.argsort(part_d, axis=1, kind='stable')
+            indices[query_idx, :m] = cand_idx[np.take_along_axis(part, order, axis=1)]
+            distances[query_idx, :m] = np.take_along_axis(part_d, order, axis=1)
+        return indices, distances
+
+    @staticmethod
+    def _pairwise(a, b):
+        # 以座標差計算（不用 |a|² + |b|² − 2ab 展開式，後者的相消誤差會讓剪枝上界小於真正距離）；
+        # a 為單一葉節點的點、維度只有 2～3，a × b × 維度 的暫存陣列很小
+        return np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+
+
+def param_matrix(param_list, strategy_type=None):
+    """
+    將 param log 轉為正規化的參數矩陣。
+    回傳 (param_ids, X, keys)：X 每個維度依最小/最大值縮放到 [0, 1]。
+    """
+    sources = [p.get('params', p) for p in param_list]
+    keys = SIGNAL_PARAM_KEYS.get((strategy_type or '').upper())
+    if not keys:
+        keys = sorted(k for k, v in sources[0].items()
+                      if isinstance(v, (int, float)) and not isinstance(v, bool) and k not in ('id', 'param_id'))
+    X = np.array([[float(s.get(k, np.nan)) for k in keys] for s in sources])
+    lo, hi = np.nanmin(X, axis=0), np.nanmax(X, axis=0)
+    span = np.where(hi > lo, hi - lo, 1.0)
+    X = np.nan_to_num((X - lo) / span)
+    return [param_id_of(p) for p in param_list], X, keys
+
+def neighborhood_scores(perf_df, param_list, strategy_type=None, metric='sharpe', k=8, penalty=0.5):
+    """
+    計算每組參數的鄰域績效統計（鄰域包含自己與 k 個最近鄰）。
+    回傳以 param_id 為鍵的 DataFrame：
+        neighbor_{metric}_median、neighbor_{metric}_std、neighbor_positive_ratio、
+        robust_{metric} = 鄰域中位數 − penalty × 鄰域標準差
+    沒有績效（NaN）的鄰居不列入統計。
+    """
+    param_ids, X, _ = param_matrix(param_list, strategy_type)
+    values = perf_df.set_index('param_id')[metric].reindex(param_ids).to_numpy(dtype=float)
+
+    neighbors, _ = KDTree(X).knn_all(k)
+    hood_idx = np.concatenate([np.arange(len(param_ids))[:, None], neighbors], axis=1)
+    hood = np.where(hood_idx >= 0, values[np.maximum(hood_idx, 0)], np.nan)
+
+    # 整個鄰域都沒有績效時 nanmedian 會發出 RuntimeWarning，結果維持 NaN 即可
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(hood, axis=1)
+        std = np.nanstd(hood, axis=1)
+        counts = (~np.isnan(hood)).sum(axis=1)
+        positive = np.where(counts > 0, (hood > 0).sum(axis=1) / np.maximum(counts, 1), np.nan)
+
+    return pd.DataFrame({
+        'param_id': param_ids,
+        f'neighbor_{metric}_median': median,
+        f'neighbor_{metric}_std': std,
+        'neighbor_positive_ratio': positive,
+        f'robust_{metric}': median - penalty * std,
+    })
+
+def add_robustness_scores(perf_df, param_list, strategy_type=None, metric='sharpe', k=8, penalty=0.5,
+                          min_positive_ratio=None):
+    """
+    在績效表加上鄰域穩健度欄位（M3 使用），可依 neighbor_positive_ratio 過濾。
+    績效表中找不到 param log 的參數會保留，但穩健度欄位為 NaN。
+    """
+    scores = neighborhood_scores(perf_df, param_list, strategy_type, metric, k, penalty)
+    merged = perf_df.merge(scores, on='param_id', how='left')
+    if min_positive_ratio is not None:
+        before = len(merged)
+        merged = merged[merged['neighbor_positive_ratio'] >= min_positive_ratio]
+        print(f"鄰域穩健度過濾：{before} → {len(merged)} 組參數（鄰域正 {metric} 比例 >= {min_positive_ratio}）")
+    return merged
+
+def add_robustness_for_perf_file(perf_df, perf_file_path, version_id=None, metric='sharpe', k=8, penalty=0.5,
+                                 min_positive_ratio=None):
+    """
+    找出產生該績效檔的 param log 並加上穩健度欄位：依產出檔目錄的 parents 往上追溯，
+    未登記的舊檔才以 param_loader.param_log_path 查詢該股票、策略的 param log。
+    找不到 param log 時顯示警告並回傳原表。
+    """
+    from utils.param_loader import param_log_path as lookup_param_log
+    from utils.version_manager import version_manager
+    symbol, strategy_type = version_manager.artifact_symbol_strategy(perf_file_path)
+    lineage = [r['path'] for r in version_manager.artifact_lineage(perf_file_path) if r['kind'] == 'param_log']
+    if lineage:
+        param_log_path = lineage[0]
+    elif symbol is not None:
+        param_log_path = lookup_param_log(strategy_type, symbol, 'in_sample', version_id)
+    else:
+        print(f'⚠️ 無法判斷績效檔的股票與策略，略過鄰域穩健度: {perf_file_path}')
+        return perf_df
+    if not os.path.exists(param_log_path):
+        print(f'⚠️ 找不到對應的 param log，略過鄰域穩健度: {param_log_path}')
+        return perf_df
+    with open(param_log_path, 'r', encoding='utf-8') as f:
+        param_list = json.load(f)
+    return add_robustness_scores(perf_df, param_list, strategy_type, metric, k, penalty, min_positive_ratio)
+
+def prompt_robustness():
+    """互動式詢問是否計算參數鄰域穩健度（M3 使用），回傳 robustness dict 或 None"""
+    if input('是否計算參數鄰域穩健度（以 k 近鄰平滑 sharpe）？(y/n, 預設n)：').strip().lower() != 'y':
+        return None
+    k = input('請輸入鄰居數 k（預設8）：').strip()
+    min_ratio = input('鄰域正 sharpe 比例下限（例如 0.5，直接 Enter 不過濾）：').strip()
+    try:
+        min_ratio = float(min_ratio) if min_ratio else None
+    except ValueError:
+        min_ratio = None
+    return {'metric': 'sharpe', 'k': int(k) if k.isdigit() else 8, 'min_positive_ratio': min_ratio}
@@ -0,0 +1,150 @@
+"""
+多目標 Pareto 篩選
+
+以多個績效指標（例如 sharpe、max_drawdown、n_trades）同時挑選策略：
+先以向量化的非支配排序找出 Pareto 前緣（第 1 層、第 2 層…），
+同一層內再以擁擠距離 (crowding distance) 偏好彼此差異較大的解，
+與 NSGA-II 的選擇規則相同。M3/M5 與 selector_utils 共用。
+"""
+import numpy as np
+
+# 各指標預設的最佳化方向（max_drawdown 為負值，越接近 0 越好；
+# n_trades 預設越多越好，代表績效不是來自少數幾筆交易，可用 'min' 改為偏好低週轉）
+DEFAULT_DIRECTIONS = {
+    'total_return': 'max',
+    'max_drawdown': 'max',
+    'sharpe': 'max',
+    'n_trades': 'max',
+    'robust_sharpe': 'max',
+}
+
+
+def _as_costs(df, objectives):
+    """將指標轉為「越小越好」的成本矩陣"""
+    costs = np.empty((len(df), len(objectives)))
+    for j, (col, direction) in enumerate(objectives.items()):
+        values = df[col].to_numpy(dtype=float)
+        costs[:, j] = -values if direction == 'max' else values
+    return costs
+
+def non_dominated_mask(costs):
+    """
+    回傳布林遮罩，標記不被任何其他點支配的點（成本越小越好）。
+    先依正規化成本總和排序，使最可能支配他人的點先被處理；每個前緣點
+    一次以向量運算剔除它支配的所有點，複雜度約為 O(n × 前緣大小)。
+    完全相同的點彼此不支配，會一起保留。
+    """
+    n = len(costs)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    span = costs.max(axis=0) - costs.min(axis=0)
+    order = np.argsort(((costs - costs.min(axis=0)) / np.where(span > 0, span, 1)).sum(axis=1), kind='stable')
+
+    remaining = order
+    candidates = costs[order]
+    i = 0
+    while i < len(candidates):
+        point = candidates[i]
+        dominated = np.all(candidates >= point, axis=1) & np.any(candidates > point, axis=1)
+        keep = ~dominated
+        remaining = remaining[keep]
+        candidates = candidates[keep]
+        i = int(keep[:i + 1].sum())
+
+    mask = np.zeros(n, dtype=bool)
+    mask[remaining] = True
+    return mask
+
+def pareto_fronts(costs, min_points=None):
+    """
+    逐層剝除非支配前緣，回傳每個點的前緣編號（1 為最佳層）。
+    有指定 min_points 時，累積點數達到後就停止，其餘點標記為 0。
+    """
+    ranks = np.zeros(len(costs), dtype=int)
+    remaining = np.arange(len(costs))
+    front = 1
+    while len(remaining):
+        mask = non_dominated_mask(costs[remaining])
+        ranks[remaining[mask]] = front
+        remaining = remaining[~mask]
+        if min_points is not None and (ranks > 0).sum() >= min_points:
+            break
+        front += 1
+    return ranks
+
+def crowding_distance(costs):
+    """同一前緣內每個點的擁擠距離；每個指標的兩端點為無限大"""
+    n, m = costs.shape
+    distance = np.zeros(n)
+    if n <= 2:
+        distance[:] = np.inf
+        return distance
+    for j in range(m):
+        order = np.argsort(costs[:, j], kind='stable')
+        sorted_vals = costs[order, j]
+        span = sorted_vals[-1] - sorted_vals[0]
+        distance[order[0]] = distance[order[-1]] = np.inf
+        if span > 0:
+            distance[order[1:-1]] += (sorted_vals[2:] - sorted_vals[:-2]) / span
+    return distance
+
+def parse_objectives(objectives):
+    """接受 ['sharpe', 'max_drawdown'] 或 {'sharpe': 'max', 'n_trades': 'min'}，回傳 {欄位: 方向}"""
+    if isinstance(objectives, dict):
+        parsed = dict(objectives)
+    else:
+        parsed = {col: DEFAULT_DIRECTIONS.get(col, 'max') for col in objectives}
+    bad = [col for col, d in parsed.items() if d not in ('max', 'min')]
+    if bad:
+        raise ValueError(f"最佳化方向必須是 max 或 min: {', '.join(bad)}")
+    return parsed
+
+def pareto_select(df, objectives, top_n=10):
+    """
+    依 Pareto 前緣與擁擠距離挑選前 N 名。
+    指標含 NaN 的列（例如沒有交易）不參與排序。回傳的 DataFrame 保留原欄位，
+    另加 pareto_front 與 crowding_distance 兩欄，依前緣、擁擠距離（大到小）排序。
+    """
+    objectives = parse_objectives(objectives)
+    missing = [col for col in objectives if col not in df.columns]
+    if missing:
+        raise ValueError(f"績效表缺少欄位: {', '.join(missing)}")
+
+    valid = df.dropna(subset=list(objectives))
+    costs = _as_costs(valid, objectives)
+    ranks = pareto_fronts(costs, min_points=top_n)
+
+    selected = valid[ranks > 0].copy()
+    selected['pareto_front'] = ranks[ranks > 0]
+    crowding = np.zeros(len(selected))
+    selected_costs = costs[ranks > 0]
+    for front in np.unique(selected['pareto_front']):
+        in_front = (selected['pareto_front'] == front).to_numpy()
+        crowding[in_front] = crowding_distance(selected_costs[in_front])
+    selected['crowding_distance'] = crowding
+
+    selected = selected.sort_values(['pareto_front', 'crowding_distance'], ascending=[True, False], kind='stable')
+    print(f"Pareto 篩選（{', '.join(f'{c}:{d}' for c, d in objectives.items())}）："
+          f"{len(valid)} 組候選，第 1 層前緣 {(ranks == 1).sum()} 組")
+    return selected.head(top_n)
+
+def prompt_pareto_objectives(columns):
+    """互動式詢問 Pareto 指標（M3/M5/selector_utils 共用），回傳 {欄位: 方向} 或 None"""
+    candidates = [c for c in DEFAULT_DIRECTIONS if c in columns]
+    default = [c for c in ('sharpe', 'max_drawdown', 'n_trades') if c in columns]
+    text = input(f'請輸入 Pareto 指標，用逗號分隔，可加 :min 改為越小越好'
+                 f'（可用：{", ".join(candidates)}；預設 {",".join(default)}）：').strip()
+    if not text:
+        return parse_objectives(default) if len(default) >= 2 else None
+
+    objectives = {}
+    for item in text.split(','):
+        col, _, direction = item.strip().partition(':')
+        if col not in columns:
+            print(f'欄位 {col} 不存在，已忽略')
+            continue
+        objectives[col] = direction or DEFAULT_DIRECTIONS.get(col, 'max')
+    if len(objectives) < 2:
+        print('Pareto 篩選至少需要兩個指標，改用單一欄位排序')
+        return None
+    return parse_objectives(objectives)
@@ -1,6 +1,8 @@
 import pandas as pd
 import numpy as np
+from utils.tracing import traced
 
+@traced(cat='compute')
 def calculate_performance_metrics(group):
     """
     計算單一策略組的績效指標。
@@ -13,12 +15,16 @@ def calculate_performance_metrics(group):
     result = {
         'total_return': np.nan,
         'max_drawdown': np.nan,
-        'sharpe': np.nan
+        'sharpe': np.nan,
+        'n_trades': 0,
     }
     
     # 核心邏輯：不信任任何傳入的 position，永遠根據 signal 重新計算。
     # 這是為了確保無論輸入數據如何，計算都是基於最原始的信號。
     position = group['signal'].replace(0, np.nan).ffill().fillna(0)
+
+    # 交易次數：部位改變的次數（首次進場也算一次）
+    result['n_trades'] = int((position.diff().fillna(position) != 0).sum())
     
     # 如果沒有任何交易訊號，直接返回 0
     if (position == 0).all():
@@ -59,4 +65,71 @@ def calculate_performance_metrics(group):
     else:
         result['sharpe'] = 0.0
     
-    return pd.Series(result) 
\ No newline at end of file
+    return pd.Series(result) 
+
+# === 矩陣版本：一次計算 bars × params 的所有策略 ===
+
+def positions_from_signals(signals):
+    """
+    將 bars × params 的訊號矩陣轉為部位矩陣（0 視為沿用前一個非 0 訊號）。
+    等同於對每一欄執行 signal.replace(0, nan).ffill().fillna(0)。
+    """
+    signals = np.asarray(signals, dtype=float)
+    if signals.ndim == 1:
+        signals = signals[:, None]
+    rows = np.arange(signals.shape[0])[:, None]
+    last_idx = np.where(signals != 0, rows, -1)
+    last_idx = np.maximum.accumulate(last_idx, axis=0)
+    positions = np.take_along_axis(signals, np.maximum(last_idx, 0), axis=0)
+    return np.where(last_idx >= 0, positions, 0.0)
+
+def trade_counts(positions):
+    """每一欄部位改變的次數（首次進場也算一次），與 calculate_performance_metrics 的 n_trades 相同"""
+    prev_pos = np.zeros_like(positions)
+    prev_pos[1:] = positions[:-1]
+    return (positions != prev_pos).sum(axis=0)
+
+def strategy_returns_matrix(close, positions):
+    """
+    計算每日策略報酬矩陣。
+    回傳 (daily_returns, active)：active 標記第一個交易訊號之後（含）的 bar，
+    與 calculate_performance_metrics 從第一筆交易開始計算的邏輯一致。
+    """
+    close = np.asarray(close, dtype=float)
+    pct = np.zeros_like(close)
+    pct[1:] = close[1:] / close[:-1] - 1
+    prev_pos = np.zeros_like(positions)
+    prev_pos[1:] = positions[:-1]
+    daily_returns = prev_pos * pct[:, None]
+    active = np.maximum.accumulate(positions != 0, axis=0)
+    return daily_returns, active
+
+@traced(cat='compute')
+def calculate_performance_from_returns(daily_returns, active):
+    """
+    以遮罩化的矩陣運算計算每個參數組的 total_return、max_drawdown、sharpe。
+    結果與逐組呼叫 calculate_performance_metrics 相同。
+    回傳 dict：指標名稱 → 長度為 params 的陣列。
+    """
+    daily_returns = np.where(active, daily_returns, 0.0)
+    n = active.sum(axis=0)
+
+    nav = np.cumprod(1 + daily_returns, axis=0)
+    peak = np.maximum.accumulate(nav, axis=0)
+    total_return = nav[-1] - 1 if len(nav) else np.zeros(daily_returns.shape[1])
+    max_drawdown = ((nav - peak) / peak).min(axis=0) if len(nav) else np.zeros(daily_returns.shape[1])
+
+    safe_n = np.maximum(n, 1)
+    mean = daily_returns.sum(axis=0) / safe_n
+    var = (np.where(active, daily_returns - mean, 0.0) ** 2).sum(axis=0) / safe_n
+    std = np.sqrt(var)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, mean * 252 / (std * np.sqrt(252)), 0.0)
+
+    # 沒有交易或有效天數不足時，與原函數相同回傳 NaN
+    valid = n > 1
+    return {
+        'total_return': np.where(valid, total_return, np.nan),
+        'max_drawdown': np.where(valid, max_drawdown, np.nan),
+        'sharpe': np.where(valid, sharpe, np.nan),
+    }
@@ -0,0 +1,270 @@
+"""
+進度與吞吐量指標
+
+長時間的批次工作（M2-1/M2-2/M4-1/M4-2 的參數迴圈、分散式 job）以 ProgressTracker
+回報進度：每秒處理的參數組數、每秒處理的 K 棒數、ETA；其他元件以 metrics 登記
+快取命中 / 未命中、佇列深度等計數器與量表。
+
+輸出：
+    - 主控台：每個 tracker 最多每 console_interval 秒印一行（含速率與 ETA），結束時再印一次，
+      不再逐組參數列印
+    - 指定輸出目錄（環境變數 QUANT_METRICS_DIR 或 metrics.configure(directory=...)）時，
+      每 export_interval 秒寫出一次：
+        quant_metrics_{pid}.prom     Prometheus textfile（供 node_exporter textfile collector 讀取），
+                                     先寫暫存檔再取代，collector 不會讀到寫到一半的檔案；
+                                     行程結束時刪除（含 multiprocessing 的子行程），
+                                     collector 不會持續回報已結束行程的指標
+        quant_metrics_{pid}.jsonl    JSON 快照的歷史紀錄，每次以單次寫入附加一整行，
+                                     讀取端逐行解析並略過最後一行未寫完的情況
+
+進度指標以階段（例如 M2-1）為標籤而不是逐檔的工作名稱，標籤組合的數量有上限。
+"""
+import json
+import multiprocessing.util
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+METRICS_DIR_ENV = 'QUANT_METRICS_DIR'
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+
+
+def _label_key(labels: Dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None or seconds != seconds or seconds == float('inf'):
+        return '--:--:--'
+    seconds = int(seconds)
+    return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+class MetricsRegistry:
+    """行程內的計數器與量表；整個行程共用 utils.progress_metrics.metrics"""
+
+    def __init__(self, directory: Optional[str] = None, export_interval: float = 10.0):
+        self.directory = directory or os.environ.get(METRICS_DIR_ENV) or None
+        self.export_interval = export_interval
+        self._metrics: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._last_export = 0.0
+        self._cleanup_registered = set()
+
+    def configure(self, directory: Optional[str] = None, export_interval: Optional[float] = None):
+        """設定輸出目錄與頻率；目錄同時寫入環境變數，讓子行程也輸出到同一個目錄"""
+        if directory is not None:
+            self.directory = directory or None
+            if self.directory:
+                os.environ[METRICS_DIR_ENV] = self.directory
+            else:
+                os.environ.pop(METRICS_DIR_ENV, None)
+        if export_interval is not None:
+            self.export_interval = export_interval
+        return self
+
+    def _series(self, name: str, kind: str, help_text: str) -> Dict:
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = {'type': kind, 'help': help_text, 'values': {}}
+        return metric['values']
+
+    def inc(self, name: str, value: float = 1, help_text: str = '', **labels):
+        """計數器加上 value"""
+        key = _label_key(labels)
+        with self._lock:
+            values = self._series(name, COUNTER, help_text)
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, value: float, help_text: str = '', **labels):
+        """設定量表的值"""
+        key = _label_key(labels)
+        with self._lock:
+            self._series(name, GAUGE, help_text)[key] = value
+
+    def get(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            metric = self._metrics.get(name)
+            return None if metric is None else metric['values'].get(_label_key(labels))
+
+    def reset(self):
+        with self._lock:
+            self._metrics = {}
+
+    # === 輸出 ===
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, metric in sorted(self._metrics.items()):
+                if metric['help']:
+                    lines.append(f"# HELP {name} {metric['help']}")
+                lines.append(f"# TYPE {name} {metric['type']}")
+                for key, value in metric['values'].items():
+                    label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in key)
+                    lines.append(f"{name}{{{label_text}}} {float(value):.6g}" if label_text
+                                 else f"{name} {float(value):.6g}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict:
+        """目前所有指標的 JSON 快照，另附各快取的命中率"""
+        with self._lock:
+            data = {name: [{'labels': dict(key), 'value': value} for key, value in metric['values'].items()]
+                    for name, metric in self._metrics.items()}
+            cache = self._metrics.get('quant_cache_requests_total', {'values': {}})['values']
+        hit_rates = {}
+        for key, value in cache.items():
+            labels = dict(key)
+            hits, total = hit_rates.get(labels['cache'], (0, 0))
+            hit_rates[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'metrics': data,
+            'cache_hit_rate': {cache: hits / total for cache, (hits, total) in hit_rates.items() if total},
+        }
+
+    def export(self, force: bool = True) -> Optional[str]:
+        """
+        寫出 Prometheus textfile 並附加一行 JSON 快照；force=False 時距離上次輸出
+        不到 export_interval 秒則略過。未設定輸出目錄時不做任何事。回傳 .prom 路徑。
+        """
+        if not self.directory:
+            return None
+        now = time.monotonic()
+        if not force and now - self._last_export < self.export_interval:
+            return None
+        self._last_export = now
+        os.makedirs(self.directory, exist_ok=True)
+        pid = os.getpid()
+        prom_path = os.path.join(self.directory, f'quant_metrics_{pid}.prom')
+        tmp_path = f'{prom_path}.{pid}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, prom_path)
+        if prom_path not in self._cleanup_registered:
+            self._cleanup_registered.add(prom_path)
+            # Finalize 在主行程結束（atexit）與 multiprocessing 子行程結束時都會執行；
+            # fork 出的子行程以 os._exit 結束，一般的 atexit 不會執行
+            multiprocessing.util.Finalize(None, _remove_file, args=(prom_path,), exitpriority=0)
+        with open(os.path.join(self.directory, f'quant_metrics_{pid}.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.snapshot(), ensure_ascii=False, default=str) + '\n')
+        return prom_path
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+metrics = MetricsRegistry()
+
+
+def record_cache(cache: str, hit: bool):
+    """記錄一次快取查詢"""
+    metrics.inc('quant_cache_requests_total', 1, 'Cache lookups by cache and result',
+                cache=cache, result='hit' if hit else 'miss')
+
+
+class ProgressTracker:
+    """
+    一個批次迴圈的進度：
+        with ProgressTracker('M2-1 AAPL RSI', total=len(param_list), stage='M2-1') as progress:
+            for param in param_list:
+                ...
+                progress.advance(bars=len(signals_df))
+    total 未知時（例如分段讀取）傳 None，只回報速率不回報 ETA。
+    job 只用於主控台輸出；指標以 stage 為標籤（未指定時用 job），同一階段的各檔案共用同一組序列。
+    """
+
+    def __init__(self, job: str, total: Optional[int] = None, unit: str = 'params',
+                 console_interval: float = 5.0, registry: Optional[MetricsRegistry] = None,
+                 stage: Optional[str] = None):
+        self.job = job
+        self.stage = stage or job
+        self.total = total
+        self.unit = unit
+        self.console_interval = console_interval
+        self.registry = registry or metrics
+        self.done = 0
+        self.bars = 0
+        self.started = time.monotonic()
+        self._last_print = self.started
+        if total is not None:
+            self.registry.set('quant_progress_total', total, 'Items a batch job has to process',
+                              stage=self.stage, unit=unit)
+        self._update()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """每秒處理的項目數"""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """預估剩餘秒數；total 未知或尚無速率時為 None"""
+        if self.total is None or not self.done:
+            return None
+        return max(self.total - self.done, 0) / self.rate if self.rate > 0 else None
+
+    def _update(self):
+        stage, unit, registry = self.stage, self.unit, self.registry
+        elapsed = self.elapsed
+        registry.set('quant_progress_done', self.done, 'Items a batch job has processed', stage=stage, unit=unit)
+        registry.set('quant_progress_rate', self.rate, 'Items processed per second', stage=stage, unit=unit)
+        registry.set('quant_progress_elapsed_seconds', elapsed, 'Seconds since the batch job started', stage=stage)
+        registry.set('quant_bars_per_second', self.bars / elapsed if elapsed > 0 else 0.0,
+                     'Price bars processed per second', stage=stage)
+        eta = self.eta
+        if eta is not None:
+            registry.set('quant_progress_eta_seconds', eta, 'Estimated seconds until the batch job finishes',
+                         stage=stage)
+
+    def advance(self, n: int = 1, bars: int = 0):
+        """完成 n 個項目（共 bars 根 K 棒）；依時間限制主控台輸出與檔案輸出的頻率"""
+        self.done += n
+        self.bars += bars
+        if bars:
+            self.registry.inc('quant_bars_processed_total', bars, 'Price bars processed', stage=self.stage)
+        self._update()
+        now = time.monotonic()
+        if now - self._last_print >= self.console_interval:
+            self._last_print = now
+            print(self.status_line())
+        self.registry.export(force=False)
+
+    def status_line(self) -> str:
+        total = f'/{self.total}' if self.total is not None else ''
+        pct = f' ({100 * self.done / self.total:.0f}%)' if self.total else ''
+        bars = f'，{self.bars / self.elapsed:,.0f} bars/s' if self.bars and self.elapsed > 0 else ''
+        eta = f'，ETA {format_duration(self.eta)}' if self.total is not None else ''
+        return f"[{self.job}] 進度: {self.done}{total}{pct}，{self.rate:,.1f} {self.unit}/s{bars}{eta}"
+
+    def finish(self):
+        self._update()
+        if self.total is not None:
+            self.registry.set('quant_progress_eta_seconds', 0, 'Estimated seconds until the batch job finishes',
+                              stage=self.stage)
+        print(f"{self.status_line()}，耗時 {format_duration(self.elapsed)}")
+        self.registry.export()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
@@ -0,0 +1,406 @@
+"""
+績效結果資料庫
+
+M2-2 與 M4-2 的每一列績效都會附加到同一個 SQLite 資料庫，並帶上
+版本、股票、策略、階段（in_sample / out_sample）與回測區間。
+股票、策略、版本、區間與每個績效指標皆建有索引，M3/M5 的「前 N 名」
+因此變成一次 ORDER BY ... LIMIT 的索引查詢，也能跨股票、跨策略、跨版本比較。
+"""
+import atexit
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import pandas as pd
+
+DEFAULT_DB = 'database/results.db'
+
+# 績效指標欄位；遇到新的數值欄位時會自動新增欄位與索引
+METRIC_COLUMNS = ['total_return', 'max_drawdown', 'sharpe']
+KEY_COLUMNS = ['version_id', 'stage', 'symbol', 'strategy', 'window_start', 'window_end', 'source_file', 'param_id']
+
+_OPERATORS = {'>', '>=', '<', '<=', '=', '!='}
+_NULL_OPERATORS = {'IS', 'IS NOT'}
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS performance (
+    row_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    version_id   TEXT,
+    stage        TEXT NOT NULL,
+    symbol       TEXT NOT NULL,
+    strategy     TEXT NOT NULL,
+    window_start TEXT,
+    window_end   TEXT,
+    source_file  TEXT NOT NULL,
+    param_id     TEXT NOT NULL,
+    total_return REAL,
+    max_drawdown REAL,
+    sharpe       REAL,
+    created_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_perf_source ON performance (source_file);
+CREATE INDEX IF NOT EXISTS idx_perf_symbol ON performance (symbol, strategy);
+CREATE INDEX IF NOT EXISTS idx_perf_version ON performance (version_id, stage, symbol, strategy);
+CREATE INDEX IF NOT EXISTS idx_perf_window ON performance (window_start, window_end);
+CREATE INDEX IF NOT EXISTS idx_perf_param ON performance (param_id);
+"""
+
+
+def parse_signal_filename(file_name: str):
+    """
+    由 M2-1/M4-1/M2-2/M4-2 的檔名解析 (symbol, strategy)。
+    檔名格式為 [performance_]{symbol}_{strategy}_signals_all_params_...；無法解析時回傳 (None, None)。
+    """
+    base = os.path.basename(file_name)
+    if base.startswith('performance_'):
+        base = base[len('performance_'):]
+    head, sep, _ = base.partition('_signals_')
+    if not sep or '_' not in head:
+        return None, None
+    symbol, strategy = head.rsplit('_', 1)
+    return symbol, strategy
+
+
+class ResultsStore:
+    """以 SQLite 儲存所有版本、所有股票的績效列，提供索引化的前 N 名查詢"""
+
+    def __init__(self, db_path: str = DEFAULT_DB):
+        # 絕對路徑：行程結束時的 optimize() 不受當時工作目錄影響
+        self.db_path = os.path.abspath(db_path)
+        self._dirty = False
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        with self._transaction() as conn:
+            conn.executescript(_SCHEMA)
+            self._refresh_columns(conn)
+            for metric in self.metric_columns():
+                self._create_metric_indexes(conn, metric)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    @contextmanager
+    def _transaction(self):
+        """一次交易：正常結束時 commit、例外時 rollback，最後一律關閉連線"""
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def optimize(self):
+        """
+        讓查詢規劃器依最新的資料分佈挑選索引。只在本行程寫入過資料時執行，
+        由 get_results_store() 登記在行程結束時執行一次，不在每次附加時執行。
+        資料庫檔案已被刪除（例如暫存沙盒已清掉）時略過，不重新建立空檔。
+        """
+        if not self._dirty or not os.path.exists(self.db_path):
+            return
+        with self._transaction() as conn:
+            conn.execute("PRAGMA optimize")
+        self._dirty = False
+
+    def metric_columns(self) -> List[str]:
+        return [c for c in self._columns if c not in KEY_COLUMNS and c not in ('row_id', 'created_at')]
+
+    @staticmethod
+    def _create_metric_indexes(conn, metric):
+        # 單欄索引供跨版本查詢，複合索引供「某版本某階段」的前 N 名直接走索引
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_perf_{metric} ON performance ({metric})")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_perf_version_{metric} "
+                     f"ON performance (version_id, stage, {metric})")
+
+    def _refresh_columns(self, conn):
+        # 其他行程可能已新增欄位
+        self._columns = [r[1] for r in conn.execute("PRAGMA table_info(performance)")]
+
+    def _ensure_metric_columns(self, conn, df: pd.DataFrame):
+        self._refresh_columns(conn)
+        for col in df.columns:
+            if col in self._columns or col in KEY_COLUMNS or not pd.api.types.is_numeric_dtype(df[col]):
+                continue
+            if not _IDENTIFIER.match(col):
+                continue
+            conn.execute(f"ALTER TABLE performance ADD COLUMN {col} REAL")
+            self._create_metric_indexes(conn, col)
+            self._columns.append(col)
+
+    def append(self, perf_df: pd.DataFrame, version_id: Optional[str], stage: str, symbol: str, strategy: str,
+               source_file: str, window_start: Optional[str] = None, window_end: Optional[str] = None) -> int:
+        """
+        附加一份績效表。同一版本的同一個 source_file 重複寫入時會先刪除舊資料，
+        重新計算同一檔案不會產生重複列。回傳寫入列數。
+        """
+        source_file = os.path.basename(source_file)
+        df = perf_df.copy()
+        for key, value in (('version_id', version_id), ('stage', stage), ('symbol', symbol),
+                           ('strategy', strategy), ('window_start', window_start),
+                           ('window_end', window_end), ('source_file', source_file)):
+            df[key] = value
+        df['created_at'] = time.time()
+
+        with self._transaction() as conn:
+            self._ensure_metric_columns(conn, df)
+            cols = [c for c in df.columns if c in self._columns]
+            conn.execute("DELETE FROM performance WHERE source_file = ? AND version_id IS ?",
+                         (source_file, version_id))
+            rows = df[cols].astype(object).where(df[cols].notna(), None).itertuples(index=False, name=None)
+            conn.executemany(
+                f"INSERT INTO performance ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", rows)
+        self._dirty = True
+        return len(df)
+
+    def ingest_file(self, perf_file_path: str, version_id: Optional[str], stage: str) -> int:
+        """匯入一份既有的績效 CSV（回測區間未知時留空）"""
+        symbol, strategy = parse_signal_filename(perf_file_path)
+        if symbol is None:
+            return 0
+        return self.append(pd.read_csv(perf_file_path), version_id, stage, symbol, strategy, perf_file_path)
+
+    def has_source(self, source_file: str, version_id: Optional[str]) -> bool:
+        with self._transaction() as conn:
+            row = conn.execute("SELECT 1 FROM performance WHERE source_file = ? AND version_id IS ? LIMIT 1",
+                               (os.path.basename(source_file), version_id)).fetchone()
+        return row is not None
+
+    def top_n(self, sort_col: str = 'sharpe', ascending: bool = False, top_n: int = 10,
+              version_id: Optional[str] = None, stage: Optional[str] = None,
+              symbols: Optional[List[str]] = None, strategy: Optional[str] = None,
+              source_file: Optional[str] = None, param_ids: Optional[List[str]] = None,
+              filters: Optional[Dict[str, tuple]] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        索引化的前 N 名查詢。
+
+        filters 為 {欄位: (運算子, 值)}，例如 {'max_drawdown': ('>', -0.2)}。
+        排序與 pandas sort_values 一致：NaN 一律排在最後。
+        symbols / param_ids 先載入暫存表再以子查詢過濾，清單長度不受 SQLite 參數個數上限限制。
+        """
+        conn = self._connect()
+        try:
+            self._refresh_columns(conn)
+            if symbols:
+                self._load_id_filter(conn, 'symbol', symbols)
+            if param_ids is not None:
+                self._load_id_filter(conn, 'param_id', param_ids)
+            if not ascending or sort_col in (filters or {}):
+                # 遞減排序時 SQLite 本來就把 NULL 排在最後；排序欄位本身有比較條件時也不會有 NULL
+                sql, params = self._top_n_query(sort_col, ascending, top_n, version_id, stage, symbols, strategy,
+                                                source_file, param_ids, filters, columns)
+                return pd.read_sql(sql, conn, params=params)
+
+            # 遞增排序時 NULL 會排在最前面，先取非 NULL，不足 N 筆再補 NULL 列
+            filters = dict(filters or {})
+            not_null = dict(filters, **{sort_col: ('IS NOT', None)})
+            sql, params = self._top_n_query(sort_col, ascending, top_n, version_id, stage, symbols, strategy,
+                                            source_file, param_ids, not_null, columns)
+            df = pd.read_sql(sql, conn, params=params)
+            if len(df) < top_n:
+                sql, params = self._top_n_query(sort_col, ascending, top_n - len(df), version_id, stage, symbols,
+                                                strategy, source_file, param_ids,
+                                                dict(filters, **{sort_col: ('IS', None)}), columns)
+                df = pd.concat([df, pd.read_sql(sql, conn, params=params)], ignore_index=True)
+            return df
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _load_id_filter(conn, column, values):
+        """將過濾清單寫入此連線的暫存表 temp.filter_{column}"""
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS filter_{column} (value TEXT PRIMARY KEY)")
+        conn.execute(f"DELETE FROM temp.filter_{column}")
+        conn.executemany(f"INSERT OR IGNORE INTO temp.filter_{column} (value) VALUES (?)",
+                         ((str(v),) for v in values))
+
+    def _top_n_query(self, sort_col, ascending, top_n, version_id, stage, symbols, strategy,
+                     source_file, param_ids, filters, columns):
+        metrics = self.metric_columns()
+        if sort_col not in metrics:
+            raise ValueError(f"無法排序的欄位: {sort_col}（可用：{', '.join(metrics)}）")
+
+        where, params = [], []
+        for col, value in (('version_id', version_id), ('stage', stage), ('strategy', strategy)):
+            if value is not None:
+                where.append(f"{col} = ?")
+                params.append(value)
+        if source_file is not None:
+            where.append("source_file = ?")
+            params.append(os.path.basename(source_file))
+        # 清單本身由 top_n() 載入暫存表
+        if symbols:
+            where.append("symbol IN (SELECT value FROM temp.filter_symbol)")
+        if param_ids is not None:
+            where.append("param_id IN (SELECT value FROM temp.filter_param_id)")
+        for col, (op, value) in (filters or {}).items():
+            if col in metrics and op in _NULL_OPERATORS:
+                where.append(f"{col} {op} NULL")
+                continue
+            if col not in metrics or op not in _OPERATORS:
+                raise ValueError(f"無效的過濾條件: {col} {op} {value}")
+            where.append(f"{col} {op} ?")
+            params.append(value)
+
+        select_cols = columns or (['param_id'] + metrics)
+        unknown = [c for c in select_cols if c not in self._columns]
+        if unknown:
+            raise ValueError(f"未知的欄位: {', '.join(unknown)}")
+
+        sql = f"SELECT {', '.join(select_cols)} FROM performance"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        # 直接 ORDER BY 指標欄位才能沿著索引走、取到 N 筆就停止
+        sql += f" ORDER BY {sort_col} {'ASC' if ascending else 'DESC'} LIMIT ?"
+        params.append(int(top_n))
+        return sql, params
+
+    def backfill(self, perf_dir: str, version_id: Optional[str]) -> int:
+        """將某個版本績效目錄下尚未入庫的 M2-2/M4-2 檔案匯入，回傳匯入列數"""
+        if not os.path.exists(perf_dir):
+            return 0
+        total = 0
+        for f in sorted(os.listdir(perf_dir)):
+            if not f.startswith('performance_') or self.has_source(f, version_id):
+                continue
+            if f.endswith('_validation.csv'):
+                total += self.ingest_file(os.path.join(perf_dir, f), version_id, 'out_sample')
+            elif f.endswith('_batch.csv'):
+                total += self.ingest_file(os.path.join(perf_dir, f), version_id, 'in_sample')
+        return total
+
+
+_store = None
+
+def get_results_store() -> ResultsStore:
+    """取得行程內共用的結果資料庫（第一次呼叫時才建立連線與資料表）"""
+    global _store
+    if _store is None:
+        _store = ResultsStore()
+        atexit.register(_store.optimize)
+    return _store
+
+def record_performance(results_df, perf_file_path, version_id, stage, window_start=None, window_end=None):
+    """
+    M2-2/M4-2 寫出績效檔後呼叫：把同一份績效附加到結果資料庫。
+    寫入失敗只顯示警告，不影響 CSV 產出。
+    """
+    symbol, strategy = parse_signal_filename(perf_file_path)
+    if symbol is None:
+        print(f'⚠️ 無法由檔名解析股票與策略，未寫入結果資料庫: {perf_file_path}')
+        return 0
+    try:
+        n = get_results_store().append(results_df, version_id, stage, symbol, strategy, perf_file_path,
+                                       window_start, window_end)
+    except sqlite3.Error as e:
+        print(f'⚠️ 寫入結果資料庫失敗: {e}')
+        return 0
+    print(f'🗄️ 已寫入結果資料庫 {n} 筆')
+    return n
+
+def select_top_from_store(perf_file_path, version_id, sort_col='sharpe', ascending=False, top_n=10,
+                          cpcv_filter=None):
+    """
+    M3/M5 的前 N 名：績效檔已入庫時改用索引查詢，欄位與順序與原 CSV 相同。
+    績效檔尚未入庫或排序欄位不是指標時回傳 None，由呼叫端改讀 CSV。
+    """
+    store = get_results_store()
+    if not store.has_source(perf_file_path, version_id) or sort_col not in store.metric_columns():
+        return None
+
+    param_ids = None
+    if cpcv_filter:
+        from utils.cpcv import cpcv_allowed_param_ids
+        param_ids, pbo = cpcv_allowed_param_ids(cpcv_filter['file'], cpcv_filter.get('max_overfit_prob'),
+                                                cpcv_filter.get('min_oos_sharpe'))
+        print(f"CPCV 過濾：保留 {len(param_ids)} 組參數（PBO={pbo:.2%}）")
+
+    columns = [c for c in pd.read_csv(perf_file_path, nrows=0).columns if c in store.metric_columns() + ['param_id']]
+    return store.top_n(sort_col, ascending, top_n, version_id=version_id, source_file=perf_file_path,
+                       param_ids=param_ids, columns=columns)
+
+def prompt_results_query(stage, version_id, perf_dir, out_dir):
+    """
+    互動式的跨股票/跨策略前 N 名查詢（M3/M5 共用）。
+    例如「版本 X 中 max_drawdown > -0.2、依 Sharpe 排序的前 20 名」。
+    結果依 (股票, 策略) 各存成一份 best_strategies_query_*.csv，欄位與 M3/M5 的最佳策略檔相同。
+    查詢本版本時登記為 best_strategies（樣本內，並同 M3 寫出只含這些參數的 best_param_log，
+    M4-1 選這份清單時會驗證同一批參數）或 final_strategies（樣本外，M6 使用）。
+    查詢所有版本時結果可能來自其他版本，參數不在本版本的 param log 中，
+    檔案多一個 version_id 欄位且不登記為產出檔，只供檢視。
+    回傳輸出檔路徑列表。
+    """
+    store = get_results_store()
+    if store.backfill(perf_dir, version_id):
+        print('已將尚未入庫的績效檔匯入結果資料庫')
+
+    scope = input(f'查詢範圍：1. 版本 {version_id}  2. 所有版本（預設1）：').strip()
+    query_version = None if scope == '2' else version_id
+    symbol_input = input('股票代碼，用逗號分隔（直接 Enter 為全部）：').strip().upper()
+    symbols = [s.strip() for s in symbol_input.split(',')] if symbol_input else None
+    strategy = input('策略類型（RSI / CROSS，直接 Enter 為全部）：').strip().upper() or None
+
+    metrics = store.metric_columns()
+    sort_col = input(f'排序欄位（{", ".join(metrics)}，預設 sharpe）：').strip() or 'sharpe'
+    if sort_col not in metrics:
+        print('欄位錯誤，預設用 sharpe')
+        sort_col = 'sharpe'
+    ascending = input('是否由大到小排序？(y/n, 預設y)：').strip().lower() == 'n'
+
+    filters = {}
+    print('過濾條件，格式如 max_drawdown > -0.2（直接 Enter 結束）：')
+    while True:
+        cond = input('> ').strip()
+        if not cond:
+            break
+        parts = cond.split()
+        if len(parts) != 3 or parts[0] not in metrics or parts[1] not in _OPERATORS:
+            print('格式錯誤，已忽略')
+            continue
+        try:
+            filters[parts[0]] = (parts[1], float(parts[2]))
+        except ValueError:
+            print('數值錯誤，已忽略')
+
+    top_n = input('請輸入要保留的前N名策略（預設20）：').strip()
+    top_n = int(top_n) if top_n.isdigit() else 20
+
+    start = time.perf_counter()
+    df = store.top_n(sort_col, ascending, top_n, version_id=query_version, stage=stage, symbols=symbols,
+                     strategy=strategy, filters=filters,
+                     columns=['version_id', 'symbol', 'strategy', 'window_start', 'window_end', 'param_id'] + metrics)
+    print(f'查詢耗時 {(time.perf_counter() - start) * 1000:.1f} ms')
+    if df.empty:
+        print('沒有符合條件的結果')
+        return None
+    print(df.to_string(index=False))
+
+    from utils.param_loader import write_best_param_log
+    from utils.version_manager import version_manager
+    os.makedirs(out_dir, exist_ok=True)
+    kind = 'best_strategies' if stage == 'in_sample' else 'final_strategies'
+    stamp = time.strftime("%Y%m%d_%H%M%S")
+    out_files = []
+    for (symbol, strategy_type), group in df.groupby(['symbol', 'strategy'], sort=False):
+        out_file = os.path.join(out_dir, f'best_strategies_query_{symbol}_{strategy_type}_{stage}_{stamp}.csv')
+        if query_version is None:
+            group[['version_id', 'param_id'] + metrics].to_csv(out_file, index=False)
+            print(f'📁 存檔於: {out_file}（跨版本結果，未登記為產出檔）')
+            out_files.append(out_file)
+            continue
+        group[['param_id'] + metrics].to_csv(out_file, index=False)
+        starts, ends = group['window_start'].dropna(), group['window_end'].dropna()
+        version_manager.register_artifact(out_file, kind, symbol, strategy_type, version_id,
+                                          starts.min() if len(starts) else None, ends.max() if len(ends) else None,
+                                          rows=len(group), query=True)
+        print(f'📁 存檔於: {out_file}')
+        if stage == 'in_sample':
+            param_log = write_best_param_log(group['param_id'], symbol, strategy_type, version_id, out_file,
+                                             f'param_log_{strategy_type}_{symbol}_query_{stamp}.json')
+            if param_log:
+                print(f'📁 參數檔存於: {param_log}')
+            else:
+                print(f'⚠️ 找不到 {symbol} {strategy_type} 的樣本內 param log，M4-1 無法使用這份清單')
+        out_files.append(out_file)
+    get_results_store().optimize()
+    return out_files
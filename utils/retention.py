@@ -0,0 +1,81 @@
+"""
+版本保留與壓縮
+
+每個版本的 M2-1/M4-1 訊號檔（每組參數 × 每個交易日一列）佔了版本目錄絕大部分的空間，
+而績效表、最佳策略表都很小。此模組依保留政策（保留最新 N 個版本、或保留 N 天內的版本；
+釘選的版本、當前版本、仍在執行中與剛建立的版本一律保留）找出過期版本，將其訊號 CSV 刪除或轉為逐欄壓縮的 .npz，
+績效與最佳策略表原樣保留，並回報釋放的空間。.npz 的格式見 utils.signal_io。
+"""
+import os
+from datetime import datetime
+from utils.signal_io import compact_signal_file
+from utils.version_manager import RETENTION_GRACE_HOURS, version_manager
+
+# 需要壓縮或刪除的大型產出檔種類
+BULKY_KINDS = ('signals', 'validation_signals')
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024 or unit == 'GB':
+            return f'{n:.1f} {unit}' if unit != 'B' else f'{n} B'
+        n /= 1024
+
+def compact_version(version_id, mode='compress', dry_run=False, kinds=BULKY_KINDS):
+    """
+    處理單一版本的大型訊號檔。mode 為 'compress'（轉為 .npz）或 'drop'（直接刪除）。
+    回傳 (檔案數, 處理前位元組, 處理後位元組)；dry_run 時不修改任何檔案，處理後位元組以 0 計。
+    """
+    if mode not in ('compress', 'drop'):
+        raise ValueError(f"未知的壓縮模式: {mode}")
+    n_files = bytes_before = bytes_after = 0
+    for kind in kinds:
+        for record in version_manager.find_artifacts(kind, version_id):
+            path = record['path']
+            if not path.endswith('.csv'):
+                continue
+            n_files += 1
+            bytes_before += os.path.getsize(path)
+            if dry_run:
+                continue
+            if mode == 'compress':
+                out_path = compact_signal_file(path)
+                version_manager.register_artifact(out_path, kind, record['symbol'], record['strategy'], version_id,
+                                                  record['start_date'], record['end_date'], parents=[path],
+                                                  rows=record['rows'], compacted_from=path, format='npz')
+                bytes_after += os.path.getsize(out_path)
+            os.remove(path)
+    return n_files, bytes_before, bytes_after
+
+def apply_retention(keep_last=None, max_age_days=None, mode='compress', dry_run=False,
+                    grace_hours=RETENTION_GRACE_HOURS):
+    """
+    依保留政策處理所有過期版本，回傳報告：
+        versions、files、bytes_before、bytes_after、bytes_reclaimed、dry_run
+    dry_run 時 bytes_reclaimed 為可釋放空間的上限（以刪除計）。
+    建立未滿 grace_hours 小時或仍有管線持有租約的版本不會被處理。
+    """
+    expired = version_manager.expired_versions(keep_last, max_age_days, grace_hours)
+    report = {'versions': [], 'files': 0, 'bytes_before': 0, 'bytes_after': 0, 'dry_run': dry_run}
+    for version_id in expired:
+        # 清單產生後才開始執行的管線（指定舊版本重跑）也不處理
+        if version_id in version_manager.active_versions():
+            continue
+        report['versions'].append(version_id)
+        n_files, before, after = compact_version(version_id, mode, dry_run)
+        report['files'] += n_files
+        report['bytes_before'] += before
+        report['bytes_after'] += after
+        if not dry_run and n_files:
+            version_manager.update_version_info(version_id, compacted={
+                'mode': mode, 'at': datetime.now().isoformat(), 'bytes_reclaimed': before - after})
+        print(f"{'🔍' if dry_run else '🗜️'} {version_id}: {n_files} 個訊號檔，"
+              f"{format_bytes(before)} → {format_bytes(after)}")
+    report['bytes_reclaimed'] = report['bytes_before'] - report['bytes_after']
+
+    if not report['versions']:
+        print('沒有需要處理的過期版本')
+    else:
+        action = '預估可釋放' if dry_run else '已釋放'
+        print(f"✅ {len(report['versions'])} 個過期版本、{report['files']} 個訊號檔，{action} {format_bytes(report['bytes_reclaimed'])}")
+    return report
@@ -0,0 +1,94 @@
+"""
+訊號/報酬矩陣快取
+
+對單一股票的完整價格序列，指標只依週期計算一次，訊號矩陣
+（bars × params）只依參數清單產生一次。之後任何時間視窗都只是對
+快取矩陣做切片，因此重疊的滾動視窗不會重複計算指標與報酬。
+
+注意：指標以完整歷史計算（只使用過去資料，沒有前視偏誤），
+因此視窗開頭不會像逐段呼叫 generate_signals 那樣有暖機期的 NaN；
+部位則在每個視窗開頭重新起算，與 M2/M4 的回測方式一致。
+"""
+import numpy as np
+import pandas as pd
+from utils.db_loader import load_price_data
+from utils.indicator_utils import rsi_array, sma_array
+from utils.performance_utils import (
+    positions_from_signals,
+    trade_counts,
+    strategy_returns_matrix,
+    calculate_performance_from_returns,
+)
+
+
+def param_id_of(param: dict) -> str:
+    """param log 使用 'id'，param_generator 使用 'param_id'"""
+    return param.get('id', param.get('param_id', 'unknown'))
+
+
+class SignalMatrixCache:
+    """單一股票的指標與訊號矩陣快取"""
+
+    def __init__(self, close: pd.Series):
+        self.dates = pd.DatetimeIndex(close.index)
+        self.close = close.to_numpy(dtype=float)
+        self._indicators = {}
+        self._signals = {}
+
+    @classmethod
+    def from_db(cls, symbol: str, start_date: str = '1900-01-01', end_date: str = '2999-12-31'):
+        """從 SQLite 載入收盤價建立快取"""
+        return cls(load_price_data(symbol, start_date, end_date)['close'])
+
+    def indicator(self, kind: str, period: int) -> np.ndarray:
+        key = (kind, int(period))
+        if key not in self._indicators:
+            if kind == 'rsi':
+                self._indicators[key] = rsi_array(self.close, int(period))
+            elif kind == 'sma':
+                self._indicators[key] = sma_array(self.close, int(period))
+            else:
+                raise ValueError(f"未知的指標類型: {kind}")
+        return self._indicators[key]
+
+    def signal_matrix(self, strategy_type: str, param_list: list) -> np.ndarray:
+        """回傳 bars × params 的訊號矩陣（1 買、-1 賣、0 觀望），依參數清單快取"""
+        strategy_type = strategy_type.upper()
+        key = (strategy_type, tuple(param_id_of(p) for p in param_list))
+        if key in self._signals:
+            return self._signals[key]
+
+        signals = np.zeros((len(self.close), len(param_list)))
+        for j, param in enumerate(param_list):
+            source = param.get('params', param)
+            if strategy_type == 'RSI':
+                rsi = self.indicator('rsi', source.get('rsi_period', 14))
+                signals[rsi > source.get('rsi_upper', 70), j] = -1
+                signals[rsi < source.get('rsi_lower', 30), j] = 1
+            elif strategy_type == 'CROSS':
+                short_sma = self.indicator('sma', source.get('fast_period', 5))
+                long_sma = self.indicator('sma', source.get('slow_period', 20))
+                signals[short_sma > long_sma, j] = 1
+                signals[short_sma < long_sma, j] = -1
+            else:
+                raise ValueError(f"未知的策略類型: {strategy_type}")
+
+        self._signals[key] = signals
+        return signals
+
+    def window_returns(self, strategy_type: str, param_list: list, start: int, end: int):
+        """回傳 [start, end) 視窗內的 (daily_returns, active) 矩陣"""
+        signals = self.signal_matrix(strategy_type, param_list)[start:end]
+        positions = positions_from_signals(signals)
+        return strategy_returns_matrix(self.close[start:end], positions)
+
+    def window_performance(self, strategy_type: str, param_list: list, start: int, end: int) -> pd.DataFrame:
+        """回傳 [start, end) 視窗內每組參數的績效表，欄位與 M2-2 輸出相同"""
+        signals = self.signal_matrix(strategy_type, param_list)[start:end]
+        positions = positions_from_signals(signals)
+        daily_returns, active = strategy_returns_matrix(self.close[start:end], positions)
+        metrics = calculate_performance_from_returns(daily_returns, active)
+        metrics['n_trades'] = trade_counts(positions)
+        df = pd.DataFrame(metrics)
+        df.insert(0, 'param_id', [param_id_of(p) for p in param_list])
+        return df
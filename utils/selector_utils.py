@@ -2,6 +2,7 @@ import os
 import pandas as pd
 import json
 import glob
+from utils.pareto import pareto_select, prompt_pareto_objectives
 
 def select_best_strategies(mode, copy_param_log=False):
     """
@@ -37,25 +38,33 @@ def select_best_strategies(mode, copy_param_log=False):
     df = pd.read_csv(os.path.join(perf_dir, perf_file))
 
     # --- 篩選邏輯 ---
-    print(f'可用排序欄位： {", ".join(df.columns)}')
-    sort_col = input('請輸入排序欄位（如 total_return、sharpe）：').strip()
-    if sort_col not in df.columns:
-        print('欄位錯誤，預設用 sharpe')
-        sort_col = 'sharpe'
+    pareto = None
+    sort_col, ascending = 'sharpe', False
+    if input('請選擇篩選方式：1. 單一欄位排序（預設）  2. Pareto 多目標：').strip() == '2':
+        pareto = prompt_pareto_objectives(df.columns)
+    if pareto is None:
+        print(f'可用排序欄位： {", ".join(df.columns)}')
+        sort_col = input('請輸入排序欄位（如 total_return、sharpe）：').strip()
+        if sort_col not in df.columns:
+            print('欄位錯誤，預設用 sharpe')
+            sort_col = 'sharpe'
 
-    default_ascending = 'drawdown' in sort_col
-    asc_choice = input(f'是否由大到小排序？(y/n, 預設{"n" if default_ascending else "y"})：').strip().lower()
-    if asc_choice == 'y':
-        ascending = False
-    elif asc_choice == 'n':
-        ascending = True
-    else:
-        ascending = default_ascending
+        default_ascending = 'drawdown' in sort_col
+        asc_choice = input(f'是否由大到小排序？(y/n, 預設{"n" if default_ascending else "y"})：').strip().lower()
+        if asc_choice == 'y':
+            ascending = False
+        elif asc_choice == 'n':
+            ascending = True
+        else:
+            ascending = default_ascending
 
     top_n = input('請輸入要保留的前N名策略（預設10）：').strip()
     top_n = int(top_n) if top_n.isdigit() else 10
     
-    df_sorted = df.sort_values(by=sort_col, ascending=ascending).head(top_n)
+    if pareto:
+        df_sorted = pareto_select(df, pareto, top_n)
+    else:
+        df_sorted = df.sort_values(by=sort_col, ascending=ascending).head(top_n)
     
     # 根據模式調整輸出檔名
     out_file_name = f'best_strategies_{perf_file.replace("performance_", "")}'
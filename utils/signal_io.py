@@ -0,0 +1,99 @@
+"""
+訊號檔讀寫
+
+M2-1/M4-1 的訊號檔（每組參數 × 每個交易日一列）的讀寫工具，供保留政策、M2-2/M4-2 與多樣化篩選共用：
+CSV 與保留政策壓縮後的 .npz 皆可讀取；訊號檔太大時預估記憶體用量並改為分段讀取。
+
+.npz 以 numpy 逐欄儲存：數值欄位保留原本的 dtype，字串欄位（date、param_id）
+存成整數代碼 + 類別表，讀回後與原本的 CSV 內容相同。
+"""
+import os
+import numpy as np
+import pandas as pd
+
+
+def compact_signal_file(csv_path, out_path=None):
+    """將訊號 CSV 轉為逐欄壓縮的 .npz，回傳輸出檔路徑（不會刪除原檔）"""
+    out_path = out_path or os.path.splitext(csv_path)[0] + '.npz'
+    df = pd.read_csv(csv_path)
+    arrays = {'__columns__': np.array(df.columns, dtype=str)}
+    for i, col in enumerate(df.columns):
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+            arrays[f'c{i}'] = df[col].to_numpy()
+        else:
+            codes, categories = pd.factorize(df[col])
+            arrays[f'c{i}_codes'] = codes.astype(np.int32)
+            arrays[f'c{i}_categories'] = np.asarray(categories, dtype=str)
+    np.savez_compressed(out_path, **arrays)
+    return out_path
+
+def load_compacted_signals(npz_path, usecols=None):
+    """讀回 compact_signal_file 產生的 .npz，usecols 與 pd.read_csv 相同"""
+    data = {}
+    with np.load(npz_path, allow_pickle=False) as archive:
+        for i, col in enumerate(archive['__columns__']):
+            col = str(col)
+            if usecols is not None and col not in usecols:
+                continue
+            if f'c{i}' in archive:
+                data[col] = archive[f'c{i}']
+            else:
+                codes = archive[f'c{i}_codes']
+                values = archive[f'c{i}_categories'].astype(object)[codes]
+                values[codes < 0] = np.nan
+                data[col] = values
+    return pd.DataFrame(data)
+
+def resolve_signal_file(path):
+    """回傳訊號檔實際存在的路徑：原 CSV 已被壓縮時回傳同名 .npz，都不存在時回傳 None"""
+    if os.path.exists(path):
+        return path
+    compacted = os.path.splitext(path)[0] + '.npz'
+    return compacted if os.path.exists(compacted) else None
+
+def read_signal_file(path, usecols=None):
+    """讀取訊號檔，CSV 與壓縮後的 .npz 皆可"""
+    resolved = resolve_signal_file(path)
+    if resolved is None:
+        raise FileNotFoundError(path)
+    if resolved.endswith('.npz'):
+        return load_compacted_signals(resolved, usecols)
+    return pd.read_csv(resolved, usecols=usecols)
+
+def estimate_signal_frame_mb(path):
+    """
+    預估讀入訊號檔後 DataFrame 佔用的記憶體（MB）。CSV 以檔案大小的 3 倍估計
+    （date、param_id 字串欄位讀入後遠大於文字本身）；.npz 一律整檔載入，回傳 0。
+    """
+    resolved = resolve_signal_file(path)
+    if resolved is None or resolved.endswith('.npz'):
+        return 0.0
+    return 3 * os.path.getsize(resolved) / 2 ** 20
+
+def iter_signal_groups(path, chunksize=200_000):
+    """
+    分段讀取訊號 CSV，逐一產生 (param_id, group)，記憶體中最多只有一段資料。
+    M2-1/M4-1 依參數逐組寫出，同一 param_id 的列是連續的；每段最後一個 param_id
+    可能延續到下一段，因此留到下一段再一起產生。group 的 date 欄位已轉為 datetime。
+    """
+    pending = None
+    seen = set()
+
+    def groups(df):
+        for param_id, group in df.groupby('param_id', sort=False):
+            if param_id in seen:
+                raise ValueError(f"訊號檔中 param_id {param_id} 的列不連續，無法分段讀取: {path}")
+            seen.add(param_id)
+            group = group.copy()
+            group['date'] = pd.to_datetime(group['date'])
+            yield param_id, group.sort_values(by='date')
+
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        last = chunk['param_id'].iloc[-1]
+        tail = chunk['param_id'] == last
+        pending = chunk[tail]
+        yield from groups(chunk[~tail])
+    if pending is not None and len(pending):
+        yield from groups(pending)
@@ -4,8 +4,9 @@ Strategy Runner
 This utility module contains the core logic for applying a given trading
 strategy to a price series and generating a trading signal.
 """
+import numpy as np
 import pandas as pd
-from .indicator_utils import calculate_rsi, calculate_sma
+from .indicator_utils import calculate_rsi, calculate_sma, rsi_array, sma_array
 
 def apply_strategy(strategy_type: str, price_df: pd.DataFrame, params: dict) -> int:
     """
@@ -76,4 +77,103 @@ def _apply_cross_strategy(price_df: pd.DataFrame, params: dict) -> int:
     elif prev_short >= prev_long and curr_short < curr_long:
         return -1 # Sell signal
     else:
-        return 0 # Hold signal 
\ No newline at end of file
+        return 0 # Hold signal
+
+
+def required_lookback(strategies: list) -> int:
+    """
+    Returns the number of bars needed for every strategy's indicators to be
+    defined on the latest bar and the one before it (crossovers compare
+    both): the longest RSI / SMA period plus one.
+    """
+    periods = [0]
+    for strategy in strategies:
+        params = strategy['params']
+        for key in ('rsi_period', 'fast_period', 'slow_period'):
+            if params.get(key):
+                periods.append(int(params[key]))
+    return max(periods) + 1
+
+def _latest_values(values: np.ndarray, n_bars: np.ndarray, period: int, offset: int = 0) -> np.ndarray:
+    """
+    Returns the indicator value offset bars before the latest bar of each
+    column, or NaN where the symbol's own history is too short for it (the
+    same result the per-symbol pandas rolling() window would give).
+    """
+    row = values[-1 - offset]
+    return np.where(n_bars - offset >= period, row, np.nan)
+
+def apply_strategies_batch(close_panel: pd.DataFrame, strategies: list) -> np.ndarray:
+    """
+    Vectorized counterpart of apply_strategy() for many symbols and strategies.
+
+    Strategies sharing a type and indicator period are evaluated together:
+    each distinct RSI period / SMA period is computed once over every
+    symbol column that needs it, and the thresholds are applied as array
+    comparisons.
+
+    Args:
+        close_panel (pd.DataFrame): A bars × symbols close panel aligned on
+            bar position, as returned by db_loader.get_recent_price_panel().
+        strategies (list): Dicts with 'symbol', 'strategy_type' and 'params'.
+
+    Returns:
+        np.ndarray: One signal per strategy: 1 buy, -1 sell, 0 hold.
+    """
+    values = close_panel.to_numpy(dtype=float)
+    n_bars = (~np.isnan(values)).sum(axis=0)
+    column = {s: i for i, s in enumerate(close_panel.columns)}
+    signals = np.zeros(len(strategies), dtype=int)
+
+    groups = {}
+    for i, strategy in enumerate(strategies):
+        groups.setdefault(str(strategy['strategy_type']).upper(), []).append(i)
+    for strategy_type in groups.keys() - {'RSI', 'CROSS'}:
+        print(f"WARNING: Strategy type '{strategy_type}' is not supported.")
+
+    def param_array(rows, key):
+        return np.array([strategies[i]['params'].get(key) or np.nan for i in rows], dtype=float)
+
+    rows = np.array(groups.get('RSI', []), dtype=int)
+    if len(rows):
+        period = param_array(rows, 'rsi_period')
+        upper, lower = param_array(rows, 'rsi_upper'), param_array(rows, 'rsi_lower')
+        complete = ~(np.isnan(period) | np.isnan(upper) | np.isnan(lower))
+        if (~complete).any():
+            print(f"WARNING: {(~complete).sum()} RSI strategies are missing one or more parameters.")
+        cols = np.array([column.get(strategies[i]['symbol'], -1) for i in rows])
+        latest = np.full(len(rows), np.nan)
+        for p in np.unique(period[complete]).astype(int):
+            members = complete & (period == p) & (cols >= 0)
+            used = np.unique(cols[members])
+            rsi = _latest_values(rsi_array(values[:, used], p), n_bars[used], p)
+            latest[members] = rsi[np.searchsorted(used, cols[members])]
+        with np.errstate(invalid='ignore'):
+            signals[rows] = np.where(latest > upper, -1, np.where(latest < lower, 1, 0))
+
+    rows = np.array(groups.get('CROSS', []), dtype=int)
+    if len(rows):
+        fast, slow = param_array(rows, 'fast_period'), param_array(rows, 'slow_period')
+        complete = ~(np.isnan(fast) | np.isnan(slow))
+        if (~complete).any():
+            print(f"WARNING: {(~complete).sum()} Crossover strategies are missing one or more parameters.")
+        cols = np.array([column.get(strategies[i]['symbol'], -1) for i in rows])
+        valid_cols = np.unique(cols[complete & (cols >= 0)])
+        # One SMA per distinct period over every symbol any crossover strategy uses
+        curr, prev = {}, {}
+        for p in np.unique(np.concatenate([fast[complete], slow[complete]])).astype(int):
+            sma = sma_array(values[:, valid_cols], p)
+            curr[p] = _latest_values(sma, n_bars[valid_cols], p)
+            prev[p] = _latest_values(sma, n_bars[valid_cols], p, offset=1)
+        prev_short, prev_long, curr_short, curr_long = (np.full(len(rows), np.nan) for _ in range(4))
+        for j in np.nonzero(complete & (cols >= 0))[0]:
+            k = np.searchsorted(valid_cols, cols[j])
+            f, s = int(fast[j]), int(slow[j])
+            prev_short[j], prev_long[j] = prev[f][k], prev[s][k]
+            curr_short[j], curr_long[j] = curr[f][k], curr[s][k]
+        with np.errstate(invalid='ignore'):
+            golden = (prev_short <= prev_long) & (curr_short > curr_long)
+            death = (prev_short >= prev_long) & (curr_short < curr_long)
+        signals[rows] = np.where(golden, 1, np.where(death, -1, 0))
+
+    return signals
@@ -0,0 +1,75 @@
+"""
+合成行情資料
+
+以固定亂數種子產生任意根數、任意股票數的 OHLCV 資料（幾何布朗運動），
+並可寫成與 M0 相同結構的價格資料庫（每支股票一張表：date, open, high,
+low, close, volume），讓效能基準測試不必連網、也不受 data_csv 只有數百列的限制。
+同一組 (seed, 股票, 根數) 每次產生的資料完全相同。
+"""
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+
+def synthetic_ohlcv(n_bars, seed=0, start_price=100.0, drift=0.0003, volatility=0.02,
+                    start_date='1950-01-02', freq='B'):
+    """
+    產生單一股票的 OHLCV。
+
+    收盤價為幾何布朗運動；開盤價為前一收盤價加上跳空，最高/最低價包住開盤與收盤，
+    成交量為對數常態分布。日期以 freq 排列（預設營業日，約可產生 8 萬根；
+    更多根數請改用分鐘等較細的頻率）。
+
+    回傳:
+        pd.DataFrame: date（YYYY-MM-DD 或含時間的字串）, open, high, low, close, volume
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=n_bars, freq=freq)
+    log_returns = rng.normal(drift - 0.5 * volatility ** 2, volatility, n_bars)
+    close = start_price * np.exp(np.cumsum(log_returns))
+    previous_close = np.concatenate(([start_price], close[:-1]))
+    open_ = previous_close * np.exp(rng.normal(0.0, volatility / 4, n_bars))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, volatility / 2, n_bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, volatility / 2, n_bars)))
+    volume = np.round(rng.lognormal(14.0, 0.5, n_bars))
+    date_format = '%Y-%m-%d' if (dates == dates.normalize()).all() else '%Y-%m-%d %H:%M:%S'
+    return pd.DataFrame({
+        'date': dates.strftime(date_format),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': volume,
+    })
+
+def synthetic_symbols(n_symbols, prefix='SYN'):
+    """合成股票代碼：SYN0000, SYN0001, ..."""
+    return [f'{prefix}{i:04d}' for i in range(n_symbols)]
+
+def synthetic_universe(n_symbols, n_bars, seed=0, **kwargs):
+    """
+    產生多支股票的 OHLCV，每支股票使用由 seed 衍生的獨立亂數流。
+
+    回傳:
+        dict: {symbol: DataFrame}
+    """
+    streams = np.random.SeedSequence(seed).spawn(n_symbols)
+    universe = {}
+    for symbol, stream in zip(synthetic_symbols(n_symbols), streams):
+        rng = np.random.default_rng(stream)
+        start_price = 20.0 + 180.0 * rng.random()
+        universe[symbol] = synthetic_ohlcv(n_bars, seed=rng, start_price=start_price, **kwargs)
+    return universe
+
+def write_price_db(universe, db_path='database/stock_price.db'):
+    """將 {symbol: DataFrame} 寫入價格資料庫，結構與 M0 寫入的資料表相同（同名表會被取代）"""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        for symbol, df in universe.items():
+            df.to_sql(symbol, conn, if_exists='replace', index=False)
+        conn.commit()
+    finally:
+        conn.close()
+    return db_path
@@ -0,0 +1,313 @@
+"""
+階段追蹤（tracing）
+
+以 context manager 與 decorator 記錄巢狀的時間區段（階段 → 股票 → 參數批次 →
+讀取 / 計算 / 寫出），每個區段記下牆鐘時間與 CPU 時間，結束後可匯出成
+Chrome trace JSON（以 chrome://tracing 或 https://ui.perfetto.dev 開啟）與
+依區段名稱彙總的表格（總時間、扣除子區段的自身時間、CPU 時間）。
+
+停用時（預設）span() 直接回傳共用的空區段，decorator 只多一次屬性檢查，
+不配置任何物件，可以留在每組參數都會呼叫的熱點上。
+
+啟用方式：
+    - 程式內：tracer.enable('trace.json')，結束時 tracer.export()
+    - 環境變數：QUANT_TRACE=trace.json python main_controller.py，
+      行程結束時自動匯出並印出彙總表
+
+DAG 的平行子行程會繼承啟用狀態，每個節點結束時把自己的區段寫入暫存目錄
+（QUANT_TRACE_SPOOL），由主行程匯出時合併，因此各階段會以不同的 pid 出現在同一份 trace 中。
+"""
+import atexit
+import csv
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+TRACE_ENV = 'QUANT_TRACE'
+TRACE_SPOOL_ENV = 'QUANT_TRACE_SPOOL'
+
+
+class _NullSpan:
+    """停用時共用的空區段"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """一個進行中的區段；結束時把事件交給 Tracer"""
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start_us', 'start_ns', 'cpu_ns', 'child_ns', 'parent', 'depth')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.child_ns = 0
+
+    def set(self, **args):
+        """補上區段參數（例如處理後才知道的列數）"""
+        self.args.update(args)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1] if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.start_us = time.time_ns() // 1000
+        self.cpu_ns = time.thread_time_ns()
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dur_ns = time.perf_counter_ns() - self.start_ns
+        cpu_ns = time.thread_time_ns() - self.cpu_ns
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if self.parent is not None:
+            self.parent.child_ns += dur_ns
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer._record({
+            'name': self.name,
+            'cat': self.cat,
+            'ts': self.start_us,
+            'dur': dur_ns / 1000,
+            'cpu': cpu_ns / 1000,
+            'self': (dur_ns - self.child_ns) / 1000,
+            'depth': self.depth,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': self.args,
+        })
+        return False
+
+
+class Tracer:
+    """收集區段事件；整個行程共用 utils.tracing.tracer"""
+
+    def __init__(self):
+        self.enabled = False
+        self.output_path: Optional[str] = None
+        self.spool_dir: Optional[str] = None
+        self.owner_pid: Optional[int] = None
+        self.events: List[Dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # === 啟用 / 停用 ===
+
+    def enable(self, output_path: Optional[str] = None, spool_dir: Optional[str] = None):
+        """
+        啟用追蹤。output_path 為 export() 預設的 Chrome trace 路徑；
+        子行程的區段寫入 spool_dir（預設建立暫存目錄）。
+        同時設定環境變數，讓以 spawn 啟動的子行程也會啟用。
+        """
+        self.enabled = True
+        self.output_path = output_path or self.output_path or 'trace.json'
+        self.spool_dir = spool_dir or self.spool_dir or tempfile.mkdtemp(prefix='quant_trace_')
+        self.owner_pid = os.getpid()
+        os.environ[TRACE_ENV] = self.output_path
+        os.environ[TRACE_SPOOL_ENV] = self.spool_dir
+        return self
+
+    def disable(self):
+        self.enabled = False
+        os.environ.pop(TRACE_ENV, None)
+        os.environ.pop(TRACE_SPOOL_ENV, None)
+
+    def reset(self):
+        """清除已記錄的事件與子行程暫存檔"""
+        with self._lock:
+            self.events = []
+        for path in self._spool_files():
+            os.remove(path)
+
+    @property
+    def is_worker(self) -> bool:
+        """是否為啟用追蹤之行程的子行程（區段需寫入暫存目錄）"""
+        return self.owner_pid is not None and os.getpid() != self.owner_pid
+
+    # === 記錄 ===
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, event: Dict):
+        with self._lock:
+            self.events.append(event)
+
+    def span(self, name: str, cat: str = 'stage', **args):
+        """
+        記錄一個區段：
+            with tracer.span('M2-1', symbol=symbol) as s:
+                ...
+                s.set(rows=len(df))
+        停用時回傳共用的空區段。
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def traced(self, name: Optional[str] = None, cat: str = 'function') -> Callable:
+        """將整個函式呼叫記錄為一個區段（名稱預設為 模組.函式）"""
+        def decorate(func):
+            label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, label, cat, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    # === 子行程 ===
+
+    def spool(self):
+        """
+        子行程把本行程記錄的區段寫入暫存目錄並清空。fork 出來的子行程會帶著
+        父行程已記錄的事件副本，只寫出 pid 為本行程的事件以免重複。
+        """
+        if not self.enabled or not self.spool_dir:
+            return None
+        pid = os.getpid()
+        with self._lock:
+            events = [e for e in self.events if e['pid'] == pid]
+            self.events = []
+        if not events:
+            return None
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'spans_{pid}_{time.time_ns()}.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(events, f, default=str)
+        os.replace(tmp_path, path)
+        return path
+
+    def _spool_files(self) -> List[str]:
+        if not self.spool_dir or not os.path.isdir(self.spool_dir):
+            return []
+        return sorted(os.path.join(self.spool_dir, n) for n in os.listdir(self.spool_dir)
+                      if n.startswith('spans_') and n.endswith('.json'))
+
+    def collect(self) -> List[Dict]:
+        """本行程的事件加上子行程寫入暫存目錄的事件，依開始時間排序"""
+        with self._lock:
+            events = list(self.events)
+        for path in self._spool_files():
+            with open(path, 'r', encoding='utf-8') as f:
+                events.extend(json.load(f))
+        return sorted(events, key=lambda e: (e['ts'], e['depth']))
+
+    # === 匯出 ===
+
+    def export_chrome_trace(self, path: Optional[str] = None) -> str:
+        """匯出 Chrome trace（complete events，時間單位為微秒）"""
+        path = path or self.output_path or 'trace.json'
+        trace_events = []
+        for e in self.collect():
+            args = dict(e['args'])
+            args['cpu_ms'] = round(e['cpu'] / 1000, 3)
+            args['self_ms'] = round(e['self'] / 1000, 3)
+            trace_events.append({'name': e['name'], 'cat': e['cat'], 'ph': 'X', 'ts': e['ts'], 'dur': e['dur'],
+                                 'pid': e['pid'], 'tid': e['tid'], 'args': args})
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False, default=str)
+        return path
+
+    def summary(self) -> List[Dict]:
+        """
+        依區段名稱彙總，依自身時間由大到小排序。
+
+        回傳:
+            list: {name, cat, count, total_ms, self_ms, cpu_ms, mean_ms, max_ms, self_pct}
+        """
+        rows = {}
+        for e in self.collect():
+            row = rows.setdefault(e['name'], {'name': e['name'], 'cat': e['cat'], 'count': 0, 'total_ms': 0.0,
+                                              'self_ms': 0.0, 'cpu_ms': 0.0, 'max_ms': 0.0})
+            row['count'] += 1
+            row['total_ms'] += e['dur'] / 1000
+            row['self_ms'] += e['self'] / 1000
+            row['cpu_ms'] += e['cpu'] / 1000
+            row['max_ms'] = max(row['max_ms'], e['dur'] / 1000)
+        total_self = sum(r['self_ms'] for r in rows.values()) or 1.0
+        for row in rows.values():
+            row['mean_ms'] = row['total_ms'] / row['count']
+            row['self_pct'] = 100 * row['self_ms'] / total_self
+        return sorted(rows.values(), key=lambda r: r['self_ms'], reverse=True)
+
+    def format_summary(self, top_n: Optional[int] = 30) -> str:
+        rows = self.summary()[:top_n] if top_n else self.summary()
+        lines = [f"{'區段':<40}{'次數':>8}{'總時間(ms)':>13}{'自身(ms)':>12}{'自身%':>8}{'CPU(ms)':>12}"
+                 f"{'平均(ms)':>11}{'最長(ms)':>11}"]
+        for r in rows:
+            lines.append(f"{r['name'][:40]:<40}{r['count']:>8}{r['total_ms']:>13.1f}{r['self_ms']:>12.1f}"
+                         f"{r['self_pct']:>8.1f}{r['cpu_ms']:>12.1f}{r['mean_ms']:>11.2f}{r['max_ms']:>11.1f}")
+        return '\n'.join(lines)
+
+    def export_summary_csv(self, path: str) -> str:
+        rows = self.summary()
+        fields = ['name', 'cat', 'count', 'total_ms', 'self_ms', 'self_pct', 'cpu_ms', 'mean_ms', 'max_ms']
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({k: round(v, 3) if isinstance(v, float) else v for k, v in row.items()})
+        return path
+
+    def export(self, path: Optional[str] = None, print_summary: bool = True) -> Optional[str]:
+        """匯出 Chrome trace 與同名的 _summary.csv，並印出彙總表；沒有任何事件時不寫檔"""
+        if not self.collect():
+            return None
+        path = self.export_chrome_trace(path)
+        self.export_summary_csv(os.path.splitext(path)[0] + '_summary.csv')
+        if print_summary:
+            print(f"\n=== 追蹤彙總（依自身時間） ===\n{self.format_summary()}")
+            print(f"📁 Chrome trace 已存於: {path}")
+        return path
+
+
+tracer = Tracer()
+span = tracer.span
+traced = tracer.traced
+
+
+def _export_at_exit():
+    if tracer.enabled and not tracer.is_worker:
+        tracer.export()
+
+
+# 以環境變數啟用：主行程在結束時匯出；子行程（環境變數由父行程帶入）只寫暫存目錄
+if os.environ.get(TRACE_ENV):
+    if os.environ.get(TRACE_SPOOL_ENV):
+        tracer.enabled = True
+        tracer.output_path = os.environ[TRACE_ENV]
+        tracer.spool_dir = os.environ[TRACE_SPOOL_ENV]
+        # spawn 的子行程：owner 設為不存在的 pid，使 is_worker 為真
+        tracer.owner_pid = -1
+    else:
+        tracer.enable(os.environ[TRACE_ENV])
+        atexit.register(_export_at_exit)
@@ -0,0 +1,135 @@
+"""
+全市場 (universe) 張量運算
+
+價格面板先壓縮成「每支股票自己的第 k 根 bar」（bars × symbols，尾端以 NaN 補齊），
+使每一欄的運算與單一股票回測完全相同。指標以 bars × symbols × windows 張量
+一次計算，訊號、部位與報酬則以 bars × symbols × params 張量分塊計算，
+最後得到 symbols × params 的績效立方體。
+"""
+import numpy as np
+import pandas as pd
+from utils.indicator_utils import rsi_array, sma_array
+from utils.performance_utils import positions_from_signals, trade_counts, calculate_performance_from_returns
+from utils.return_matrix import param_id_of
+
+
+def compact_panel(panel: pd.DataFrame):
+    """
+    將 dates × symbols 面板中每一欄的有效值往上壓縮。
+    回傳 (values, valid)：皆為 bars × symbols，valid 標記非補齊的位置。
+    """
+    raw = panel.to_numpy(dtype=float)
+    valid_raw = ~np.isnan(raw)
+    lengths = valid_raw.sum(axis=0)
+    n_bars = int(lengths.max()) if len(lengths) else 0
+
+    values = np.full((n_bars, raw.shape[1]), np.nan)
+    for j in range(raw.shape[1]):
+        values[:lengths[j], j] = raw[valid_raw[:, j], j]
+    valid = np.arange(n_bars)[:, None] < lengths[None, :]
+    return values, valid
+
+def indicator_tensor(values, kind, periods):
+    """回傳 (bars × symbols × windows 張量, {period: window 索引})"""
+    periods = sorted({int(p) for p in periods})
+    func = rsi_array if kind == 'rsi' else sma_array
+    tensor = np.stack([func(values, p) for p in periods], axis=2)
+    return tensor, {p: i for i, p in enumerate(periods)}
+
+def _param_sources(param_list):
+    return [p.get('params', p) for p in param_list]
+
+def universe_performance_cube(panel: pd.DataFrame, strategy_type: str, param_list: list, chunk_size: int = 256):
+    """
+    一次計算所有股票 × 所有參數的績效。
+    回傳 dict：指標名稱（total_return、max_drawdown、sharpe、n_trades）→ symbols × params 的 DataFrame。
+    """
+    strategy_type = strategy_type.upper()
+    values, valid = compact_panel(panel)
+    sources = _param_sources(param_list)
+
+    pct = np.zeros_like(values)
+    pct[1:] = values[1:] / values[:-1] - 1
+    pct = np.where(valid, np.nan_to_num(pct), 0.0)
+
+    if strategy_type == 'RSI':
+        rsi, rsi_idx = indicator_tensor(values, 'rsi', [s.get('rsi_period', 14) for s in sources])
+    elif strategy_type == 'CROSS':
+        windows = [s.get('fast_period', 5) for s in sources] + [s.get('slow_period', 20) for s in sources]
+        sma, sma_idx = indicator_tensor(values, 'sma', windows)
+    else:
+        raise ValueError(f"未知的策略類型: {strategy_type}")
+
+    n_bars, n_symbols = values.shape
+    metrics = {name: np.full((n_symbols, len(param_list)), np.nan)
+               for name in ('total_return', 'max_drawdown', 'sharpe')}
+    n_trades = np.zeros((n_symbols, len(param_list)), dtype=np.int64)
+
+    for start in range(0, len(param_list), chunk_size):
+        chunk = sources[start:start + chunk_size]
+        if strategy_type == 'RSI':
+            ind = rsi[:, :, [rsi_idx[int(s.get('rsi_period', 14))] for s in chunk]]
+            upper = np.array([s.get('rsi_upper', 70) for s in chunk])
+            lower = np.array([s.get('rsi_lower', 30) for s in chunk])
+            signals = np.where(ind > upper, -1.0, np.where(ind < lower, 1.0, 0.0))
+        else:
+            short = sma[:, :, [sma_idx[int(s.get('fast_period', 5))] for s in chunk]]
+            long = sma[:, :, [sma_idx[int(s.get('slow_period', 20))] for s in chunk]]
+            signals = np.where(short > long, 1.0, np.where(short < long, -1.0, 0.0))
+
+        # 補齊的 bar 不產生訊號（指標在尾端可能仍有值），部位維持不變
+        signals = np.where(valid[:, :, None], signals, 0.0)
+        n_chunk = len(chunk)
+        positions = positions_from_signals(signals.reshape(n_bars, -1)).reshape(n_bars, n_symbols, n_chunk)
+        prev_pos = np.zeros_like(positions)
+        prev_pos[1:] = positions[:-1]
+        daily_returns = prev_pos * pct[:, :, None]
+        active = np.maximum.accumulate(positions != 0, axis=0) & valid[:, :, None]
+
+        chunk_metrics = calculate_performance_from_returns(
+            daily_returns.reshape(n_bars, -1), active.reshape(n_bars, -1))
+        for name, arr in chunk_metrics.items():
+            metrics[name][:, start:start + n_chunk] = arr.reshape(n_symbols, n_chunk)
+        n_trades[:, start:start + n_chunk] = trade_counts(positions.reshape(n_bars, -1)).reshape(n_symbols, n_chunk)
+
+    metrics['n_trades'] = n_trades
+    param_ids = [param_id_of(p) for p in param_list]
+    return {name: pd.DataFrame(arr, index=panel.columns, columns=param_ids) for name, arr in metrics.items()}
+
+def cube_to_long(cube: dict) -> pd.DataFrame:
+    """將績效立方體轉為 symbol, param_id, 各指標 的長表（欄位與 M2-2 輸出相容）"""
+    first = next(iter(cube.values()))
+    long_df = pd.DataFrame({
+        'symbol': np.repeat(first.index.to_numpy(), first.shape[1]),
+        'param_id': np.tile(first.columns.to_numpy(), first.shape[0]),
+    })
+    for name, df in cube.items():
+        long_df[name] = df.to_numpy().ravel()
+    return long_df
+
+# 以 > 0 判斷「該股票表現為正」有意義的指標
+POSITIVE_RATIO_METRICS = ('total_return', 'sharpe')
+
+def rank_generalizing_params(cube: dict, metric: str = 'sharpe', agg: str = 'median',
+                             min_positive_ratio: float = 0.0, top_n: int = 20) -> pd.DataFrame:
+    """
+    找出跨股票表現最穩定的參數：依各股票 metric 的 agg（mean/median/min）由大到小排序，
+    並可要求 metric > 0 的股票比例至少為 min_positive_ratio。
+    三個指標皆為越大越好（max_drawdown 為負值，越接近 0 越好）。
+    max_drawdown 不會大於 0，因此不計算 positive_ratio，也不套用 min_positive_ratio。
+    """
+    table = cube[metric]
+    summary = pd.DataFrame({
+        f'{metric}_mean': table.mean(axis=0),
+        f'{metric}_median': table.median(axis=0),
+        f'{metric}_min': table.min(axis=0),
+        f'{metric}_std': table.std(axis=0),
+        'n_symbols': table.notna().sum(axis=0),
+    })
+    summary.index.name = 'param_id'
+    if metric in POSITIVE_RATIO_METRICS:
+        summary.insert(4, 'positive_ratio', (table > 0).sum(axis=0) / summary['n_symbols'].clip(lower=1))
+        summary = summary[summary['positive_ratio'] >= min_positive_ratio]
+    elif min_positive_ratio > 0:
+        print(f"⚠️ {metric} 不適用 min_positive_ratio，已忽略")
+    return summary.sort_values(f'{metric}_{agg}', ascending=False).head(top_n).reset_index()
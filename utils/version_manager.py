@@ -1,16 +1,221 @@
 """
 版本管理模組
 負責管理策略參數、訊號、績效的版本控制
+
+另外維護一份產出檔目錄 (artifact catalog)：每個模組寫出的檔案都登記種類、股票、策略、
+資料區間、上游檔案、列數、大小與修改時間（checksum 需要時才計算）。目錄以 JSON Lines 逐筆附加寫入，載入時建立
+記憶體索引，「NVDA RSI 最新的樣本外績效檔」這類查詢為一次 dict 查找，不必掃描目錄、
+也不必從檔名拆出 symbol（含底線的代碼也不會解析錯誤）。
 """
 import os
 import json
-from datetime import datetime
+import time
+import hashlib
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import product
 from typing import Dict, List, Optional
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 專案根目錄與單次執行版本的環境變數
+PROJECT_ROOT_ENV = "QUANT_PROJECT_ROOT"
+RUN_VERSION_ENV = "QUANT_VERSION_ID"
+_DEFAULT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_run_version = contextvars.ContextVar("run_version", default=None)
+
+# 使用中版本的租約目錄（相對於專案根目錄）；保留政策不處理持有租約的版本
+ACTIVE_DIR = ".active_versions"
+# 建立未滿此時數的版本不會過期（剛建立、尚未開始持有租約的管線也不會被處理）
+RETENTION_GRACE_HOURS = 6.0
+_lease_ids = itertools.count()
+
+# 各版本目錄類型相對於專案根目錄的位置
+VERSION_DIRS = {
+    "in_sample_params": "strategies/in_sample/all_params",
+    "in_sample_best": "strategies/in_sample/best",
+    "out_sample_params": "strategies/out_sample/param_logs",
+    "out_sample_best": "strategies/out_sample/best",
+    "trading_signal": "trading_simulation/signal",
+    "trading_performance": "trading_simulation/performance",
+}
+
+# 產出檔種類與所在的版本目錄類型
+ARTIFACT_KINDS = {
+    "param_log": "in_sample_params",
+    "signals": "trading_signal",
+    "performance": "trading_performance",
+    "best_strategies": "in_sample_best",
+    "best_param_log": "out_sample_params",
+    "validation_signals": "trading_signal",
+    "validation_performance": "trading_performance",
+    "final_strategies": "out_sample_best",
+    "trade_decisions": "trading_signal",
+    "live_decisions": "trading_signal",
+    "account_snapshot": "trading_performance",
+    "equity_curve": "trading_performance",
+    "account_ledger": "trading_performance",
+    "cpcv": "trading_performance",
+    "walk_forward": "trading_performance",
+    "memory_report": "trading_performance",
+}
+
+_ANY = "*"
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """以 sha256 分塊計算檔案 checksum"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _parse_legacy_name(file_name: str, path_type: str):
+    """
+    由舊版檔名推斷 (kind, symbol, strategy)，只供尚未登記的舊版本回填目錄使用。
+    無法辨識的檔案回傳 None。
+    """
+    from utils.results_store import parse_signal_filename
+    base = file_name
+    if path_type in ("in_sample_params", "out_sample_params"):
+        if not (base.startswith('param_log_') and base.endswith('.json')):
+            return None
+        strategy, _, symbol = base[len('param_log_'):-len('.json')].partition('_')
+        kind = "param_log" if path_type == "in_sample_params" else "best_param_log"
+        return kind, symbol, strategy
+    if path_type in ("in_sample_best", "out_sample_best"):
+        if not (base.startswith('best_strategies_') and base.endswith('.csv')):
+            return None
+        symbol, strategy = parse_signal_filename(base[len('best_strategies_'):])
+        kind = "best_strategies" if path_type == "in_sample_best" else "final_strategies"
+        return kind, symbol, strategy
+    if not base.endswith('.csv'):
+        return None
+    if base.startswith('M6_trade_decisions_'):
+        return "trade_decisions", None, None
+    if base.startswith('M7_simulation_result_'):
+        return "account_snapshot", None, None
+    if base.startswith('cpcv_'):
+        symbol, _, strategy = base[len('cpcv_'):-len('.csv')].rsplit('_', 2)[0].rpartition('_')
+        return "cpcv", symbol, strategy
+    if base.startswith('walk_forward_'):
+        symbol, _, strategy = base[len('walk_forward_'):-len('.csv')].rsplit('_', 3)[0].rpartition('_')
+        return "walk_forward", symbol, strategy
+    symbol, strategy = parse_signal_filename(base)
+    if symbol is None:
+        return None
+    if path_type == "trading_signal":
+        return ("validation_signals" if base.endswith('_validation.csv') else "signals"), symbol, strategy
+    if base.endswith('_validation.csv'):
+        return "validation_performance", symbol, strategy
+    if base.endswith('_batch.csv'):
+        return "performance", symbol, strategy
+    return None
+
+
+def _lock_handle(handle, blocking: bool = True) -> bool:
+    """對已開啟的檔案取得獨占鎖；blocking 為 False 且已被其他持有者鎖住時回傳 False"""
+    if fcntl is not None:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+    handle.seek(0)
+    while True:
+        try:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            if not blocking:
+                return False
+            time.sleep(0.05)
+
+def _unlock_handle(handle):
+    if fcntl is not None:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+    else:
+        handle.seek(0)
+        msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class _FileLock:
+    """跨行程的獨占檔案鎖；同一行程內可重入，也會同時鎖住同一行程的其他執行緒"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._handle = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._handle = open(self.path, 'a+')
+            _lock_handle(self._handle)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            _unlock_handle(self._handle)
+            self._handle.close()
+            self._handle = None
+        self._thread_lock.release()
+
+
+def _atomic_write_json(path: str, data):
+    """先寫入暫存檔再以 os.replace 取代，讀取端不會讀到寫到一半的檔案"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _file_stamp(path: str):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
 class VersionManager:
-    def __init__(self):
-        self.version_metadata_file = "version_metadata.json"
-        self.metadata = self._load_metadata()
+    """
+    版本與產出檔目錄管理。
+    所有路徑都相對於 project_root（預設為環境變數 QUANT_PROJECT_ROOT，否則為專案目錄），
+    不受目前工作目錄影響。version_metadata.json 的修改都在檔案鎖內「重新載入 → 修改 →
+    原子寫回」，其他行程的更新會在下次讀取時自動載入，多個管線/worker 可同時執行。
+    """
+
+    def __init__(self, project_root: Optional[str] = None):
+        self.project_root = os.path.abspath(project_root or os.environ.get(PROJECT_ROOT_ENV) or _DEFAULT_ROOT)
+        self.version_metadata_file = os.path.join(self.project_root, "version_metadata.json")
+        self.catalog_file = os.path.join(self.project_root, "artifact_catalog.jsonl")
+        self._lock = _FileLock(os.path.join(self.project_root, ".version_manager.lock"))
+        self._metadata = None
+        self._metadata_stamp = None
+        self._catalog = None
+
+    @property
+    def metadata(self) -> Dict:
+        """版本元數據；檔案被其他行程更新後自動重新載入"""
+        stamp = _file_stamp(self.version_metadata_file)
+        if self._metadata is None or stamp != self._metadata_stamp:
+            self._metadata = self._load_metadata()
+            self._metadata_stamp = stamp
+        return self._metadata
     
     def _load_metadata(self) -> Dict:
         """載入版本元數據"""
@@ -18,37 +223,43 @@ class VersionManager:
             with open(self.version_metadata_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
         return {"versions": [], "current_version": None}
+
+    @contextmanager
+    def _update_metadata(self):
+        """在檔案鎖內重新載入元數據，交給呼叫端修改後以原子方式寫回"""
+        with self._lock:
+            self._metadata = self._load_metadata()
+            yield self._metadata
+            _atomic_write_json(self.version_metadata_file, self._metadata)
+            self._metadata_stamp = _file_stamp(self.version_metadata_file)
     
-    def _save_metadata(self):
-        """儲存版本元數據"""
-        with open(self.version_metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, indent=2, ensure_ascii=False)
-    
-    def create_new_version(self) -> str:
-        """建立新版本"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # 建立版本目錄
-        version_dirs = [
-            f"strategies/in_sample/all_params/{timestamp}",
-            f"strategies/in_sample/best/{timestamp}",
-            f"strategies/out_sample/param_logs/{timestamp}",
-            f"strategies/out_sample/best/{timestamp}",
-            f"trading_simulation/signal/{timestamp}",
-            f"trading_simulation/performance/{timestamp}"
-        ]
-        
-        for dir_path in version_dirs:
-            os.makedirs(dir_path, exist_ok=True)
-        
-        # 更新元數據
-        self.metadata["versions"].append({
-            "version_id": timestamp,
-            "created_at": datetime.now().isoformat(),
-            "description": f"Version created at {timestamp}"
-        })
-        self.metadata["current_version"] = timestamp
-        self._save_metadata()
+    def create_new_version(self, description: Optional[str] = None, make_current: bool = True) -> str:
+        """
+        建立新版本。make_current 為 False 時不改變全域的當前版本（供平行執行的管線使用）。
+        同一秒內建立多個版本時，版本 ID 會加上 _1、_2 等後綴。
+        """
+        with self._update_metadata() as metadata:
+            existing = {v["version_id"] for v in metadata["versions"]}
+            timestamp = base = datetime.now().strftime('%Y%m%d_%H%M%S')
+            suffix = 1
+            while timestamp in existing:
+                timestamp = f"{base}_{suffix}"
+                suffix += 1
+
+            # 建立版本目錄
+            for path_type in VERSION_DIRS:
+                os.makedirs(self.get_version_path(timestamp, path_type), exist_ok=True)
+
+            # 更新元數據
+            metadata["versions"].append({
+                "version_id": timestamp,
+                "created_at": datetime.now().isoformat(),
+                "description": description or f"Version created at {timestamp}"
+            })
+            if make_current:
+                metadata["current_version"] = timestamp
+        # 新版本的檔案都會在寫出時登記，不需要回填
+        self._mark_cataloged(timestamp)
         
         print(f"✅ 新版本已建立: {timestamp}")
         return timestamp
@@ -60,33 +271,383 @@ class VersionManager:
         return self.metadata["versions"][-1]["version_id"]
     
     def get_current_version(self) -> Optional[str]:
-        """取得當前版本"""
-        return self.metadata.get("current_version")
+        """
+        取得當前版本。優先順序：run_scope() 指定的版本 → 環境變數 QUANT_VERSION_ID →
+        version_metadata.json 中的全域當前版本。
+        """
+        return _run_version.get() or os.environ.get(RUN_VERSION_ENV) or self.metadata.get("current_version")
     
     def set_current_version(self, version_id: str):
         """設定當前版本"""
-        if version_id in [v["version_id"] for v in self.metadata["versions"]]:
-            self.metadata["current_version"] = version_id
-            self._save_metadata()
+        with self._update_metadata() as metadata:
+            found = version_id in [v["version_id"] for v in metadata["versions"]]
+            if found:
+                metadata["current_version"] = version_id
+        if found:
             print(f"✅ 當前版本已設定為: {version_id}")
         else:
             print(f"❌ 版本 {version_id} 不存在")
+
+    @contextmanager
+    def run_scope(self, version_id: Optional[str] = None, description: Optional[str] = None):
+        """
+        單次執行的版本隔離：範圍內 get_current_version() 回傳 version_id
+        （未指定時建立新版本，但不改變全域當前版本）。只影響目前的執行緒/context，
+        不會寫入 version_metadata.json，其他同時執行的管線不受影響。
+        """
+        if version_id is None:
+            version_id = self.create_new_version(description, make_current=False)
+        token = _run_version.set(version_id)
+        try:
+            with self.hold_version(version_id):
+                yield version_id
+        finally:
+            _run_version.reset(token)
+
+    @contextmanager
+    def hold_version(self, version_id: str):
+        """
+        範圍內把版本標記為使用中，保留政策（expired_versions）不會處理它。
+        以 ACTIVE_DIR 下持有獨占鎖的租約檔表示；行程當機時作業系統會釋放鎖，
+        租約自動失效，不會讓版本永遠無法清理。可巢狀、可在多個行程同時持有。
+        """
+        directory = os.path.join(self.project_root, ACTIVE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{version_id}.{os.getpid()}.{next(_lease_ids)}.lease")
+        while True:
+            handle = open(path, 'a+')
+            _lock_handle(handle)
+            # 建立檔案到取得鎖之間，active_versions() 可能已把尚未上鎖的租約檔當成過期刪除；
+            # 這時鎖住的是已刪除的檔案，必須重新建立，否則版本看起來沒有在使用中
+            try:
+                if os.path.samestat(os.fstat(handle.fileno()), os.stat(path)):
+                    break
+            except FileNotFoundError:
+                pass
+            _unlock_handle(handle)
+            handle.close()
+        try:
+            yield version_id
+        finally:
+            _unlock_handle(handle)
+            handle.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def active_versions(self) -> set:
+        """回傳目前有行程持有租約的版本；順便清除持有者已結束的租約檔"""
+        directory = os.path.join(self.project_root, ACTIVE_DIR)
+        if not os.path.isdir(directory):
+            return set()
+        active = set()
+        for name in os.listdir(directory):
+            if not name.endswith(".lease"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                handle = open(path, 'a+')
+            except OSError:
+                continue
+            try:
+                held = not _lock_handle(handle, blocking=False)
+                if not held:
+                    _unlock_handle(handle)
+            finally:
+                handle.close()
+            if held:
+                active.add(name.split(".", 1)[0])
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return active
     
     def list_versions(self) -> List[Dict]:
         """列出所有版本"""
         return self.metadata["versions"]
+
+    def _find_version(self, version_id: str, metadata: Optional[Dict] = None) -> Optional[Dict]:
+        for v in (metadata or self.metadata)["versions"]:
+            if v["version_id"] == version_id:
+                return v
+        return None
+
+    def pin_version(self, version_id: str, pinned: bool = True):
+        """釘選（或取消釘選）版本；釘選的版本不受保留政策影響"""
+        with self._update_metadata() as metadata:
+            version = self._find_version(version_id, metadata)
+            if version is not None:
+                version["pinned"] = pinned
+        if version is None:
+            print(f"❌ 版本 {version_id} 不存在")
+            return
+        print(f"✅ 版本 {version_id} 已{'釘選' if pinned else '取消釘選'}")
+
+    def update_version_info(self, version_id: str, **fields):
+        """更新版本元數據的附加欄位（例如壓縮紀錄）"""
+        with self._update_metadata() as metadata:
+            version = self._find_version(version_id, metadata)
+            if version is not None:
+                version.update(fields)
+
+    def expired_versions(self, keep_last: Optional[int] = None, max_age_days: Optional[float] = None,
+                         grace_hours: float = RETENTION_GRACE_HOURS) -> List[str]:
+        """
+        依保留政策回傳過期的版本（由舊到新）。
+        最新的 keep_last 個版本、或建立未超過 max_age_days 天的版本會被保留（符合任一條件即保留）；
+        釘選的版本、當前版本、仍在執行中的版本（有行程持有 run_scope / hold_version 租約）
+        與建立未滿 grace_hours 小時的版本一律保留。兩個條件都未指定時不會有版本過期。
+        """
+        if keep_last is None and max_age_days is None:
+            return []
+        now = datetime.now()
+        metadata = self.metadata
+        # 全域當前版本與本行程 run_scope 的版本都保留
+        protected = self.active_versions() | {metadata.get("current_version"), self.get_current_version()}
+        expired = []
+        for rank, version in enumerate(reversed(metadata["versions"])):
+            if version.get("pinned") or version["version_id"] in protected:
+                continue
+            age = now - datetime.fromisoformat(version["created_at"])
+            if age < timedelta(hours=grace_hours):
+                continue
+            keep = keep_last is not None and rank < keep_last
+            if max_age_days is not None:
+                keep = keep or age <= timedelta(days=max_age_days)
+            if not keep:
+                expired.append(version["version_id"])
+        return expired[::-1]
     
     def get_version_path(self, version_id: str, path_type: str) -> str:
-        """取得指定版本的目錄路徑"""
-        path_mapping = {
-            "in_sample_params": f"strategies/in_sample/all_params/{version_id}",
-            "in_sample_best": f"strategies/in_sample/best/{version_id}",
-            "out_sample_params": f"strategies/out_sample/param_logs/{version_id}",
-            "out_sample_best": f"strategies/out_sample/best/{version_id}",
-            "trading_signal": f"trading_simulation/signal/{version_id}",
-            "trading_performance": f"trading_simulation/performance/{version_id}"
+        """取得指定版本的目錄路徑（位於專案根目錄下）"""
+        if path_type not in VERSION_DIRS:
+            return ""
+        return os.path.join(self.project_root, VERSION_DIRS[path_type], version_id)
+
+    # ------------------------------------------------------------------
+    # 產出檔目錄
+    # ------------------------------------------------------------------
+    def _artifact_key(self, path: str) -> str:
+        """目錄以相對於專案根目錄、使用 / 分隔的路徑作為產出檔的唯一鍵（專案外的檔案保留絕對路徑）"""
+        path = os.path.abspath(path)
+        try:
+            rel = os.path.relpath(path, self.project_root)
+        except ValueError:  # Windows 上位於不同磁碟
+            rel = os.pardir
+        return (path if rel.startswith(os.pardir) else rel).replace(os.sep, '/')
+
+    def _load_catalog(self):
+        """
+        讀入其他行程新附加的目錄紀錄並更新索引。第一次呼叫時讀入整個檔案，
+        之後只讀取上次讀到的位置之後新增的完整行；同一路徑重複登記時以最後一筆為準。
+        """
+        if self._catalog is None or _file_stamp(self.catalog_file) is None:
+            self._catalog, self._index = {}, {}
+            self._cataloged_versions = set()
+            self._catalog_offset = 0
+        if not os.path.exists(self.catalog_file):
+            return
+        size = os.path.getsize(self.catalog_file)
+        if size < self._catalog_offset:
+            # 目錄檔被改寫過（例如手動清理），整份重新載入
+            self._catalog = None
+            return self._load_catalog()
+        if size == self._catalog_offset:
+            return
+        with open(self.catalog_file, 'rb') as f:
+            f.seek(self._catalog_offset)
+            chunk = f.read(size - self._catalog_offset)
+        # 只處理完整的行，寫到一半的最後一行留到下次
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        self._catalog_offset += len(complete)
+        for line in complete.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            # 「版本已回填」標記：該版本之後的檔案都會在寫出時登記，不需再掃描目錄
+            if "cataloged_version" in record:
+                self._cataloged_versions.add(record["cataloged_version"])
+            else:
+                self._index_record(record)
+
+    def _index_record(self, record: Dict):
+        """
+        將一筆紀錄加入索引。每筆紀錄以 (kind, version, symbol, strategy) 的所有「指定或任意」
+        組合登記，任何條件組合的查詢都是一次 dict 查找。每個索引項目是以路徑為鍵的有序 dict
+        （值不使用），依登記順序排列，最後一筆為最新；同一路徑重新登記時 O(1) 移到最後。
+        記憶體中的紀錄 path 為絕對路徑，索引鍵為相對於專案根目錄的路徑。
+        """
+        key = record["path"]
+        record["path"] = key if os.path.isabs(key) else os.path.join(self.project_root, key)
+        old = self._catalog.get(key)
+        if old is not None:
+            for index_key in self._index_keys(old):
+                del self._index[index_key][key]
+        self._catalog[key] = record
+        for index_key in self._index_keys(record):
+            self._index.setdefault(index_key, {})[key] = None
+
+    @staticmethod
+    def _index_keys(record: Dict):
+        values = (record.get("version_id"), record.get("symbol"), record.get("strategy"))
+        for mask in product((True, False), repeat=3):
+            yield (record["kind"],) + tuple(v if keep else _ANY for v, keep in zip(values, mask))
+
+    def _version_of_path(self, path: str) -> Optional[str]:
+        """由版本目錄路徑推斷版本 ID（版本目錄的最後一層即為版本 ID）"""
+        parent = os.path.basename(os.path.dirname(os.path.normpath(path)))
+        if parent in {v["version_id"] for v in self.metadata["versions"]}:
+            return parent
+        return None
+
+    def register_artifact(self, path: str, kind: str, symbol: Optional[str] = None,
+                          strategy: Optional[str] = None, version_id: Optional[str] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          parents: Optional[List[str]] = None, rows: Optional[int] = None,
+                          checksum: bool = False, **extra) -> Dict:
+        """
+        登記一個產出檔並回傳紀錄。version_id 未指定時由所在的版本目錄推斷；
+        parents 為產生此檔所讀取的上游檔案路徑；extra 的欄位原樣保存在紀錄中。
+        預設只記錄大小與修改時間；checksum 為 True 時才讀完整個檔案計算 sha256。
+        """
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"未知的產出檔種類: {kind}")
+        key = self._artifact_key(path)
+        st = os.stat(path)
+        record = {
+            "path": key,
+            "kind": kind,
+            "version_id": version_id or self._version_of_path(path),
+            "symbol": symbol,
+            "strategy": strategy,
+            "start_date": start_date,
+            "end_date": end_date,
+            "parents": [self._artifact_key(p) for p in parents or [] if p],
+            "rows": None if rows is None else int(rows),
+            "bytes": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "checksum": file_checksum(path) if checksum else None,
+            "created_at": datetime.now().isoformat(),
         }
-        return path_mapping.get(path_type, "")
+        record.update(extra)
+        self._append_catalog(record)
+        return self._catalog[key]
+
+    def _append_catalog(self, record: Dict):
+        """在檔案鎖內以單次寫入附加一行，再同步索引（包含其他行程在這之前附加的紀錄）"""
+        with self._lock:
+            with open(self.catalog_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._load_catalog()
+
+    def _mark_cataloged(self, version_id: str):
+        self._append_catalog({"cataloged_version": version_id, "created_at": datetime.now().isoformat()})
+
+    def catalog_version(self, version_id: str) -> int:
+        """
+        回填尚未登記的舊版本：掃描一次該版本的各目錄，依檔名推斷種類後登記。
+        已登記的檔案不會重複處理。回傳新登記的檔案數。
+        在檔案鎖內執行，多個行程同時查詢同一個舊版本時只會回填一次。
+        """
+        added = 0
+        with self._lock:
+            self._load_catalog()
+            if version_id in self._cataloged_versions:
+                return 0
+            for path_type in dict.fromkeys(ARTIFACT_KINDS.values()):
+                directory = self.get_version_path(version_id, path_type)
+                if not os.path.isdir(directory):
+                    continue
+                for name in sorted(os.listdir(directory), key=lambda n: os.path.getmtime(os.path.join(directory, n))):
+                    path = os.path.join(directory, name)
+                    parsed = _parse_legacy_name(name, path_type)
+                    if parsed is None or self._artifact_key(path) in self._catalog:
+                        continue
+                    kind, symbol, strategy = parsed
+                    self.register_artifact(path, kind, symbol, strategy, version_id, backfilled=True)
+                    added += 1
+            self._mark_cataloged(version_id)
+        return added
+
+    def _ensure_cataloged(self, version_id: Optional[str]):
+        """同步其他行程的新紀錄，並確保查詢範圍內的版本都已回填；未指定版本時涵蓋所有版本"""
+        self._load_catalog()
+        versions = [version_id] if version_id else [v["version_id"] for v in self.metadata["versions"]]
+        for v in versions:
+            if v not in self._cataloged_versions:
+                self.catalog_version(v)
+
+    def find_artifacts(self, kind: str, version_id: Optional[str] = None, symbol: Optional[str] = None,
+                       strategy: Optional[str] = None, existing_only: bool = True) -> List[Dict]:
+        """
+        依條件查詢產出檔，最新的在前；未指定的條件視為任意值。
+        existing_only 為 True 時略過已被刪除的檔案。
+        """
+        self._ensure_cataloged(version_id)
+        key = (kind, version_id or _ANY, symbol or _ANY, strategy or _ANY)
+        records = [self._catalog[p] for p in reversed(self._index.get(key, {}))]
+        if existing_only:
+            records = [r for r in records if os.path.exists(r["path"])]
+        return records
+
+    def latest_artifact(self, kind: str, version_id: Optional[str] = None, symbol: Optional[str] = None,
+                        strategy: Optional[str] = None) -> Optional[Dict]:
+        """回傳最新的一筆符合條件且仍存在的產出檔紀錄，找不到時回傳 None"""
+        self._ensure_cataloged(version_id)
+        key = (kind, version_id or _ANY, symbol or _ANY, strategy or _ANY)
+        for path in reversed(self._index.get(key, {})):
+            record = self._catalog[path]
+            if os.path.exists(record["path"]):
+                return record
+        return None
+
+    def get_artifact(self, path: str) -> Optional[Dict]:
+        """依路徑取得產出檔紀錄；舊版本的檔案會先回填該版本"""
+        self._ensure_cataloged(self._version_of_path(path))
+        return self._catalog.get(self._artifact_key(path))
+
+    def artifact_symbol_strategy(self, path: str):
+        """回傳產出檔的 (symbol, strategy)；未登記的檔案才退回檔名解析"""
+        record = self.get_artifact(path)
+        if record and record.get("symbol"):
+            return record["symbol"], record.get("strategy")
+        from utils.results_store import parse_signal_filename
+        return parse_signal_filename(path)
+
+    def derived_from(self, path: str, parent: str) -> bool:
+        """產出檔登記的直接上游是否包含 parent"""
+        return self._artifact_key(parent) in (self.get_artifact(path) or {}).get("parents", [])
+
+    def artifact_lineage(self, path: str) -> List[Dict]:
+        """回傳產出檔的所有上游紀錄（由近到遠，不重複）"""
+        lineage, seen = [], set()
+        stack = list((self.get_artifact(path) or {}).get("parents", []))
+        while stack:
+            parent = stack.pop(0)
+            if parent in seen:
+                continue
+            seen.add(parent)
+            record = self._catalog.get(parent)
+            if record is not None:
+                lineage.append(record)
+                stack.extend(record.get("parents", []))
+        return lineage
+
+    def verify_artifact(self, path: str) -> bool:
+        """
+        檢查檔案是否與登記時相同：登記時算過 checksum 的比對內容，
+        否則比對大小與修改時間。
+        """
+        record = self.get_artifact(path)
+        if not record or not os.path.exists(path):
+            return False
+        if record.get("checksum"):
+            return file_checksum(path) == record["checksum"]
+        st = os.stat(path)
+        return st.st_size == record.get("bytes") and st.st_mtime_ns == record.get("mtime_ns")
 
 # 全域版本管理器實例
 version_manager = VersionManager() 
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+SQLite 工作佇列（broker）
+
+協調者把 (symbol, strategy, param-shard, window) 任務寫入一個 SQLite 檔，
+任何主機上的 worker 只要能存取這個檔案（例如共用磁碟）就能領取任務、
+執行並回寫精簡的結果。任務以租約 (lease) 領取：worker 當機或失聯時租約到期，
+任務會被其他 worker 重新領取，直到超過 max_attempts 才標記為失敗。
+
+注意：跨主機共用時請使用預設的 rollback journal（不要開 WAL），
+WAL 需要共享記憶體，無法在網路檔案系統上跨主機運作。
+"""
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id       INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id        TEXT NOT NULL,
+    kind          TEXT NOT NULL,
+    payload       TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'pending',
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL DEFAULT 3,
+    worker_id     TEXT,
+    lease_expires REAL,
+    error         TEXT,
+    created_at    REAL NOT NULL,
+    updated_at    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (status, lease_expires);
+CREATE INDEX IF NOT EXISTS idx_tasks_job ON tasks (job_id, status);
+CREATE TABLE IF NOT EXISTS results (
+    task_id     INTEGER PRIMARY KEY,
+    job_id      TEXT NOT NULL,
+    result      TEXT NOT NULL,
+    worker_id   TEXT,
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_job ON results (job_id);
+"""
+
+
+class WorkQueue:
+    """以 SQLite 檔案實作、可跨行程/跨主機共用的持久化工作佇列"""
+
+    def __init__(self, db_path: str = 'database/work_queue.db', timeout: float = 60.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.executescript(_SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None：由程式自行以 BEGIN IMMEDIATE 控制交易
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _fail_exhausted(conn: sqlite3.Connection, now: float):
+        """租約過期且已用完重試次數的任務直接標記失敗"""
+        conn.execute(
+            "UPDATE tasks SET status = ?, error = COALESCE(error, 'lease expired'), updated_at = ? "
+            "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (FAILED, now, RUNNING, now))
+
+    def reclaim_expired(self) -> int:
+        """
+        將租約已過期（worker 當機或失聯）的 running 任務放回 pending，
+        已用完重試次數的標記失敗；回傳放回 pending 的任務數
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._fail_exhausted(conn, now)
+            cur = conn.execute(
+                "UPDATE tasks SET status = ?, error = COALESCE(error, 'lease expired'), updated_at = ? "
+                "WHERE status = ? AND lease_expires < ?",
+                (PENDING, now, RUNNING, now))
+            conn.execute("COMMIT")
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def enqueue(self, job_id: str, kind: str, payloads: List[Dict], max_attempts: int = 3) -> int:
+        """批次新增任務，回傳新增的任務數"""
+        now = time.time()
+        rows = [(job_id, kind, json.dumps(p, ensure_ascii=False), max_attempts, now, now) for p in payloads]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO tasks (job_id, kind, payload, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return len(rows)
+
+    def claim(self, worker_id: str, lease_seconds: float = 120.0) -> Optional[Dict]:
+        """
+        領取一個任務：優先取 pending，其次是租約已過期的 running（worker 已失聯）。
+        沒有可領取的任務時回傳 None。
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._fail_exhausted(conn, now)
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE status = ? OR (status = ? AND lease_expires < ?) "
+                "ORDER BY task_id LIMIT 1", (PENDING, RUNNING, now)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, attempts = attempts + 1, worker_id = ?, "
+                "lease_expires = ?, updated_at = ? WHERE task_id = ?",
+                (RUNNING, worker_id, now + lease_seconds, now, row['task_id']))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        task = dict(row)
+        task['payload'] = json.loads(task['payload'])
+        task['attempts'] += 1
+        return task
+
+    def heartbeat(self, task_id: int, worker_id: str, lease_seconds: float = 120.0) -> bool:
+        """延長租約；任務已被其他 worker 接手時回傳 False"""
+        conn = self._connect()
+        try:
+            cur = conn.execute(
+                "UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                "WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (time.time() + lease_seconds, time.time(), task_id, worker_id, RUNNING))
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, task_id: int, worker_id: str, result) -> bool:
+        """回寫結果並標記完成；任務已被其他 worker 接手時忽略並回傳 False"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            cur = conn.execute(
+                "UPDATE tasks SET status = ?, lease_expires = NULL, error = NULL, updated_at = ? "
+                "WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (DONE, now, task_id, worker_id, RUNNING))
+            if cur.rowcount == 1:
+                job_id = conn.execute("SELECT job_id FROM tasks WHERE task_id = ?", (task_id,)).fetchone()[0]
+                conn.execute(
+                    "INSERT OR REPLACE INTO results (task_id, job_id, result, worker_id, finished_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (task_id, job_id, json.dumps(result, ensure_ascii=False), worker_id, now))
+            conn.execute("COMMIT")
+            return cur.rowcount == 1
+        finally:
+            conn.close()
+
+    def fail(self, task_id: int, worker_id: str, error: str):
+        """回報失敗：尚有重試次數時放回 pending，否則標記 failed"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END, "
+                "lease_expires = NULL, error = ?, updated_at = ? "
+                "WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (PENDING, FAILED, error, time.time(), task_id, worker_id, RUNNING))
+        finally:
+            conn.close()
+
+    def job_status(self, job_id: str) -> Dict[str, int]:
+        """回傳 {狀態: 任務數}"""
+        conn = self._connect()
+        try:
+            self._fail_exhausted(conn, time.time())
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM tasks WHERE job_id = ? GROUP BY status", (job_id,)).fetchall()
+        finally:
+            conn.close()
+        status = {PENDING: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        status.update({r[0]: r[1] for r in rows})
+        return status
+
+    def is_finished(self, job_id: str) -> bool:
+        status = self.job_status(job_id)
+        return status[PENDING] == 0 and status[RUNNING] == 0
+
+    def results(self, job_id: str) -> List[Dict]:
+        """回傳 job 所有已完成任務的 payload 與結果"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT t.task_id, t.kind, t.payload, r.result, r.worker_id FROM results r "
+                "JOIN tasks t ON t.task_id = r.task_id WHERE r.job_id = ? ORDER BY t.task_id",
+                (job_id,)).fetchall()
+        finally:
+            conn.close()
+        return [{'task_id': r['task_id'], 'kind': r['kind'], 'payload': json.loads(r['payload']),
+                 'result': json.loads(r['result']), 'worker_id': r['worker_id']} for r in rows]
+
+    def failures(self, job_id: str) -> List[Dict]:
+        """回傳 job 中最終失敗的任務與錯誤訊息"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT task_id, kind, attempts, error FROM tasks WHERE job_id = ? AND status = ?",
+                (job_id, FAILED)).fetchall()
+        finally:
+            conn.close()
+        return [dict(r) for r in rows]